@@ -0,0 +1,243 @@
+# app/core/admission.py
+"""
+Controllo di ammissione per worker: limita upload e download concorrenti e
+i byte di upload in volo, con una coda d'attesa limitata. Quando la coda è
+piena (o l'attesa scade) la richiesta riceve 429 con Retry-After.
+
+Le letture "leggere" (GET di liste e dettagli) non vengono mai accodate:
+hanno la precedenza sugli upload, che non vengono ammessi finché le letture
+in corso superano la soglia `read_pressure`. In più upload e download
+occupano al massimo max_uploads + max_downloads connessioni del pool Mongo,
+lasciando il resto alle letture.
+"""
+from __future__ import annotations
+
+import asyncio
+import re
+from collections import Counter, deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Callable, Optional
+
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+UPLOAD = "upload"
+DOWNLOAD = "download"
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+@dataclass(eq=False)
+class _Ticket:
+    kind: str
+    user_id: str
+    nbytes: int = 0
+    future: Optional[asyncio.Future] = field(default=None, repr=False)
+
+class AdmissionController:
+    def __init__(
+        self,
+        *,
+        max_uploads: int,
+        max_downloads: int,
+        max_upload_bytes: int,
+        max_uploads_per_user: int,
+        max_queue: int,
+        queue_timeout: float,
+        retry_after: int,
+        read_pressure: int = 0,
+    ):
+        self.max_uploads = max_uploads
+        self.max_downloads = max_downloads
+        self.max_upload_bytes = max_upload_bytes
+        self.max_uploads_per_user = max_uploads_per_user
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.read_pressure = read_pressure
+
+        self.uploads = 0
+        self.downloads = 0
+        self.upload_bytes = 0
+        self.reads = 0
+        self._per_user: Counter[str] = Counter()
+        self._queue: deque[_Ticket] = deque()
+
+    # -------------------------
+    # Stato
+    # -------------------------
+    def _blocker(self, t: _Ticket) -> Optional[str]:
+        """None se il ticket può entrare, "user" se bloccato dal limite per utente, "global" altrimenti."""
+        if t.kind == DOWNLOAD:
+            return None if self.downloads < self.max_downloads else "global"
+        if self.uploads >= self.max_uploads:
+            return "global"
+        # un singolo upload più grande dell'intero budget entra solo da solo
+        if self.upload_bytes and self.upload_bytes + t.nbytes > self.max_upload_bytes:
+            return "global"
+        if self.read_pressure and self.reads >= self.read_pressure:
+            return "global"
+        if self._per_user[t.user_id] >= self.max_uploads_per_user:
+            return "user"
+        return None
+
+    def _take(self, t: _Ticket) -> None:
+        if t.kind == DOWNLOAD:
+            self.downloads += 1
+        else:
+            self.uploads += 1
+            self.upload_bytes += t.nbytes
+            self._per_user[t.user_id] += 1
+
+    def _release(self, t: _Ticket) -> None:
+        if t.kind == DOWNLOAD:
+            self.downloads -= 1
+        else:
+            self.uploads -= 1
+            self.upload_bytes -= t.nbytes
+            self._per_user[t.user_id] -= 1
+            if self._per_user[t.user_id] <= 0:
+                del self._per_user[t.user_id]
+        self._drain()
+
+    def _drain(self) -> None:
+        # FIFO per tipo; un utente al suo limite non blocca quelli dietro di lui
+        blocked: set[str] = set()
+        for t in list(self._queue):
+            if t.kind in blocked or t.future.done():
+                continue
+            reason = self._blocker(t)
+            if reason is None:
+                self._queue.remove(t)
+                self._take(t)
+                t.future.set_result(None)
+            elif reason == "global":
+                blocked.add(t.kind)
+
+    # -------------------------
+    # API
+    # -------------------------
+    @asynccontextmanager
+    async def admit(self, kind: str, *, user_id: str = "", nbytes: int = 0) -> AsyncIterator[None]:
+        t = _Ticket(kind=kind, user_id=user_id, nbytes=max(nbytes, 0))
+        if not any(q.kind == kind for q in self._queue) and self._blocker(t) is None:
+            self._take(t)
+        else:
+            await self._wait(t)
+        try:
+            yield
+        finally:
+            self._release(t)
+
+    async def _wait(self, t: _Ticket) -> None:
+        if len(self._queue) >= self.max_queue:
+            raise AdmissionRejected("queue full", self.retry_after)
+        t.future = asyncio.get_running_loop().create_future()
+        self._queue.append(t)
+        self._drain()  # può entrare subito se chi è in coda è fermo solo per il limite per utente
+        try:
+            await asyncio.wait_for(t.future, self.queue_timeout)
+        except BaseException as exc:
+            if t.future.done() and not t.future.cancelled():
+                # ammesso proprio mentre scadeva l'attesa: restituisco lo slot
+                self._release(t)
+            elif t in self._queue:
+                self._queue.remove(t)
+                self._drain()
+            if isinstance(exc, asyncio.TimeoutError):
+                raise AdmissionRejected("queue timeout", self.retry_after) from None
+            raise
+
+    @asynccontextmanager
+    async def track_read(self) -> AsyncIterator[None]:
+        self.reads += 1
+        try:
+            yield
+        finally:
+            self.reads -= 1
+            self._drain()
+
+    def snapshot(self) -> dict:
+        return {
+            "uploads": self.uploads,
+            "downloads": self.downloads,
+            "uploadBytes": self.upload_bytes,
+            "reads": self.reads,
+            "queued": len(self._queue),
+        }
+
+
+class AdmissionMiddleware:
+    """
+    Middleware ASGI: l'ammissione avviene prima che FastAPI legga il body,
+    così un upload in coda non occupa né banda né connessioni Mongo.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        *,
+        controller: AdmissionController,
+        identify: Callable[[Scope], Optional[str]],
+        prefix: str = "/api/v1",
+    ):
+        self.app = app
+        self.controller = controller
+        self.identify = identify
+        p = re.escape(prefix)
+        self._upload_routes = [
+            ("POST", re.compile(rf"^{p}/submissions/?$")),
+            ("PATCH", re.compile(rf"^{p}/uploads/[^/]+/?$")),
+            ("POST", re.compile(rf"^{p}/imports/submissions/?$")),
+        ]
+        self._download_route = re.compile(rf"^{p}/files/[^/]+/?$")
+        # stream SSE di lunga durata: non sono letture da conteggiare
+        self._stream_route = re.compile(rf"^{p}/assignments/[^/]+/submissions/events/?$")
+
+    def _classify(self, method: str, path: str) -> Optional[str]:
+        if any(method == m and rx.match(path) for m, rx in self._upload_routes):
+            return UPLOAD
+        if method == "GET" and self._download_route.match(path):
+            return DOWNLOAD
+        if method in ("GET", "HEAD") and not self._stream_route.match(path):
+            return "read"
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        kind = self._classify(scope["method"], scope["path"])
+        if kind is None:
+            await self.app(scope, receive, send)
+            return
+        if kind == "read":
+            async with self.controller.track_read():
+                await self.app(scope, receive, send)
+            return
+
+        headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope.get("headers", [])}
+        user_id = ""
+        nbytes = 0
+        if kind == UPLOAD:
+            user_id = self.identify(scope) or "anonymous"
+            try:
+                nbytes = int(headers.get("content-length", 0))
+            except ValueError:
+                nbytes = 0
+
+        try:
+            async with self.controller.admit(kind, user_id=user_id, nbytes=nbytes):
+                await self.app(scope, receive, send)
+        except AdmissionRejected as e:
+            response = JSONResponse(
+                status_code=429,
+                content={"detail": f"Server busy ({e.reason}), retry later"},
+                headers={"Retry-After": str(e.retry_after)},
+            )
+            await response(scope, receive, send)
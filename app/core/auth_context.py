@@ -0,0 +1,67 @@
+# app/core/auth_context.py
+"""
+Autenticazione decodificata una sola volta per richiesta.
+
+AuthContextMiddleware (esterno ad ammissione e idempotenza) decodifica il
+Bearer token e mette in scope["state"] l'utente (o None) e l'eventuale
+errore; middleware e dipendenze FastAPI rileggono da lì invece di rifare
+jwt.decode, che è CPU sull'event loop.
+"""
+from __future__ import annotations
+
+from typing import Any, Callable, Optional
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.schemas.context import UserContext
+
+USER_KEY = "user"
+ERROR_KEY = "auth_error"
+
+def bearer_token(scope: Scope) -> Optional[str]:
+    for k, v in scope.get("headers", []):
+        if k.lower() == b"authorization":
+            value = v.decode("latin-1")
+            if value.lower().startswith("bearer "):
+                return value[7:].strip() or None
+            return None
+    return None
+
+def authenticate(scope: Scope, decode: Callable[[str], UserContext]) -> Optional[UserContext]:
+    """Utente della richiesta, decodificato al primo uso e poi letto da scope["state"]."""
+    state = scope.setdefault("state", {})
+    if USER_KEY in state:
+        return state[USER_KEY]
+    user: Optional[UserContext] = None
+    error: Optional[Exception] = None
+    token = bearer_token(scope)
+    if token is not None:
+        try:
+            user = decode(token)
+        except Exception as e:
+            error = e
+    state[USER_KEY] = user
+    state[ERROR_KEY] = error
+    return user
+
+def cached_user(scope: Scope) -> tuple[bool, Optional[UserContext], Optional[Exception]]:
+    """(già decodificato?, utente, errore) dallo stato della richiesta."""
+    state: dict[str, Any] = scope.get("state") or {}
+    if USER_KEY not in state:
+        return False, None, None
+    return True, state[USER_KEY], state.get(ERROR_KEY)
+
+def scope_user_id(scope: Scope) -> Optional[str]:
+    """User id già decodificato da AuthContextMiddleware (None se assente o non valido)."""
+    _, user, _ = cached_user(scope)
+    return user.user_id if user is not None else None
+
+class AuthContextMiddleware:
+    def __init__(self, app: ASGIApp, *, decode: Callable[[str], UserContext]):
+        self.app = app
+        self.decode = decode
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http":
+            authenticate(scope, self.decode)
+        await self.app(scope, receive, send)
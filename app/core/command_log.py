@@ -0,0 +1,230 @@
+# app/core/command_log.py
+"""
+Monitoraggio dei comandi Mongo (alimentato dal CommandListener di
+app/database/command_listener.py).
+
+- Contatori per tipo di comando: numero, errori, lenti, tempo totale e massimo.
+- Log dei comandi sopra `slow_ms` con la loro "forma": namespace, chiavi di
+  filtro, sort, stadi della pipeline. I valori sono sempre sostituiti da "?":
+  nei log non finiscono id di studenti né testo delle submission.
+- Con `explain_top` > 0 si tengono le query più lente per forma nella finestra
+  corrente; run_explain_loop ne chiede il piano (explain "queryPlanner") e
+  logga solo stadi e indici usati.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+logger = logging.getLogger(__name__)
+
+REDACTED = "?"
+
+# handshake e heartbeat: contati, mai loggati
+IGNORED_COMMANDS = {"hello", "ismaster", "isMaster", "ping", "buildinfo", "buildInfo", "endSessions", "killCursors"}
+EXPLAINABLE = {"find", "aggregate", "count", "distinct", "findAndModify", "update", "delete"}
+# campi di sessione/driver da togliere prima di rieseguire il comando sotto explain
+_DRIVER_FIELDS = {
+    "lsid", "txnNumber", "autocommit", "startTransaction", "readConcern", "writeConcern",
+    "$db", "$clusterTime", "$readPreference", "apiVersion", "apiStrict", "apiDeprecationErrors",
+}
+
+def redact(value: Any) -> Any:
+    """Stessa struttura (chiavi e operatori), valori sostituiti da "?"."""
+    if isinstance(value, dict):
+        return {k: redact(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)) and value and all(isinstance(v, dict) for v in value):
+        return [redact(v) for v in value]  # $and / $or / pipeline
+    return REDACTED
+
+def _sort_shape(sort: Any) -> Any:
+    if not isinstance(sort, dict):
+        return REDACTED
+    return {k: v if isinstance(v, int) else redact(v) for k, v in sort.items()}
+
+def _stage_shape(stage: Any) -> Any:
+    if isinstance(stage, dict) and "$sort" in stage:
+        return {"$sort": _sort_shape(stage["$sort"])}
+    return redact(stage)
+
+def command_shape(command_name: str, database: str, command: dict) -> dict[str, Any]:
+    """Forma del comando senza valori: namespace, filtro, sort, pipeline, dimensione dei batch."""
+    target = command.get(command_name)
+    shape: dict[str, Any] = {"op": command_name, "ns": f"{database}.{target}" if isinstance(target, str) else database}
+    if command_name == "find":
+        shape["filter"] = redact(command.get("filter", {}))
+        if "sort" in command:
+            shape["sort"] = _sort_shape(command["sort"])
+    elif command_name == "aggregate":
+        shape["pipeline"] = [_stage_shape(s) for s in command.get("pipeline", ())]
+    elif command_name in ("count", "distinct"):
+        shape["filter"] = redact(command.get("query", {}))
+        if command_name == "distinct":
+            shape["key"] = command.get("key")
+    elif command_name == "findAndModify":
+        shape["filter"] = redact(command.get("query", {}))
+        if "sort" in command:
+            shape["sort"] = _sort_shape(command["sort"])
+    elif command_name in ("update", "delete"):
+        ops = command.get("updates" if command_name == "update" else "deletes", ())
+        if ops:
+            shape["filter"] = redact(ops[0].get("q", {}))
+        shape["batch"] = len(ops)
+    elif command_name == "insert":
+        shape["batch"] = len(command.get("documents", ()))
+    return shape
+
+def shape_key(shape: dict[str, Any]) -> str:
+    return json.dumps(shape, separators=(",", ":"), default=str)
+
+def plan_summary(explain: dict) -> str:
+    """Stadi del piano vincente, es. "LIMIT > FETCH > IXSCAN(assignmentId_1_createdAt_1)"."""
+    planner = explain.get("queryPlanner") or {}
+    if not planner and explain.get("stages"):
+        planner = (explain["stages"][0].get("$cursor") or {}).get("queryPlanner") or {}
+    plan = planner.get("winningPlan") or {}
+    plan = plan.get("queryPlan", plan)  # formato del motore SBE
+    stages: list[str] = []
+    while plan:
+        stage = plan.get("stage", "?")
+        stages.append(f"{stage}({plan['indexName']})" if plan.get("indexName") else stage)
+        children = plan.get("inputStages") or []
+        plan = plan.get("inputStage") or (children[0] if children else None)
+    return " > ".join(stages) or "n/a"
+
+@dataclass(slots=True)
+class CommandCounters:
+    count: int = 0
+    failed: int = 0
+    slow: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "count": self.count, "failed": self.failed, "slow": self.slow,
+            "totalMs": round(self.total_ms, 3), "maxMs": round(self.max_ms, 3),
+        }
+
+@dataclass(slots=True)
+class SlowSample:
+    shape: dict[str, Any]
+    duration_ms: float
+    database: str
+    command: dict = field(repr=False)
+    address: Any = None
+
+class CommandLog:
+    def __init__(
+        self,
+        *,
+        slow_ms: float,
+        explain_top: int = 0,
+        max_inflight: int = 10000,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.slow_ms = slow_ms
+        self.explain_top = explain_top
+        self.max_inflight = max_inflight
+        self.clock = clock
+        self.counters: dict[str, CommandCounters] = {}
+        self._inflight: dict[tuple[int, Any], tuple[str, str, dict]] = {}
+        self._slowest: dict[str, SlowSample] = {}
+        self._explained: dict[str, float] = {}
+
+    # -------------------------
+    # Eventi (dal listener: sincroni, devono costare poco)
+    # -------------------------
+    def started(self, request_id: int, address: Any, command_name: str, database: str, command: dict) -> None:
+        if len(self._inflight) >= self.max_inflight:
+            # eventi di fine persi (es. connessione chiusa): scarto i più vecchi
+            self._inflight.pop(next(iter(self._inflight)))
+        self._inflight[(request_id, address)] = (command_name, database, command)
+
+    def finished(self, request_id: int, address: Any, command_name: str, duration_micros: int, *, failed: bool = False) -> None:
+        entry = self._inflight.pop((request_id, address), None)
+        ms = duration_micros / 1000
+        c = self.counters.get(command_name)
+        if c is None:
+            c = self.counters[command_name] = CommandCounters()
+        c.count += 1
+        c.total_ms += ms
+        c.max_ms = max(c.max_ms, ms)
+        if failed:
+            c.failed += 1
+        if ms < self.slow_ms or entry is None or command_name in IGNORED_COMMANDS:
+            return
+
+        c.slow += 1
+        name, database, command = entry
+        shape = command_shape(name, database, command)
+        key = shape_key(shape)
+        logger.warning("Mongo slow %s %.1fms%s %s", name, ms, " (failed)" if failed else "", key)
+        if self.explain_top > 0 and name in EXPLAINABLE:
+            current = self._slowest.get(key)
+            if current is None or ms > current.duration_ms:
+                self._slowest[key] = SlowSample(shape, ms, database, command, address)
+
+    # -------------------------
+    # Letture
+    # -------------------------
+    def stats(self) -> dict[str, Any]:
+        return {
+            "slowMs": self.slow_ms,
+            "inflight": len(self._inflight),
+            "commands": {name: c.as_dict() for name, c in sorted(self.counters.items())},
+        }
+
+    def take_slowest(self) -> list[SlowSample]:
+        """Le `explain_top` forme più lente della finestra corrente; apre una nuova finestra."""
+        samples = sorted(self._slowest.values(), key=lambda s: -s.duration_ms)[: self.explain_top]
+        self._slowest = {}
+        return samples
+
+    # -------------------------
+    # Explain
+    # -------------------------
+    @staticmethod
+    def explain_command(sample: SlowSample) -> dict:
+        return {k: v for k, v in sample.command.items() if k not in _DRIVER_FIELDS}
+
+    async def explain_slowest(self, client: Any, *, min_interval: float) -> int:
+        """
+        Explain delle forme più lente della finestra, sul client da cui arrivano
+        (altri cluster, es. shard dello storage, vengono saltati). Una stessa
+        forma si spiega al più una volta ogni `min_interval` secondi.
+        """
+        done = 0
+        nodes = getattr(client, "nodes", None)
+        for sample in self.take_slowest():
+            key = shape_key(sample.shape)
+            now = self.clock()
+            if now - self._explained.get(key, float("-inf")) < min_interval:
+                continue
+            if nodes and sample.address is not None and sample.address not in nodes:
+                continue
+            self._explained[key] = now
+            try:
+                res = await client[sample.database].command(
+                    {"explain": self.explain_command(sample), "verbosity": "queryPlanner"}
+                )
+            except Exception as e:
+                logger.warning("Mongo explain fallito per %s: %s", key, e)
+                continue
+            logger.warning("Mongo explain %.1fms %s -> %s", sample.duration_ms, key, plan_summary(res))
+            done += 1
+        return done
+
+    async def run_explain_loop(self, client: Any, *, window_seconds: float, reexplain_seconds: float = 3600.0) -> None:
+        while True:
+            await asyncio.sleep(window_seconds)
+            try:
+                await self.explain_slowest(client, min_interval=reexplain_seconds)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Explain delle query lente fallito")
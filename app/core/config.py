@@ -1,16 +1,138 @@
 import os
+from typing import Optional
+from pydantic import BaseModel
 from pydantic_settings import BaseSettings
 
+class StorageShard(BaseModel):
+    name: str                     # finisce negli URI: gridfs://<name>/<oid>
+    uri: Optional[str] = None     # None = stesso cluster delle submission
+    db: Optional[str] = None      # None = mongo_db_name
+    bucket: Optional[str] = None  # None = name
+    weight: int = 1
+
 class Settings(BaseSettings):
     env: str = os.getenv("ENV", "unit-test")
     jwt_algorithm: str
     jwt_public_key: str
     mongo_uri: str
     mongo_db_name: str
+    # client Mongo
+    mongo_max_pool_size: int = 100
+    mongo_min_pool_size: int = 0
+    mongo_compressors: str = ""          # es. "zstd,snappy" (vuoto = nessuna compressione)
+    mongo_zlib_compression_level: Optional[int] = None
+    mongo_connect_timeout_ms: int = 10000
+    mongo_server_selection_timeout_ms: int = 30000
+    mongo_socket_timeout_ms: int = 0     # 0 = nessun timeout
+    mongo_wait_queue_timeout_ms: int = 0 # 0 = nessun timeout
+    mongo_read_preference: str = "primary"  # solo per liste, dettaglio e download
+    mongo_max_staleness_seconds: int = 0    # 0 = nessun limite, altrimenti >= 90
+
     rabbitmq_username: str
     rabbitmq_password: str
     rabbitmq_url: str
 
+    # eventi submission: schema 2 con file e anteprima (header schemaVersion)
+    events_rich: bool = False
+    events_preview_chars: int = 500
+    events_max_bytes: int = 64 * 1024   # oltre: solo il riferimento alla submission
+
+    # testo delle submission fuori dal documento
+    content_inline_max_bytes: int = 16 * 1024
+    content_preview_chars: int = 500
+    content_max_delta_chain: int = 8   # riconsegne: delta di fila prima di un testo completo
+
+    # download: read-ahead da GridFS (chunk da 1MB)
+    download_read_ahead_bytes: int = 4 * 1024 * 1024           # per download
+    download_read_ahead_total_bytes: int = 128 * 1024 * 1024   # per worker
+
+    # upload GridFS: chunk scritti in insert_many parallele (0 = GridIn, un chunk alla volta)
+    gridfs_upload_concurrency: int = 4
+    gridfs_upload_batch_chunks: int = 8
+
+    # cache in memoria dei file scaricati più spesso (per worker; 0 = disattivata)
+    blob_cache_max_bytes: int = 256 * 1024 * 1024
+    blob_cache_max_object_bytes: int = 8 * 1024 * 1024
+    blob_cache_ttl_seconds: float = 600.0
+
+    # shard dello storage binario, es. STORAGE_SHARDS='[{"name": "blobs1", "uri": "mongodb://..."}]'
+    # (vuoto = solo il bucket "uploads" del database principale)
+    storage_shards: list[StorageShard] = []
+    storage_route_by: str = "file"      # file | assignment
+    storage_legacy_weight: int = 1      # peso di "uploads" nel ring (0 = solo lettura)
+
+    # archivio a freddo (python -m app.jobs.archive_submissions): bucket GridFS "archive"
+    archive_uri: Optional[str] = None       # cluster freddo (default: mongo_uri)
+    archive_db: Optional[str] = None        # default: mongo_db_name
+    archive_block_compressor: str = "zstd"  # compressione WiredTiger del bucket freddo
+    archive_after_days: int = 180           # assignment senza consegne da N giorni
+
+    # upload ripristinabili
+    upload_session_ttl_seconds: int = 24 * 3600
+    upload_purge_interval_seconds: int = 600
+
+    # Idempotency-Key su POST /submissions
+    idempotency_ttl_seconds: int = 24 * 3600
+    idempotency_pending_ttl_seconds: int = 600   # chiave "in corso" di un worker caduto
+    idempotency_wait_seconds: float = 30.0
+    idempotency_max_body_bytes: int = 64 * 1024
+
+    # import in blocco (POST /imports/submissions)
+    import_concurrency: int = 16       # blob scritti in parallelo
+    import_max_records: int = 20000
+
+    # ricerca full-text (GET /submissions/search)
+    search_text_language: str = "none"  # lingua dell'indice di testo (es. "italian"); "none" = nessuno stemming
+    search_default_limit: int = 20
+    search_max_limit: int = 100
+
+    # quasi-duplicati (MinHash + LSH)
+    similarity_min: float = 0.5
+    similarity_max_results: int = 50
+    similarity_max_attachment_bytes: int = 2 * 1024 * 1024   # allegati testuali inclusi nella firma
+
+    # lookup in blocco
+    batch_lookup_max_ids: int = 500
+
+    # controllo di ammissione (per worker)
+    admission_max_uploads: int = 16
+    admission_max_downloads: int = 32
+    admission_max_upload_bytes: int = 512 * 1024 * 1024
+    admission_max_uploads_per_user: int = 2
+    admission_max_queue: int = 200
+    admission_queue_timeout_seconds: float = 15.0
+    admission_retry_after_seconds: int = 5
+    admission_read_pressure: int = 64   # 0 = letture senza precedenza sugli upload
+
+    # tracing (OpenTelemetry)
+    tracing_enabled: bool = False
+    tracing_sample_rate: float = 0.1
+    tracing_exporter: str = "file"          # file | otlp | console
+    tracing_file_path: str = "traces/spans.jsonl"
+    tracing_otlp_endpoint: Optional[str] = None
+
+    # monitoraggio comandi Mongo (CommandListener)
+    mongo_monitoring: bool = True
+    mongo_slow_ms: float = 100.0
+    mongo_explain_top: int = 0              # 0 = niente explain automatici
+    mongo_explain_window_seconds: float = 300.0
+
+    # monitor dell'event loop (lag ed eventuale watchdog dei passi bloccanti)
+    loop_monitor_enabled: bool = True
+    loop_monitor_interval_seconds: float = 0.25
+    loop_monitor_window: int = 2000
+    loop_watchdog_ms: float = 0.0           # 0 = watchdog spento
+
+    # anteprime e testo degli allegati (process pool, in background)
+    preview_workers: int = 2                # 0 = anteprime spente
+    preview_max_pending: int = 4            # allegati in memoria contemporaneamente
+    preview_max_source_bytes: int = 20 * 1024 * 1024
+    preview_max_text_chars: int = 200_000
+
+    # feed SSE delle submission
+    feed_buffer_size: int = 1000
+    feed_keepalive_seconds: int = 15
+
     class Config:
         env_file = None  # nessun file .env, solo ENV
 
@@ -1,7 +1,12 @@
+from typing import Optional
 from fastapi import Request
 from app.database.submission_repo import SubmissionRepo
 from app.database.base import BinaryStorage
+from app.database.upload_session_repo import UploadSessionRepo
+from app.database.fingerprint_repo import FingerprintRepo
 from app.services.publisher_service import SubmissionPublisher
+from app.services.change_feed import SubmissionChangeFeed
+from app.services.preview_service import PreviewWorkers
 
 def get_repository(request: Request) -> SubmissionRepo:
     repo = getattr(request.app.state, "submission_repo", None)
@@ -19,4 +24,26 @@ def get_publisher(request: Request) -> SubmissionPublisher:
     publisher = getattr(request.app.state, "submission_publisher", None)
     if publisher is None:
         raise RuntimeError("Publiscer non inizializzato")
-    return publisher
\ No newline at end of file
+    return publisher
+
+def get_upload_sessions(request: Request) -> UploadSessionRepo:
+    sessions = getattr(request.app.state, "upload_session_repo", None)
+    if sessions is None:
+        raise RuntimeError("Repository sessioni di upload non inizializzato")
+    return sessions
+
+def get_change_feed(request: Request) -> SubmissionChangeFeed:
+    feed = getattr(request.app.state, "change_feed", None)
+    if feed is None:
+        raise RuntimeError("Change feed non inizializzato")
+    return feed
+
+def get_fingerprints(request: Request) -> FingerprintRepo:
+    fingerprints = getattr(request.app.state, "fingerprint_repo", None)
+    if fingerprints is None:
+        raise RuntimeError("Repository firme non inizializzato")
+    return fingerprints
+
+def get_preview_workers(request: Request) -> Optional[PreviewWorkers]:
+    # None: anteprime spente (preview_workers = 0)
+    return getattr(request.app.state, "preview_workers", None)
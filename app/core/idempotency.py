@@ -0,0 +1,201 @@
+# app/core/idempotency.py
+"""
+Supporto all'header Idempotency-Key su POST /submissions.
+
+La prima richiesta con una certa chiave la "prenota" (stato pending) e, a
+fine richiesta, salva status, header e body della risposta. Un retry con la
+stessa chiave riceve subito la risposta salvata, senza leggere il body (i
+file non vengono ricaricati). Un duplicato concorrente aspetta che la
+richiesta originale finisca e poi riceve la stessa risposta.
+
+Le risposte 5xx, 429 o con Retry-After (o un'eccezione) liberano la
+chiave: il retry rieseguirà la richiesta. Il middleware sta fuori
+dall'ammissione, così i replay non entrano in coda; i 429 dell'ammissione
+hanno Retry-After e quindi non vengono mai salvati. La chiave è sempre
+legata all'utente del token, così due utenti non possono vedere l'uno la
+risposta dell'altro.
+"""
+from __future__ import annotations
+
+import asyncio
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Optional
+
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.database.idempotency_repo import IdempotencyStore
+from app.schemas.idempotency import IdempotencyRecord
+
+HEADER = "idempotency-key"
+REPLAYED_HEADER = b"idempotent-replayed"
+MAX_KEY_LENGTH = 255
+
+def _storable(status: int, headers: list[list[str]]) -> bool:
+    """
+    Solo esiti definitivi: 429 e risposte con Retry-After (coda piena
+    dell'ammissione, 503 temporanei) chiedono esplicitamente un nuovo
+    tentativo, che deve rieseguire la richiesta.
+    """
+    if status == 429:
+        return False
+    return not any(k.lower() == "retry-after" for k, _ in headers)
+
+class IdempotencyMiddleware:
+    def __init__(
+        self,
+        app: ASGIApp,
+        *,
+        identify: Callable[[Scope], Optional[str]],
+        ttl_seconds: int,
+        pending_ttl_seconds: int,
+        wait_seconds: float,
+        max_body_bytes: int,
+        poll_interval: float = 0.2,
+        store: Optional[IdempotencyStore] = None,
+        prefix: str = "/api/v1",
+    ):
+        self.app = app
+        self.identify = identify
+        self.ttl = timedelta(seconds=ttl_seconds)
+        self.pending_ttl = timedelta(seconds=pending_ttl_seconds)
+        self.wait_seconds = wait_seconds
+        self.max_body_bytes = max_body_bytes
+        self.poll_interval = poll_interval
+        self.store = store
+        self._route = re.compile(rf"^{re.escape(prefix)}/submissions/?$")
+        # richieste in corso su questo worker: i duplicati locali non fanno polling
+        self._inflight: dict[str, asyncio.Event] = {}
+
+    def _store(self, scope: Scope) -> Optional[IdempotencyStore]:
+        if self.store is not None:
+            return self.store
+        # lo store nasce nel lifespan, dopo la costruzione del middleware
+        state = getattr(scope.get("app"), "state", None)
+        return getattr(state, "idempotency_store", None)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] != "POST" or not self._route.match(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+
+        headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope.get("headers", [])}
+        key = headers.get(HEADER)
+        store = self._store(scope)
+        if not key or store is None:
+            await self.app(scope, receive, send)
+            return
+        if len(key) > MAX_KEY_LENGTH:
+            await self._error(scope, receive, send, 400, "Idempotency-Key too long")
+            return
+
+        user_id = self.identify(scope)
+        if user_id is None:
+            # token mancante o non valido: ci pensa l'autenticazione a rispondere 401
+            await self.app(scope, receive, send)
+            return
+
+        scoped = f"{user_id}:{key}"
+        fingerprint = f"{scope['method']} {scope['path'].rstrip('/')}"
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.wait_seconds
+
+        while True:
+            existing = await store.claim(
+                scoped, fingerprint=fingerprint, expires_at=datetime.now(timezone.utc) + self.pending_ttl
+            )
+            if existing is None:
+                await self._execute(store, scoped, scope, receive, send)
+                return
+            if existing.fingerprint != fingerprint:
+                await self._error(scope, receive, send, 422, "Idempotency-Key already used for a different request")
+                return
+            if existing.status != "completed":
+                existing = await self._wait(store, scoped, deadline)
+            if existing is not None:
+                await self._replay(existing, send)
+                return
+            if loop.time() >= deadline:
+                await self._error(
+                    scope, receive, send, 409, "A request with this Idempotency-Key is still in progress",
+                    retry_after=1,
+                )
+                return
+            # l'originale è fallita e ha liberato la chiave: provo a prenotarla io
+
+    async def _wait(self, store: IdempotencyStore, key: str, deadline: float) -> Optional[IdempotencyRecord]:
+        """Aspetta la fine della richiesta originale: record completato, oppure None se liberato/scaduto."""
+        loop = asyncio.get_running_loop()
+        while (remaining := deadline - loop.time()) > 0:
+            event = self._inflight.get(key)
+            if event is not None:
+                try:
+                    await asyncio.wait_for(event.wait(), remaining)
+                except asyncio.TimeoutError:
+                    return None
+            else:
+                # originale su un altro worker
+                await asyncio.sleep(min(self.poll_interval, remaining))
+            record = await store.find(key)
+            if record is None:
+                return None
+            if record.status == "completed":
+                return record
+        return None
+
+    async def _execute(self, store: IdempotencyStore, key: str, scope: Scope, receive: Receive, send: Send) -> None:
+        event = asyncio.Event()
+        self._inflight[key] = event
+        status: Optional[int] = None
+        response_headers: list[list[str]] = []
+        body = bytearray()
+        overflow = False
+
+        async def capture(message: Message) -> None:
+            nonlocal status, response_headers, overflow
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                response_headers = [
+                    [k.decode("latin-1"), v.decode("latin-1")] for k, v in message.get("headers", [])
+                ]
+            elif message["type"] == "http.response.body" and not overflow:
+                body.extend(message.get("body", b""))
+                if len(body) > self.max_body_bytes:
+                    overflow = True
+                    body.clear()
+            await send(message)
+
+        try:
+            try:
+                await self.app(scope, receive, capture)
+            except BaseException:
+                await asyncio.shield(store.release(key))
+                raise
+            if status is None or status >= 500 or overflow or not _storable(status, response_headers):
+                await store.release(key)
+            else:
+                await store.complete(
+                    key,
+                    status=status,
+                    headers=response_headers,
+                    body=bytes(body),
+                    expires_at=datetime.now(timezone.utc) + self.ttl,
+                )
+        finally:
+            self._inflight.pop(key, None)
+            event.set()
+
+    async def _replay(self, record: IdempotencyRecord, send: Send) -> None:
+        # il body della richiesta non viene letto
+        headers = [(k.encode("latin-1"), v.encode("latin-1")) for k, v in record.responseHeaders]
+        headers.append((REPLAYED_HEADER, b"true"))
+        await send({"type": "http.response.start", "status": record.responseStatus, "headers": headers})
+        await send({"type": "http.response.body", "body": record.responseBody or b""})
+
+    async def _error(
+        self, scope: Scope, receive: Receive, send: Send, status: int, detail: str, retry_after: Optional[int] = None
+    ) -> None:
+        headers = {"Retry-After": str(retry_after)} if retry_after is not None else None
+        response = JSONResponse(status_code=status, content={"detail": detail}, headers=headers)
+        await response(scope, receive, send)
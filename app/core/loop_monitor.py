@@ -0,0 +1,152 @@
+# app/core/loop_monitor.py
+"""
+Monitor dell'event loop del worker.
+
+- Campionatore del lag: un task dorme `interval` secondi e misura di quanto
+  si sveglia in ritardo; gli ultimi `window` campioni danno i percentili
+  (p50/p90/p99/max) esposti da GET /submissions/health/stats.
+- Watchdog (opzionale, `watchdog_ms` > 0): un thread controlla che il
+  campionatore si svegli in tempo; se il loop resta fermo oltre la soglia
+  cattura lo stack del thread del loop, cioè del passo di coroutine che lo
+  sta bloccando (hash di chunk grandi, validazione di liste enormi, ...),
+  lo logga una volta per blocco e conta i punti caldi per funzione.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# i frame del codice del servizio hanno la precedenza nel riassunto del punto caldo
+_APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_MAX_STACK_FRAMES = 30
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, max(0, round(q * (len(sorted_values) - 1))))
+    return sorted_values[idx]
+
+def hotspot(frames: traceback.StackSummary) -> str:
+    """Il frame più interno del servizio (o il più interno in assoluto), es. "app/x.py:12 fn"."""
+    chosen = None
+    for f in reversed(frames):
+        if f.filename.startswith(_APP_DIR):
+            chosen = f
+            break
+    chosen = chosen or (frames[-1] if frames else None)
+    if chosen is None:
+        return "?"
+    name = os.path.relpath(chosen.filename, os.path.dirname(_APP_DIR)) if chosen.filename.startswith(_APP_DIR) else chosen.filename
+    return f"{name}:{chosen.lineno} {chosen.name}"
+
+class LoopMonitor:
+    def __init__(
+        self,
+        *,
+        interval: float = 0.25,
+        window: int = 2000,
+        watchdog_ms: float = 0.0,
+        max_hotspots: int = 100,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.watchdog = watchdog_ms / 1000
+        # il campionatore deve svegliarsi più spesso della soglia del watchdog
+        self.interval = min(interval, self.watchdog / 2) if self.watchdog > 0 else interval
+        self.max_hotspots = max_hotspots
+        self.clock = clock
+        self.samples: deque[float] = deque(maxlen=window)
+        self.blocked = 0
+        self.hotspots: Counter[str] = Counter()
+
+        self._expected = 0.0          # quando il campionatore dovrebbe svegliarsi
+        self._reported = 0.0          # ultimo risveglio atteso già segnalato
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._loop_thread_id: Optional[int] = None
+
+    # -------------------------
+    # Campionatore del lag
+    # -------------------------
+    async def _sample_loop(self) -> None:
+        while True:
+            self._expected = self.clock() + self.interval
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, self.clock() - self._expected) * 1000)
+
+    # -------------------------
+    # Watchdog
+    # -------------------------
+    def _watch(self) -> None:
+        check = self.watchdog / 4
+        while not self._stop.wait(check):
+            expected = self._expected
+            if expected == self._reported or self.clock() - expected < self.watchdog:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            self._reported = expected
+            self.record_block(traceback.extract_stack(frame, limit=_MAX_STACK_FRAMES), (self.clock() - expected) * 1000)
+
+    def record_block(self, frames: traceback.StackSummary, blocked_ms: float) -> str:
+        spot = hotspot(frames)
+        self.blocked += 1
+        if spot in self.hotspots or len(self.hotspots) < self.max_hotspots:
+            self.hotspots[spot] += 1
+        logger.warning(
+            "Event loop bloccato da %.0fms in %s\n%s", blocked_ms, spot, "".join(frames.format()).rstrip(),
+        )
+        return spot
+
+    # -------------------------
+    # Ciclo di vita (start dentro il loop da monitorare)
+    # -------------------------
+    def start(self) -> None:
+        if self._task is not None:
+            return
+        self._expected = self._reported = self.clock() + self.interval
+        self._task = asyncio.get_running_loop().create_task(self._sample_loop())
+        if self.watchdog > 0:
+            self._loop_thread_id = threading.get_ident()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+            self._thread.start()
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+            self._thread = None
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self, *, top: int = 10) -> dict[str, Any]:
+        values = sorted(self.samples)
+        lag = {
+            "samples": len(values),
+            "p50Ms": round(percentile(values, 0.50), 3),
+            "p90Ms": round(percentile(values, 0.90), 3),
+            "p99Ms": round(percentile(values, 0.99), 3),
+            "maxMs": round(values[-1], 3) if values else 0.0,
+        }
+        out: dict[str, Any] = {"intervalMs": round(self.interval * 1000, 3), "lag": lag}
+        if self.watchdog > 0:
+            out["watchdogMs"] = round(self.watchdog * 1000, 3)
+            out["blocked"] = self.blocked
+            out["hotspots"] = dict(self.hotspots.most_common(top))
+        return out
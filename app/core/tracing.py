@@ -0,0 +1,218 @@
+# app/core/tracing.py
+"""
+Tracing compatibile OpenTelemetry.
+
+Ogni livello (router, AuthService, submissionService, repository, storage,
+publisher) apre uno span con `@traced`; il contesto passa nei messaggi AMQP
+tramite gli header W3C (`traceparent`). Senza `setup_tracing` il tracer è
+quello no-op dell'API OpenTelemetry, quindi gli span non costano quasi
+nulla.
+
+Exporter:
+- "file": una riga JSON per span, nessun collector esterno richiesto
+- "otlp": OTLP/HTTP (serve opentelemetry-exporter-otlp-proto-http)
+- "console": stdout, utile in sviluppo
+"""
+from __future__ import annotations
+
+import functools
+import inspect
+import logging
+import os
+import threading
+from typing import Any, Callable, Optional, Sequence
+
+from opentelemetry import context as otel_context, propagate, trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import (
+    BatchSpanProcessor, ConsoleSpanExporter, SpanExporter, SpanExportResult,
+)
+from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+from opentelemetry.trace import Span, SpanKind, Status, StatusCode
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+TRACER_NAME = "submission-service"
+
+tracer = trace.get_tracer(TRACER_NAME)
+
+# -------------------------
+# Decoratore
+# -------------------------
+def traced(
+    name: Optional[str] = None,
+    *,
+    kind: SpanKind = SpanKind.INTERNAL,
+    attributes: Optional[dict[str, Any]] = None,
+) -> Callable:
+    """Apre uno span attorno a funzioni, coroutine e generatori asincroni (default: __qualname__)."""
+
+    def decorator(fn: Callable) -> Callable:
+        span_name = name or fn.__qualname__
+
+        if inspect.isasyncgenfunction(fn):
+            @functools.wraps(fn)
+            async def agen_wrapper(*args, **kwargs):
+                # lo span è corrente solo dentro ogni passo del generatore: tra un
+                # chunk e l'altro il consumer resta nel proprio contesto
+                span = tracer.start_span(span_name, kind=kind, attributes=attributes)
+                ctx = trace.set_span_in_context(span)
+                agen = fn(*args, **kwargs)
+                try:
+                    while True:
+                        token = otel_context.attach(ctx)
+                        try:
+                            item = await agen.__anext__()
+                        except StopAsyncIteration:
+                            break
+                        finally:
+                            otel_context.detach(token)
+                        yield item
+                except Exception as e:
+                    span.record_exception(e)
+                    span.set_status(Status(StatusCode.ERROR, f"{type(e).__name__}: {e}"))
+                    raise
+                finally:
+                    # client disconnesso: chiude subito il generatore interno (e le sue risorse)
+                    token = otel_context.attach(ctx)
+                    try:
+                        await agen.aclose()
+                    finally:
+                        otel_context.detach(token)
+                        span.end()
+            return agen_wrapper
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with tracer.start_as_current_span(span_name, kind=kind, attributes=attributes):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def sync_wrapper(*args, **kwargs):
+            with tracer.start_as_current_span(span_name, kind=kind, attributes=attributes):
+                return fn(*args, **kwargs)
+        return sync_wrapper
+
+    return decorator
+
+def set_attributes(**attrs: Any) -> None:
+    """Aggiunge attributi allo span corrente (None ignorati)."""
+    span = trace.get_current_span()
+    if span.is_recording():
+        span.set_attributes({k: v for k, v in attrs.items() if v is not None})
+
+# -------------------------
+# Propagazione
+# -------------------------
+def inject_headers(headers: dict[str, Any]) -> dict[str, Any]:
+    """Aggiunge traceparent/tracestate agli header (es. messaggi AMQP)."""
+    propagate.inject(headers)
+    return headers
+
+def extract_context(headers: dict[str, Any]):
+    return propagate.extract(headers)
+
+# -------------------------
+# Middleware ASGI
+# -------------------------
+class TracingMiddleware:
+    """Span SERVER per ogni richiesta HTTP, figlio dell'eventuale traceparent del client."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        carrier = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope.get("headers", [])}
+        method = scope["method"]
+        with tracer.start_as_current_span(
+            f"{method} {scope['path']}",
+            kind=SpanKind.SERVER,
+            context=extract_context(carrier),
+            attributes={"http.request.method": method, "url.path": scope["path"]},
+        ) as span:
+            async def send_wrapper(message: Message) -> None:
+                if message["type"] == "http.response.start":
+                    _set_status(span, message["status"])
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                # nome a bassa cardinalità: il template della route, se noto
+                route = getattr(scope.get("route"), "path", None)
+                if route:
+                    span.update_name(f"{method} {route}")
+                    span.set_attribute("http.route", route)
+
+def _set_status(span: Span, status: int) -> None:
+    span.set_attribute("http.response.status_code", status)
+    if status >= 500:
+        span.set_status(Status(StatusCode.ERROR))
+
+# -------------------------
+# Setup
+# -------------------------
+def setup_tracing(
+    *,
+    service_name: str,
+    sample_rate: float,
+    exporter: str = "file",
+    file_path: str = "traces.jsonl",
+    otlp_endpoint: Optional[str] = None,
+) -> TracerProvider:
+    """Installa il TracerProvider globale; ritorna il provider (da chiudere allo shutdown)."""
+    provider = TracerProvider(
+        resource=Resource.create({"service.name": service_name}),
+        # rispetta la decisione del chiamante; per le radici campiona sample_rate
+        sampler=ParentBased(TraceIdRatioBased(sample_rate)),
+    )
+
+    span_exporter: Any
+    if exporter == "otlp":
+        try:
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        except ImportError:
+            logger.warning("opentelemetry-exporter-otlp-proto-http non installato, uso l'exporter su file")
+            span_exporter = FileSpanExporter(file_path)
+        else:
+            span_exporter = OTLPSpanExporter(endpoint=otlp_endpoint) if otlp_endpoint else OTLPSpanExporter()
+    elif exporter == "console":
+        span_exporter = ConsoleSpanExporter()
+    else:
+        span_exporter = FileSpanExporter(file_path)
+
+    provider.add_span_processor(BatchSpanProcessor(span_exporter))
+    trace.set_tracer_provider(provider)
+    return provider
+
+
+class FileSpanExporter(SpanExporter):
+    """Scrive gli span come JSON, uno per riga (chiamato dal thread del BatchSpanProcessor)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def export(self, spans: Sequence[Any]) -> SpanExportResult:
+        lines = "".join(span.to_json(indent=None) + "\n" for span in spans)
+        try:
+            with self._lock, open(self.path, "a", encoding="utf-8") as f:
+                f.write(lines)
+        except OSError as exc:
+            logger.warning("Export degli span su %s fallito: %s", self.path, exc)
+            return SpanExportResult.FAILURE
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self) -> None:
+        pass
@@ -0,0 +1,137 @@
+# app/database/archive_storage.py
+from __future__ import annotations
+
+from typing import Any, AsyncIterator, Optional, Sequence
+
+from app.database.base import BinaryStorage, ChunkedBinaryStorage
+from app.database.sharding import LEGACY_SHARD, split_file_id
+from app.schemas.file import StoredFile, FileInfo
+
+ARCHIVE_SHARD = "archive"
+
+class ArchiveStorage(ChunkedBinaryStorage):
+    """
+    Storage dell'app con l'archivio a freddo dietro (vedi app/jobs/archive_submissions.py).
+
+    I file archiviati hanno id `archive.<oid>` (URI `gridfs://archive/<oid>`) e
+    vengono letti direttamente dal bucket freddo. Un id "caldo" che non esiste
+    più (es. un link di download salvato prima dell'archiviazione) viene
+    cercato anche nel bucket freddo con lo stesso oid: più lento, ma funziona.
+    Upload e upload ripristinabili vanno sempre sullo storage caldo.
+    """
+
+    def __init__(self, hot: BinaryStorage, cold: BinaryStorage, *, legacy_shard: str = LEGACY_SHARD):
+        self.hot = hot
+        self.cold = cold
+        self.legacy_shard = legacy_shard
+        self.chunk_size = getattr(hot, "chunk_size", 0)
+
+    def _cold_oid(self, file_id: str) -> Optional[str]:
+        """oid nel bucket freddo se l'id è già un id d'archivio, altrimenti None."""
+        shard, oid = split_file_id(file_id, self.legacy_shard)
+        return oid if shard == ARCHIVE_SHARD else None
+
+    def _fallback_oid(self, file_id: str) -> str:
+        return split_file_id(file_id, self.legacy_shard)[1]
+
+    # -------------------------
+    # BinaryStorage
+    # -------------------------
+    async def upload(
+        self,
+        *,
+        filename: str,
+        content_type: Optional[str],
+        data: AsyncIterator[bytes],
+        metadata: Optional[dict[str, Any]] = None,
+        file_id: Optional[str] = None,
+    ) -> StoredFile:
+        if file_id is not None:
+            return await self._chunked().upload(
+                filename=filename, content_type=content_type, data=data, metadata=metadata, file_id=file_id,
+            )
+        return await self.hot.upload(filename=filename, content_type=content_type, data=data, metadata=metadata)
+
+    async def stream(self, file_id: str) -> AsyncIterator[bytes]:
+        oid = self._cold_oid(file_id)
+        if oid is not None:
+            async for chunk in self.cold.stream(oid):
+                yield chunk
+            return
+
+        hot = self.hot.stream(file_id)
+        try:
+            try:
+                first = await hot.__anext__()
+            except StopAsyncIteration:
+                return
+            except Exception:
+                # file non (più) sullo storage caldo: riprovo sull'archivio
+                oid = self._fallback_oid(file_id)
+                if await self.cold.info(oid) is None:
+                    raise
+            else:
+                yield first
+                async for chunk in hot:
+                    yield chunk
+                return
+        finally:
+            await hot.aclose()
+
+        async for chunk in self.cold.stream(oid):
+            yield chunk
+
+    async def info(self, file_id: str) -> Optional[FileInfo]:
+        oid = self._cold_oid(file_id)
+        if oid is None:
+            info = await self.hot.info(file_id)
+            if info is not None:
+                return info
+            oid = self._fallback_oid(file_id)
+        info = await self.cold.info(oid)
+        return info.model_copy(update={"file_id": file_id}) if info else None
+
+    async def delete(self, file_id: str) -> bool:
+        oid = self._cold_oid(file_id)
+        if oid is not None:
+            return await self.cold.delete(oid)
+        return await self.hot.delete(file_id)
+
+    # -------------------------
+    # ChunkedBinaryStorage (solo storage caldo)
+    # -------------------------
+    def _chunked(self) -> ChunkedBinaryStorage:
+        if not isinstance(self.hot, ChunkedBinaryStorage):
+            raise ValueError("Hot storage does not support chunked uploads")
+        return self.hot
+
+    def new_file_id(self) -> str:
+        return self._chunked().new_file_id()
+
+    async def write_chunks(self, file_id: str, chunks: Sequence[tuple[int, bytes]]) -> None:
+        await self._chunked().write_chunks(file_id, chunks)
+
+    async def finalize_chunks(
+        self,
+        file_id: str,
+        *,
+        filename: str,
+        content_type: Optional[str],
+        length: int,
+        metadata: Optional[dict[str, Any]] = None,
+    ) -> StoredFile:
+        return await self._chunked().finalize_chunks(
+            file_id, filename=filename, content_type=content_type, length=length, metadata=metadata,
+        )
+
+    async def discard_chunks(self, file_id: str) -> None:
+        await self._chunked().discard_chunks(file_id)
+
+    async def unfinalize_chunks(self, file_id: str) -> None:
+        await self._chunked().unfinalize_chunks(file_id)
+
+    async def ensure_indexes(self):
+        for storage in (self.hot, self.cold):
+            ensure = getattr(storage, "ensure_indexes", None)
+            if ensure is not None:
+                await ensure()
@@ -1,7 +1,7 @@
 # app/storage/base.py
 from __future__ import annotations
 from abc import ABC, abstractmethod
-from typing import AsyncIterator, Optional, Any
+from typing import AsyncIterator, Optional, Any, Sequence
 
 from app.schemas.file import StoredFile, FileInfo
 
@@ -34,3 +34,69 @@ class BinaryStorage(ABC):
     async def info(self, file_id: str) -> Optional[FileInfo]:  
         """Ritorna i metadati di un file per id."""
         raise NotImplementedError
+
+
+class ChunkedBinaryStorage(BinaryStorage):
+    """
+    Storage binario che accetta anche upload ripristinabili: i dati arrivano
+    a chunk di dimensione fissa indirizzati per indice (anche fuori ordine),
+    e il file diventa visibile solo dopo finalize_chunks.
+    """
+
+    chunk_size: int
+
+    @abstractmethod
+    async def upload(
+        self,
+        *,
+        filename: str,
+        content_type: Optional[str],
+        data: AsyncIterator[bytes],
+        metadata: Optional[dict[str, Any]] = None,
+        file_id: Optional[str] = None,
+    ) -> StoredFile:
+        """
+        Come BinaryStorage.upload; `file_id`, se passato, è un id ottenuto da
+        new_file_id e diventa l'id del file invece di generarne uno nuovo.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def new_file_id(self) -> str:
+        """Genera l'id del file che verrà composto dai chunk."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def write_chunks(self, file_id: str, chunks: Sequence[tuple[int, bytes]]) -> None:
+        """Scrive (o riscrive) i chunk (indice, dati) di un file non ancora finalizzato."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def finalize_chunks(
+        self,
+        file_id: str,
+        *,
+        filename: str,
+        content_type: Optional[str],
+        length: int,
+        metadata: Optional[dict[str, Any]] = None,
+    ) -> StoredFile:
+        """
+        Verifica i chunk scritti e rende il file visibile, ritornando i
+        metadati persistiti. Idempotente: su un file già finalizzato con la
+        stessa lunghezza ritorna gli stessi metadati.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def discard_chunks(self, file_id: str) -> None:
+        """Elimina i chunk di un file mai finalizzato."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def unfinalize_chunks(self, file_id: str) -> None:
+        """
+        Annulla finalize_chunks: il file non è più visibile ma i chunk restano,
+        così la finalizzazione si può ripetere.
+        """
+        raise NotImplementedError
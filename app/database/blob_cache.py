@@ -0,0 +1,236 @@
+# app/database/blob_cache.py
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Callable, Optional, Sequence
+
+from app.core.tracing import set_attributes
+from app.database.base import BinaryStorage, ChunkedBinaryStorage
+from app.schemas.file import StoredFile, FileInfo
+
+@dataclass(slots=True)
+class _Entry:
+    data: bytes
+    expires: float
+
+@dataclass(slots=True)
+class _InfoEntry:
+    info: FileInfo
+    expires: float
+
+class CachingStorage(ChunkedBinaryStorage):
+    """
+    Cache in memoria (per worker) dei file piccoli e medi, davanti allo storage.
+
+    I blob sono immutabili (un id = sempre gli stessi byte), quindi la cache
+    non va invalidata se non alla cancellazione; il TTL limita per quanto un
+    altro worker può ancora servire un file cancellato. Eviction LRU a byte:
+    in cache al più `max_bytes`, e solo file fino a `max_object_bytes`.
+
+    Più download contemporanei dello stesso file non in cache fanno una sola
+    lettura dallo storage (single flight); i file più grandi passano in
+    streaming senza toccare la cache. Anche i FileInfo restano in cache, così
+    un download ripetuto (info + stream) non arriva a Mongo.
+
+    Ogni delete incrementa `_generation`: una lettura partita prima non
+    rimette in cache byte o FileInfo del file appena cancellato (le
+    cancellazioni sono rare, saltare la cache di qualche lettura concorrente
+    non costa nulla).
+    """
+
+    def __init__(
+        self,
+        inner: BinaryStorage,
+        *,
+        max_bytes: int,
+        max_object_bytes: int,
+        ttl_seconds: float = 600.0,
+        read_chunk: int = 1024 * 1024,
+        max_infos: int = 10000,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.inner = inner
+        self.max_bytes = max_bytes
+        self.max_object_bytes = min(max_object_bytes, max_bytes)
+        self.ttl = ttl_seconds
+        self.read_chunk = read_chunk
+        self.max_infos = max_infos
+        self.clock = clock
+        self.chunk_size = getattr(inner, "chunk_size", 0)
+
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._infos: OrderedDict[str, _InfoEntry] = OrderedDict()
+        self._inflight: dict[str, asyncio.Future] = {}
+        self._generation = 0
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    # -------------------------
+    # Cache
+    # -------------------------
+    def _get(self, file_id: str) -> Optional[bytes]:
+        entry = self._entries.get(file_id)
+        if entry is None:
+            return None
+        if entry.expires <= self.clock():
+            self._drop(file_id)
+            return None
+        self._entries.move_to_end(file_id)
+        return entry.data
+
+    def _put(self, file_id: str, data: bytes) -> None:
+        if len(data) > self.max_object_bytes:
+            return
+        self._drop(file_id)
+        while self._entries and self.size + len(data) > self.max_bytes:
+            _, old = self._entries.popitem(last=False)
+            self.size -= len(old.data)
+        self._entries[file_id] = _Entry(data, self.clock() + self.ttl)
+        self.size += len(data)
+
+    def _drop(self, file_id: str) -> None:
+        entry = self._entries.pop(file_id, None)
+        if entry is not None:
+            self.size -= len(entry.data)
+
+    def _put_info(self, file_id: str, info: FileInfo) -> None:
+        self._infos[file_id] = _InfoEntry(info, self.clock() + self.ttl)
+        self._infos.move_to_end(file_id)
+        while len(self._infos) > self.max_infos:
+            self._infos.popitem(last=False)
+
+    def _get_info(self, file_id: str) -> Optional[FileInfo]:
+        entry = self._infos.get(file_id)
+        if entry is None or entry.expires <= self.clock():
+            self._infos.pop(file_id, None)
+            return None
+        self._infos.move_to_end(file_id)
+        return entry.info
+
+    async def _fetch(self, file_id: str) -> bytes:
+        generation = self._generation
+        data = b"".join([chunk async for chunk in self.inner.stream(file_id)])
+        if generation == self._generation:
+            self._put(file_id, data)
+        return data
+
+    async def _load(self, file_id: str) -> bytes:
+        task = self._inflight.get(file_id)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(file_id))
+            self._inflight[file_id] = task
+
+            def _done(t: asyncio.Future) -> None:
+                if self._inflight.get(file_id) is t:
+                    del self._inflight[file_id]
+                if not t.cancelled():
+                    t.exception()  # letta anche se tutti i client se ne sono andati
+            task.add_done_callback(_done)
+        # shield: un client che chiude la connessione non annulla la lettura degli altri
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict[str, int]:
+        return {"entries": len(self._entries), "bytes": self.size, "hits": self.hits, "misses": self.misses}
+
+    # -------------------------
+    # BinaryStorage
+    # -------------------------
+    async def upload(
+        self,
+        *,
+        filename: str,
+        content_type: Optional[str],
+        data: AsyncIterator[bytes],
+        metadata: Optional[dict[str, Any]] = None,
+        file_id: Optional[str] = None,
+    ) -> StoredFile:
+        if file_id is not None:
+            return await self._chunked().upload(
+                filename=filename, content_type=content_type, data=data, metadata=metadata, file_id=file_id,
+            )
+        return await self.inner.upload(filename=filename, content_type=content_type, data=data, metadata=metadata)
+
+    async def stream(self, file_id: str) -> AsyncIterator[bytes]:
+        data = self._get(file_id)
+        set_attributes(**{"cache.hit": data is not None})
+        if data is None:
+            self.misses += 1
+            info = await self.info(file_id)
+            if info is None or info.size is None or info.size > self.max_object_bytes:
+                async for chunk in self.inner.stream(file_id):
+                    yield chunk
+                return
+            data = await self._load(file_id)
+        else:
+            self.hits += 1
+        for start in range(0, len(data), self.read_chunk):
+            yield data[start:start + self.read_chunk]
+
+    async def info(self, file_id: str) -> Optional[FileInfo]:
+        info = self._get_info(file_id)
+        if info is None:
+            generation = self._generation
+            info = await self.inner.info(file_id)
+            if info is not None and generation == self._generation:
+                self._put_info(file_id, info)
+        return info
+
+    async def delete(self, file_id: str) -> bool:
+        self._generation += 1
+        self._drop(file_id)
+        self._infos.pop(file_id, None)
+        # chi legge dopo la delete non si accoda a una lettura partita prima
+        self._inflight.pop(file_id, None)
+        try:
+            return await self.inner.delete(file_id)
+        finally:
+            # letture partite durante la delete
+            self._generation += 1
+            self._drop(file_id)
+            self._infos.pop(file_id, None)
+
+    # -------------------------
+    # ChunkedBinaryStorage (file nuovi: niente da invalidare, salvo unfinalize)
+    # -------------------------
+    def _chunked(self) -> ChunkedBinaryStorage:
+        if not isinstance(self.inner, ChunkedBinaryStorage):
+            raise ValueError("Storage does not support chunked uploads")
+        return self.inner
+
+    def new_file_id(self) -> str:
+        return self._chunked().new_file_id()
+
+    async def write_chunks(self, file_id: str, chunks: Sequence[tuple[int, bytes]]) -> None:
+        await self._chunked().write_chunks(file_id, chunks)
+
+    async def finalize_chunks(
+        self,
+        file_id: str,
+        *,
+        filename: str,
+        content_type: Optional[str],
+        length: int,
+        metadata: Optional[dict[str, Any]] = None,
+    ) -> StoredFile:
+        return await self._chunked().finalize_chunks(
+            file_id, filename=filename, content_type=content_type, length=length, metadata=metadata,
+        )
+
+    async def discard_chunks(self, file_id: str) -> None:
+        await self._chunked().discard_chunks(file_id)
+
+    async def unfinalize_chunks(self, file_id: str) -> None:
+        # il file sparisce: come una delete per la cache
+        self._generation += 1
+        self._drop(file_id)
+        self._infos.pop(file_id, None)
+        await self._chunked().unfinalize_chunks(file_id)
+
+    async def ensure_indexes(self):
+        ensure = getattr(self.inner, "ensure_indexes", None)
+        if ensure is not None:
+            await ensure()
@@ -0,0 +1,67 @@
+# app/database/client.py
+from __future__ import annotations
+
+from typing import Any, Optional, Sequence
+from pymongo import AsyncMongoClient
+from pymongo.read_preferences import (
+    Primary, PrimaryPreferred, Secondary, SecondaryPreferred, Nearest,
+)
+
+from app.core.config import Settings
+
+_READ_PREFERENCES = {
+    "primary": Primary,
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+
+def mongo_client_kwargs(settings: Settings) -> dict[str, Any]:
+    """Opzioni del client Mongo (pool, compressione, timeout) lette dai Settings."""
+    kwargs: dict[str, Any] = {
+        "uuidRepresentation": "standard",
+        "maxPoolSize": settings.mongo_max_pool_size,
+        "minPoolSize": settings.mongo_min_pool_size,
+        "connectTimeoutMS": settings.mongo_connect_timeout_ms,
+        "serverSelectionTimeoutMS": settings.mongo_server_selection_timeout_ms,
+    }
+    if settings.mongo_socket_timeout_ms:
+        kwargs["socketTimeoutMS"] = settings.mongo_socket_timeout_ms
+    if settings.mongo_wait_queue_timeout_ms:
+        kwargs["waitQueueTimeoutMS"] = settings.mongo_wait_queue_timeout_ms
+    if settings.mongo_compressors:
+        # "zstd,snappy,zlib": il server sceglie il primo che supporta
+        kwargs["compressors"] = settings.mongo_compressors
+        if settings.mongo_zlib_compression_level is not None:
+            kwargs["zlibCompressionLevel"] = settings.mongo_zlib_compression_level
+    return kwargs
+
+def create_mongo_client(
+    settings: Settings,
+    uri: Optional[str] = None,
+    *,
+    event_listeners: Sequence[Any] = (),
+) -> AsyncMongoClient:
+    """
+    Client per mongo_uri, o per un altro cluster (es. shard dello storage) con
+    le stesse opzioni. `event_listeners` valgono solo per questo client.
+    """
+    kwargs = mongo_client_kwargs(settings)
+    if event_listeners:
+        kwargs["event_listeners"] = list(event_listeners)
+    return AsyncMongoClient(uri or settings.mongo_uri, **kwargs)
+
+def read_preference(settings: Settings) -> Optional[PrimaryPreferred | Secondary | SecondaryPreferred | Nearest]:
+    """
+    Read preference per i percorsi di sola lettura (liste, dettaglio, download).
+    None = primary, cioè nessuna opzione da applicare. Le scritture restano
+    sempre sul primary. maxStalenessSeconds, se impostato, deve essere >= 90.
+    """
+    mode = settings.mongo_read_preference
+    if mode not in _READ_PREFERENCES:
+        raise ValueError(f"mongo_read_preference non valida: {mode}")
+    if mode == "primary":
+        return None
+    staleness = settings.mongo_max_staleness_seconds
+    return _READ_PREFERENCES[mode](max_staleness=staleness if staleness > 0 else -1)
@@ -0,0 +1,27 @@
+# app/database/command_listener.py
+from __future__ import annotations
+
+from pymongo import monitoring
+
+from app.core.command_log import CommandLog
+
+class SlowCommandListener(monitoring.CommandListener):
+    """
+    Listener PyMongo che passa inizio e fine di ogni comando a CommandLog.
+    Passato al client principale (event_listeners), non registrato
+    globalmente: ogni create_app ha il suo e nessun evento è contato due
+    volte. Shard dello storage e archivio riusano i listener del client
+    principale.
+    """
+
+    def __init__(self, log: CommandLog):
+        self.log = log
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        self.log.started(event.request_id, event.connection_id, event.command_name, event.database_name, event.command)
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        self.log.finished(event.request_id, event.connection_id, event.command_name, event.duration_micros)
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        self.log.finished(event.request_id, event.connection_id, event.command_name, event.duration_micros, failed=True)
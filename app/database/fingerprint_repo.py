@@ -0,0 +1,37 @@
+from __future__ import annotations
+
+from abc import ABC, abstractmethod
+from typing import Sequence, Optional
+from app.schemas.similarity import Fingerprint
+
+class FingerprintRepo(ABC):
+    @abstractmethod
+    async def save(self, fingerprint: Fingerprint) -> None:
+        """Salva (o sostituisce) la firma di una submission."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def find_one(self, submission_id: str) -> Optional[Fingerprint]:
+        """Ritorna la firma di una submission, oppure None se non è (ancora) calcolata."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def find_candidates(
+        self,
+        assignment_id: str,
+        bands: Sequence[str],
+        *,
+        exclude: str,
+        exclude_student: Optional[str] = None,
+    ) -> Sequence[Fingerprint]:
+        """
+        Firme dello stesso assignment con almeno una chiave LSH in comune (via
+        indice, senza scansione); `exclude_student` esclude le altre versioni
+        dello stesso studente.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def delete(self, submission_id: str) -> bool:
+        """Elimina la firma di una submission."""
+        raise NotImplementedError
@@ -1,35 +1,100 @@
 # app/database/gridfs_storage.py
 from __future__ import annotations
 
+import asyncio
 import hashlib
-from typing import AsyncIterator, Optional, Any
-from bson import ObjectId
-from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+from datetime import datetime, timezone
+from typing import AsyncIterator, Optional, Any, Sequence
+from bson import ObjectId, Binary
+from gridfs import AsyncGridFSBucket
+from pymongo.asynchronous.database import AsyncDatabase
+from pymongo import ASCENDING, ReplaceOne
 
-from app.database.base import BinaryStorage
+from app.core.tracing import traced
+from app.database.base import ChunkedBinaryStorage
+from app.database.read_ahead import ReadAheadBudget, read_ahead
 from app.schemas.file import StoredFile, FileInfo
 
-class GridFSStorage(BinaryStorage):
+DEFAULT_CHUNK_SIZE = 255 * 1024
+
+DB_ATTRIBUTES = {"db.system": "mongodb", "db.collection.name": "uploads"}
+
+COPY_BATCH_CHUNKS = 16
+
+DEFAULT_UPLOAD_BATCH_CHUNKS = 8   # chunk per insert_many (~2MB)
+DEFAULT_UPLOAD_CONCURRENCY = 4    # insert_many in volo per upload
+
+class GridFSStorage(ChunkedBinaryStorage):
     """
-    Implementazione BinaryStorage basata su MongoDB GridFS (Motor 3.7.x / PyMongo 4.x).
+    Implementazione BinaryStorage basata su MongoDB GridFS (API async nativa di PyMongo 4.x,
+    senza il thread pool di Motor).
 
-    Regole API Motor:
-      - open_upload_stream(...)     -> NON è coroutine (ritorna subito GridIn)
-      - open_download_stream(...)   -> È coroutine (va await-ata, ritorna GridOut)
+    Regole API AsyncGridFSBucket:
+      - open_upload_stream(...)     -> NON è coroutine (ritorna subito AsyncGridIn)
+      - open_download_stream(...)   -> È coroutine (va await-ata, ritorna AsyncGridOut)
       - read/write/close            -> metodi async (vanno await-ati)
+
+    Gli upload ripristinabili (ChunkedBinaryStorage) scrivono direttamente
+    nelle collection <bucket>.chunks / <bucket>.files con lo stesso formato
+    GridFS: per questo serve anche il database e la chunk size del bucket.
+
+    `read_bucket` (opzionale) è lo stesso bucket su un database con read
+    preference verso i secondari: lo usano solo stream() e info().
+
+    Durante il download restano in memoria al più `read_ahead_chunks` chunk
+    da `read_chunk` (compresi quello in lettura e quello in invio; vedi
+    app/database/read_ahead.py), entro il budget condiviso `read_ahead_budget`.
+
+    Con `upload_concurrency` > 0 (e `db` configurato) upload() non passa da
+    GridIn, che inserisce un chunk alla volta: i chunk vengono raggruppati in
+    insert_many da `upload_batch_chunks` e fino a `upload_concurrency` batch
+    sono in volo insieme (vedi write_chunks_parallel). Il formato resta
+    GridFS standard.
     """
 
     def __init__(
         self,
         *,
-        bucket: AsyncIOMotorGridFSBucket,
+        bucket: AsyncGridFSBucket,
         bucket_name: str = "uploads",
         read_chunk: int = 1024 * 1024,
+        db: Optional[AsyncDatabase] = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        read_bucket: Optional[AsyncGridFSBucket] = None,
+        read_ahead_chunks: int = 0,
+        read_ahead_budget: Optional[ReadAheadBudget] = None,
+        upload_batch_chunks: int = DEFAULT_UPLOAD_BATCH_CHUNKS,
+        upload_concurrency: int = 0,
     ):
         self.bucket = bucket
+        self.read_bucket = read_bucket or bucket
         self.bucket_name = bucket_name
         self.read_chunk = read_chunk
+        self.db = db
+        self.chunk_size = chunk_size
+        self.read_ahead_chunks = read_ahead_chunks
+        self.read_ahead_budget = read_ahead_budget
+        self.upload_batch_chunks = upload_batch_chunks
+        self.upload_concurrency = upload_concurrency
 
+    def _collection(self, suffix: str):
+        if self.db is None:
+            raise RuntimeError("GridFSStorage: database non configurato per upload a chunk")
+        return self.db[f"{self.bucket_name}.{suffix}"]
+
+    async def ensure_indexes(self):
+        # Stessi indici che GridFS crea al primo upload: servono subito
+        # perché gli upload a chunk non passano da GridIn.
+        if self.db is None:
+            return
+        await self._collection("chunks").create_index(
+            [("files_id", ASCENDING), ("n", ASCENDING)], unique=True
+        )
+        await self._collection("files").create_index(
+            [("filename", ASCENDING), ("uploadDate", ASCENDING)]
+        )
+
+    @traced(attributes=DB_ATTRIBUTES)
     async def upload(
         self,
         *,
@@ -37,16 +102,45 @@ class GridFSStorage(BinaryStorage):
         content_type: Optional[str],
         data: AsyncIterator[bytes],
         metadata: Optional[dict[str, Any]] = None,
+        file_id: Optional[str] = None,
     ) -> StoredFile:
         """
         Carica un file in GridFS in streaming (no filesystem locale).
+        `file_id` (da new_file_id) serve a chi deve conoscere l'id prima dell'upload.
         """
         meta = dict(metadata or {})
         if content_type:
             meta.setdefault("contentType", content_type)
 
-        # open_upload_stream: NON async
-        grid_in = self.bucket.open_upload_stream(filename=filename, metadata=meta)
+        if self.db is not None and self.upload_concurrency > 0:
+            oid = ObjectId(file_id) if file_id is not None else ObjectId()
+            size, checksum = await write_chunks_parallel(
+                self._collection("chunks"), oid, data,
+                chunk_size=self.chunk_size,
+                batch_chunks=self.upload_batch_chunks,
+                concurrency=self.upload_concurrency,
+            )
+            try:
+                # documento files per ultimo: il file è visibile solo quando è completo
+                await self._collection("files").insert_one(self._files_doc(oid, filename, size, meta))
+            except BaseException:
+                await self._collection("chunks").delete_many({"files_id": oid})
+                raise
+            return StoredFile(
+                file_id=str(oid),
+                filename=filename,
+                size=size,
+                content_type=content_type,
+                checksum=checksum,
+                uri=f"gridfs://{self.bucket_name}/{oid}",
+                metadata=meta,
+            )
+
+        # open_upload_stream(_with_id): NON async
+        if file_id is not None:
+            grid_in = self.bucket.open_upload_stream_with_id(ObjectId(file_id), filename, metadata=meta)
+        else:
+            grid_in = self.bucket.open_upload_stream(filename=filename, metadata=meta)
 
         hasher = hashlib.sha256()
         size = 0
@@ -56,14 +150,7 @@ class GridFSStorage(BinaryStorage):
                 hasher.update(chunk)
                 await grid_in.write(chunk)  # async
         finally:
-            # close è async
-            res = grid_in.close()
-            # close() è awaitable nelle versioni attuali
-            try:
-                await res
-            except TypeError:
-                # fallback nel raro caso fosse sinc
-                pass
+            await grid_in.close()
 
         file_id = str(grid_in._id)
         return StoredFile(
@@ -76,33 +163,30 @@ class GridFSStorage(BinaryStorage):
             metadata=meta,
         )
 
+    @traced(attributes=DB_ATTRIBUTES)
     async def stream(self, file_id: str) -> AsyncIterator[bytes]:
         """
         Restituisce uno stream async del contenuto del file.
         """
         # open_download_stream: È async
-        s = await self.bucket.open_download_stream(ObjectId(file_id))
+        s = await self.read_bucket.open_download_stream(ObjectId(file_id))
+        # la prossima read parte mentre il chunk corrente viene inviato al client
+        chunks = read_ahead(s.read, self.read_chunk, depth=self.read_ahead_chunks, budget=self.read_ahead_budget)
         try:
-            while True:
-                chunk = await s.read(self.read_chunk)  # async
-                if not chunk:
-                    break
+            async for chunk in chunks:
                 yield chunk
         finally:
-            close = getattr(s, "close", None)
-            if callable(close):
-                res = close()
-                try:
-                    await res  # async
-                except TypeError:
-                    pass
+            # prima fermo il read-ahead (può avere una read in corso), poi chiudo lo stream
+            await chunks.aclose()
+            await s.close()
 
+    @traced(attributes=DB_ATTRIBUTES)
     async def info(self, file_id: str) -> Optional[FileInfo]:
         """
         Ritorna metadati base (filename, content_type, size) senza scaricare il file.
         """
         try:
-            s = await self.bucket.open_download_stream(ObjectId(file_id))
+            s = await self.read_bucket.open_download_stream(ObjectId(file_id))
         except Exception:
             return None
 
@@ -116,14 +200,9 @@ class GridFSStorage(BinaryStorage):
                 metadata=metadata,
             )
         finally:
-            close = getattr(s, "close", None)
-            if callable(close):
-                res = close()
-                try:
-                    await res
-                except TypeError:
-                    pass
+            await s.close()
 
+    @traced(attributes=DB_ATTRIBUTES)
     async def delete(self, file_id: str) -> bool:
         """
         Elimina un file da GridFS.
@@ -133,3 +212,192 @@ class GridFSStorage(BinaryStorage):
             return True
         except Exception:
             return False
+
+    # -------------------------
+    # Upload ripristinabili
+    # -------------------------
+    def new_file_id(self) -> str:
+        return str(ObjectId())
+
+    @traced(attributes=DB_ATTRIBUTES)
+    async def write_chunks(self, file_id: str, chunks: Sequence[tuple[int, bytes]]) -> None:
+        """
+        Scrive i chunk GridFS (files_id, n) in un'unica bulk write non ordinata.
+        L'upsert rende idempotente il re-invio dello stesso chunk.
+        """
+        if not chunks:
+            return
+        oid = ObjectId(file_id)
+        ops = [
+            ReplaceOne(
+                {"files_id": oid, "n": n},
+                {"files_id": oid, "n": n, "data": Binary(data)},
+                upsert=True,
+            )
+            for n, data in chunks
+        ]
+        await self._collection("chunks").bulk_write(ops, ordered=False)
+
+    @traced(attributes=DB_ATTRIBUTES)
+    async def finalize_chunks(
+        self,
+        file_id: str,
+        *,
+        filename: str,
+        content_type: Optional[str],
+        length: int,
+        metadata: Optional[dict[str, Any]] = None,
+    ) -> StoredFile:
+        """
+        Rilegge i chunk in ordine (checksum + verifica di continuità) e scrive
+        il documento files per ultimo, così i lettori non vedono mai file parziali.
+        Ripetibile: un documento files già scritto (finalizzazione interrotta
+        dopo l'insert) resta quello, purché la lunghezza coincida.
+        """
+        oid = ObjectId(file_id)
+        meta = dict(metadata or {})
+        if content_type:
+            meta.setdefault("contentType", content_type)
+
+        hasher = hashlib.sha256()
+        size = 0
+        expected = 0
+        cursor = self._collection("chunks").find({"files_id": oid}).sort("n", ASCENDING)
+        async for c in cursor:
+            if c["n"] != expected:
+                raise ValueError(f"Missing chunk {expected}")
+            data = bytes(c["data"])
+            hasher.update(data)
+            size += len(data)
+            expected += 1
+        if size != length:
+            raise ValueError(f"Upload length mismatch: expected {length}, got {size}")
+
+        doc = self._files_doc(oid, filename, size, meta)
+        del doc["_id"]
+        res = await self._collection("files").update_one({"_id": oid}, {"$setOnInsert": doc}, upsert=True)
+        if res.upserted_id is None:
+            existing = await self._collection("files").find_one({"_id": oid}, {"length": 1})
+            if existing is None or existing.get("length") != size:
+                raise ValueError(f"File {file_id} already finalized with a different length")
+        return StoredFile(
+            file_id=file_id,
+            filename=filename,
+            size=size,
+            content_type=content_type,
+            checksum=hasher.hexdigest(),
+            uri=f"gridfs://{self.bucket_name}/{file_id}",
+            metadata=meta,
+        )
+
+    def _files_doc(self, oid: ObjectId, filename: str, length: int, meta: dict[str, Any]) -> dict[str, Any]:
+        # stessi campi scritti da GridIn (PyMongo 4: niente md5)
+        return {
+            "_id": oid,
+            "length": length,
+            "chunkSize": self.chunk_size,
+            "uploadDate": datetime.now(timezone.utc),
+            "filename": filename,
+            "metadata": meta,
+        }
+
+    @traced(attributes=DB_ATTRIBUTES)
+    async def discard_chunks(self, file_id: str) -> None:
+        await self._collection("chunks").delete_many({"files_id": ObjectId(file_id)})
+
+    @traced(attributes=DB_ATTRIBUTES)
+    async def unfinalize_chunks(self, file_id: str) -> None:
+        await self._collection("files").delete_one({"_id": ObjectId(file_id)})
+
+
+def _raise_first(done: set[asyncio.Task]) -> None:
+    # legge tutte le eccezioni (niente "exception was never retrieved"), propaga la prima
+    errors = [t.exception() for t in done]
+    for e in errors:
+        if e is not None:
+            raise e
+
+async def write_chunks_parallel(
+    chunks_col,
+    oid: ObjectId,
+    data: AsyncIterator[bytes],
+    *,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    batch_chunks: int = DEFAULT_UPLOAD_BATCH_CHUNKS,
+    concurrency: int = DEFAULT_UPLOAD_CONCURRENCY,
+) -> tuple[int, str]:
+    """
+    Scrive lo stream `data` come chunk GridFS del file `oid` e ritorna
+    (dimensione, sha256). Il documento files lo scrive il chiamante, dopo.
+
+    I chunk (tutti di `chunk_size` byte tranne l'ultimo, come vuole GridFS)
+    vanno in insert_many non ordinate da `batch_chunks`; al più `concurrency`
+    batch sono in volo, quindi la memoria per upload resta sotto
+    (concurrency + 1) * batch_chunks * chunk_size. In caso di errore o
+    cancellazione i chunk già scritti vengono rimossi.
+    """
+    hasher = hashlib.sha256()
+    size = 0
+    n = 0
+    buf = bytearray()
+    batch: list[dict[str, Any]] = []
+    pending: set[asyncio.Task] = set()
+
+    async def submit(docs: list[dict[str, Any]]) -> None:
+        nonlocal pending
+        while len(pending) >= concurrency:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            _raise_first(done)
+        pending.add(asyncio.create_task(chunks_col.insert_many(docs, ordered=False)))
+
+    try:
+        async for piece in data:
+            size += len(piece)
+            hasher.update(piece)
+            buf += piece
+            if len(buf) < chunk_size:
+                continue
+            view = memoryview(buf)
+            full = len(buf) - len(buf) % chunk_size
+            for start in range(0, full, chunk_size):
+                batch.append({"files_id": oid, "n": n, "data": Binary(bytes(view[start:start + chunk_size]))})
+                n += 1
+                if len(batch) >= batch_chunks:
+                    await submit(batch)
+                    batch = []
+            view.release()
+            del buf[:full]
+        if buf:
+            batch.append({"files_id": oid, "n": n, "data": Binary(bytes(buf))})
+        if batch:
+            await submit(batch)
+        if pending:
+            done, pending = await asyncio.wait(pending)
+            _raise_first(done)
+    except BaseException:
+        for t in pending:
+            t.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        await chunks_col.delete_many({"files_id": oid})
+        raise
+    return size, hasher.hexdigest()
+
+async def copy_file(src: GridFSStorage, dst: GridFSStorage, files_doc: dict) -> None:
+    """
+    Copia un file tra due bucket GridFS mantenendo lo stesso _id: prima i
+    chunk, poi il documento files (il file è visibile solo quando è completo).
+    Idempotente: si può ripetere dopo un'interruzione.
+    """
+    file_id = files_doc["_id"]
+    batch: list[tuple[int, bytes]] = []
+    async for chunk in src._collection("chunks").find({"files_id": file_id}).sort("n", ASCENDING):
+        batch.append((chunk["n"], bytes(chunk["data"])))
+        if len(batch) >= COPY_BATCH_CHUNKS:
+            await dst.write_chunks(str(file_id), batch)
+            batch = []
+    if batch:
+        await dst.write_chunks(str(file_id), batch)
+    await dst._collection("files").replace_one({"_id": file_id}, files_doc, upsert=True)
+
+async def find_files_doc(storage: GridFSStorage, oid: str) -> Optional[dict]:
+    return await storage._collection("files").find_one({"_id": ObjectId(oid)})
@@ -0,0 +1,35 @@
+from __future__ import annotations
+
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Optional
+from app.schemas.idempotency import IdempotencyRecord
+
+class IdempotencyStore(ABC):
+    @abstractmethod
+    async def claim(self, key: str, *, fingerprint: str, expires_at: datetime) -> Optional[IdempotencyRecord]:
+        """Prenota la chiave (stato pending). Ritorna None se prenotata ora, altrimenti il record esistente."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def find(self, key: str) -> Optional[IdempotencyRecord]:
+        """Ritorna il record di una chiave, oppure None."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def complete(
+        self,
+        key: str,
+        *,
+        status: int,
+        headers: list[list[str]],
+        body: bytes,
+        expires_at: datetime,
+    ) -> None:
+        """Salva la risposta della richiesta originale."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def release(self, key: str) -> None:
+        """Libera la chiave (richiesta fallita: il retry deve poter ripartire)."""
+        raise NotImplementedError
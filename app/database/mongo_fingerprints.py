@@ -0,0 +1,69 @@
+# app/database/mongo_fingerprints.py
+from typing import Sequence, Optional
+from pymongo.asynchronous.database import AsyncDatabase
+
+from app.core.tracing import traced
+from app.database.fingerprint_repo import FingerprintRepo
+from app.schemas.similarity import Fingerprint
+
+DB_ATTRIBUTES = {"db.system": "mongodb", "db.collection.name": "submission_fingerprints"}
+
+class MongoFingerprintRepository(FingerprintRepo):
+    """
+    Una firma per submission (_id = submissionId). L'indice multikey
+    (assignmentId, bands) è l'indice LSH: ogni banda è una chiave e i
+    candidati si trovano con un $in sulle bande della submission.
+    Le firme delle versioni precedenti restano (servono a confrontare anche
+    la storia): chi cerca i candidati filtra per studente e ultima versione.
+    """
+
+    def __init__(self, db: AsyncDatabase):
+        self.col = db["submission_fingerprints"]
+
+    def _from_doc(self, d: dict) -> Fingerprint:
+        return Fingerprint(
+            submissionId=d["_id"],
+            assignmentId=d["assignmentId"],
+            studentId=d.get("studentId"),
+            signature=bytes(d["signature"]),
+            bands=d.get("bands", []),
+            shingles=d.get("shingles", 0),
+        )
+
+    @traced(attributes=DB_ATTRIBUTES)
+    async def save(self, fingerprint: Fingerprint) -> None:
+        doc = fingerprint.model_dump()
+        doc["_id"] = doc.pop("submissionId")
+        await self.col.replace_one({"_id": doc["_id"]}, doc, upsert=True)
+
+    @traced(attributes=DB_ATTRIBUTES)
+    async def find_one(self, submission_id: str) -> Optional[Fingerprint]:
+        d = await self.col.find_one({"_id": submission_id})
+        return self._from_doc(d) if d else None
+
+    @traced(attributes=DB_ATTRIBUTES)
+    async def find_candidates(
+        self,
+        assignment_id: str,
+        bands: Sequence[str],
+        *,
+        exclude: str,
+        exclude_student: Optional[str] = None,
+    ) -> Sequence[Fingerprint]:
+        query: dict = {
+            "assignmentId": assignment_id,
+            "bands": {"$in": list(bands)},
+            "_id": {"$ne": exclude},
+        }
+        if exclude_student is not None:
+            query["studentId"] = {"$ne": exclude_student}
+        cursor = self.col.find(query)
+        return [self._from_doc(d) async for d in cursor]
+
+    @traced(attributes=DB_ATTRIBUTES)
+    async def delete(self, submission_id: str) -> bool:
+        res = await self.col.delete_one({"_id": submission_id})
+        return res.deleted_count > 0
+
+    async def ensure_indexes(self):
+        await self.col.create_index([("assignmentId", 1), ("bands", 1)])
@@ -0,0 +1,79 @@
+# app/database/mongo_idempotency.py
+from datetime import datetime, timezone
+from typing import Optional
+from bson import Binary
+from pymongo.asynchronous.database import AsyncDatabase
+from pymongo.errors import DuplicateKeyError
+
+from app.database.idempotency_repo import IdempotencyStore
+from app.schemas.idempotency import IdempotencyRecord
+
+class MongoIdempotencyStore(IdempotencyStore):
+    def __init__(self, db: AsyncDatabase):
+        self.col = db["idempotency_keys"]
+
+    def _from_doc(self, d: dict) -> IdempotencyRecord:
+        body = d.get("responseBody")
+        return IdempotencyRecord(
+            key=d["_id"],
+            fingerprint=d.get("fingerprint", ""),
+            status=d["status"],
+            responseStatus=d.get("responseStatus"),
+            responseHeaders=d.get("responseHeaders", []),
+            responseBody=bytes(body) if body is not None else None,
+            expiresAt=d["expiresAt"],
+        )
+
+    async def claim(self, key: str, *, fingerprint: str, expires_at: datetime) -> Optional[IdempotencyRecord]:
+        doc = {"_id": key, "fingerprint": fingerprint, "status": "pending", "expiresAt": expires_at}
+        try:
+            await self.col.insert_one(doc)
+            return None
+        except DuplicateKeyError:
+            pass
+
+        # pending scaduto (worker morto a metà richiesta): il monitor TTL
+        # passa ogni ~60s, quindi lo riprendo senza aspettarlo
+        taken = await self.col.find_one_and_replace(
+            {"_id": key, "status": "pending", "expiresAt": {"$lt": datetime.now(timezone.utc)}},
+            doc,
+        )
+        if taken is not None:
+            return None
+
+        existing = await self.find(key)
+        if existing is None:
+            # rilasciata nel frattempo: riprovo
+            return await self.claim(key, fingerprint=fingerprint, expires_at=expires_at)
+        return existing
+
+    async def find(self, key: str) -> Optional[IdempotencyRecord]:
+        d = await self.col.find_one({"_id": key})
+        return self._from_doc(d) if d else None
+
+    async def complete(
+        self,
+        key: str,
+        *,
+        status: int,
+        headers: list[list[str]],
+        body: bytes,
+        expires_at: datetime,
+    ) -> None:
+        await self.col.update_one(
+            {"_id": key},
+            {"$set": {
+                "status": "completed",
+                "responseStatus": status,
+                "responseHeaders": headers,
+                "responseBody": Binary(body),
+                "expiresAt": expires_at,
+            }},
+        )
+
+    async def release(self, key: str) -> None:
+        await self.col.delete_one({"_id": key, "status": "pending"})
+
+    async def ensure_indexes(self):
+        # TTL: Mongo elimina da solo le chiavi scadute
+        await self.col.create_index("expiresAt", expireAfterSeconds=0)
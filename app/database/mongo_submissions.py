@@ -1,18 +1,65 @@
 # app/repositories/mongo_submission.py
 from datetime import datetime, timezone
 from typing import Sequence, Optional
+from uuid import uuid4
 import random
-from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.asynchronous.database import AsyncDatabase
+from pymongo import ReturnDocument, TEXT
+from pymongo.errors import BulkWriteError
 
+from app.core.tracing import traced
 from app.database.submission_repo import SubmissionRepo
-from app.schemas.submission import Submission, SubmissionCreate, FileMeta
+from app.schemas.submission import Submission, SubmissionCreate, FileMeta, ContentRef, ContentDelta, DerivedFiles
+from app.schemas.records import SubmissionRecord, RECORD_PROJECTION, LATEST_FILTER
+from app.schemas.stats import AssignmentStats
+from app.schemas.bulk_import import NewSubmission
+from app.schemas.search import SearchHit
 
 def create_submission_id() -> str:
     return f"sm-{random.randint(0, 99999):05d}"
 
+STATS_COLLECTION = "submission_stats"
+SEARCH_COLLECTION = "submission_search"
+TEXT_INDEX = "submission_text"
+TEXT_WEIGHTS = {"text": 1, "filenames": 3}
+BULK_ID_ATTEMPTS = 5
+
+DB_ATTRIBUTES = {"db.system": "mongodb", "db.collection.name": "submissions"}
+
 class MongosubmissionRepository(SubmissionRepo):
-    def __init__(self, db: AsyncIOMotorDatabase):
+    """
+    Oltre alle submission mantiene `submission_stats`, un documento per
+    assignment aggiornato in modo incrementale ($inc/$min/$max) da create,
+    add_file e delete. Gli aggiornamenti non sono transazionali con la
+    collection principale: recompute_stats li riallinea.
+
+    Con `read_preference` le letture delle liste e del dettaglio (se chiesto
+    con allow_secondary) possono andare sui secondari; le scritture e le
+    letture che precedono una scrittura restano sul primary.
+
+    La ricerca usa `submission_search`, un documento per submission
+    (`_id` = submissionId) con il testo completo e i nomi dei file, e un
+    indice di testo su quei campi (`text_language`: "none" = niente stemming
+    né stop word). Il testo completo resta fuori da `submissions` anche
+    quando inline c'è solo l'anteprima; la ricerca fa il join sugli ID.
+
+    Versioni: ogni riconsegna è un documento nuovo con `version`,
+    `previousId` e `latest`; liste, ricerca e statistiche considerano solo
+    l'ultima versione (`latest` != false: i documenti più vecchi non hanno il
+    campo). Un indice unico parziale impedisce due "ultime" versioni per la
+    stessa coppia (assignmentId, studentId).
+    """
+
+    def __init__(self, db: AsyncDatabase, *, read_preference=None, text_language: str = "none"):
+        self.text_language = text_language
         self.col = db["submissions"]
+        self.read_col = self.col.with_options(read_preference=read_preference) if read_preference else self.col
+        self.stats = db[STATS_COLLECTION]
+        self.read_stats = self.stats.with_options(read_preference=read_preference) if read_preference else self.stats
+        self.search_col = db[SEARCH_COLLECTION]
+        self.read_search = (
+            self.search_col.with_options(read_preference=read_preference) if read_preference else self.search_col
+        )
 
     def _from_doc(self, d: dict) -> Submission:
         return Submission(
@@ -22,49 +69,480 @@ class MongosubmissionRepository(SubmissionRepo):
             studentId=d.get("studentId"),
             content=d.get("content", ""),
             files=[FileMeta(**f) for f in d.get("files", [])],
+            contentTruncated=d.get("contentRef") is not None or d.get("contentDelta") is not None,
+            version=d.get("version", 1),
+            previousId=d.get("previousId"),
+            latest=d.get("latest") is not False,
+            contentRef=d.get("contentRef"),
+            contentDelta=d.get("contentDelta"),
         )
 
-    async def create(self, data: SubmissionCreate, *, assignment_id: str, student_id: str) -> str:
+    @traced(attributes=DB_ATTRIBUTES)
+    async def create(
+        self,
+        data: SubmissionCreate,
+        *,
+        assignment_id: str,
+        student_id: str,
+        content_ref: Optional[ContentRef] = None,
+        search_text: Optional[str] = None,
+    ) -> str:
         new_id = create_submission_id()
+        now = datetime.now(timezone.utc)
         doc = {
             "submissionId": new_id,
-            "createdAt": datetime.now(timezone.utc),
+            "createdAt": now,
             "assignmentId": assignment_id,
             "studentId": student_id,
             "content": data.content,
             "files": [],
+            "version": 1,
+            "latest": True,
         }
+        if content_ref is not None:
+            doc["contentRef"] = content_ref.model_dump()
         await self.col.insert_one(doc)
+        await self.search_col.insert_one(
+            {"_id": new_id, "text": data.content if search_text is None else search_text, "filenames": []}
+        )
+        await self.stats.update_one(
+            {"_id": assignment_id},
+            {
+                "$inc": {"submissionCount": 1},
+                "$min": {"firstSubmissionAt": now},
+                "$max": {"lastSubmissionAt": now},
+                "$setOnInsert": {"fileCount": 0, "totalBytes": 0},
+            },
+            upsert=True,
+        )
         return new_id
 
-    async def add_file(self, submission_id: str, file_meta: FileMeta) -> bool:
+    @traced(attributes=DB_ATTRIBUTES)
+    async def create_version(
+        self,
+        data: SubmissionCreate,
+        *,
+        previous: Submission,
+        files: Sequence[FileMeta] = (),
+        content_ref: Optional[ContentRef] = None,
+        content_delta: Optional[ContentDelta] = None,
+        search_text: Optional[str] = None,
+    ) -> Optional[str]:
+        # prima la versione precedente smette di essere l'ultima (condizionale:
+        # due riconsegne concorrenti non possono partire dalla stessa versione)
         res = await self.col.update_one(
+            {"submissionId": previous.submissionId, **LATEST_FILTER}, {"$set": {"latest": False}}
+        )
+        if res.modified_count == 0:
+            return None
+
+        new_id = create_submission_id()
+        now = datetime.now(timezone.utc)
+        doc = {
+            "submissionId": new_id,
+            "createdAt": now,
+            "assignmentId": previous.assignmentId,
+            "studentId": previous.studentId,
+            "content": data.content,
+            "files": [f.model_dump() for f in files],
+            "version": previous.version + 1,
+            "previousId": previous.submissionId,
+            "latest": True,
+        }
+        if content_ref is not None:
+            doc["contentRef"] = content_ref.model_dump()
+        if content_delta is not None:
+            doc["contentDelta"] = content_delta.model_dump()
+        try:
+            await self.col.insert_one(doc)
+        except BaseException:
+            await self.col.update_one({"submissionId": previous.submissionId}, {"$set": {"latest": True}})
+            raise
+        await self.search_col.insert_one({
+            "_id": new_id,
+            "text": data.content if search_text is None else search_text,
+            "filenames": [f.filename for f in files],
+        })
+
+        # statistiche: conta solo l'ultima versione (i file aggiunti dopo passano da add_file)
+        await self.stats.update_one(
+            {"_id": previous.assignmentId},
+            {
+                "$inc": {
+                    "fileCount": len(files) - len(previous.files),
+                    "totalBytes": sum(f.size for f in files) - sum(f.size for f in previous.files),
+                },
+                "$max": {"lastSubmissionAt": now},
+            },
+            upsert=True,
+        )
+        return new_id
+
+    @traced(attributes=DB_ATTRIBUTES)
+    async def replace_content(
+        self,
+        submission_id: str,
+        content: str,
+        content_ref: Optional[ContentRef],
+        *,
+        search_text: Optional[str] = None,
+    ) -> bool:
+        update: dict = {"$set": {"content": content}, "$unset": {"contentDelta": ""}}
+        if content_ref is not None:
+            update["$set"]["contentRef"] = content_ref.model_dump()
+        else:
+            update["$unset"]["contentRef"] = ""
+        res = await self.col.update_one({"submissionId": submission_id}, update)
+        if res.matched_count == 0:
+            return False
+        await self.search_col.update_one(
+            {"_id": submission_id}, {"$set": {"text": content if search_text is None else search_text}}
+        )
+        return True
+
+    @traced(attributes=DB_ATTRIBUTES)
+    async def create_many(self, items: Sequence[NewSubmission]) -> Sequence[tuple[Optional[str], Optional[str]]]:
+        results: list[tuple[Optional[str], Optional[str]]] = [(None, "not inserted")] * len(items)
+        pending = list(range(len(items)))
+        # gli ID sm-NNNNN sono pochi: le collisioni si riprovano con un nuovo ID
+        for _ in range(BULK_ID_ATTEMPTS):
+            docs = []
+            for i in pending:
+                it = items[i]
+                doc = {
+                    "submissionId": create_submission_id(),
+                    "createdAt": it.createdAt,
+                    "assignmentId": it.assignmentId,
+                    "studentId": it.studentId,
+                    "content": it.content,
+                    "files": [f.model_dump() for f in it.files],
+                    "version": 1,
+                    "latest": True,
+                }
+                if it.contentRef is not None:
+                    doc["contentRef"] = it.contentRef.model_dump()
+                docs.append(doc)
+
+            failed: dict[int, dict] = {}
+            try:
+                await self.col.insert_many(docs, ordered=False)
+            except BulkWriteError as e:
+                failed = {err["index"]: err for err in e.details.get("writeErrors", [])}
+
+            retry = []
+            inserted = []
+            for k, (i, doc) in enumerate(zip(pending, docs)):
+                err = failed.get(k)
+                if err is None:
+                    results[i] = (doc["submissionId"], None)
+                    it = items[i]
+                    inserted.append({
+                        "_id": doc["submissionId"],
+                        "text": it.content if it.searchText is None else it.searchText,
+                        "filenames": [f.filename for f in it.files],
+                    })
+                elif err.get("code") == 11000 and "submissionId" in (err.get("keyPattern") or {}):
+                    retry.append(i)
+                    results[i] = (None, "could not allocate a submission id")
+                else:
+                    results[i] = (None, err.get("errmsg", "insert failed"))
+            if inserted:
+                await self.search_col.insert_many(inserted, ordered=False)
+            pending = retry
+            if not pending:
+                break
+
+        # statistiche: un $inc/$min/$max per assignment, sommato sui documenti inseriti
+        # (recompute_stats resta un job offline: il suo $merge sovrascrive gli $inc concorrenti)
+        per_assignment: dict[str, list[NewSubmission]] = {}
+        for it, (sid, _) in zip(items, results):
+            if sid:
+                per_assignment.setdefault(it.assignmentId, []).append(it)
+        for assignment_id, group in sorted(per_assignment.items()):
+            await self.stats.update_one(
+                {"_id": assignment_id},
+                {
+                    "$inc": {
+                        "submissionCount": len(group),
+                        "fileCount": sum(len(it.files) for it in group),
+                        "totalBytes": sum(f.size for it in group for f in it.files),
+                    },
+                    "$min": {"firstSubmissionAt": min(it.createdAt for it in group)},
+                    "$max": {"lastSubmissionAt": max(it.createdAt for it in group)},
+                },
+                upsert=True,
+            )
+        return results
+
+    @traced(attributes=DB_ATTRIBUTES)
+    async def find_submitted_pairs(self, pairs: Sequence[tuple[str, str]]) -> set[tuple[str, str]]:
+        wanted = set(pairs)
+        if not wanted:
+            return set()
+        cursor = self.col.find(
+            {
+                "assignmentId": {"$in": sorted({a for a, _ in wanted})},
+                "studentId": {"$in": sorted({s for _, s in wanted})},
+            },
+            {"_id": 0, "assignmentId": 1, "studentId": 1},
+        )
+        return {(d["assignmentId"], d["studentId"]) async for d in cursor} & wanted
+
+    @traced(attributes=DB_ATTRIBUTES)
+    async def add_file(self, submission_id: str, file_meta: FileMeta) -> bool:
+        d = await self.col.find_one_and_update(
             {"submissionId": submission_id},
-            {"$push": {"files": file_meta.model_dump()}}
+            {"$push": {"files": file_meta.model_dump()}},
+            projection={"assignmentId": 1},
+        )
+        if d is None:
+            return False
+        await self.search_col.update_one({"_id": submission_id}, {"$push": {"filenames": file_meta.filename}})
+        await self.stats.update_one(
+            {"_id": d["assignmentId"]},
+            {"$inc": {"fileCount": 1, "totalBytes": file_meta.size}},
+            upsert=True,
         )
-        return res.modified_count > 0
+        return True
 
-    async def find_one(self, submission_id: str) -> Optional[Submission]:
-        d = await self.col.find_one({"submissionId": submission_id})
+    @traced(attributes=DB_ATTRIBUTES)
+    async def find_one(self, submission_id: str, *, allow_secondary: bool = False) -> Optional[Submission]:
+        col = self.read_col if allow_secondary else self.col
+        d = await col.find_one({"submissionId": submission_id})
         return self._from_doc(d) if d else None
 
-    async def find_for_assignment(self, assignment_id: str) -> Sequence[Submission]:
-        cursor = self.col.find({"assignmentId": assignment_id}).sort("createdAt", -1)
+    @traced(attributes=DB_ATTRIBUTES)
+    async def find_many(self, submission_ids: Sequence[str]) -> Sequence[SubmissionRecord]:
+        cursor = self.read_col.find({"submissionId": {"$in": list(submission_ids)}}, RECORD_PROJECTION)
+        return [SubmissionRecord.from_doc(d) async for d in cursor]
+
+    @traced(attributes=DB_ATTRIBUTES)
+    async def set_file_derived(self, submission_id: str, path: str, derived: DerivedFiles) -> bool:
+        res = await self.col.update_one(
+            {"submissionId": submission_id, "files.path": path},
+            {"$set": {"files.$.derived": derived.model_dump()}},
+        )
+        return res.matched_count > 0
+
+    @traced(attributes=DB_ATTRIBUTES)
+    async def find_for_assignment(self, assignment_id: str, *, include_history: bool = False) -> Sequence[Submission]:
+        query = {"assignmentId": assignment_id, **({} if include_history else LATEST_FILTER)}
+        cursor = self.read_col.find(query).sort("createdAt", -1)
         return [self._from_doc(d) async for d in cursor]
 
-    async def find_for_assignment_and_student(self, assignment_id: str, student_id: str) -> Sequence[Submission]:
-        cursor = self.col.find({"assignmentId": assignment_id, "studentId": student_id}).sort("createdAt", -1)
+    @traced(attributes=DB_ATTRIBUTES)
+    async def find_for_assignment_and_student(
+        self, assignment_id: str, student_id: str, *, include_history: bool = False
+    ) -> Sequence[Submission]:
+        query = {"assignmentId": assignment_id, "studentId": student_id, **({} if include_history else LATEST_FILTER)}
+        cursor = self.col.find(query).sort("createdAt", -1)
         return [self._from_doc(d) async for d in cursor]
 
+    @traced(attributes=DB_ATTRIBUTES)
+    async def find_records_for_assignment(self, assignment_id: str, *, include_history: bool = False) -> Sequence[SubmissionRecord]:
+        query = {"assignmentId": assignment_id, **({} if include_history else LATEST_FILTER)}
+        cursor = self.read_col.find(query, RECORD_PROJECTION).sort("createdAt", -1)
+        return [SubmissionRecord.from_doc(d) async for d in cursor]
+
+    @traced(attributes=DB_ATTRIBUTES)
+    async def find_records_for_assignment_and_student(
+        self, assignment_id: str, student_id: str, *, include_history: bool = False
+    ) -> Sequence[SubmissionRecord]:
+        query = {"assignmentId": assignment_id, "studentId": student_id, **({} if include_history else LATEST_FILTER)}
+        cursor = self.read_col.find(query, RECORD_PROJECTION).sort("createdAt", -1)
+        return [SubmissionRecord.from_doc(d) async for d in cursor]
+
+    @traced(attributes=DB_ATTRIBUTES)
     async def find_for_student(self, student_id: str) -> Sequence[Submission]:
-        cursor = self.col.find({"studentId": student_id}).sort("createdAt", -1)
+        cursor = self.read_col.find({"studentId": student_id, **LATEST_FILTER}).sort("createdAt", -1)
         return [self._from_doc(d) async for d in cursor]
 
+    @traced(attributes=DB_ATTRIBUTES)
+    async def search(
+        self,
+        query: str,
+        *,
+        assignment_id: Optional[str] = None,
+        student_id: Optional[str] = None,
+        limit: int = 20,
+        after: Optional[tuple[float, str]] = None,
+    ) -> Sequence[SearchHit]:
+        # $text passa dall'indice (e deve essere il primo stadio); poi il join
+        # con le submission applica gli altri filtri e tiene solo l'ultima versione
+        match: dict = dict(LATEST_FILTER)
+        if assignment_id:
+            match["assignmentId"] = assignment_id
+        if student_id:
+            match["studentId"] = student_id
+        pipeline: list[dict] = [
+            {"$match": {"$text": {"$search": query}}},
+            {"$project": {"_score": {"$meta": "textScore"}}},
+        ]
+        if after is not None:
+            score, last_id = after
+            pipeline.append({"$match": {"$or": [
+                {"_score": {"$lt": score}},
+                {"_score": score, "_id": {"$gt": last_id}},
+            ]}})
+        pipeline += [
+            {"$sort": {"_score": -1, "_id": 1}},
+            {"$lookup": {
+                "from": self.col.name,
+                "localField": "_id",
+                "foreignField": "submissionId",
+                "pipeline": [{"$match": match}, {"$project": RECORD_PROJECTION}],
+                "as": "submission",
+            }},
+            {"$unwind": "$submission"},
+            {"$limit": limit},
+        ]
+        cursor = await self.read_search.aggregate(pipeline)
+        return [
+            SearchHit(score=d["_score"], submission=SubmissionRecord.from_doc(d["submission"])) async for d in cursor
+        ]
+
+    @traced(attributes=DB_ATTRIBUTES)
     async def delete(self, submission_id: str) -> bool:
-        res = await self.col.delete_one({"submissionId": submission_id})
-        return res.deleted_count > 0
+        d = await self.col.find_one_and_delete(
+            {"submissionId": submission_id},
+            projection={"assignmentId": 1, "createdAt": 1, "files.size": 1, "previousId": 1, "latest": 1},
+        )
+        if d is None:
+            return False
+        await self.search_col.delete_one({"_id": submission_id})
+
+        assignment_id = d["assignmentId"]
+        previous_id = d.get("previousId")
+        # la catena delle versioni salta quella cancellata
+        await self.col.update_many({"previousId": submission_id}, {"$set": {"previousId": previous_id}})
+        if d.get("latest") is False:
+            return True  # versione storica: le statistiche non la contano
+
+        files = d.get("files", [])
+        inc = {
+            "submissionCount": -1,
+            "fileCount": -len(files),
+            "totalBytes": -sum(f.get("size", 0) for f in files),
+        }
+        if previous_id is not None:
+            # torna ultima la versione precedente
+            prev = await self.col.find_one_and_update(
+                {"submissionId": previous_id}, {"$set": {"latest": True}}, projection={"files.size": 1},
+            )
+            if prev is not None:
+                prev_files = prev.get("files", [])
+                inc["submissionCount"] = 0
+                inc["fileCount"] += len(prev_files)
+                inc["totalBytes"] += sum(f.get("size", 0) for f in prev_files)
+        st = await self.stats.find_one_and_update(
+            {"_id": assignment_id},
+            {"$inc": inc},
+            return_document=ReturnDocument.AFTER,
+        )
+        if st is None:
+            return True
+        if st.get("submissionCount", 0) <= 0:
+            await self.stats.delete_one({"_id": assignment_id, "submissionCount": {"$lte": 0}})
+        elif d["createdAt"] in (st.get("firstSubmissionAt"), st.get("lastSubmissionAt")):
+            # $min/$max non si possono "decrementare": rileggo gli estremi dall'indice
+            await self._refresh_bounds(assignment_id)
+        return True
+
+    # -------------------------
+    # Statistiche per assignment
+    # -------------------------
+    async def _refresh_bounds(self, assignment_id: str) -> None:
+        query = {"assignmentId": assignment_id, **LATEST_FILTER}
+        first = await self.col.find_one(query, {"createdAt": 1}, sort=[("createdAt", 1)])
+        last = await self.col.find_one(query, {"createdAt": 1}, sort=[("createdAt", -1)])
+        if first and last:
+            await self.stats.update_one(
+                {"_id": assignment_id},
+                {"$set": {"firstSubmissionAt": first["createdAt"], "lastSubmissionAt": last["createdAt"]}},
+            )
+
+    @traced(attributes=DB_ATTRIBUTES)
+    async def get_stats(self, assignment_id: str) -> Optional[AssignmentStats]:
+        d = await self.read_stats.find_one({"_id": assignment_id})
+        if not d:
+            return None
+        return AssignmentStats(
+            assignmentId=d["_id"],
+            submissionCount=d.get("submissionCount", 0),
+            fileCount=d.get("fileCount", 0),
+            totalBytes=d.get("totalBytes", 0),
+            firstSubmissionAt=d.get("firstSubmissionAt"),
+            lastSubmissionAt=d.get("lastSubmissionAt"),
+        )
+
+    @traced(attributes=DB_ATTRIBUTES)
+    async def recompute_stats(self, assignment_id: Optional[str] = None) -> int:
+        """
+        Job di riparazione: ricalcola le statistiche con una pipeline di
+        aggregazione e le scrive con $merge. Da eseguire a traffico basso:
+        un incremento concorrente può essere sovrascritto dal $merge.
+        """
+        run_id = uuid4().hex
+        match = {"assignmentId": assignment_id, **LATEST_FILTER} if assignment_id else dict(LATEST_FILTER)
+        pipeline = [
+            {"$match": match},
+            {"$group": {
+                "_id": "$assignmentId",
+                "submissionCount": {"$sum": 1},
+                "fileCount": {"$sum": {"$size": {"$ifNull": ["$files", []]}}},
+                "totalBytes": {"$sum": {"$sum": "$files.size"}},
+                "firstSubmissionAt": {"$min": "$createdAt"},
+                "lastSubmissionAt": {"$max": "$createdAt"},
+            }},
+            {"$set": {"recomputeRun": run_id}},
+            {"$merge": {"into": STATS_COLLECTION, "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"}},
+        ]
+        cursor = await self.col.aggregate(pipeline)
+        async for _ in cursor:
+            pass
+
+        # statistiche di assignment senza più submission
+        stale = {"recomputeRun": {"$ne": run_id}}
+        if assignment_id:
+            stale["_id"] = assignment_id
+        async for st in self.stats.find(stale, {"_id": 1}):
+            if await self.col.find_one({"assignmentId": st["_id"]}, {"_id": 1}) is None:
+                await self.stats.delete_one({"_id": st["_id"]})
+
+        return await self.stats.count_documents({"recomputeRun": run_id})
 
     async def ensure_indexes(self):
         await self.col.create_index("assignmentId")
+        await self.col.create_index([("assignmentId", 1), ("createdAt", 1)])
         await self.col.create_index("studentId")
         await self.col.create_index("submissionId", unique=True)
+        await self.col.create_index("previousId", sparse=True)
+        # al più un'ultima versione per studente e assignment
+        await self.col.create_index(
+            [("assignmentId", 1), ("studentId", 1)],
+            name="latest_version",
+            unique=True,
+            partialFilterExpression={"latest": True},
+        )
+        # l'indice di testo stava su `submissions`: ora è sulla collection di ricerca
+        if TEXT_INDEX in await self.col.index_information():
+            await self.col.drop_index(TEXT_INDEX)
+        await self.search_col.create_index(
+            [(field, TEXT) for field in TEXT_WEIGHTS],
+            name=TEXT_INDEX,
+            weights=TEXT_WEIGHTS,
+            default_language=self.text_language,
+        )
+        if await self.search_col.estimated_document_count() == 0:
+            await self._backfill_search()
+
+    async def _backfill_search(self) -> None:
+        # le submission salvate prima della collection di ricerca: testo inline
+        # (al più l'anteprima) e nomi dei file; i documenti già presenti restano
+        pipeline = [
+            {"$project": {"_id": "$submissionId", "text": "$content", "filenames": "$files.filename"}},
+            {"$merge": {"into": SEARCH_COLLECTION, "on": "_id", "whenMatched": "keepExisting", "whenNotMatched": "insert"}},
+        ]
+        cursor = await self.col.aggregate(pipeline)
+        async for _ in cursor:
+            pass
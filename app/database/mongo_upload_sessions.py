@@ -0,0 +1,63 @@
+# app/database/mongo_upload_sessions.py
+from datetime import datetime
+from typing import Sequence, Optional
+from pymongo.asynchronous.database import AsyncDatabase
+from pymongo import ReturnDocument
+
+from app.database.upload_session_repo import UploadSessionRepo
+from app.schemas.upload import UploadSession
+
+# le sessioni create prima del campo `status` sono aperte
+OPEN = {"status": {"$in": ["open", None]}}
+
+class MongoUploadSessionRepository(UploadSessionRepo):
+    def __init__(self, db: AsyncDatabase):
+        self.col = db["upload_sessions"]
+
+    def _from_doc(self, d: dict) -> UploadSession:
+        d = dict(d)
+        d.pop("_id", None)
+        return UploadSession(**d)
+
+    async def create(self, session: UploadSession) -> None:
+        await self.col.insert_one(session.model_dump())
+
+    async def find_one(self, upload_id: str) -> Optional[UploadSession]:
+        d = await self.col.find_one({"uploadId": upload_id})
+        return self._from_doc(d) if d else None
+
+    async def mark_received(self, upload_id: str, indices: Sequence[int], expires_at: datetime) -> Optional[UploadSession]:
+        d = await self.col.find_one_and_update(
+            {"uploadId": upload_id, **OPEN},
+            {
+                "$addToSet": {"received": {"$each": list(indices)}},
+                "$set": {"expiresAt": expires_at},
+            },
+            return_document=ReturnDocument.AFTER,
+        )
+        return self._from_doc(d) if d else None
+
+    async def claim(self, upload_id: str, expires_at: datetime) -> Optional[UploadSession]:
+        d = await self.col.find_one_and_update(
+            {"uploadId": upload_id, **OPEN},
+            {"$set": {"status": "completing", "expiresAt": expires_at}},
+            return_document=ReturnDocument.AFTER,
+        )
+        return self._from_doc(d) if d else None
+
+    async def release(self, upload_id: str) -> None:
+        await self.col.update_one({"uploadId": upload_id, "status": "completing"}, {"$set": {"status": "open"}})
+
+    async def find_expired(self, now: datetime, limit: int = 100) -> Sequence[UploadSession]:
+        cursor = self.col.find({"expiresAt": {"$lt": now}}).limit(limit)
+        return [self._from_doc(d) async for d in cursor]
+
+    async def delete(self, upload_id: str) -> bool:
+        res = await self.col.delete_one({"uploadId": upload_id})
+        return res.deleted_count > 0
+
+    async def ensure_indexes(self):
+        await self.col.create_index("uploadId", unique=True)
+        # niente TTL: la scadenza la gestisce purge_expired, che deve
+        # eliminare anche i chunk orfani nel bucket GridFS
+        await self.col.create_index("expiresAt")
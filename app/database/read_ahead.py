@@ -0,0 +1,123 @@
+# app/database/read_ahead.py
+"""
+Read-ahead per i download: mentre il server ASGI invia un chunk al client,
+un task legge già i successivi dallo storage, così rete e database si
+sovrappongono invece di alternarsi.
+
+Memoria:
+- per download: al più `depth` chunk in memoria, contando quello in
+  lettura e quello in invio al client
+- per worker: i chunk in anticipo di tutti i download si contendono un
+  `ReadAheadBudget`; a budget esaurito il download torna a un solo chunk
+  (il prossimo che il client aspetta), come senza read-ahead.
+"""
+from __future__ import annotations
+
+import asyncio
+import contextlib
+from typing import AsyncIterator, Awaitable, Callable, Optional
+
+class ReadAheadBudget:
+    """Byte di read-ahead in memoria condivisi da tutti i download del worker."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.used = 0
+
+    def try_acquire(self, nbytes: int) -> bool:
+        if self.used + nbytes > self.max_bytes:
+            return False
+        self.used += nbytes
+        return True
+
+    def release(self, nbytes: int) -> None:
+        self.used -= nbytes
+
+async def read_ahead(
+    read: Callable[[int], Awaitable[bytes]],
+    chunk_size: int,
+    *,
+    depth: int,
+    budget: Optional[ReadAheadBudget] = None,
+) -> AsyncIterator[bytes]:
+    """Chunk da `read(chunk_size)` fino a b"" con al più `depth` chunk in memoria."""
+    if depth <= 0:
+        while chunk := await read(chunk_size):
+            yield chunk
+        return
+
+    queue: asyncio.Queue[tuple[object, int]] = asyncio.Queue()
+    taken = asyncio.Event()
+    # chunk di questo download in memoria: in lettura, in coda o in invio al
+    # client (liberato solo quando il consumer chiede il successivo)
+    held = 0
+    free_held = False  # il chunk "gratuito" è già in lettura, in coda o in invio
+
+    def _reserve() -> Optional[int]:
+        nonlocal held, free_held
+        if held >= depth:
+            return None
+        if budget is None:
+            charged = 0
+        elif not free_held:
+            # un chunk alla volta è sempre ammesso, con costo 0 sul budget:
+            # a budget esaurito il download procede comunque
+            free_held = True
+            charged = 0
+        elif budget.try_acquire(chunk_size):
+            charged = chunk_size
+        else:
+            return None
+        held += 1
+        return charged
+
+    def _release(charged: int) -> None:
+        nonlocal held, free_held
+        held -= 1
+        if charged:
+            budget.release(charged)
+        else:
+            free_held = False
+        taken.set()
+
+    async def _produce() -> None:
+        try:
+            while True:
+                while (charged := _reserve()) is None:
+                    taken.clear()
+                    await taken.wait()
+                try:
+                    chunk = await read(chunk_size)
+                except BaseException:
+                    _release(charged)
+                    raise
+                queue.put_nowait((chunk, charged))
+                if not chunk:
+                    return
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            queue.put_nowait((exc, 0))
+
+    producer = asyncio.create_task(_produce())
+    try:
+        while True:
+            item, charged = await queue.get()
+            try:
+                if isinstance(item, Exception):
+                    raise item
+                if not item:
+                    return
+                yield item
+            finally:
+                if not isinstance(item, Exception):
+                    _release(charged)
+    finally:
+        producer.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await producer
+        # client disconnesso: restituisco il budget dei chunk mai inviati
+        while not queue.empty():
+            _, charged = queue.get_nowait()
+            if charged:
+                budget.release(charged)
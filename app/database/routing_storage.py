@@ -0,0 +1,164 @@
+# app/database/routing_storage.py
+from __future__ import annotations
+
+from typing import Any, AsyncIterator, Optional, Sequence
+
+from app.core.tracing import traced
+from app.database.base import ChunkedBinaryStorage
+from app.database.sharding import LEGACY_SHARD, HashRing, file_uri, join_file_id, split_file_id
+from app.schemas.file import StoredFile, FileInfo
+
+ROUTE_BY_FILE = "file"
+ROUTE_BY_ASSIGNMENT = "assignment"
+
+class RoutingStorage(ChunkedBinaryStorage):
+    """
+    BinaryStorage che distribuisce i file su più shard (bucket GridFS sullo
+    stesso database, su altri database o su altri cluster).
+
+    Lo shard di un file è scritto nel suo id/URI (vedi app/database/sharding.py),
+    quindi letture e cancellazioni non dipendono dal ring: aggiungere uno shard
+    cambia solo dove vanno i file nuovi. I file esistenti si spostano con
+    `python -m app.jobs.rebalance_storage`.
+
+    Con route_by="assignment" tutti i file di un assignment finiscono sullo
+    stesso shard; gli upload ripristinabili (che nascono senza metadati)
+    vengono comunque distribuiti per id del file.
+    """
+
+    def __init__(
+        self,
+        shards: dict[str, ChunkedBinaryStorage],
+        ring: HashRing,
+        *,
+        route_by: str = ROUTE_BY_FILE,
+        legacy_shard: str = LEGACY_SHARD,
+    ):
+        if route_by not in (ROUTE_BY_FILE, ROUTE_BY_ASSIGNMENT):
+            raise ValueError(f"Unknown route_by: {route_by}")
+        missing = ring.shards - shards.keys()
+        if missing:
+            raise ValueError(f"Ring shards without storage: {sorted(missing)}")
+        sizes = {s.chunk_size for s in shards.values()}
+        if len(sizes) != 1:
+            raise ValueError("All shards must use the same chunk size")
+
+        self.shards = shards
+        self.ring = ring
+        self.route_by = route_by
+        self.legacy_shard = legacy_shard
+        self.chunk_size = sizes.pop()
+        self._any = next(iter(shards.values()))
+
+    # -------------------------
+    # Routing
+    # -------------------------
+    def placement_key(self, oid: str, metadata: Optional[dict[str, Any]] = None) -> str:
+        assignment_id = (metadata or {}).get("assignmentId")
+        if self.route_by == ROUTE_BY_ASSIGNMENT and assignment_id:
+            return f"assignment:{assignment_id}"
+        return oid
+
+    def owner(self, oid: str, metadata: Optional[dict[str, Any]] = None) -> str:
+        """Shard a cui spetta il file secondo il ring attuale."""
+        return self.ring.node_for(self.placement_key(oid, metadata))
+
+    def _locate(self, file_id: str) -> tuple[Optional[ChunkedBinaryStorage], str, str]:
+        shard, oid = split_file_id(file_id, self.legacy_shard)
+        return self.shards.get(shard), shard, oid
+
+    def _public(self, shard: str, stored: StoredFile) -> StoredFile:
+        oid = stored.file_id
+        return stored.model_copy(update={
+            "file_id": join_file_id(shard, oid, self.legacy_shard),
+            "uri": file_uri(shard, oid),
+        })
+
+    # -------------------------
+    # BinaryStorage
+    # -------------------------
+    @traced()
+    async def upload(
+        self,
+        *,
+        filename: str,
+        content_type: Optional[str],
+        data: AsyncIterator[bytes],
+        metadata: Optional[dict[str, Any]] = None,
+        file_id: Optional[str] = None,
+    ) -> StoredFile:
+        if file_id is not None:
+            # id già assegnato da new_file_id: lo shard è quello scritto nell'id
+            _, shard, oid = self._chunked(file_id)
+        else:
+            # l'id serve prima dell'upload: con route_by="file" decide lo shard
+            oid = self._any.new_file_id()
+            shard = self.owner(oid, metadata)
+        stored = await self.shards[shard].upload(
+            filename=filename, content_type=content_type, data=data, metadata=metadata, file_id=oid,
+        )
+        return self._public(shard, stored)
+
+    async def stream(self, file_id: str) -> AsyncIterator[bytes]:
+        storage, shard, oid = self._locate(file_id)
+        if storage is None:
+            raise FileNotFoundError(f"Unknown storage shard: {shard}")
+        async for chunk in storage.stream(oid):
+            yield chunk
+
+    async def info(self, file_id: str) -> Optional[FileInfo]:
+        storage, shard, oid = self._locate(file_id)
+        if storage is None:
+            return None
+        info = await storage.info(oid)
+        return info.model_copy(update={"file_id": file_id}) if info else None
+
+    async def delete(self, file_id: str) -> bool:
+        storage, _, oid = self._locate(file_id)
+        return await storage.delete(oid) if storage is not None else False
+
+    # -------------------------
+    # ChunkedBinaryStorage
+    # -------------------------
+    def new_file_id(self) -> str:
+        oid = self._any.new_file_id()
+        return join_file_id(self.owner(oid), oid, self.legacy_shard)
+
+    def _chunked(self, file_id: str) -> tuple[ChunkedBinaryStorage, str, str]:
+        storage, shard, oid = self._locate(file_id)
+        if storage is None:
+            raise ValueError(f"Unknown storage shard: {shard}")
+        return storage, shard, oid
+
+    async def write_chunks(self, file_id: str, chunks: Sequence[tuple[int, bytes]]) -> None:
+        storage, _, oid = self._chunked(file_id)
+        await storage.write_chunks(oid, chunks)
+
+    async def finalize_chunks(
+        self,
+        file_id: str,
+        *,
+        filename: str,
+        content_type: Optional[str],
+        length: int,
+        metadata: Optional[dict[str, Any]] = None,
+    ) -> StoredFile:
+        storage, shard, oid = self._chunked(file_id)
+        stored = await storage.finalize_chunks(
+            oid, filename=filename, content_type=content_type, length=length, metadata=metadata,
+        )
+        return self._public(shard, stored)
+
+    async def discard_chunks(self, file_id: str) -> None:
+        storage, _, oid = self._chunked(file_id)
+        await storage.discard_chunks(oid)
+
+    async def unfinalize_chunks(self, file_id: str) -> None:
+        storage, _, oid = self._chunked(file_id)
+        await storage.unfinalize_chunks(oid)
+
+    async def ensure_indexes(self):
+        for storage in self.shards.values():
+            ensure = getattr(storage, "ensure_indexes", None)
+            if ensure is not None:
+                await ensure()
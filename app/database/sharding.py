@@ -0,0 +1,68 @@
+# app/database/sharding.py
+"""
+Indirizzamento dei file su più shard di storage binario.
+
+- Un file su uno shard ha id `<shard>.<oid>` e URI `gridfs://<shard>/<oid>`.
+- Lo shard storico `uploads` mantiene id e URI di sempre (`<oid>` e
+  `gridfs://uploads/<oid>`), quindi i path già salvati restano validi.
+- Lo shard di un file nuovo si sceglie con consistent hashing (con nodi
+  virtuali) sull'id del file o sull'assignment: aggiungendo uno shard si
+  sposta solo la quota di file che gli spetta.
+"""
+from __future__ import annotations
+
+import bisect
+import hashlib
+from typing import Iterable, Optional
+
+LEGACY_SHARD = "uploads"
+SEPARATOR = "."
+URI_SCHEME = "gridfs://"
+
+def split_file_id(file_id: str, legacy_shard: str = LEGACY_SHARD) -> tuple[str, str]:
+    """`<shard>.<oid>` -> (shard, oid); un id senza shard appartiene allo shard storico."""
+    shard, sep, oid = file_id.rpartition(SEPARATOR)
+    return (shard, oid) if sep else (legacy_shard, file_id)
+
+def join_file_id(shard: str, oid: str, legacy_shard: str = LEGACY_SHARD) -> str:
+    return oid if shard == legacy_shard else f"{shard}{SEPARATOR}{oid}"
+
+def file_uri(shard: str, oid: str) -> str:
+    return f"{URI_SCHEME}{shard}/{oid}"
+
+def file_id_from_uri(uri: str, legacy_shard: str = LEGACY_SHARD) -> Optional[str]:
+    """Id per lo storage (e per /files/{file_id}) da un path salvato; None se non è un URI gridfs."""
+    if not uri.startswith(URI_SCHEME):
+        return None
+    shard, _, oid = uri[len(URI_SCHEME):].rpartition("/")
+    return join_file_id(shard, oid, legacy_shard) if shard else None
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+class HashRing:
+    """Consistent hashing con `vnodes` punti per unità di peso."""
+
+    def __init__(self, shards: dict[str, int], vnodes: int = 64):
+        if not shards:
+            raise ValueError("HashRing needs at least one shard")
+        points: list[tuple[int, str]] = []
+        for name, weight in shards.items():
+            for i in range(max(weight, 0) * vnodes):
+                points.append((_hash(f"{name}#{i}"), name))
+        if not points:
+            raise ValueError("HashRing needs at least one shard with positive weight")
+        points.sort()
+        self._keys = [p for p, _ in points]
+        self._nodes = [n for _, n in points]
+        self.shards = {name for name, weight in shards.items() if weight > 0}
+
+    def node_for(self, key: str) -> str:
+        i = bisect.bisect(self._keys, _hash(key)) % len(self._keys)
+        return self._nodes[i]
+
+    def distribution(self, keys: Iterable[str]) -> dict[str, int]:
+        counts = dict.fromkeys(sorted(self.shards), 0)
+        for k in keys:
+            counts[self.node_for(k)] += 1
+        return counts
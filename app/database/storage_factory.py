@@ -0,0 +1,113 @@
+# app/database/storage_factory.py
+from __future__ import annotations
+
+from typing import Optional
+
+from gridfs import AsyncGridFSBucket
+from pymongo import AsyncMongoClient
+from pymongo.asynchronous.database import AsyncDatabase
+from pymongo.errors import CollectionInvalid
+
+from app.core.config import Settings
+from app.database.archive_storage import ARCHIVE_SHARD
+from app.database.base import ChunkedBinaryStorage
+from app.database.client import create_mongo_client
+from app.database.gridfs import GridFSStorage, DEFAULT_CHUNK_SIZE
+from app.database.read_ahead import ReadAheadBudget
+from app.database.routing_storage import RoutingStorage
+from app.database.sharding import LEGACY_SHARD, SEPARATOR, HashRing
+
+READ_CHUNK = 1024 * 1024
+
+def _gridfs(
+    db: AsyncDatabase,
+    bucket_name: str,
+    settings: Settings,
+    *,
+    read_preference=None,
+    read_ahead_budget: Optional[ReadAheadBudget] = None,
+) -> GridFSStorage:
+    read_db = db.with_options(read_preference=read_preference) if read_preference else db
+    return GridFSStorage(
+        bucket=AsyncGridFSBucket(db, bucket_name=bucket_name, chunk_size_bytes=DEFAULT_CHUNK_SIZE),
+        read_bucket=AsyncGridFSBucket(read_db, bucket_name=bucket_name, chunk_size_bytes=DEFAULT_CHUNK_SIZE),
+        bucket_name=bucket_name,
+        db=db,
+        chunk_size=DEFAULT_CHUNK_SIZE,
+        read_chunk=READ_CHUNK,
+        read_ahead_chunks=settings.download_read_ahead_bytes // READ_CHUNK,
+        read_ahead_budget=read_ahead_budget,
+        upload_concurrency=settings.gridfs_upload_concurrency,
+        upload_batch_chunks=settings.gridfs_upload_batch_chunks,
+    )
+
+def create_binary_storage(
+    settings: Settings,
+    client: AsyncMongoClient,
+    *,
+    read_preference=None,
+    read_ahead_budget: Optional[ReadAheadBudget] = None,
+) -> tuple[ChunkedBinaryStorage, list[AsyncMongoClient]]:
+    """
+    Storage binario dell'app: il bucket "uploads" del database principale e,
+    se configurati, gli shard di `storage_shards` dietro un RoutingStorage.
+    Ritorna anche i client Mongo aggiuntivi (da chiudere allo shutdown).
+    """
+    legacy = _gridfs(
+        client[settings.mongo_db_name], LEGACY_SHARD, settings,
+        read_preference=read_preference, read_ahead_budget=read_ahead_budget,
+    )
+    if not settings.storage_shards:
+        return legacy, []
+
+    shards: dict[str, ChunkedBinaryStorage] = {LEGACY_SHARD: legacy}
+    weights = {LEGACY_SHARD: settings.storage_legacy_weight}
+    clients: dict[str, AsyncMongoClient] = {}
+    for cfg in settings.storage_shards:
+        if cfg.name in shards or cfg.name == ARCHIVE_SHARD or SEPARATOR in cfg.name or "/" in cfg.name:
+            raise ValueError(f"Invalid or duplicate storage shard name: {cfg.name}")
+        shard_client = client
+        if cfg.uri:
+            if cfg.uri not in clients:
+                # stessi listener (comandi lenti) del client principale
+                clients[cfg.uri] = create_mongo_client(settings, cfg.uri, event_listeners=client.options.event_listeners)
+            shard_client = clients[cfg.uri]
+        shards[cfg.name] = _gridfs(
+            shard_client[cfg.db or settings.mongo_db_name], cfg.bucket or cfg.name, settings,
+            read_preference=read_preference, read_ahead_budget=read_ahead_budget,
+        )
+        weights[cfg.name] = cfg.weight
+
+    storage = RoutingStorage(shards, HashRing(weights), route_by=settings.storage_route_by)
+    return storage, list(clients.values())
+
+def create_archive_storage(
+    settings: Settings,
+    client: AsyncMongoClient,
+    *,
+    read_ahead_budget: Optional[ReadAheadBudget] = None,
+) -> tuple[GridFSStorage, list[AsyncMongoClient]]:
+    """Bucket freddo "archive" (su archive_uri/archive_db se configurati) e gli eventuali client aggiuntivi."""
+    clients: list[AsyncMongoClient] = []
+    if settings.archive_uri:
+        client = create_mongo_client(settings, settings.archive_uri, event_listeners=client.options.event_listeners)
+        clients.append(client)
+    db = client[settings.archive_db or settings.mongo_db_name]
+    return _gridfs(db, ARCHIVE_SHARD, settings, read_ahead_budget=read_ahead_budget), clients
+
+async def ensure_compressed_bucket(storage: GridFSStorage, block_compressor: str) -> None:
+    """
+    Crea le collection del bucket con un compressore di blocco dedicato (es.
+    zstd, più compatto dello snappy di default). Vale solo alla creazione:
+    un bucket già esistente resta com'è. Stringa vuota = opzioni di default.
+    """
+    if not block_compressor:
+        await storage.ensure_indexes()
+        return
+    options = {"storageEngine": {"wiredTiger": {"configString": f"block_compressor={block_compressor}"}}}
+    for suffix in ("files", "chunks"):
+        try:
+            await storage.db.create_collection(f"{storage.bucket_name}.{suffix}", **options)
+        except CollectionInvalid:
+            pass
+    await storage.ensure_indexes()
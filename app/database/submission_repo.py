@@ -2,12 +2,71 @@ from __future__ import annotations
 
 from abc import ABC, abstractmethod
 from typing import Sequence, Optional
-from app.schemas.submission import Submission, SubmissionCreate, FileMeta
+from app.schemas.submission import Submission, SubmissionCreate, FileMeta, ContentRef, ContentDelta, DerivedFiles
+from app.schemas.records import SubmissionRecord
+from app.schemas.stats import AssignmentStats
+from app.schemas.bulk_import import NewSubmission
+from app.schemas.search import SearchHit
 
 class SubmissionRepo(ABC):
     @abstractmethod
-    async def create(self, data: SubmissionCreate, *, teacher_id: str) -> str:
-        """Crea una submission e ritorna l'ID generato."""
+    async def create(
+        self,
+        data: SubmissionCreate,
+        *,
+        assignment_id: str,
+        student_id: str,
+        content_ref: Optional[ContentRef] = None,
+        search_text: Optional[str] = None,
+    ) -> str:
+        """
+        Crea una submission e ritorna l'ID generato (content_ref: testo completo
+        fuori documento; search_text: testo completo da indicizzare, separato
+        dalla submission, quando inline resta solo l'anteprima).
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def create_version(
+        self,
+        data: SubmissionCreate,
+        *,
+        previous: Submission,
+        files: Sequence[FileMeta] = (),
+        content_ref: Optional[ContentRef] = None,
+        content_delta: Optional[ContentDelta] = None,
+        search_text: Optional[str] = None,
+    ) -> Optional[str]:
+        """
+        Nuova versione di `previous` (che deve essere l'ultima), con i file
+        riusati `files`. Ritorna l'ID, oppure None se nel frattempo è stata
+        creata un'altra versione.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def replace_content(
+        self,
+        submission_id: str,
+        content: str,
+        content_ref: Optional[ContentRef],
+        *,
+        search_text: Optional[str] = None,
+    ) -> bool:
+        """Sostituisce il testo (es. un delta con il testo completo)."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def create_many(self, items: Sequence[NewSubmission]) -> Sequence[tuple[Optional[str], Optional[str]]]:
+        """
+        Inserisce in blocco (non ordinato) submission già complete.
+        Ritorna, nello stesso ordine, (submissionId, None) oppure (None, errore).
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def find_submitted_pairs(self, pairs: Sequence[tuple[str, str]]) -> set[tuple[str, str]]:
+        """Tra le coppie (assignmentId, studentId) date, quelle che hanno già una submission."""
         raise NotImplementedError
 
     @abstractmethod
@@ -16,8 +75,13 @@ class SubmissionRepo(ABC):
         raise NotImplementedError
 
     @abstractmethod
-    async def find_for_assignment(self, assignment_id: str) -> Sequence[Submission]:
-        """Ritorna le submission per un dato assignment."""
+    async def set_file_derived(self, submission_id: str, path: str, derived: DerivedFiles) -> bool:
+        """Collega all'allegato `path` della submission i blob derivati (testo, anteprima)."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def find_for_assignment(self, assignment_id: str, *, include_history: bool = False) -> Sequence[Submission]:
+        """Ritorna le submission per un dato assignment (solo l'ultima versione, salvo include_history)."""
         raise NotImplementedError
 
     @abstractmethod
@@ -26,16 +90,61 @@ class SubmissionRepo(ABC):
         raise NotImplementedError
     
     @abstractmethod
-    async def find_for_assignment_and_student(self, assignment_id: str, student_id: str) -> Sequence[Submission]:
+    async def find_for_assignment_and_student(self, assignment_id: str, student_id: str, *, include_history: bool = False) -> Sequence[Submission]:
         """Ritorna le submission per un assignment e uno studente specifico."""
         raise NotImplementedError
 
     @abstractmethod
-    async def find_one(self, submission_id: str) -> Optional[Submission]:
-        """Ritorna una submission per ID, oppure None se non esiste."""
+    async def find_records_for_assignment(self, assignment_id: str, *, include_history: bool = False) -> Sequence[SubmissionRecord]:
+        """Come find_for_assignment, ma ritorna record compatti per la serializzazione veloce."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def find_records_for_assignment_and_student(self, assignment_id: str, student_id: str, *, include_history: bool = False) -> Sequence[SubmissionRecord]:
+        """Come find_for_assignment_and_student, ma ritorna record compatti."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def find_one(self, submission_id: str, *, allow_secondary: bool = False) -> Optional[Submission]:
+        """
+        Ritorna una submission per ID, oppure None se non esiste.
+        allow_secondary=True solo per letture pure (può essere leggermente in ritardo).
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def find_many(self, submission_ids: Sequence[str]) -> Sequence[SubmissionRecord]:
+        """Ritorna (come record compatti) le submission esistenti tra gli ID dati, con una sola query."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def search(
+        self,
+        query: str,
+        *,
+        assignment_id: Optional[str] = None,
+        student_id: Optional[str] = None,
+        limit: int = 20,
+        after: Optional[tuple[float, str]] = None,
+    ) -> Sequence[SearchHit]:
+        """
+        Ricerca full-text su testo e nomi dei file, per punteggio decrescente
+        (a parità, per submissionId). `after` = (score, submissionId) dell'ultimo
+        risultato della pagina precedente.
+        """
         raise NotImplementedError
 
     @abstractmethod
     async def delete(self, submission_id: str) -> bool:
         """Cancella una submission."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_stats(self, assignment_id: str) -> Optional[AssignmentStats]:
+        """Ritorna le statistiche mantenute per un assignment (lettura O(1))."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def recompute_stats(self, assignment_id: Optional[str] = None) -> int:
+        """Ricalcola le statistiche dai documenti (tutte o di un assignment); ritorna quante ne ha scritte."""
         raise NotImplementedError
\ No newline at end of file
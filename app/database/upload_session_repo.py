@@ -0,0 +1,46 @@
+from __future__ import annotations
+
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Sequence, Optional
+from app.schemas.upload import UploadSession
+
+class UploadSessionRepo(ABC):
+    @abstractmethod
+    async def create(self, session: UploadSession) -> None:
+        """Salva una nuova sessione di upload."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def find_one(self, upload_id: str) -> Optional[UploadSession]:
+        """Ritorna una sessione per ID, oppure None se non esiste."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def mark_received(self, upload_id: str, indices: Sequence[int], expires_at: datetime) -> Optional[UploadSession]:
+        """Registra i chunk ricevuti, rinnova la scadenza e ritorna la sessione aggiornata (None se non è aperta)."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def claim(self, upload_id: str, expires_at: datetime) -> Optional[UploadSession]:
+        """
+        Passa atomicamente la sessione da "open" a "completing" e sposta la
+        scadenza a `expires_at` (la purge non tocca una finalizzazione in
+        corso); None se non è aperta.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def release(self, upload_id: str) -> None:
+        """Riporta a "open" una sessione la cui finalizzazione è fallita."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def find_expired(self, now: datetime, limit: int = 100) -> Sequence[UploadSession]:
+        """Ritorna le sessioni scadute prima di `now`."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def delete(self, upload_id: str) -> bool:
+        """Cancella una sessione."""
+        raise NotImplementedError
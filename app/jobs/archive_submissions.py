@@ -0,0 +1,304 @@
+# app/jobs/archive_submissions.py
+"""
+Archiviazione a freddo delle submission degli assignment chiusi.
+
+Per ogni assignment senza consegne da `--older-than-days` giorni (da
+`submission_stats.lastSubmissionAt`), oppure per quelli indicati con
+`--assignment`:
+  1. copia allegati e testi fuori documento nel bucket freddo "archive"
+     (stesso oid, vedi app/database/archive_storage.py)
+  2. il testo inline più lungo dell'anteprima diventa un blob compresso
+     nel bucket freddo
+  3. salva un bundle zip (submissions.bson + manifest.json) con i documenti
+     originali e lo registra in `archived_assignments`
+  4. sostituisce ogni documento con uno stub (vedi ArchiveService): liste,
+     dettaglio e download continuano a funzionare, leggendo dall'archivio
+  5. dopo `--grace` secondi elimina gli originali dallo storage caldo
+
+Il restore (`--restore`, in blocco o per `--assignment`) fa il percorso
+inverso a partire dai bundle. Entrambi si possono interrompere e rilanciare.
+
+Uso:  python -m app.jobs.archive_submissions [--older-than-days 180] [--assignment A ...]
+                                             [--dry-run] [--limit N] [--grace 60]
+      python -m app.jobs.archive_submissions --restore [--assignment A ...] [--grace 60]
+"""
+import argparse
+import asyncio
+import io
+import json
+import logging
+import zipfile
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+import bson
+from pymongo.asynchronous.collection import AsyncCollection
+
+from app.core.config import settings
+from app.database.archive_storage import ARCHIVE_SHARD
+from app.database.base import BinaryStorage
+from app.database.client import create_mongo_client
+from app.database.gridfs import GridFSStorage, copy_file, find_files_doc
+from app.database.mongo_submissions import STATS_COLLECTION
+from app.database.routing_storage import RoutingStorage
+from app.database.sharding import LEGACY_SHARD, file_id_from_uri, file_uri, split_file_id
+from app.database.storage_factory import create_archive_storage, create_binary_storage, ensure_compressed_bucket
+from app.services.archive_service import ArchiveService
+from app.services.content_service import ContentService
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_COLLECTION = "archived_assignments"
+BUNDLE_DOCS = "submissions.bson"
+BUNDLE_MANIFEST = "manifest.json"
+
+# -------------------------
+# Bundle
+# -------------------------
+def build_bundle(assignment_id: str, docs: list[dict], moved: dict[str, str], archived_at: datetime) -> bytes:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=9) as zf:
+        zf.writestr(BUNDLE_DOCS, b"".join(bson.encode(d) for d in docs))
+        zf.writestr(BUNDLE_MANIFEST, json.dumps({
+            "assignmentId": assignment_id,
+            "archivedAt": archived_at.isoformat(),
+            "submissions": [d["submissionId"] for d in docs],
+            "blobs": moved,
+        }, indent=2))
+    return buf.getvalue()
+
+def read_bundle(data: bytes) -> list[dict]:
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        return bson.decode_all(zf.read(BUNDLE_DOCS))
+
+async def _once(data: bytes):
+    yield data
+
+# -------------------------
+# Blob
+# -------------------------
+def _hot_shards(hot: BinaryStorage) -> dict[str, GridFSStorage]:
+    return dict(hot.shards) if isinstance(hot, RoutingStorage) else {LEGACY_SHARD: hot}
+
+def _locate(uri: str) -> Optional[tuple[str, str]]:
+    file_id = file_id_from_uri(uri)
+    return split_file_id(file_id) if file_id is not None else None
+
+async def _delete_after(grace_seconds: float, blobs: list[tuple[GridFSStorage, str]]) -> None:
+    if not blobs:
+        return
+    # i download già partiti finiscono dalla vecchia copia
+    logger.info("Attendo %ss prima di eliminare %s blob", grace_seconds, len(blobs))
+    await asyncio.sleep(grace_seconds)
+    for storage, oid in blobs:
+        await storage.delete(oid)
+
+# -------------------------
+# Archiviazione
+# -------------------------
+async def archive_assignment(
+    assignment_id: str,
+    submissions: AsyncCollection,
+    archive: AsyncCollection,
+    hot: dict[str, GridFSStorage],
+    cold: GridFSStorage,
+    *,
+    preview_chars: int,
+    dry_run: bool = False,
+) -> tuple[int, list[tuple[GridFSStorage, str]]]:
+    """Ritorna (submission archiviate, blob caldi da eliminare)."""
+    docs = [d async for d in submissions.find({"assignmentId": assignment_id, "archived": {"$exists": False}})]
+    if not docs or dry_run:
+        return len(docs), []
+
+    moved: dict[str, str] = {}
+    sources: dict[str, tuple[GridFSStorage, str]] = {}
+    for doc in docs:
+        for uri in ArchiveService.blob_uris(doc):
+            loc = _locate(uri)
+            if uri in moved or loc is None or loc[0] not in hot:
+                continue
+            src, oid = hot[loc[0]], loc[1]
+            files_doc = await find_files_doc(src, oid)
+            if files_doc is None:
+                logger.warning("Blob %s non trovato: resta referenziato com'è", uri)
+                continue
+            await copy_file(src, cold, files_doc)
+            moved[uri] = file_uri(ARCHIVE_SHARD, oid)
+            sources[uri] = (src, oid)
+
+    archived_at = datetime.now(timezone.utc)
+    data = await asyncio.to_thread(build_bundle, assignment_id, docs, moved, archived_at)
+    bundle = await cold.upload(
+        filename=f"{assignment_id}.zip",
+        content_type="application/zip",
+        data=_once(data),
+        metadata={"kind": "archive-bundle", "assignmentId": assignment_id},
+    )
+    bundle_uri = file_uri(ARCHIVE_SHARD, bundle.file_id)
+    # un run interrotto lascia un bundle in più: il restore lo ignora (nessuno stub lo referenzia)
+    await archive.update_one(
+        {"_id": assignment_id},
+        {"$push": {"bundles": bundle_uri}, "$inc": {"submissionCount": len(docs), "bundleBytes": len(data)},
+         "$set": {"archivedAt": archived_at}},
+        upsert=True,
+    )
+
+    archived = 0
+    to_delete: list[tuple[GridFSStorage, str]] = []
+    for doc in docs:
+        content, content_ref = None, None
+        if doc.get("contentRef") is None and doc.get("contentDelta") is None:
+            # testo inline: nello stub resta l'anteprima, il resto va nel bucket freddo
+            content, content_ref = await ContentService.offload(
+                doc.get("content", ""), cold,
+                inline_max_bytes=preview_chars, preview_chars=preview_chars,
+                metadata={"assignmentId": assignment_id, "studentId": doc.get("studentId")},
+            )
+        stub = ArchiveService.make_stub(
+            doc, moved=moved, bundle_uri=bundle_uri, archived_at=archived_at,
+            content=content, content_ref=content_ref.model_dump() if content_ref else None,
+            preview_chars=preview_chars,
+        )
+        # solo se il documento non è cambiato nel frattempo (es. un file aggiunto)
+        res = await submissions.replace_one(
+            {"_id": doc["_id"], "archived": {"$exists": False}, "files": doc.get("files", [])}, stub
+        )
+        uris = [u for u in ArchiveService.blob_uris(doc) if u in sources]
+        if res.matched_count:
+            archived += 1
+            to_delete += [sources[u] for u in uris]
+        else:
+            logger.warning("Submission %s modificata durante l'archiviazione: resta calda", doc["submissionId"])
+            for u in uris:
+                await cold.delete(sources[u][1])
+            if content_ref is not None:
+                await cold.delete(_locate(content_ref.uri)[1])
+    return archived, to_delete
+
+async def closed_assignments(stats: AsyncCollection, archive: AsyncCollection, before: datetime) -> list[str]:
+    done = {d["_id"] async for d in archive.find({}, {"_id": 1})}
+    cursor = stats.find({"lastSubmissionAt": {"$lt": before}}, {"_id": 1})
+    return [d["_id"] async for d in cursor if d["_id"] not in done]
+
+# -------------------------
+# Restore
+# -------------------------
+async def restore_assignment(
+    assignment_id: str,
+    submissions: AsyncCollection,
+    archive: AsyncCollection,
+    hot: dict[str, GridFSStorage],
+    cold: GridFSStorage,
+) -> tuple[int, list[tuple[GridFSStorage, str]]]:
+    """Ritorna (submission ripristinate, blob freddi da eliminare)."""
+    record = await archive.find_one({"_id": assignment_id})
+    if record is None:
+        return 0, []
+
+    restored = 0
+    to_delete: list[tuple[GridFSStorage, str]] = []
+    for bundle_uri in record.get("bundles", []):
+        _, bundle_oid = split_file_id(file_id_from_uri(bundle_uri))
+        data = b"".join([c async for c in cold.stream(bundle_oid)])
+        for original in await asyncio.to_thread(read_bundle, data):
+            stub = await submissions.find_one({"_id": original["_id"], "archived.bundle": bundle_uri})
+            if stub is None:
+                continue  # cancellata mentre era archiviata, o bundle di un run interrotto
+            for uri in ArchiveService.blob_uris(original):
+                loc = _locate(uri)
+                if loc is None or loc[0] not in hot:
+                    continue
+                files_doc = await find_files_doc(cold, loc[1])
+                if files_doc is not None:
+                    await copy_file(cold, hot[loc[0]], files_doc)
+            res = await submissions.replace_one(
+                {"_id": original["_id"], "archived.bundle": bundle_uri},
+                ArchiveService.restored_doc(original, stub),
+            )
+            if res.matched_count:
+                restored += 1
+                to_delete += [(cold, _locate(u)[1]) for u in ArchiveService.cold_blob_uris(stub)]
+        to_delete.append((cold, bundle_oid))
+
+    await archive.delete_one({"_id": assignment_id})
+    return restored, to_delete
+
+# -------------------------
+# Entry point
+# -------------------------
+async def run(
+    *,
+    restore: bool,
+    assignments: list[str],
+    older_than_days: int,
+    dry_run: bool,
+    limit: int,
+    grace_seconds: float,
+    concurrency: int,
+) -> Counter:
+    client = create_mongo_client(settings)
+    hot_storage, extra_clients = create_binary_storage(settings, client)
+    cold, archive_clients = create_archive_storage(settings, client)
+    extra_clients += archive_clients
+    try:
+        await ensure_compressed_bucket(cold, settings.archive_block_compressor)
+        db = client[settings.mongo_db_name]
+        submissions, archive = db["submissions"], db[ARCHIVE_COLLECTION]
+        hot = _hot_shards(hot_storage)
+
+        if restore:
+            targets = assignments or [d["_id"] async for d in archive.find({}, {"_id": 1})]
+        else:
+            before = datetime.now(timezone.utc) - timedelta(days=older_than_days)
+            targets = assignments or await closed_assignments(db[STATS_COLLECTION], archive, before)
+        if limit:
+            targets = targets[:limit]
+
+        sem = asyncio.Semaphore(max(concurrency, 1))
+        async def one(assignment_id: str) -> tuple[int, list[tuple[GridFSStorage, str]]]:
+            async with sem:
+                if restore:
+                    return await restore_assignment(assignment_id, submissions, archive, hot, cold)
+                return await archive_assignment(
+                    assignment_id, submissions, archive, hot, cold,
+                    preview_chars=settings.content_preview_chars, dry_run=dry_run,
+                )
+
+        counts: Counter = Counter()
+        to_delete: list[tuple[GridFSStorage, str]] = []
+        for assignment_id, (n, blobs) in zip(targets, await asyncio.gather(*(one(a) for a in targets))):
+            counts[assignment_id] = n
+            to_delete += blobs
+        await _delete_after(grace_seconds, to_delete)
+        return counts
+    finally:
+        for c in extra_clients:
+            await c.close()
+        await client.close()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Archivia (o ripristina) le submission degli assignment chiusi")
+    parser.add_argument("--restore", action="store_true", help="ripristina invece di archiviare")
+    parser.add_argument("--assignment", action="append", default=[], help="solo questo assignment (ripetibile)")
+    parser.add_argument("--older-than-days", type=int, default=settings.archive_after_days,
+                        help="assignment senza consegne da N giorni")
+    parser.add_argument("--dry-run", action="store_true", help="conta soltanto le submission da archiviare")
+    parser.add_argument("--limit", type=int, default=0, help="al più N assignment (0 = tutti)")
+    parser.add_argument("--grace", type=float, default=60.0, help="secondi prima di eliminare le copie sostituite")
+    parser.add_argument("--concurrency", type=int, default=4, help="assignment elaborati in parallelo")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    counts = asyncio.run(run(
+        restore=args.restore, assignments=args.assignment, older_than_days=args.older_than_days,
+        dry_run=args.dry_run, limit=args.limit, grace_seconds=args.grace, concurrency=args.concurrency,
+    ))
+    verb = "ripristinate" if args.restore else ("da archiviare" if args.dry_run else "archiviate")
+    for assignment_id, n in sorted(counts.items()):
+        logger.info("%s: %s submission %s", assignment_id, n, verb)
+    logger.info("Totale: %s submission %s", sum(counts.values()), verb)
+
+if __name__ == "__main__":
+    main()
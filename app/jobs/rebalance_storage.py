@@ -0,0 +1,117 @@
+# app/jobs/rebalance_storage.py
+"""
+Ribilanciamento online dello storage binario dopo l'aggiunta (o il cambio di
+peso) di uno shard in `storage_shards`.
+
+Per ogni file che secondo il ring attuale spetta a un altro shard:
+  1. copia chunk e documento files sullo shard di destinazione (stesso _id,
+     files per ultimo: il file è visibile solo quando è completo)
+  2. aggiorna i riferimenti nelle submission (files.path, i derivati
+     files.derived.textUri/previewUri e contentRef.uri)
+  3. dopo `--grace` secondi elimina l'originale, così i download già
+     partiti dal vecchio shard finiscono senza errori
+
+Il servizio resta in linea: fino al passo 2 tutti leggono dal vecchio shard,
+dopo dal nuovo. Il job si può interrompere e rilanciare: la copia è idempotente.
+
+Uso:  python -m app.jobs.rebalance_storage [--dry-run] [--limit N] [--grace 60]
+"""
+import argparse
+import asyncio
+import logging
+from collections import Counter
+
+from pymongo.asynchronous.collection import AsyncCollection
+
+from app.core.config import settings
+from app.database.client import create_mongo_client
+from app.database.gridfs import GridFSStorage, copy_file
+from app.database.routing_storage import RoutingStorage
+from app.database.sharding import file_uri
+from app.database.storage_factory import create_binary_storage
+
+logger = logging.getLogger(__name__)
+
+FILE_REFERENCES = ("path", "derived.textUri", "derived.previewUri")
+
+async def _update_references(submissions: AsyncCollection, old_uri: str, new_uri: str) -> int:
+    modified = 0
+    # allegati e loro testo/anteprima derivati: il blob spostato può essere uno qualunque
+    for field in FILE_REFERENCES:
+        res = await submissions.update_many(
+            {f"files.{field}": old_uri},
+            {"$set": {f"files.$[f].{field}": new_uri}},
+            array_filters=[{f"f.{field}": old_uri}],
+        )
+        modified += res.modified_count
+    content = await submissions.update_many({"contentRef.uri": old_uri}, {"$set": {"contentRef.uri": new_uri}})
+    return modified + content.modified_count
+
+async def rebalance(
+    storage: RoutingStorage,
+    submissions: AsyncCollection,
+    *,
+    dry_run: bool = False,
+    limit: int = 0,
+    grace_seconds: float = 60.0,
+) -> Counter:
+    moves: Counter = Counter()
+    to_delete: list[tuple[GridFSStorage, str]] = []
+
+    for src_name, src in storage.shards.items():
+        cursor = src._collection("files").find({})
+        async for doc in cursor:
+            oid = str(doc["_id"])
+            dst_name = storage.owner(oid, doc.get("metadata"))
+            if dst_name == src_name:
+                continue
+            moves[f"{src_name}->{dst_name}"] += 1
+            if not dry_run:
+                await copy_file(src, storage.shards[dst_name], doc)
+                refs = await _update_references(
+                    submissions, file_uri(src_name, oid), file_uri(dst_name, oid)
+                )
+                logger.debug("Spostato %s: %s -> %s (%s riferimenti)", oid, src_name, dst_name, refs)
+                to_delete.append((src, oid))
+            if limit and sum(moves.values()) >= limit:
+                break
+        if limit and sum(moves.values()) >= limit:
+            break
+
+    if to_delete:
+        logger.info("Attendo %ss prima di eliminare %s originali", grace_seconds, len(to_delete))
+        await asyncio.sleep(grace_seconds)
+        for src, oid in to_delete:
+            await src.delete(oid)
+    return moves
+
+async def run(*, dry_run: bool, limit: int, grace_seconds: float) -> Counter:
+    client = create_mongo_client(settings)
+    storage, extra_clients = create_binary_storage(settings, client)
+    try:
+        if not isinstance(storage, RoutingStorage):
+            logger.info("Nessuno shard configurato (storage_shards vuoto): niente da ribilanciare")
+            return Counter()
+        await storage.ensure_indexes()
+        submissions = client[settings.mongo_db_name]["submissions"]
+        return await rebalance(storage, submissions, dry_run=dry_run, limit=limit, grace_seconds=grace_seconds)
+    finally:
+        for c in extra_clients:
+            await c.close()
+        await client.close()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Sposta i file sugli shard previsti dal ring attuale")
+    parser.add_argument("--dry-run", action="store_true", help="conta soltanto i file da spostare")
+    parser.add_argument("--limit", type=int, default=0, help="sposta al più N file (0 = tutti)")
+    parser.add_argument("--grace", type=float, default=60.0, help="secondi prima di eliminare gli originali")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    moves = asyncio.run(run(dry_run=args.dry_run, limit=args.limit, grace_seconds=args.grace))
+    for route, n in sorted(moves.items()):
+        logger.info("%s: %s file%s", route, n, " (dry run)" if args.dry_run else "")
+    logger.info("Totale: %s file", sum(moves.values()))
+
+if __name__ == "__main__":
+    main()
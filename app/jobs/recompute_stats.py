@@ -0,0 +1,35 @@
+# app/jobs/recompute_stats.py
+"""
+Job di riparazione delle statistiche per assignment (`submission_stats`).
+
+Uso:  python -m app.jobs.recompute_stats [--assignment <assignmentId>]
+"""
+import argparse
+import asyncio
+import logging
+
+from app.core.config import settings
+from app.database.client import create_mongo_client
+from app.database.mongo_submissions import MongosubmissionRepository
+
+logger = logging.getLogger(__name__)
+
+async def run(assignment_id: str | None) -> int:
+    client = create_mongo_client(settings)
+    try:
+        repo = MongosubmissionRepository(client[settings.mongo_db_name])
+        return await repo.recompute_stats(assignment_id)
+    finally:
+        await client.close()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Ricalcola le statistiche delle submission per assignment")
+    parser.add_argument("--assignment", help="ricalcola solo questo assignment")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    written = asyncio.run(run(args.assignment))
+    logger.info("Statistiche ricalcolate: %s assignment", written)
+
+if __name__ == "__main__":
+    main()
@@ -1,30 +1,124 @@
 # app/main.py
+import asyncio
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorGridFSBucket  
 
 from app.core.config import settings
+from app.core.admission import AdmissionController, AdmissionMiddleware
+from app.core.idempotency import IdempotencyMiddleware
+from app.core.tracing import TracingMiddleware, setup_tracing
+from app.core.command_log import CommandLog
+from app.core.auth_context import AuthContextMiddleware, scope_user_id
+from app.core.loop_monitor import LoopMonitor
+from app.database.client import create_mongo_client, read_preference
+from app.database.command_listener import SlowCommandListener
 from app.database.mongo_submissions import MongosubmissionRepository
-from app.database.gridfs import GridFSStorage
+from app.database.storage_factory import create_binary_storage, create_archive_storage, ensure_compressed_bucket
+from app.database.archive_storage import ArchiveStorage
+from app.database.blob_cache import CachingStorage
+from app.database.read_ahead import ReadAheadBudget
+from app.database.mongo_upload_sessions import MongoUploadSessionRepository
+from app.database.mongo_idempotency import MongoIdempotencyStore
+from app.database.mongo_fingerprints import MongoFingerprintRepository
 from app.routers.v1 import health
 from app.routers.v1 import submission
+from app.routers.v1 import uploads
+from app.routers.v1 import imports
 from app.services.publisher_service import SubmissionPublisher
+from app.services.resumable_upload_service import ResumableUploadService
+from app.services.change_feed import SubmissionChangeFeed
+from app.services.auth_service import AuthService
+from app.services.preview_service import PreviewWorkers
 
 def create_app() -> FastAPI:
+    tracer_provider = None
+    if settings.tracing_enabled:
+        tracer_provider = setup_tracing(
+            service_name="submission-service",
+            sample_rate=settings.tracing_sample_rate,
+            exporter=settings.tracing_exporter,
+            file_path=settings.tracing_file_path,
+            otlp_endpoint=settings.tracing_otlp_endpoint,
+        )
+
+    # comandi Mongo lenti e contatori: listener dei client di questa app (non globale)
+    command_log = None
+    mongo_listeners: list[SlowCommandListener] = []
+    if settings.mongo_monitoring:
+        command_log = CommandLog(slow_ms=settings.mongo_slow_ms, explain_top=settings.mongo_explain_top)
+        mongo_listeners.append(SlowCommandListener(command_log))
+
+    loop_monitor = None
+    if settings.loop_monitor_enabled:
+        loop_monitor = LoopMonitor(
+            interval=settings.loop_monitor_interval_seconds,
+            window=settings.loop_monitor_window,
+            watchdog_ms=settings.loop_watchdog_ms,
+        )
+
     @asynccontextmanager
     async def lifespan(app: FastAPI):
-        client = AsyncIOMotorClient(settings.mongo_uri, uuidRepresentation="standard")
+        if loop_monitor is not None:
+            loop_monitor.start()
+        client = create_mongo_client(settings, event_listeners=mongo_listeners)
         db = client[settings.mongo_db_name]
+        # liste, dettaglio e download possono leggere dai secondari (staleness limitata)
+        read_pref = read_preference(settings)
 
         # Mongo repository
-        repo = MongosubmissionRepository(db)
+        repo = MongosubmissionRepository(db, read_preference=read_pref, text_language=settings.search_text_language)
         await repo.ensure_indexes()
         app.state.submission_repo = repo
 
-        # GridFS bucket
-        bucket = AsyncIOMotorGridFSBucket(db, bucket_name="uploads", chunk_size_bytes=255 * 1024)
-        app.state.binary_storage = GridFSStorage(bucket=bucket, bucket_name="uploads")
+        # Feed live: un solo change stream per worker condiviso dai client SSE
+        feed = SubmissionChangeFeed(repo.col, buffer_size=settings.feed_buffer_size)
+        await feed.enable_pre_images()
+        app.state.change_feed = feed
+
+        # Storage binario: bucket GridFS "uploads" ed eventuali shard (storage_shards)
+        read_ahead_budget = ReadAheadBudget(settings.download_read_ahead_total_bytes)
+        hot_storage, storage_clients = create_binary_storage(
+            settings, client, read_preference=read_pref, read_ahead_budget=read_ahead_budget,
+        )
+        # submission archiviate: blob nel bucket freddo "archive" (app/jobs/archive_submissions.py)
+        cold_storage, archive_clients = create_archive_storage(settings, client, read_ahead_budget=read_ahead_budget)
+        storage_clients += archive_clients
+        await ensure_compressed_bucket(cold_storage, settings.archive_block_compressor)
+        storage = ArchiveStorage(hot_storage, cold_storage)
+        # allegati scaricati da più revisori: i ripetuti non arrivano a Mongo
+        if settings.blob_cache_max_bytes > 0:
+            storage = CachingStorage(
+                storage,
+                max_bytes=settings.blob_cache_max_bytes,
+                max_object_bytes=settings.blob_cache_max_object_bytes,
+                ttl_seconds=settings.blob_cache_ttl_seconds,
+            )
+        await storage.ensure_indexes()
+        app.state.binary_storage = storage
+
+        # Sessioni di upload ripristinabili
+        upload_sessions = MongoUploadSessionRepository(db)
+        await upload_sessions.ensure_indexes()
+        app.state.upload_session_repo = upload_sessions
+
+        # Firme MinHash + indice LSH per i quasi-duplicati
+        fingerprints = MongoFingerprintRepository(db)
+        await fingerprints.ensure_indexes()
+        app.state.fingerprint_repo = fingerprints
+
+        # Idempotency-Key su POST /submissions (collection con TTL)
+        idempotency_store = MongoIdempotencyStore(db)
+        await idempotency_store.ensure_indexes()
+        app.state.idempotency_store = idempotency_store
+
+        # Anteprime degli allegati: parsing in un process pool, fuori dall'event loop
+        preview_workers = None
+        if settings.preview_workers > 0:
+            preview_workers = PreviewWorkers.process_pool(
+                settings.preview_workers, max_pending=settings.preview_max_pending,
+            )
+        app.state.preview_workers = preview_workers
 
         # --- RabbitMQ Publisher ---
         publisher = SubmissionPublisher(
@@ -34,18 +128,47 @@ def create_app() -> FastAPI:
             review_routing_key="submissions.reviews",
             report_exchange = "elearning.reports",
             report_routing_key = "submissions.reports",
+            rich_events=settings.events_rich,
+            event_preview_chars=settings.events_preview_chars,
+            event_max_bytes=settings.events_max_bytes,
         )
 
         await publisher.connect(max_retries=10, delay=5)
         app.state.submission_publisher = publisher
 
+        # pulizia periodica delle sessioni di upload scadute
+        purge_task = asyncio.create_task(
+            ResumableUploadService.run_purge_loop(
+                upload_sessions, storage, interval=settings.upload_purge_interval_seconds
+            )
+        )
+
+        # explain periodico delle query più lente (solo database principale)
+        explain_task = None
+        if command_log is not None and command_log.explain_top > 0:
+            explain_task = asyncio.create_task(
+                command_log.run_explain_loop(client, window_seconds=settings.mongo_explain_window_seconds)
+            )
+
         try:
             yield
         finally:
+            purge_task.cancel()
+            if explain_task is not None:
+                explain_task.cancel()
+            if loop_monitor is not None:
+                await loop_monitor.stop()
+            if preview_workers is not None:
+                await preview_workers.shutdown()
+            await feed.close()
             try:
                 await publisher.close()
             finally:
-                client.close()
+                for c in storage_clients:
+                    await c.close()
+                await client.close()
+                if tracer_provider is not None:
+                    tracer_provider.shutdown()
 
     app = FastAPI(
         title="submission Microservice",
@@ -54,6 +177,36 @@ def create_app() -> FastAPI:
         lifespan=lifespan,
     )
 
+    admission = AdmissionController(
+        max_uploads=settings.admission_max_uploads,
+        max_downloads=settings.admission_max_downloads,
+        max_upload_bytes=settings.admission_max_upload_bytes,
+        max_uploads_per_user=settings.admission_max_uploads_per_user,
+        max_queue=settings.admission_max_queue,
+        queue_timeout=settings.admission_queue_timeout_seconds,
+        retry_after=settings.admission_retry_after_seconds,
+        read_pressure=settings.admission_read_pressure,
+    )
+    app.state.admission = admission
+    app.state.command_log = command_log
+    app.state.loop_monitor = loop_monitor
+    app.add_middleware(AdmissionMiddleware, controller=admission, identify=scope_user_id)
+    # più esterno dell'ammissione: i retry con risposta salvata non entrano in coda
+    # (i 429 dell'ammissione hanno Retry-After e non vengono salvati)
+    app.add_middleware(IdempotencyMiddleware,
+        identify=scope_user_id,
+        ttl_seconds=settings.idempotency_ttl_seconds,
+        pending_ttl_seconds=settings.idempotency_pending_ttl_seconds,
+        wait_seconds=settings.idempotency_wait_seconds,
+        max_body_bytes=settings.idempotency_max_body_bytes,
+    )
+
+    # token decodificato una volta sola, riusato da ammissione, idempotenza e router
+    app.add_middleware(AuthContextMiddleware, decode=AuthService.decode_token)
+
+    # esterno a idempotenza e ammissione: lo span copre anche coda e replay
+    app.add_middleware(TracingMiddleware)
+
     app.add_middleware(CORSMiddleware,
         allow_origins=["*"], allow_credentials=True,
         allow_methods=["*"], allow_headers=["*"],
@@ -61,6 +214,8 @@ def create_app() -> FastAPI:
 
     app.include_router(health.router,     prefix="/api/v1", tags=["health"])
     app.include_router(submission.router, prefix="/api/v1", tags=["submissions"])
+    app.include_router(uploads.router,    prefix="/api/v1", tags=["uploads"])
+    app.include_router(imports.router,    prefix="/api/v1", tags=["imports"])
     return app
 
 app = create_app()
@@ -1,7 +1,18 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Request
 
 router = APIRouter()
 
 @router.get("/submissions/health")
 async def health_check():
-    return {"status": "ok"}
\ No newline at end of file
+    return {"status": "ok"}
+
+@router.get("/submissions/health/stats")
+async def health_stats(request: Request):
+    stats = {}
+    command_log = getattr(request.app.state, "command_log", None)
+    if command_log is not None:
+        stats["mongo"] = command_log.stats()
+    loop_monitor = getattr(request.app.state, "loop_monitor", None)
+    if loop_monitor is not None:
+        stats["loop"] = loop_monitor.stats()
+    return stats
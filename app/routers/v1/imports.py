@@ -0,0 +1,72 @@
+import asyncio
+import zipfile
+from typing import Annotated, List, Optional
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, Request
+
+from app.core.config import settings
+from app.core.deps import get_repository, get_storage, get_publisher
+from app.schemas.bulk_import import ImportReport
+from app.schemas.context import UserContext
+
+from app.services.auth_service import AuthService
+from app.services.bulk_import_service import BulkImportService, UploadedFilesSource, ZipSource
+
+from app.database.submission_repo import SubmissionRepo
+from app.database.base import BinaryStorage
+
+router = APIRouter()
+
+SubmissionRepoDep = Annotated[SubmissionRepo, Depends(get_repository)]
+FileStorageDep    = Annotated[BinaryStorage, Depends(get_storage)]
+
+CurrentUser       = Annotated[UserContext, Depends(AuthService.get_current_user)]
+
+
+@router.post("/imports/submissions", response_model=ImportReport)
+async def import_submissions_endpoint(
+    user: CurrentUser,
+    repo: SubmissionRepoDep,
+    storage: FileStorageDep,
+    request: Request,
+    manifest: Annotated[Optional[UploadFile], File()] = None,
+    archive: Annotated[Optional[UploadFile], File()] = None,
+    files: Annotated[Optional[List[UploadFile]], File()] = None,
+    publish_events: Annotated[bool, Form(alias="publishEvents")] = False,
+):
+    """
+    Import in blocco da un altro LMS. Due formati:
+      - `archive`: zip con manifest.ndjson nella radice e i file referenziati per percorso
+      - `manifest` (NDJSON) + `files`: file referenziati per nome
+    Una riga del manifest: {"assignmentId", "studentId", "content", "createdAt", "files": [{"name", ...}]}
+    """
+    if (archive is None) == (manifest is None):
+        raise HTTPException(status_code=400, detail="Send either an archive or a manifest")
+
+    publisher = get_publisher(request) if publish_events else None
+    zf: Optional[zipfile.ZipFile] = None
+    try:
+        if archive is not None:
+            try:
+                zf = await asyncio.to_thread(zipfile.ZipFile, archive.file)
+                source = ZipSource(zf)
+                manifest_data = await asyncio.to_thread(source.manifest)
+            except (zipfile.BadZipFile, ValueError) as e:
+                raise HTTPException(status_code=400, detail=str(e))
+        else:
+            source = UploadedFilesSource(f for f in (files or []) if f is not None)
+            manifest_data = await manifest.read()
+
+        return await BulkImportService.import_manifest(
+            manifest_data, source, user, repo, storage, publisher,
+            concurrency=settings.import_concurrency,
+            max_records=settings.import_max_records,
+            inline_max_bytes=settings.content_inline_max_bytes,
+            preview_chars=settings.content_preview_chars,
+        )
+    except PermissionError as e:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        if zf is not None:
+            zf.close()
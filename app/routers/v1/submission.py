@@ -1,40 +1,75 @@
 from datetime import datetime, timezone
-from typing import Annotated, List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, Response, Request
+from typing import Annotated, List, Literal, Optional
+import logging
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, Response, Request, Header, Query, BackgroundTasks
+from fastapi.exceptions import RequestValidationError
+from pydantic import ValidationError
 from fastapi.responses import JSONResponse, StreamingResponse
 
-from app.schemas.submission import SubmissionCreate, Submission, FileMeta
+from app.schemas.submission import SubmissionCreate, Submission, FileMeta, SubmissionBatchRequest
+from app.schemas.records import encode_records, encode_json
+from app.schemas.stats import AssignmentStats
 from app.schemas.context import UserContext
+from app.schemas.similarity import NearDuplicates
 
-from app.core.deps import get_repository, get_storage, get_publisher
+from app.core.config import settings
+from app.core.deps import get_repository, get_storage, get_publisher, get_change_feed, get_fingerprints, get_preview_workers
 
-from app.services.submission_service import submissionService
+from app.services.submission_service import submissionService, SubmissionConflict
 from app.services.auth_service import AuthService
 from app.services.file_upload_service import FileUploadService
 from app.services.publisher_service import SubmissionPublisher
+from app.services.change_feed import SubmissionChangeFeed
+from app.services.similarity_service import SimilarityService
+from app.services.event_service import EventService
+from app.services.preview_service import PreviewService, PreviewWorkers
 
 from app.database.submission_repo import SubmissionRepo
 from app.database.base import BinaryStorage
+from app.database.fingerprint_repo import FingerprintRepo
+from app.database.sharding import file_id_from_uri
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
 SubmissionRepoDep = Annotated[SubmissionRepo, Depends(get_repository)]
 FileStorageDep    = Annotated[BinaryStorage, Depends(get_storage)]
 PublisherDep      = Annotated[SubmissionPublisher, Depends(get_publisher)]
+ChangeFeedDep     = Annotated[SubmissionChangeFeed, Depends(get_change_feed)]
+FingerprintsDep   = Annotated[FingerprintRepo, Depends(get_fingerprints)]
+PreviewWorkersDep = Annotated[Optional[PreviewWorkers], Depends(get_preview_workers)]
 
 CurrentUser       = Annotated[UserContext, Depends(AuthService.get_current_user)]
 
 
+async def _fingerprint_in_background(submission_id: str, assignment_id: str, student_id: str, content: str,
+                                     metas: List[FileMeta], storage: BinaryStorage, fingerprints: FingerprintRepo):
+    try:
+        await SimilarityService.fingerprint(
+            submission_id, assignment_id, student_id, content, metas, storage, fingerprints,
+            max_attachment_bytes=settings.similarity_max_attachment_bytes,
+        )
+    except Exception:
+        # non blocca nulla: la firma viene ricalcolata alla prima richiesta dei quasi-duplicati
+        logger.exception("Firma MinHash non calcolata per %s", submission_id)
+
+
 @router.post("/submissions", status_code=status.HTTP_201_CREATED)
 async def create_submission_for_assignment_endpoint(
     user: CurrentUser,
     repo: SubmissionRepoDep,
     storage: FileStorageDep,
     publisher: PublisherDep,
+    fingerprints: FingerprintsDep,
+    preview_workers: PreviewWorkersDep,
+    background: BackgroundTasks,
     request: Request,
     content: Annotated[str, Form(..., alias="content")],
     assignment_id: Annotated[str, Form(..., alias="assignmentId")],
-    files: Annotated[Optional[List[UploadFile]], File()] = None
+    files: Annotated[Optional[List[UploadFile]], File()] = None,
+    resubmit: Annotated[bool, Form()] = False,
+    keep_files: Annotated[Optional[List[str]], Form(alias="keepFiles")] = None,
 ):
     try:
         payload = SubmissionCreate(
@@ -42,15 +77,30 @@ async def create_submission_for_assignment_endpoint(
             studentId=user.user_id,
             content=content,
         )
-        new_id = await submissionService.create_submission(
-            assignment_id, payload, user, repo
-        )
-
+        previous: Optional[Submission] = None
+        kept: list[FileMeta] = []
+        if resubmit:
+            # nuova versione: file tenuti per nome o checksum (senza ricaricarli),
+            # upload identici riusati per checksum
+            new_id, previous, kept = await submissionService.resubmit(
+                assignment_id, payload, user, repo, storage,
+                keep_files=keep_files or [],
+                inline_max_bytes=settings.content_inline_max_bytes,
+                preview_chars=settings.content_preview_chars,
+                max_delta_chain=settings.content_max_delta_chain,
+            )
+        else:
+            new_id = await submissionService.create_submission(
+                assignment_id, payload, user, repo, storage,
+                inline_max_bytes=settings.content_inline_max_bytes,
+                preview_chars=settings.content_preview_chars,
+            )
         safe_files: List[UploadFile] = [
             f for f in (files or [])
             if f is not None and getattr(f, "filename", None) not in (None, "")
         ]
         if safe_files:
+            kept_paths = {k.path for k in kept}
             metas: list[FileMeta] = await FileUploadService.upload_files(
                 assignment_id=assignment_id,
                 submission_id=new_id,
@@ -58,9 +108,12 @@ async def create_submission_for_assignment_endpoint(
                 user=user,
                 repo=repo,
                 storage=storage,
+                # i file già tenuti con keepFiles non si riusano una seconda volta
+                reuse=[f for f in previous.files if f.path not in kept_paths] if previous else (),
             )
         else:
             metas = []
+        metas = kept + metas
 
         now = datetime.now().astimezone()
         try:
@@ -68,17 +121,25 @@ async def create_submission_for_assignment_endpoint(
                 submissionId = new_id,
                 assignmentId = assignment_id,
                 studentId = user.user_id,
-                deliveredAt = now
+                deliveredAt = now,
+                files = metas,
+                content = content,
             )
             await publisher.publish_submission_report(
                 submissionId = new_id,
                 assignmentId = assignment_id,
                 studentId = user.user_id,
-                deliveredAt = now
+                deliveredAt = now,
+                files = metas,
+                content = content,
             )
         except Exception as e:
             admin = UserContext(user_id="admin", role= "teacher")
-            await submissionService.delete_submission(new_id, admin, repo, storage=storage)
+            await submissionService.delete_submission(
+                new_id, admin, repo, storage=storage,
+                inline_max_bytes=settings.content_inline_max_bytes,
+                preview_chars=settings.content_preview_chars,
+            )
             raise HTTPException(status_code=503, detail=f"Invio evento RabbitMQ fallito: {e}")
 
         # 4) risposta OK
@@ -86,25 +147,44 @@ async def create_submission_for_assignment_endpoint(
         for m in metas:
             path = getattr(m, "path", None)
             filename = getattr(m, "filename", None)
-            file_id = path.split("/")[-1] if isinstance(path, str) and path.startswith("gridfs://") else None
+            file_id = file_id_from_uri(path) if isinstance(path, str) else None
             download_url = str(request.url_for("download_file", file_id=file_id)) if file_id else None
             if filename and download_url:
                 files_payload.append({"filename": filename, "downloadUrl": download_url})
 
-        location = f"/api/v1/submissions/{assignment_id}/{new_id}"
+        # firma per i quasi-duplicati dopo la risposta (testo completo + allegati testuali)
+        background.add_task(
+            _fingerprint_in_background, new_id, assignment_id, user.user_id, content, metas, storage, fingerprints,
+        )
+        # testo e anteprime degli allegati nuovi (quelli riusati hanno già i loro)
+        PreviewService.schedule(
+            preview_workers, new_id, [m for m in metas if m.derived is None], storage, repo,
+            max_source_bytes=settings.preview_max_source_bytes,
+            max_text_chars=settings.preview_max_text_chars,
+        )
+
+        # stesso URL dell'href negli eventi: la route di dettaglio GET /submissions/{id}
+        location = EventService.submission_href(new_id)
         return JSONResponse(
             status_code=status.HTTP_201_CREATED,
             content={
                 "message": "submission created",
                 "submissionId": new_id,
                 "assignmentId": assignment_id,
+                "version": previous.version + 1 if previous else 1,
                 "files": files_payload,
             },
             headers={"Location": location},
         )
 
+    except HTTPException:
+        raise
     except PermissionError as e:
         raise HTTPException(status_code=403, detail=str(e))
+    except SubmissionConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValidationError as e:
+        raise RequestValidationError(e.errors())
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Upload failed: {e}")
 
@@ -127,26 +207,171 @@ async def download_file(file_id: str, storage: FileStorageDep):
         },
     )
 
+@router.get("/submissions/{submission_id}/files/{filename}/preview")
+async def file_preview_endpoint(
+    submission_id: str,
+    filename: str,
+    user: CurrentUser,
+    repo: SubmissionRepoDep,
+    storage: FileStorageDep,
+    kind: Annotated[Literal["preview", "text"], Query()] = "preview",
+):
+    try:
+        found = await PreviewService.get_derived(submission_id, filename, kind, user, repo)
+    except PermissionError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    if found is None:
+        raise HTTPException(status_code=404, detail="Preview not available")
+    file_id, content_type = found
+
+    async def body():
+        async for chunk in storage.stream(file_id):
+            yield chunk
+
+    return StreamingResponse(
+        body(),
+        headers={
+            "Content-Disposition": "inline",
+            "Content-Type": content_type,
+            # blob derivati immutabili
+            "Cache-Control": "private, max-age=86400",
+        },
+    )
+
+
 @router.get("/assignments/{assignment_id}/submissions", response_model=list[Submission])
 async def list_submissions_endpoint(
     assignment_id: str,
     user: CurrentUser,
     repo: SubmissionRepoDep,
+    history: bool = False,
+):
+    try:
+        # percorso veloce: record compatti + orjson, niente doppia validazione
+        # del response_model (che resta solo per la documentazione OpenAPI)
+        # history=true: anche le versioni precedenti delle riconsegne
+        records = await submissionService.list_records_for_assignment(
+            assignment_id, user, repo, include_history=history
+        )
+        return Response(content=encode_records(records), media_type="application/json")
+    except PermissionError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+
+# FEED LIVE (SSE)
+@router.get("/assignments/{assignment_id}/submissions/events")
+async def submission_events_endpoint(
+    assignment_id: str,
+    user: CurrentUser,
+    feed: ChangeFeedDep,
+    last_event_id: Annotated[Optional[str], Header(alias="Last-Event-ID")] = None,
+):
+    try:
+        student_id = submissionService.feed_filter_for(user)
+    except PermissionError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+
+    async def body():
+        async with feed.subscribe(assignment_id, student_id=student_id, last_event_id=last_event_id) as sub:
+            yield b"retry: 3000\n\n"
+            async for ev in sub.events(keepalive=settings.feed_keepalive_seconds):
+                yield ev.to_sse() if ev is not None else b": keepalive\n\n"
+
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# STATISTICHE (solo docente)
+@router.get("/assignments/{assignment_id}/submissions/stats", response_model=AssignmentStats)
+async def submission_stats_endpoint(
+    assignment_id: str,
+    user: CurrentUser,
+    repo: SubmissionRepoDep,
 ):
     try:
-        return await submissionService.list_for_assignment(assignment_id, user, repo)
+        return await submissionService.stats_for_assignment(assignment_id, user, repo)
     except PermissionError as e:
         raise HTTPException(status_code=403, detail=str(e))
-    
+
+# LOOKUP IN BLOCCO
+@router.post("/submissions/batch")
+async def batch_get_submissions_endpoint(
+    body: SubmissionBatchRequest,
+    user: CurrentUser,
+    repo: SubmissionRepoDep,
+):
+    if len(body.ids) > settings.batch_lookup_max_ids:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many ids: max {settings.batch_lookup_max_ids} per request",
+        )
+    try:
+        items, not_found, forbidden = await submissionService.get_many(body.ids, user, repo)
+    except PermissionError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    return Response(
+        content=encode_json({"items": items, "notFound": not_found, "forbidden": forbidden}),
+        media_type="application/json",
+    )
+
+# RICERCA FULL-TEXT (prima del dettaglio: "search" non è un submission_id)
+@router.get("/submissions/search")
+async def search_submissions_endpoint(
+    user: CurrentUser,
+    repo: SubmissionRepoDep,
+    q: Annotated[str, Query(min_length=1)],
+    assignment_id: Annotated[Optional[str], Query(alias="assignmentId")] = None,
+    cursor: Optional[str] = None,
+    limit: Annotated[Optional[int], Query(ge=1)] = None,
+):
+    try:
+        page = await submissionService.search(
+            q, user, repo,
+            assignment_id=assignment_id,
+            cursor=cursor,
+            limit=min(limit or settings.search_default_limit, settings.search_max_limit),
+        )
+    except PermissionError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return Response(content=encode_json(page), media_type="application/json")
+
+# QUASI-DUPLICATI (solo docente)
+@router.get("/submissions/{submission_id}/similar", response_model=NearDuplicates)
+async def near_duplicates_endpoint(
+    submission_id: str,
+    user: CurrentUser,
+    repo: SubmissionRepoDep,
+    storage: FileStorageDep,
+    fingerprints: FingerprintsDep,
+    min_similarity: Annotated[Optional[float], Query(alias="minSimilarity", ge=0, le=1)] = None,
+    limit: Annotated[Optional[int], Query(ge=1)] = None,
+):
+    try:
+        candidates = await SimilarityService.near_duplicates(
+            submission_id, user, repo, fingerprints, storage,
+            min_similarity=settings.similarity_min if min_similarity is None else min_similarity,
+            limit=min(limit or settings.similarity_max_results, settings.similarity_max_results),
+            max_attachment_bytes=settings.similarity_max_attachment_bytes,
+        )
+    except PermissionError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    if candidates is None:
+        raise HTTPException(status_code=404, detail="submission not found")
+    return NearDuplicates(submissionId=submission_id, candidates=candidates)
+
 # DETTAGLIO
 @router.get("/submissions/{submission_id}", response_model=Submission | None)
 async def get_submission_endpoint(
     submission_id: str,
     user: CurrentUser,
     repo: SubmissionRepoDep,
+    storage: FileStorageDep,
 ):
     try:
-        result = await submissionService.get_submission(submission_id, user, repo)
+        result = await submissionService.get_submission(submission_id, user, repo, storage)
         if result is None:
             raise HTTPException(status_code=404, detail="submission not found")
         return result
@@ -160,11 +385,17 @@ async def delete_submission_endpoint(
     user: CurrentUser,
     repo: SubmissionRepoDep,
     storage: FileStorageDep,
+    fingerprints: FingerprintsDep,
 ):
     try:
-        deleted = await submissionService.delete_submission(submission_id, user, repo, storage=storage)
+        deleted = await submissionService.delete_submission(
+            submission_id, user, repo, storage=storage,
+            inline_max_bytes=settings.content_inline_max_bytes,
+            preview_chars=settings.content_preview_chars,
+        )
         if not deleted:
             raise HTTPException(status_code=404, detail="submission not found")
+        await fingerprints.delete(submission_id)
         return Response(status_code=status.HTTP_204_NO_CONTENT)
     except PermissionError as e:
         raise HTTPException(status_code=403, detail=str(e))
\ No newline at end of file
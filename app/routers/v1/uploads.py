@@ -0,0 +1,166 @@
+from datetime import timedelta
+from typing import Annotated, Optional
+from fastapi import APIRouter, Depends, HTTPException, status, Header, Request, Response
+from fastapi.responses import JSONResponse
+
+from app.core.config import settings
+from app.core.deps import get_repository, get_storage, get_upload_sessions, get_fingerprints, get_preview_workers
+from app.schemas.context import UserContext
+from app.schemas.upload import UploadSession, UploadSessionCreate
+
+from app.services.auth_service import AuthService
+from app.services.resumable_upload_service import ResumableUploadService
+from app.services.preview_service import PreviewService, PreviewWorkers
+
+from app.database.submission_repo import SubmissionRepo
+from app.database.upload_session_repo import UploadSessionRepo
+from app.database.fingerprint_repo import FingerprintRepo
+from app.database.base import BinaryStorage, ChunkedBinaryStorage
+from app.database.sharding import file_id_from_uri
+
+router = APIRouter()
+
+SubmissionRepoDep = Annotated[SubmissionRepo, Depends(get_repository)]
+FileStorageDep    = Annotated[BinaryStorage, Depends(get_storage)]
+UploadSessionsDep = Annotated[UploadSessionRepo, Depends(get_upload_sessions)]
+FingerprintsDep   = Annotated[FingerprintRepo, Depends(get_fingerprints)]
+PreviewWorkersDep = Annotated[Optional[PreviewWorkers], Depends(get_preview_workers)]
+
+CurrentUser       = Annotated[UserContext, Depends(AuthService.get_current_user)]
+
+SESSION_TTL = timedelta(seconds=settings.upload_session_ttl_seconds)
+
+
+def _chunked(storage: BinaryStorage) -> ChunkedBinaryStorage:
+    if not isinstance(storage, ChunkedBinaryStorage):
+        raise HTTPException(status_code=501, detail="Resumable uploads not supported by storage")
+    return storage
+
+def _offset_headers(session: UploadSession) -> dict[str, str]:
+    return {
+        "Upload-Offset": str(ResumableUploadService.received_offset(session)),
+        "Upload-Length": str(session.length),
+        "Upload-Chunk-Size": str(session.chunkSize),
+        "Upload-Expires": session.expiresAt.isoformat(),
+        "Cache-Control": "no-store",
+    }
+
+def _status_payload(session: UploadSession) -> dict:
+    return {
+        "uploadId": session.uploadId,
+        "submissionId": session.submissionId,
+        "filename": session.filename,
+        "length": session.length,
+        "chunkSize": session.chunkSize,
+        "offset": ResumableUploadService.received_offset(session),
+        "receivedChunks": len(session.received),
+        "expiresAt": session.expiresAt.isoformat(),
+    }
+
+
+@router.post("/submissions/{submission_id}/uploads", status_code=status.HTTP_201_CREATED)
+async def create_upload_session_endpoint(
+    submission_id: str,
+    data: UploadSessionCreate,
+    user: CurrentUser,
+    repo: SubmissionRepoDep,
+    storage: FileStorageDep,
+    sessions: UploadSessionsDep,
+):
+    try:
+        session = await ResumableUploadService.create_session(
+            submission_id, data, user, repo, sessions, _chunked(storage), ttl=SESSION_TTL
+        )
+    except PermissionError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if session is None:
+        raise HTTPException(status_code=404, detail="submission not found")
+
+    headers = _offset_headers(session)
+    headers["Location"] = f"/api/v1/uploads/{session.uploadId}"
+    return JSONResponse(status_code=status.HTTP_201_CREATED, content=_status_payload(session), headers=headers)
+
+
+@router.head("/uploads/{upload_id}")
+async def upload_offset_endpoint(upload_id: str, user: CurrentUser, sessions: UploadSessionsDep):
+    try:
+        session = await ResumableUploadService.get_session(upload_id, user, sessions)
+    except PermissionError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    if session is None:
+        raise HTTPException(status_code=404, detail="upload not found")
+    return Response(status_code=status.HTTP_200_OK, headers=_offset_headers(session))
+
+
+@router.get("/uploads/{upload_id}")
+async def upload_status_endpoint(upload_id: str, user: CurrentUser, sessions: UploadSessionsDep):
+    try:
+        session = await ResumableUploadService.get_session(upload_id, user, sessions)
+    except PermissionError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    if session is None:
+        raise HTTPException(status_code=404, detail="upload not found")
+    return JSONResponse(content=_status_payload(session), headers=_offset_headers(session))
+
+
+@router.patch("/uploads/{upload_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def upload_chunk_endpoint(
+    upload_id: str,
+    request: Request,
+    user: CurrentUser,
+    storage: FileStorageDep,
+    sessions: UploadSessionsDep,
+    upload_offset: Annotated[int, Header(alias="Upload-Offset")],
+):
+    try:
+        session = await ResumableUploadService.write(
+            upload_id, upload_offset, request.stream(), user, sessions, _chunked(storage), ttl=SESSION_TTL
+        )
+    except PermissionError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if session is None:
+        raise HTTPException(status_code=404, detail="upload not found")
+    return Response(status_code=status.HTTP_204_NO_CONTENT, headers=_offset_headers(session))
+
+
+@router.post("/uploads/{upload_id}/complete", status_code=status.HTTP_201_CREATED)
+async def complete_upload_endpoint(
+    upload_id: str,
+    request: Request,
+    user: CurrentUser,
+    repo: SubmissionRepoDep,
+    storage: FileStorageDep,
+    sessions: UploadSessionsDep,
+    fingerprints: FingerprintsDep,
+    preview_workers: PreviewWorkersDep,
+):
+    try:
+        completed = await ResumableUploadService.complete(upload_id, user, repo, sessions, _chunked(storage))
+    except PermissionError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if completed is None:
+        raise HTTPException(status_code=404, detail="upload not found")
+    session, meta = completed
+    # nuovo allegato: la firma dei quasi-duplicati va ricalcolata (alla prossima richiesta)
+    await fingerprints.delete(session.submissionId)
+    PreviewService.schedule(
+        preview_workers, session.submissionId, [meta], storage, repo,
+        max_source_bytes=settings.preview_max_source_bytes,
+        max_text_chars=settings.preview_max_text_chars,
+    )
+
+    file_id = file_id_from_uri(meta.path)
+    return JSONResponse(
+        status_code=status.HTTP_201_CREATED,
+        content={
+            "filename": meta.filename,
+            "size": meta.size,
+            "downloadUrl": str(request.url_for("download_file", file_id=file_id)),
+        },
+    )
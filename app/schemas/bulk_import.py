@@ -0,0 +1,40 @@
+from datetime import datetime
+from typing import List, Optional
+from pydantic import BaseModel
+
+from app.schemas.submission import FileMeta, ContentRef
+
+class ImportFile(BaseModel):
+    name: str                          # percorso nell'archivio / nome del file caricato
+    filename: Optional[str] = None     # nome mostrato (default: ultimo segmento di name)
+    contentType: Optional[str] = None
+
+class ImportRecord(BaseModel):
+    """Una riga del manifest NDJSON."""
+    assignmentId: str
+    studentId: str
+    content: str = ""
+    createdAt: Optional[datetime] = None   # data di consegna originale
+    files: List[ImportFile] = []
+
+class NewSubmission(BaseModel):
+    """Submission completa da inserire in blocco (file già caricati)."""
+    assignmentId: str
+    studentId: str
+    content: str
+    createdAt: datetime
+    files: List[FileMeta] = []
+    contentRef: Optional[ContentRef] = None
+    searchText: Optional[str] = None         # testo completo da indicizzare se contentRef è impostato
+
+class ImportResult(BaseModel):
+    line: int
+    status: str                        # "imported" | "error"
+    submissionId: Optional[str] = None
+    error: Optional[str] = None
+    warning: Optional[str] = None
+
+class ImportReport(BaseModel):
+    imported: int
+    failed: int
+    results: List[ImportResult]
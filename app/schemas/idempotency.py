@@ -0,0 +1,12 @@
+from datetime import datetime
+from typing import List, Optional
+from pydantic import BaseModel
+
+class IdempotencyRecord(BaseModel):
+    key: str                      # "<userId>:<Idempotency-Key>"
+    fingerprint: str              # metodo + path della richiesta originale
+    status: str                   # "pending" | "completed"
+    responseStatus: Optional[int] = None
+    responseHeaders: List[List[str]] = []
+    responseBody: Optional[bytes] = None
+    expiresAt: datetime
@@ -0,0 +1,88 @@
+# app/schemas/records.py
+"""
+Record compatti per il percorso di lettura veloce.
+
+I documenti Mongo vengono decodificati in dataclass con __slots__ (niente
+validazione Pydantic) e serializzati direttamente con orjson. L'ordine dei
+campi e il formato delle date ricalcano `Submission`, quindi il JSON
+prodotto è identico a quello di `response_model=list[Submission]`.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Iterable, List, Optional
+
+import orjson
+
+@dataclass(slots=True)
+class FileRecord:
+    filename: str
+    path: str
+    size: int
+    contentType: Optional[str] = None
+    checksum: Optional[str] = None
+    derived: Optional[dict[str, Any]] = None  # già nel formato di DerivedFiles
+
+    @classmethod
+    def from_doc(cls, d: dict) -> "FileRecord":
+        return cls(d["filename"], d["path"], d["size"], d.get("contentType"), d.get("checksum"), d.get("derived"))
+
+@dataclass(slots=True)
+class SubmissionRecord:
+    assignmentId: str
+    studentId: Optional[str]
+    content: str
+    submissionId: str
+    createdAt: datetime
+    files: List[FileRecord] = field(default_factory=list)
+    contentTruncated: bool = False
+    version: int = 1
+    previousId: Optional[str] = None
+    latest: bool = True
+
+    @classmethod
+    def from_doc(cls, d: dict) -> "SubmissionRecord":
+        return cls(
+            d["assignmentId"],
+            d.get("studentId"),
+            d.get("content", ""),
+            d["submissionId"],
+            d["createdAt"],
+            [FileRecord.from_doc(f) for f in d.get("files", ())],
+            d.get("contentRef") is not None or d.get("contentDelta") is not None or d.get("contentTruncated", False),
+            d.get("version", 1),
+            d.get("previousId"),
+            d.get("latest") is not False,
+        )
+
+# Campi letti dal percorso veloce (niente _id né campi interni)
+RECORD_PROJECTION = {
+    "_id": 0,
+    "assignmentId": 1,
+    "studentId": 1,
+    "content": 1,
+    "submissionId": 1,
+    "createdAt": 1,
+    "files": 1,
+    "contentRef.size": 1,
+    "contentDelta.base": 1,
+    "version": 1,
+    "previousId": 1,
+    "latest": 1,
+}
+
+# Solo l'ultima versione di ogni consegna (i documenti precedenti alle versioni non hanno `latest`)
+LATEST_FILTER = {"latest": {"$ne": False}}
+
+def encode_json(obj: Any) -> bytes:
+    """Serializza record (anche annidati in dict/liste) con le stesse convenzioni di Pydantic."""
+    # OPT_UTC_Z: le date UTC escono come "...Z", come fa Pydantic
+    return orjson.dumps(obj, option=orjson.OPT_UTC_Z)
+
+def encode_records(records: Iterable[SubmissionRecord]) -> bytes:
+    """Serializza una lista di record nello stesso JSON di list[Submission]."""
+    return encode_json(list(records))
+
+def encode_record(record: SubmissionRecord) -> bytes:
+    return encode_json(record)
@@ -0,0 +1,16 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from app.schemas.records import SubmissionRecord
+
+@dataclass(slots=True)
+class SearchHit:
+    score: float
+    submission: SubmissionRecord
+
+@dataclass(slots=True)
+class SearchPage:
+    items: List[SearchHit] = field(default_factory=list)
+    nextCursor: Optional[str] = None
@@ -0,0 +1,20 @@
+from typing import List, Optional
+from pydantic import BaseModel
+
+class Fingerprint(BaseModel):
+    """Firma MinHash di una submission (testo + allegati testuali) e chiavi LSH per banda."""
+    submissionId: str
+    assignmentId: str
+    studentId: Optional[str] = None
+    signature: bytes          # NUM_PERM valori uint32
+    bands: List[str]
+    shingles: int = 0
+
+class SimilarSubmission(BaseModel):
+    submissionId: str
+    studentId: Optional[str] = None
+    similarity: float         # stima della similarità di Jaccard
+
+class NearDuplicates(BaseModel):
+    submissionId: str
+    candidates: List[SimilarSubmission]
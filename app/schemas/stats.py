@@ -0,0 +1,11 @@
+from datetime import datetime
+from typing import Optional
+from pydantic import BaseModel
+
+class AssignmentStats(BaseModel):
+    assignmentId: str
+    submissionCount: int = 0
+    fileCount: int = 0
+    totalBytes: int = 0
+    firstSubmissionAt: Optional[datetime] = None
+    lastSubmissionAt: Optional[datetime] = None
@@ -1,11 +1,33 @@
-from pydantic import BaseModel
-from typing import List
+from pydantic import BaseModel, Field
+from typing import List, Optional, Union
 from datetime import datetime
 
+class DerivedFiles(BaseModel):
+    status: str = "ready"             # ready | unsupported | failed
+    textUri: Optional[str] = None     # testo estratto (UTF-8)
+    textSize: int = 0
+    textTruncated: bool = False
+    previewUri: Optional[str] = None  # prima pagina o miniatura
+    previewContentType: Optional[str] = None
+
 class FileMeta(BaseModel):
     filename: str
     path: str
     size: int
+    contentType: Optional[str] = None
+    checksum: Optional[str] = None    # sha256 esadecimale del contenuto
+    derived: Optional[DerivedFiles] = None  # anteprime estratte in background
+
+class ContentRef(BaseModel):
+    uri: str            # blob compresso nello storage binario
+    size: int           # byte UTF-8 del testo originale
+    encoding: str = "zlib"
+
+class ContentDelta(BaseModel):
+    base: str           # submissionId della versione precedente
+    ops: List[Union[List[int], str]]  # [i, j] = righe i..j della base, stringa = testo nuovo
+    size: int           # byte UTF-8 del testo ricostruito
+    depth: int = 1      # delta da attraversare fino a un testo completo
 
 class SubmissionCreate(BaseModel):
     assignmentId: str
@@ -16,3 +38,12 @@ class Submission(SubmissionCreate):
     submissionId: str
     createdAt: datetime
     files: List[FileMeta] = []
+    contentTruncated: bool = False  # content contiene solo l'anteprima
+    version: int = 1
+    previousId: Optional[str] = None  # versione precedente (riconsegna)
+    latest: bool = True
+    contentRef: Optional[ContentRef] = Field(default=None, exclude=True)
+    contentDelta: Optional[ContentDelta] = Field(default=None, exclude=True)
+
+class SubmissionBatchRequest(BaseModel):
+    ids: List[str]
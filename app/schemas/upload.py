@@ -0,0 +1,20 @@
+from datetime import datetime
+from typing import List, Optional
+from pydantic import BaseModel
+
+class UploadSessionCreate(BaseModel):
+    filename: str
+    length: int
+    contentType: Optional[str] = None
+
+class UploadSession(UploadSessionCreate):
+    uploadId: str
+    submissionId: str
+    assignmentId: str
+    studentId: str
+    fileId: str
+    chunkSize: int
+    received: List[int] = []   # indici dei chunk già scritti (anche non contigui)
+    createdAt: datetime
+    expiresAt: datetime
+    status: str = "open"       # open | completing (finalizzazione in corso)
@@ -0,0 +1,103 @@
+# app/services/archive_service.py
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Any, Optional
+
+from app.database.archive_storage import ARCHIVE_SHARD
+from app.database.sharding import file_id_from_uri, split_file_id
+from app.services.content_service import ContentService, DEFAULT_PREVIEW_CHARS
+
+STUB_FIELDS = ("_id", "submissionId", "assignmentId", "studentId", "createdAt", "version", "previousId", "latest")
+
+class ArchiveService:
+    """
+    Regole dei documenti archiviati (il job è app/jobs/archive_submissions.py).
+
+    Lo stub che resta in `submissions` ha gli stessi campi letti dalle API
+    (id, assignment, studente, data, metadati dei file, anteprima del testo)
+    più `archived`; i path puntano ai blob nel bucket freddo e il testo
+    completo è un contentRef, quindi dettaglio e download funzionano come
+    per le submission "calde". Il documento originale è nel bundle.
+    """
+
+    @staticmethod
+    def blob_uris(doc: dict[str, Any]) -> list[str]:
+        """URI dei blob referenziati da un documento (allegati, loro derivati e testo fuori documento)."""
+        uris = []
+        for f in doc.get("files", ()):
+            derived = f.get("derived") or {}
+            uris += [u for u in (f.get("path"), derived.get("textUri"), derived.get("previewUri")) if u]
+        ref = doc.get("contentRef")
+        if ref and ref.get("uri"):
+            uris.append(ref["uri"])
+        return uris
+
+    @staticmethod
+    def is_archive_uri(uri: str) -> bool:
+        file_id = file_id_from_uri(uri)
+        return file_id is not None and split_file_id(file_id)[0] == ARCHIVE_SHARD
+
+    @staticmethod
+    def _moved_file(f: dict[str, Any], moved: dict[str, str]) -> dict[str, Any]:
+        out = {**f, "path": moved.get(f["path"], f["path"])}
+        derived = f.get("derived")
+        if derived:
+            out["derived"] = {
+                **derived,
+                **{k: moved.get(derived[k], derived[k]) for k in ("textUri", "previewUri") if derived.get(k)},
+            }
+        return out
+
+    @staticmethod
+    def make_stub(
+        doc: dict[str, Any],
+        *,
+        moved: dict[str, str],
+        bundle_uri: str,
+        archived_at: datetime,
+        content: Optional[str] = None,
+        content_ref: Optional[dict[str, Any]] = None,
+        preview_chars: int = DEFAULT_PREVIEW_CHARS,
+    ) -> dict[str, Any]:
+        """
+        moved: URI originale -> URI nel bucket freddo.
+        content/content_ref: anteprima e blob freddo del testo inline, se è stato spostato.
+        """
+        stub = {k: doc[k] for k in STUB_FIELDS if k in doc}
+        stub["files"] = [ArchiveService._moved_file(f, moved) for f in doc.get("files", ())]
+
+        ref = doc.get("contentRef")
+        if doc.get("contentDelta"):
+            # delta rispetto alla versione precedente (archiviata con lo stesso assignment)
+            stub["content"] = doc.get("content", "")
+            stub["contentDelta"] = doc["contentDelta"]
+        elif ref:
+            stub["content"] = doc.get("content", "")
+            stub["contentRef"] = {**ref, "uri": moved.get(ref["uri"], ref["uri"])}
+        elif content_ref is not None:
+            stub["content"] = content if content is not None else ContentService.preview(doc.get("content", ""), preview_chars)
+            stub["contentRef"] = content_ref
+        else:
+            stub["content"] = doc.get("content", "")
+
+        stub["archived"] = {"bundle": bundle_uri, "at": archived_at}
+        return stub
+
+    @staticmethod
+    def restored_doc(original: dict[str, Any], stub: dict[str, Any]) -> dict[str, Any]:
+        """Documento originale dal bundle, più i file aggiunti allo stub dopo l'archiviazione."""
+        known = {f.get("path") for f in original.get("files", ())}
+        added = [
+            f for f in stub.get("files", ())
+            if not ArchiveService.is_archive_uri(f["path"]) and f["path"] not in known
+        ]
+        doc = dict(original)
+        if added:
+            doc["files"] = [*original.get("files", ()), *added]
+        return doc
+
+    @staticmethod
+    def cold_blob_uris(stub: dict[str, Any]) -> list[str]:
+        """Blob dello stub che vivono nel bucket freddo (da eliminare dopo il restore)."""
+        return [uri for uri in ArchiveService.blob_uris(stub) if ArchiveService.is_archive_uri(uri)]
@@ -1,10 +1,12 @@
 from __future__ import annotations
 
-from fastapi import Depends, HTTPException
+from fastapi import Depends, HTTPException, Request
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 import jwt
 
+from app.core.tracing import traced
 from app.core.config import settings
+from app.core.auth_context import cached_user
 from app.schemas.context import UserContext
 
 security = HTTPBearer() 
@@ -15,10 +17,8 @@ class AuthService:
     PUBLIC_KEY = settings.jwt_public_key     
 
     @staticmethod
-    async def get_current_user(
-        credentials: HTTPAuthorizationCredentials = Depends(security),
-    ) -> UserContext:
-        token = credentials.credentials
+    @traced()
+    def decode_token(token: str) -> UserContext:
         try:
             payload = jwt.decode(
                 token,
@@ -37,3 +37,18 @@ class AuthService:
             raise HTTPException(status_code=401, detail="Token expired")
         except jwt.InvalidTokenError:
             raise HTTPException(status_code=401, detail="Invalid token")
+
+    @staticmethod
+    async def get_current_user(
+        request: Request,
+        credentials: HTTPAuthorizationCredentials = Depends(security),
+    ) -> UserContext:
+        # già decodificato da AuthContextMiddleware: niente secondo jwt.decode
+        decoded, user, error = cached_user(request.scope)
+        if decoded:
+            if user is not None:
+                return user
+            if isinstance(error, HTTPException):
+                raise error
+            raise HTTPException(status_code=401, detail="Invalid token")
+        return AuthService.decode_token(credentials.credentials)
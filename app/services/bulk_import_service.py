@@ -0,0 +1,263 @@
+# app/services/bulk_import_service.py
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import zipfile
+from datetime import datetime, timezone
+from typing import AsyncIterator, Iterable, Optional, Protocol, Sequence
+
+from pydantic import ValidationError
+
+from app.schemas.bulk_import import ImportRecord, ImportReport, ImportResult, NewSubmission
+from app.schemas.context import UserContext
+from app.schemas.submission import FileMeta
+from app.database.base import BinaryStorage
+from app.database.sharding import file_id_from_uri
+from app.database.submission_repo import SubmissionRepo
+from app.services.content_service import ContentService, DEFAULT_INLINE_MAX_BYTES, DEFAULT_PREVIEW_CHARS
+from app.services.submission_service import _is_teacher
+
+logger = logging.getLogger(__name__)
+
+READ_CHUNK = 1024 * 1024
+MANIFEST_NAME = "manifest.ndjson"
+
+# -------------------------
+# Sorgenti dei file
+# -------------------------
+class FileSource(Protocol):
+    def names(self) -> set[str]: ...
+    def open(self, name: str) -> AsyncIterator[bytes]: ...
+
+class UploadedFileLike(Protocol):
+    filename: str
+    async def read(self, size: int = ...) -> bytes: ...
+
+class UploadedFilesSource:
+    """File caricati insieme al manifest (multipart), indicizzati per nome."""
+
+    def __init__(self, files: Iterable[UploadedFileLike]):
+        self._files = {f.filename: f for f in files if f.filename}
+
+    def names(self) -> set[str]:
+        return set(self._files)
+
+    async def open(self, name: str) -> AsyncIterator[bytes]:
+        f = self._files[name]
+        while chunk := await f.read(READ_CHUNK):
+            yield chunk
+
+class ZipSource:
+    """Archivio zip: manifest.ndjson nella radice, file referenziati per percorso."""
+
+    def __init__(self, archive: zipfile.ZipFile):
+        self.archive = archive
+
+    def names(self) -> set[str]:
+        return {i.filename for i in self.archive.infolist() if not i.is_dir()}
+
+    def manifest(self) -> bytes:
+        try:
+            return self.archive.read(MANIFEST_NAME)
+        except KeyError:
+            raise ValueError(f"Archive has no {MANIFEST_NAME}") from None
+
+    async def open(self, name: str) -> AsyncIterator[bytes]:
+        # zipfile è sincrono (e decomprime): letture fuori dall'event loop
+        fh = await asyncio.to_thread(self.archive.open, name)
+        try:
+            while chunk := await asyncio.to_thread(fh.read, READ_CHUNK):
+                yield chunk
+        finally:
+            fh.close()
+
+class EventPublisher(Protocol):
+    async def publish_submission_delivered(
+        self, assignmentId: str, submissionId: str, studentId: str, deliveredAt: datetime, *,
+        files: Sequence[FileMeta] = ..., content: Optional[str] = ..., contentTruncated: bool = ...,
+    ) -> None: ...
+    async def publish_submission_report(
+        self, assignmentId: str, submissionId: str, studentId: str, deliveredAt: datetime, *,
+        files: Sequence[FileMeta] = ..., content: Optional[str] = ..., contentTruncated: bool = ...,
+    ) -> None: ...
+
+# -------------------------
+# Servizio
+# -------------------------
+def _validation_message(e: ValidationError) -> str:
+    err = e.errors()[0]
+    loc = ".".join(str(p) for p in err.get("loc", ()))
+    return f"{loc}: {err['msg']}" if loc else err["msg"]
+
+class BulkImportService:
+    """
+    Import in blocco (es. migrazione da un altro LMS): i blob vengono scritti
+    in parallelo (al più `concurrency` alla volta), le submission inserite con
+    un solo insert_many non ordinato, gli eventi pubblicati solo se richiesto.
+    Ogni riga del manifest ha il suo esito; un errore non ferma le altre.
+    """
+
+    @staticmethod
+    def parse_manifest(data: bytes, *, max_records: int) -> tuple[list[tuple[int, ImportRecord]], list[ImportResult]]:
+        records: list[tuple[int, ImportRecord]] = []
+        errors: list[ImportResult] = []
+        for line_no, raw in enumerate(data.splitlines(), start=1):
+            if not raw.strip():
+                continue
+            if len(records) + len(errors) >= max_records:
+                raise ValueError(f"Manifest has too many records (max {max_records})")
+            try:
+                records.append((line_no, ImportRecord.model_validate(json.loads(raw))))
+            except json.JSONDecodeError as e:
+                errors.append(ImportResult(line=line_no, status="error", error=f"invalid JSON: {e.msg}"))
+            except ValidationError as e:
+                errors.append(ImportResult(line=line_no, status="error", error=_validation_message(e)))
+        return records, errors
+
+    @staticmethod
+    async def import_manifest(
+        manifest: bytes,
+        source: FileSource,
+        user: UserContext,
+        repo: SubmissionRepo,
+        storage: BinaryStorage,
+        publisher: Optional[EventPublisher] = None,
+        *,
+        concurrency: int = 16,
+        max_records: int = 20000,
+        inline_max_bytes: int = DEFAULT_INLINE_MAX_BYTES,
+        preview_chars: int = DEFAULT_PREVIEW_CHARS,
+    ) -> ImportReport:
+        if not _is_teacher(user.role):
+            raise PermissionError("Only teachers can import submissions")
+
+        records, results = BulkImportService.parse_manifest(manifest, max_records=max_records)
+
+        def fail(line: int, error: str) -> None:
+            results.append(ImportResult(line=line, status="error", error=error))
+
+        # 1) controlli senza I/O: duplicati nel manifest, file mancanti o condivisi
+        available = source.names()
+        seen_pairs: set[tuple[str, str]] = set()
+        used_files: set[str] = set()
+        candidates: list[tuple[int, ImportRecord]] = []
+        for line, rec in records:
+            pair = (rec.assignmentId, rec.studentId)
+            names = [f.name for f in rec.files]
+            missing = [n for n in names if n not in available]
+            if pair in seen_pairs:
+                fail(line, "duplicate record in manifest")
+            elif missing:
+                fail(line, f"missing file: {missing[0]}")
+            elif used_files.intersection(names) or len(set(names)) != len(names):
+                fail(line, "file referenced by more than one record")
+            else:
+                seen_pairs.add(pair)
+                used_files.update(names)
+                candidates.append((line, rec))
+
+        # 2) una sola query per chi ha già consegnato
+        existing = await repo.find_submitted_pairs([(r.assignmentId, r.studentId) for _, r in candidates])
+        ready: list[tuple[int, ImportRecord]] = []
+        for line, rec in candidates:
+            if (rec.assignmentId, rec.studentId) in existing:
+                fail(line, "already submitted for this assignment")
+            else:
+                ready.append((line, rec))
+
+        # 3) blob in parallelo
+        sem = asyncio.Semaphore(max(concurrency, 1))
+        now = datetime.now(timezone.utc)
+
+        async def prepare(rec: ImportRecord) -> tuple[NewSubmission, list[str]]:
+            uploaded: list[str] = []
+            try:
+                metas: list[FileMeta] = []
+                for f in rec.files:
+                    async with sem:
+                        stored = await storage.upload(
+                            filename=f.filename or f.name.rsplit("/", 1)[-1],
+                            content_type=f.contentType,
+                            data=source.open(f.name),
+                            metadata={"assignmentId": rec.assignmentId, "studentId": rec.studentId, "imported": True},
+                        )
+                    uploaded.append(stored.uri)
+                    metas.append(FileMeta(
+                        filename=stored.filename, path=stored.uri, size=stored.size,
+                        contentType=stored.content_type, checksum=stored.checksum,
+                    ))
+
+                content, content_ref = await ContentService.offload(
+                    rec.content, storage,
+                    inline_max_bytes=inline_max_bytes,
+                    preview_chars=preview_chars,
+                    metadata={"assignmentId": rec.assignmentId, "studentId": rec.studentId},
+                )
+                if content_ref is not None:
+                    uploaded.append(content_ref.uri)
+                return NewSubmission(
+                    assignmentId=rec.assignmentId,
+                    studentId=rec.studentId,
+                    content=content,
+                    createdAt=rec.createdAt or now,
+                    files=metas,
+                    contentRef=content_ref,
+                    searchText=rec.content if content_ref is not None else None,
+                ), uploaded
+            except BaseException:
+                await BulkImportService._discard(storage, uploaded)
+                raise
+
+        prepared = await asyncio.gather(*(prepare(rec) for _, rec in ready), return_exceptions=True)
+        to_insert: list[tuple[int, NewSubmission, list[str]]] = []
+        for (line, _), outcome in zip(ready, prepared):
+            if isinstance(outcome, BaseException):
+                fail(line, f"file upload failed: {outcome}")
+            else:
+                to_insert.append((line, *outcome))
+
+        # 4) insert_many non ordinato
+        inserted = await repo.create_many([item for _, item, _ in to_insert]) if to_insert else []
+        published: list[tuple[ImportResult, NewSubmission]] = []
+        for (line, item, uploaded), (submission_id, error) in zip(to_insert, inserted):
+            if submission_id is None:
+                await BulkImportService._discard(storage, uploaded)
+                fail(line, error or "insert failed")
+                continue
+            result = ImportResult(line=line, status="imported", submissionId=submission_id)
+            results.append(result)
+            published.append((result, item))
+
+        # 5) eventi (opzionali: una migrazione di solito non deve riattivare le review)
+        if publisher is not None and published:
+            async def publish(result: ImportResult, item: NewSubmission) -> None:
+                async with sem:
+                    try:
+                        kwargs = dict(
+                            assignmentId=item.assignmentId, submissionId=result.submissionId,
+                            studentId=item.studentId, deliveredAt=item.createdAt,
+                            files=item.files, content=item.content, contentTruncated=item.contentRef is not None,
+                        )
+                        await publisher.publish_submission_delivered(**kwargs)
+                        await publisher.publish_submission_report(**kwargs)
+                    except Exception as e:
+                        result.warning = f"event not published: {e}"
+
+            await asyncio.gather(*(publish(r, item) for r, item in published))
+
+        results.sort(key=lambda r: r.line)
+        imported = sum(1 for r in results if r.status == "imported")
+        return ImportReport(imported=imported, failed=len(results) - imported, results=results)
+
+    @staticmethod
+    async def _discard(storage: BinaryStorage, uris: list[str]) -> None:
+        for uri in uris:
+            file_id = file_id_from_uri(uri)
+            if file_id is None:
+                continue
+            try:
+                await storage.delete(file_id)
+            except Exception as e:
+                logger.warning("Blob importato non eliminato (%s): %s", uri, e)
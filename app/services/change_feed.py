@@ -0,0 +1,303 @@
+# app/services/change_feed.py
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Optional
+
+import orjson
+
+from app.schemas.records import SubmissionRecord, FileRecord
+
+logger = logging.getLogger(__name__)
+
+EVENT_CREATED = "submission.created"
+EVENT_FILE_ADDED = "submission.file_added"
+EVENT_DELETED = "submission.deleted"
+EVENT_REPLACED = "submission.replaced"  # documento riscritto (archiviazione/ripristino): record completo
+EVENT_SUPERSEDED = "submission.superseded"  # non è più l'ultima versione: il client la nasconde
+EVENT_RESET = "reset"  # il client deve ricaricare la lista (resume token non più disponibile)
+
+# ChangeStreamFatalError, ChangeStreamHistoryLost: il resume token non è più utilizzabile
+RESUME_TOKEN_LOST_CODES = (280, 286)
+
+WATCH_PIPELINE = [{"$match": {"operationType": {"$in": ["insert", "update", "replace", "delete"]}}}]
+
+@dataclass(slots=True)
+class FeedEvent:
+    id: str
+    type: str
+    assignmentId: Optional[str]
+    studentId: Optional[str]
+    data: Any
+
+    def to_sse(self) -> bytes:
+        data = orjson.dumps(self.data, option=orjson.OPT_UTC_Z)
+        return b"id: %s\nevent: %s\ndata: %s\n\n" % (self.id.encode(), self.type.encode(), data)
+
+
+def decode_change(change: dict) -> Optional[FeedEvent]:
+    """Converte un evento del change stream in un delta per i client (None se non interessa)."""
+    token = change["_id"]["_data"] if isinstance(change.get("_id"), dict) else str(change.get("_id"))
+    op = change.get("operationType")
+
+    if op == "insert":
+        d = change.get("fullDocument") or {}
+        return FeedEvent(token, EVENT_CREATED, d.get("assignmentId"), d.get("studentId"), SubmissionRecord.from_doc(d))
+
+    if op == "replace":
+        # stub d'archivio e documenti ripristinati: stessi campi API, il client sostituisce il record
+        d = change.get("fullDocument")
+        if not d:
+            return None
+        return FeedEvent(token, EVENT_REPLACED, d.get("assignmentId"), d.get("studentId"), SubmissionRecord.from_doc(d))
+
+    if op == "update":
+        updated = (change.get("updateDescription") or {}).get("updatedFields") or {}
+        d = change.get("fullDocument")
+        if "latest" in updated and d:
+            # create_version toglie `latest` alla versione precedente; delete lo rimette
+            if updated["latest"] is False:
+                return FeedEvent(token, EVENT_SUPERSEDED, d.get("assignmentId"), d.get("studentId"), {
+                    "submissionId": d.get("submissionId"),
+                })
+            return FeedEvent(token, EVENT_REPLACED, d.get("assignmentId"), d.get("studentId"), SubmissionRecord.from_doc(d))
+        # $push su files -> "files.<n>": {...}, oppure "files": [...] se l'array era vuoto/assente
+        added: list[FileRecord] = []
+        for key, value in updated.items():
+            if key == "files":
+                added.extend(FileRecord.from_doc(f) for f in value)
+            elif key.startswith("files.") and key.count(".") == 1:
+                added.append(FileRecord.from_doc(value))
+        if not added or not d:
+            return None
+        return FeedEvent(token, EVENT_FILE_ADDED, d.get("assignmentId"), d.get("studentId"), {
+            "submissionId": d.get("submissionId"),
+            "files": added,
+        })
+
+    if op == "delete":
+        # serve la pre-image per sapere a quale assignment apparteneva
+        d = change.get("fullDocumentBeforeChange")
+        if not d:
+            return None
+        return FeedEvent(token, EVENT_DELETED, d.get("assignmentId"), d.get("studentId"), {
+            "submissionId": d.get("submissionId"),
+        })
+
+    return None
+
+
+class Subscription:
+    def __init__(self, assignment_id: str, student_id: Optional[str], queue_size: int):
+        self.assignment_id = assignment_id
+        self.student_id = student_id
+        self.queue: asyncio.Queue[FeedEvent] = asyncio.Queue(maxsize=queue_size)
+        self.overflowed = False
+        # in recupero da un cursore proprio: gli eventi del cursore condiviso arrivano dopo
+        self.catching_up = False
+
+    def matches(self, ev: FeedEvent) -> bool:
+        if ev.type == EVENT_RESET:
+            return True
+        if ev.assignmentId != self.assignment_id:
+            return False
+        return self.student_id is None or ev.studentId == self.student_id
+
+    def offer(self, ev: FeedEvent, *, catch_up: bool = False) -> None:
+        if self.overflowed or self.catching_up != catch_up or not self.matches(ev):
+            return
+        try:
+            self.queue.put_nowait(ev)
+        except asyncio.QueueFull:
+            # client troppo lento: non blocca il cursore condiviso, riceverà un reset
+            self.overflowed = True
+
+    async def events(self, keepalive: float) -> AsyncIterator[Optional[FeedEvent]]:
+        """Eventi in arrivo; None ogni `keepalive` secondi di silenzio."""
+        while True:
+            if self.overflowed and self.queue.empty():
+                yield FeedEvent("", EVENT_RESET, None, None, {"reason": "overflow"})
+                return
+            try:
+                yield await asyncio.wait_for(self.queue.get(), timeout=keepalive)
+            except asyncio.TimeoutError:
+                yield None
+
+
+class SubmissionChangeFeed:
+    """
+    Un unico change stream sulla collection `submissions` per worker,
+    condiviso da tutti i subscriber SSE: il cursore parte col primo client
+    e si ferma `linger` secondi dopo l'uscita dell'ultimo. Gli ultimi eventi
+    restano in un buffer circolare, così un client che si riconnette con
+    Last-Event-ID riceve solo i delta persi invece di ricaricare tutto.
+
+    L'id di ogni evento è il resume token del change stream. Se non è nel
+    buffer locale (il client era su un altro worker, o il cursore si è
+    fermato nel frattempo) il client riparte da un cursore proprio aperto
+    con `start_after`, finché non incontra un evento già nel buffer: da lì
+    passa al cursore condiviso. Solo se il token non è più utilizzabile
+    riceve un reset.
+
+    Quando il cursore condiviso si ferma davvero, resume token e buffer si
+    azzerano: il prossimo parte da "adesso" (niente arretrato da riversare
+    ai nuovi client).
+    """
+
+    def __init__(
+        self,
+        collection: Any,
+        *,
+        buffer_size: int = 1000,
+        queue_size: int = 256,
+        retry_delay: float = 2.0,
+        linger: float = 30.0,
+    ):
+        self.collection = collection
+        self.queue_size = queue_size
+        self.retry_delay = retry_delay
+        self.linger = linger
+        self._recent: deque[FeedEvent] = deque(maxlen=buffer_size)
+        self._subscribers: set[Subscription] = set()
+        self._resume_token: Optional[dict] = None
+        self._task: Optional[asyncio.Task] = None
+        self._catch_ups: set[asyncio.Task] = set()
+        self._idle: Optional[asyncio.TimerHandle] = None
+
+    async def enable_pre_images(self) -> None:
+        """Le pre-image servono per filtrare per assignment anche le delete (MongoDB >= 6)."""
+        try:
+            await self.collection.database.command(
+                "collMod", self.collection.name, changeStreamPreAndPostImages={"enabled": True}
+            )
+        except Exception as exc:
+            logger.warning("Pre-image del change stream non abilitate: %s", exc)
+
+    @asynccontextmanager
+    async def subscribe(
+        self,
+        assignment_id: str,
+        *,
+        student_id: Optional[str] = None,
+        last_event_id: Optional[str] = None,
+    ) -> AsyncIterator[Subscription]:
+        sub = Subscription(assignment_id, student_id, self.queue_size)
+        catch_up: Optional[asyncio.Task] = None
+        if last_event_id and not self._replay(sub, last_event_id):
+            sub.catching_up = True
+            catch_up = asyncio.create_task(self._catch_up(sub, last_event_id))
+            self._catch_ups.add(catch_up)
+            catch_up.add_done_callback(self._catch_ups.discard)
+        self._subscribers.add(sub)
+        if self._idle is not None:
+            self._idle.cancel()
+            self._idle = None
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        try:
+            yield sub
+        finally:
+            if catch_up is not None:
+                catch_up.cancel()
+            self._subscribers.discard(sub)
+            if not self._subscribers and self._task is not None and self._idle is None:
+                self._idle = asyncio.get_running_loop().call_later(self.linger, self._stop_if_idle)
+
+    def _stop_if_idle(self) -> None:
+        self._idle = None
+        if self._subscribers:
+            return
+        self._stop()
+
+    def _stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        # eventi persi mentre il cursore è fermo: token e buffer non sono più validi
+        self._resume_token = None
+        self._recent.clear()
+
+    def _replay(self, sub: Subscription, last_event_id: str) -> bool:
+        """Eventi del buffer dopo `last_event_id`; False se l'id non è nel buffer."""
+        ids = [ev.id for ev in self._recent]
+        if last_event_id not in ids:
+            return False
+        for ev in list(self._recent)[ids.index(last_event_id) + 1:]:
+            sub.offer(ev)
+        return True
+
+    async def _catch_up(self, sub: Subscription, last_event_id: str) -> None:
+        try:
+            async with await self.collection.watch(
+                WATCH_PIPELINE,
+                full_document="updateLookup",
+                full_document_before_change="whenAvailable",
+                start_after={"_data": last_event_id},
+            ) as stream:
+                async for change in stream:
+                    ev = decode_change(change)
+                    if ev is None:
+                        continue
+                    # raggiunto il cursore condiviso: da questo evento in poi si legge il buffer,
+                    # poi il vivo (nessun await tra replay e passaggio: non si perde niente)
+                    if any(r.id == ev.id for r in self._recent):
+                        sub.catching_up = False
+                        sub.offer(ev)
+                        self._replay(sub, ev.id)
+                        return
+                    sub.offer(ev, catch_up=True)
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            logger.info("Last-Event-ID non riprendibile: %s", exc)
+            sub.offer(FeedEvent("", EVENT_RESET, None, None, {"reason": "resume-token-expired"}), catch_up=True)
+            sub.catching_up = False
+
+    def _dispatch(self, ev: FeedEvent) -> None:
+        self._recent.append(ev)
+        for sub in self._subscribers:
+            sub.offer(ev)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                async with await self.collection.watch(
+                    WATCH_PIPELINE,
+                    full_document="updateLookup",
+                    full_document_before_change="whenAvailable",
+                    resume_after=self._resume_token,
+                ) as stream:
+                    async for change in stream:
+                        self._resume_token = change["_id"]
+                        ev = decode_change(change)
+                        if ev is not None:
+                            self._dispatch(ev)
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.warning("Change stream submissions interrotto: %s", exc)
+                if getattr(exc, "code", None) in RESUME_TOKEN_LOST_CODES:
+                    # storia persa: riparto da adesso e chi è connesso deve ricaricare
+                    self._resume_token = None
+                    self._recent.clear()
+                    for sub in self._subscribers:
+                        sub.offer(FeedEvent("", EVENT_RESET, None, None, {"reason": "history-lost"}))
+                await asyncio.sleep(self.retry_delay)
+
+    async def close(self) -> None:
+        if self._idle is not None:
+            self._idle.cancel()
+            self._idle = None
+        for catch_up in list(self._catch_ups):
+            catch_up.cancel()
+        task = self._task
+        self._stop()
+        if task is not None:
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
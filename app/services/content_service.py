@@ -0,0 +1,143 @@
+# app/services/content_service.py
+from __future__ import annotations
+
+import asyncio
+import difflib
+import json
+import zlib
+from typing import Any, Optional, Union
+
+from app.schemas.submission import ContentRef, ContentDelta, Submission
+from app.database.base import BinaryStorage
+from app.database.sharding import file_id_from_uri
+from app.database.submission_repo import SubmissionRepo
+
+DEFAULT_INLINE_MAX_BYTES = 16 * 1024
+DEFAULT_PREVIEW_CHARS = 500
+DEFAULT_MAX_DELTA_CHAIN = 8
+
+DeltaOps = list[Union[list[int], str]]
+
+class ContentService:
+    """
+    Testo delle submission fuori dal documento: sopra una soglia il testo
+    viene compresso e salvato nello storage binario, mentre nel documento
+    restano un'anteprima breve e il riferimento al blob. Liste e finder
+    lavorano solo sull'anteprima; il testo completo si carica su richiesta.
+
+    Per le riconsegne il testo fuori documento può essere invece un delta a
+    righe rispetto alla versione precedente (`contentDelta`), se molto più
+    piccolo del testo: al più `max_chain` delta di fila, poi di nuovo un
+    testo completo, così la ricostruzione legge pochi documenti.
+    """
+
+    @staticmethod
+    def preview(content: str, chars: int = DEFAULT_PREVIEW_CHARS) -> str:
+        return content if len(content) <= chars else content[:chars]
+
+    @staticmethod
+    async def offload(
+        content: str,
+        storage: BinaryStorage,
+        *,
+        inline_max_bytes: int = DEFAULT_INLINE_MAX_BYTES,
+        preview_chars: int = DEFAULT_PREVIEW_CHARS,
+        metadata: Optional[dict[str, Any]] = None,
+    ) -> tuple[str, Optional[ContentRef]]:
+        """Ritorna (testo da salvare inline, riferimento al blob o None se resta tutto inline)."""
+        raw = content.encode("utf-8")
+        if len(raw) <= inline_max_bytes:
+            return content, None
+
+        # compressione fuori dall'event loop: il testo può essere grande
+        compressed = await asyncio.to_thread(zlib.compress, raw, 6)
+
+        async def _data():
+            yield compressed
+
+        stored = await storage.upload(
+            filename="content.txt.z",
+            content_type="application/zlib",
+            data=_data(),
+            metadata={**(metadata or {}), "kind": "submission-content"},
+        )
+        return ContentService.preview(content, preview_chars), ContentRef(uri=stored.uri, size=len(raw))
+
+    @staticmethod
+    async def load(ref: ContentRef, storage: BinaryStorage) -> str:
+        file_id = file_id_from_uri(ref.uri)
+        parts = [chunk async for chunk in storage.stream(file_id)]
+        raw = await asyncio.to_thread(zlib.decompress, b"".join(parts))
+        return raw.decode("utf-8")
+
+    @staticmethod
+    async def discard(ref: ContentRef, storage: BinaryStorage) -> None:
+        await storage.delete(file_id_from_uri(ref.uri))
+
+    # -------------------------
+    # Delta tra versioni
+    # -------------------------
+    @staticmethod
+    def make_delta(base: str, text: str) -> DeltaOps:
+        """Operazioni per ricostruire `text` dalle righe di `base`."""
+        a = base.splitlines(keepends=True)
+        b = text.splitlines(keepends=True)
+        ops: DeltaOps = []
+        for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, a, b).get_opcodes():
+            if tag == "equal":
+                ops.append([i1, i2])
+            elif tag in ("replace", "insert"):
+                chunk = "".join(b[j1:j2])
+                if ops and isinstance(ops[-1], str):
+                    ops[-1] += chunk
+                else:
+                    ops.append(chunk)
+        return ops
+
+    @staticmethod
+    def apply_delta(base: str, ops: DeltaOps) -> str:
+        a = base.splitlines(keepends=True)
+        return "".join("".join(a[op[0]:op[1]]) if isinstance(op, list) else op for op in ops)
+
+    @staticmethod
+    async def delta_against(
+        previous: Submission,
+        previous_text: str,
+        text: str,
+        *,
+        inline_max_bytes: int = DEFAULT_INLINE_MAX_BYTES,
+        max_chain: int = DEFAULT_MAX_DELTA_CHAIN,
+    ) -> Optional[ContentDelta]:
+        """
+        Delta del testo nuovo rispetto alla versione precedente, solo per i
+        testi che uscirebbero dal documento e se il delta pesa al più metà del
+        testo (e sta inline); altrimenti None e il testo si salva per intero.
+        """
+        raw_size = len(text.encode("utf-8"))
+        depth = (previous.contentDelta.depth + 1) if previous.contentDelta is not None else 1
+        if raw_size <= inline_max_bytes or depth > max_chain:
+            return None
+        ops = await asyncio.to_thread(ContentService.make_delta, previous_text, text)
+        encoded = len(json.dumps(ops, ensure_ascii=False).encode("utf-8"))
+        if encoded > min(inline_max_bytes, raw_size // 2):
+            return None
+        return ContentDelta(base=previous.submissionId, ops=ops, size=raw_size, depth=depth)
+
+    @staticmethod
+    async def resolve(submission: Submission, storage: Optional[BinaryStorage], repo: Optional[SubmissionRepo] = None) -> str:
+        """Testo completo: inline, dal blob compresso o ricostruito dalla catena di delta."""
+        chain: list[ContentDelta] = []
+        current = submission
+        while current.contentDelta is not None and repo is not None:
+            chain.append(current.contentDelta)
+            base = await repo.find_one(current.contentDelta.base)
+            if base is None:
+                raise LookupError(f"Missing base version {current.contentDelta.base}")
+            current = base
+        if storage is not None and current.contentRef is not None:
+            text = await ContentService.load(current.contentRef, storage)
+        else:
+            text = current.content
+        for delta in reversed(chain):
+            text = ContentService.apply_delta(text, delta.ops)
+        return text
@@ -0,0 +1,94 @@
+# app/services/event_service.py
+"""
+Payload degli eventi submission (exchange review e report).
+
+Versione 1: solo gli id e la data di consegna. Versione 2 (opzionale):
+anche l'elenco dei file (id, dimensione, content type, checksum) e
+un'anteprima del testo, così i consumer non devono richiamare il servizio
+a ogni consegna. Se il corpo supera `max_bytes`, la versione 2 porta solo
+il riferimento (`href`) e `truncated: true`: il consumer legge il resto via API.
+
+La versione viaggia nell'header AMQP `schemaVersion`.
+"""
+from __future__ import annotations
+
+import json
+from datetime import datetime
+from typing import Optional, Sequence
+
+from app.schemas.submission import FileMeta
+from app.database.sharding import file_id_from_uri
+
+SCHEMA_VERSION_BASIC = 1
+SCHEMA_VERSION_RICH = 2
+
+DEFAULT_PREVIEW_CHARS = 500
+DEFAULT_MAX_BYTES = 64 * 1024
+
+def _encode(payload: dict) -> bytes:
+    return json.dumps(payload, ensure_ascii=False).encode("utf-8")
+
+class EventService:
+    @staticmethod
+    def submission_href(submissionId: str) -> str:
+        """Path del dettaglio (GET /api/v1/submissions/{submission_id})."""
+        return f"/api/v1/submissions/{submissionId}"
+
+    @staticmethod
+    def file_manifest(files: Sequence[FileMeta]) -> list[dict]:
+        return [
+            {
+                "fileId": file_id_from_uri(f.path),
+                "filename": f.filename,
+                "size": f.size,
+                "contentType": f.contentType,
+                "checksum": f.checksum,
+            }
+            for f in files
+        ]
+
+    @staticmethod
+    def build_submission_event(
+        assignmentId: str,
+        submissionId: str,
+        studentId: str,
+        deliveredAt: datetime,
+        *,
+        rich: bool = False,
+        files: Sequence[FileMeta] = (),
+        content: Optional[str] = None,
+        contentTruncated: bool = False,
+        preview_chars: int = DEFAULT_PREVIEW_CHARS,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+    ) -> tuple[int, dict, bytes]:
+        """(versione dello schema, payload, corpo JSON) di un evento submission."""
+        payload = {
+            "assignmentId": assignmentId,
+            "submissionId": submissionId,
+            "studentId": studentId,
+            "deliveredAt": deliveredAt.isoformat(),
+        }
+        if not rich:
+            return SCHEMA_VERSION_BASIC, payload, json.dumps(payload).encode("utf-8")
+
+        reference = {
+            **payload,
+            "href": EventService.submission_href(submissionId),
+            "fileCount": len(files),
+            "totalSize": sum(f.size for f in files),
+        }
+        text = content or ""
+        full = {
+            **reference,
+            "files": EventService.file_manifest(files),
+            "contentPreview": text[:preview_chars],
+            "contentTruncated": contentTruncated or len(text) > preview_chars,
+            "truncated": False,
+        }
+        body = _encode(full)
+        if len(body) <= max_bytes:
+            return SCHEMA_VERSION_RICH, full, body
+
+        # troppo grande per il broker: solo il riferimento
+        reference["truncated"] = True
+        return SCHEMA_VERSION_RICH, reference, _encode(reference)
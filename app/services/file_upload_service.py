@@ -1,9 +1,12 @@
 # app/services/file_upload_service.py
 from __future__ import annotations
 
+import asyncio
+import hashlib
 from asyncio import Protocol
-from typing import AsyncIterator, Iterable, Optional
+from typing import AsyncIterator, Iterable, Optional, Sequence
 
+from app.core.tracing import traced
 from app.schemas.submission import FileMeta
 from app.schemas.context import UserContext
 from app.database.base import BinaryStorage
@@ -28,6 +31,30 @@ class FileUploadService:
             yield chunk
 
     @classmethod
+    async def _find_reusable(cls, f: UploadFileLike, known: dict[tuple[str, int], FileMeta]) -> Optional[FileMeta]:
+        """
+        File identico (sha256 e dimensione) a uno della versione precedente:
+        si riusa il blob esistente invece di salvarne una copia. Serve un file
+        riavvolgibile (UploadFile lo è: è già su disco o in memoria). Lo sha256
+        gira in un thread per non bloccare l'event loop sui file grandi.
+        """
+        seek = getattr(f, "seek", None)
+        size = getattr(f, "size", None)
+        if seek is None or (size is not None and size not in {s for _, s in known}):
+            return None
+        hasher = hashlib.sha256()
+        read = 0
+        async for chunk in cls._iter_file(f):
+            await asyncio.to_thread(hasher.update, chunk)
+            read += len(chunk)
+        await seek(0)
+        old = known.get((hasher.hexdigest(), read))
+        if old is None:
+            return None
+        return old.model_copy(update={"filename": f.filename or old.filename, "contentType": f.content_type or old.contentType})
+
+    @classmethod
+    @traced()
     async def upload_files(
         cls,
         *,
@@ -37,9 +64,21 @@ class FileUploadService:
         user: UserContext,
         repo: SubmissionRepo,
         storage: BinaryStorage,
+        reuse: Sequence[FileMeta] = (),
     ) -> list[FileMeta]:
+        """
+        `reuse`: file della versione precedente, riusati se un upload è
+        identico (al più una volta: lo stesso `path` non compare due volte).
+        """
+        known = {(m.checksum, m.size): m for m in reuse if m.checksum}
         metas: list[FileMeta] = []
         for f in files:
+            reused = await cls._find_reusable(f, known) if known else None
+            if reused is not None:
+                known.pop((reused.checksum, reused.size))
+                metas.append(reused)
+                await submissionService.add_file(submission_id, reused, user, repo)
+                continue
             stored = await storage.upload(
                 filename=f.filename,
                 content_type=f.content_type,
@@ -54,6 +93,8 @@ class FileUploadService:
                 filename=stored.filename,
                 path=stored.uri,
                 size=stored.size,
+                contentType=stored.content_type,
+                checksum=stored.checksum,
             )
             metas.append(fm)
 
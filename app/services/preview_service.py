@@ -0,0 +1,308 @@
+# app/services/preview_service.py
+"""
+Anteprime degli allegati, calcolate in background dopo la consegna.
+
+Per ogni allegato si estraggono il testo (troncato a `max_text_chars`) e,
+dove il formato lo permette, un'anteprima piccola: la prima pagina dei PDF,
+una miniatura JPEG delle immagini, la miniatura incorporata nei .docx, il
+primo grafico dei notebook. Entrambi finiscono come blob derivati nello
+storage binario, collegati dal FileMeta (`derived`): i revisori li scorrono
+senza scaricare l'allegato intero.
+
+Il parsing gira in un process pool (PreviewWorkers), mai sull'event loop, e
+parte in un task staccato dalla richiesta: POST /submissions risponde senza
+aspettarlo e senza tenere occupati gli slot di ammissione.
+"""
+from __future__ import annotations
+
+import asyncio
+import base64
+import html
+import io
+import json
+import logging
+import multiprocessing
+import os
+import re
+import zipfile
+from concurrent.futures import Executor, ProcessPoolExecutor
+from functools import partial
+from typing import Any, Awaitable, Callable, Optional, Sequence
+
+from app.schemas.context import UserContext
+from app.schemas.submission import DerivedFiles, FileMeta
+from app.database.base import BinaryStorage
+from app.database.sharding import file_id_from_uri
+from app.database.submission_repo import SubmissionRepo
+from app.services.similarity_service import TEXT_EXTENSIONS
+from app.services.submission_service import submissionService
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_SOURCE_BYTES = 20 * 1024 * 1024
+DEFAULT_MAX_TEXT_CHARS = 200_000
+DEFAULT_MAX_PDF_PAGES = 50
+THUMBNAIL_SIZE = (320, 320)
+
+TEXT = "text"
+PREVIEW = "preview"
+
+_DOCX_PARAGRAPH = re.compile(r"</w:p>")
+_XML_TAG = re.compile(r"<[^>]+>")
+
+# -------------------------
+# Estrazione (funzioni pure, eseguite nei processi del pool)
+# -------------------------
+def _truncate(text: str, max_chars: int) -> tuple[str, bool]:
+    return (text, False) if len(text) <= max_chars else (text[:max_chars], True)
+
+def _notebook(data: bytes) -> tuple[str, Optional[bytes], Optional[str]]:
+    nb = json.loads(data)
+    parts: list[str] = []
+    image: Optional[bytes] = None
+    for cell in nb.get("cells", ()):
+        source = cell.get("source", "")
+        parts.append("".join(source) if isinstance(source, list) else str(source))
+        if image is not None:
+            continue
+        for out in cell.get("outputs", ()):
+            png = (out.get("data") or {}).get("image/png")
+            if png:
+                image = base64.b64decode("".join(png) if isinstance(png, list) else png)
+                break
+    return "\n\n".join(p for p in parts if p), image, "image/png" if image else None
+
+def _docx(data: bytes) -> tuple[str, Optional[bytes], Optional[str]]:
+    with zipfile.ZipFile(io.BytesIO(data)) as z:
+        xml = z.read("word/document.xml").decode("utf-8", errors="replace")
+        thumb = next((n for n in z.namelist() if n.lower().startswith("docprops/thumbnail.")), None)
+        image = z.read(thumb) if thumb else None
+    text = html.unescape(_XML_TAG.sub("", _DOCX_PARAGRAPH.sub("\n", xml)))
+    content_type = None
+    if thumb:
+        content_type = "image/png" if thumb.lower().endswith(".png") else "image/jpeg"
+    return text, image, content_type
+
+def _pdf(data: bytes, max_chars: int) -> tuple[str, Optional[bytes], Optional[str]]:
+    from pypdf import PdfReader, PdfWriter
+
+    reader = PdfReader(io.BytesIO(data))
+    parts: list[str] = []
+    chars = 0
+    for page in reader.pages[:DEFAULT_MAX_PDF_PAGES]:
+        text = page.extract_text() or ""
+        parts.append(text)
+        chars += len(text)
+        if chars >= max_chars:
+            break
+    preview: Optional[bytes] = None
+    if reader.pages:
+        writer = PdfWriter()
+        writer.add_page(reader.pages[0])
+        buf = io.BytesIO()
+        writer.write(buf)
+        preview = buf.getvalue()
+    return "\n".join(parts), preview, "application/pdf" if preview else None
+
+def _image(data: bytes) -> tuple[str, Optional[bytes], Optional[str]]:
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as img:
+        img.thumbnail(THUMBNAIL_SIZE)
+        buf = io.BytesIO()
+        img.convert("RGB").save(buf, "JPEG", quality=80)
+    return "", buf.getvalue(), "image/jpeg"
+
+def extract_derived(
+    filename: str,
+    content_type: Optional[str],
+    data: bytes,
+    *,
+    max_text_chars: int = DEFAULT_MAX_TEXT_CHARS,
+) -> dict[str, Any]:
+    """
+    Testo e anteprima di un allegato. Ritorna un dict (serializzabile tra
+    processi): status, text, textTruncated, preview, previewContentType.
+    PDF e immagini richiedono pypdf e Pillow; senza, il formato è "unsupported".
+    """
+    ext = os.path.splitext(filename)[1].lower()
+    ctype = (content_type or "").split(";")[0].strip().lower()
+    try:
+        if ext == ".ipynb":
+            text, preview, preview_type = _notebook(data)
+        elif ext == ".docx":
+            text, preview, preview_type = _docx(data)
+        elif ext == ".pdf" or ctype == "application/pdf":
+            text, preview, preview_type = _pdf(data, max_text_chars)
+        elif ctype.startswith("image/"):
+            text, preview, preview_type = _image(data)
+        elif ext in TEXT_EXTENSIONS or ctype.startswith("text/"):
+            text, preview, preview_type = data.decode("utf-8", errors="replace"), None, None
+        else:
+            return {"status": "unsupported"}
+    except ImportError:
+        return {"status": "unsupported"}
+    text, truncated = _truncate(text, max_text_chars)
+    return {
+        "status": "ready",
+        "text": text,
+        "textTruncated": truncated,
+        "preview": preview,
+        "previewContentType": preview_type,
+    }
+
+# -------------------------
+# Pool di processi
+# -------------------------
+class PreviewWorkers:
+    """
+    Esecutore delle estrazioni: process pool più un limite ai file in
+    lavorazione (ognuno è in memoria per intero mentre si estrae). I job
+    sono task staccati dalla richiesta, annullati allo shutdown.
+    """
+
+    def __init__(self, executor: Executor, *, max_pending: int):
+        self.executor = executor
+        self.slots = asyncio.Semaphore(max_pending)
+        self._tasks: set[asyncio.Task] = set()
+
+    @classmethod
+    def process_pool(cls, workers: int, *, max_pending: int) -> "PreviewWorkers":
+        # spawn: niente fork di un processo con i thread di pymongo e del watchdog
+        context = multiprocessing.get_context("spawn")
+        return cls(ProcessPoolExecutor(max_workers=workers, mp_context=context), max_pending=max_pending)
+
+    async def run(self, fn: Callable[..., Any], /, *args: Any, **kwargs: Any) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self.executor, partial(fn, *args, **kwargs))
+
+    def spawn(self, job: Awaitable[Any]) -> asyncio.Task:
+        task = asyncio.ensure_future(job)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    @property
+    def pending(self) -> int:
+        return len(self._tasks)
+
+    async def shutdown(self) -> None:
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+# -------------------------
+# Servizio
+# -------------------------
+async def _once(data: bytes):
+    yield data
+
+class PreviewService:
+    @staticmethod
+    def derived_uris(meta: FileMeta) -> list[str]:
+        d = meta.derived
+        return [u for u in (d.textUri, d.previewUri) if u] if d is not None else []
+
+    @staticmethod
+    async def derive_file(
+        submission_id: str,
+        meta: FileMeta,
+        storage: BinaryStorage,
+        repo: SubmissionRepo,
+        workers: PreviewWorkers,
+        *,
+        max_source_bytes: int = DEFAULT_MAX_SOURCE_BYTES,
+        max_text_chars: int = DEFAULT_MAX_TEXT_CHARS,
+    ) -> Optional[DerivedFiles]:
+        file_id = file_id_from_uri(meta.path)
+        if file_id is None or meta.derived is not None or meta.size > max_source_bytes:
+            return None
+
+        async with workers.slots:
+            data = b"".join([c async for c in storage.stream(file_id)])
+            try:
+                result = await workers.run(
+                    extract_derived, meta.filename, meta.contentType, data, max_text_chars=max_text_chars,
+                )
+            except Exception as e:
+                logger.warning("Anteprima di %s non estratta: %s", meta.path, e)
+                result = {"status": "failed"}
+        del data
+
+        derived = DerivedFiles(status=result["status"])
+        metadata = {"kind": "derived", "submissionId": submission_id, "source": meta.path}
+        if result.get("text"):
+            raw = result["text"].encode("utf-8")
+            stored = await storage.upload(
+                filename=f"{meta.filename}.txt", content_type="text/plain; charset=utf-8",
+                data=_once(raw), metadata={**metadata, "derived": TEXT},
+            )
+            derived.textUri, derived.textSize, derived.textTruncated = stored.uri, len(raw), result["textTruncated"]
+        if result.get("preview"):
+            stored = await storage.upload(
+                filename=f"{meta.filename}.preview", content_type=result["previewContentType"],
+                data=_once(result["preview"]), metadata={**metadata, "derived": PREVIEW},
+            )
+            derived.previewUri, derived.previewContentType = stored.uri, result["previewContentType"]
+
+        if not await repo.set_file_derived(submission_id, meta.path, derived):
+            # submission o allegato cancellati nel frattempo
+            for uri in PreviewService.derived_uris(meta.model_copy(update={"derived": derived})):
+                await storage.delete(file_id_from_uri(uri))
+            return None
+        return derived
+
+    @staticmethod
+    async def derive_files(
+        submission_id: str,
+        metas: Sequence[FileMeta],
+        storage: BinaryStorage,
+        repo: SubmissionRepo,
+        workers: PreviewWorkers,
+        **limits: int,
+    ) -> int:
+        done = 0
+        for meta in metas:
+            try:
+                if await PreviewService.derive_file(submission_id, meta, storage, repo, workers, **limits) is not None:
+                    done += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # l'allegato resta scaricabile: manca solo l'anteprima
+                logger.exception("Anteprima di %s non salvata", meta.path)
+        return done
+
+    @staticmethod
+    def schedule(
+        workers: Optional[PreviewWorkers],
+        submission_id: str,
+        metas: Sequence[FileMeta],
+        storage: BinaryStorage,
+        repo: SubmissionRepo,
+        **limits: int,
+    ) -> Optional[asyncio.Task]:
+        """Job staccato dalla richiesta: la risposta non lo aspetta e lo slot di upload si libera subito."""
+        if workers is None or not metas:
+            return None
+        return workers.spawn(PreviewService.derive_files(submission_id, metas, storage, repo, workers, **limits))
+
+    @staticmethod
+    async def get_derived(
+        submission_id: str,
+        filename: str,
+        kind: str,
+        user: UserContext,
+        repo: SubmissionRepo,
+    ) -> Optional[tuple[str, str]]:
+        """(file_id, content type) del blob derivato richiesto; None se non c'è (ancora)."""
+        submission = await submissionService.get_submission(submission_id, user, repo)
+        if submission is None:
+            return None
+        meta = next((f for f in submission.files if f.filename == filename), None)
+        if meta is None or meta.derived is None:
+            return None
+        d = meta.derived
+        uri, content_type = (d.textUri, "text/plain; charset=utf-8") if kind == TEXT else (d.previewUri, d.previewContentType)
+        file_id = file_id_from_uri(uri) if uri else None
+        return (file_id, content_type or "application/octet-stream") if file_id else None
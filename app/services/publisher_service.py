@@ -1,14 +1,18 @@
 import asyncio
-import json
 import logging
 from datetime import datetime
-from typing import Optional
+from typing import Optional, Sequence
 
 import aio_pika
 from aio_pika import Message, DeliveryMode, ExchangeType
 from aio_pika.abc import (
     AbstractRobustConnection, AbstractRobustChannel, AbstractExchange
 )
+from opentelemetry.trace import SpanKind
+
+from app.core.tracing import traced, set_attributes, inject_headers
+from app.schemas.submission import FileMeta
+from app.services.event_service import EventService, DEFAULT_PREVIEW_CHARS, DEFAULT_MAX_BYTES
 
 logger = logging.getLogger(__name__)
 
@@ -20,6 +24,9 @@ class SubmissionPublisher:
 
     - exchange review (esistente):   direct "elearning.submission-review", rk "submission.review"
     - exchange report (nuovo):       direct "elearning.reports",          rk "submissions.reports"
+
+    Con `rich_events` i messaggi usano lo schema 2 (file + anteprima del testo,
+    vedi `EventService`); l'header `schemaVersion` dice ai consumer quale leggere.
     """
 
     def __init__(
@@ -31,6 +38,9 @@ class SubmissionPublisher:
         review_routing_key: str = "submissions.reviews",
         report_exchange: str = "elearning.reports",
         report_routing_key: str = "submissions.reports",
+        rich_events: bool = False,
+        event_preview_chars: int = DEFAULT_PREVIEW_CHARS,
+        event_max_bytes: int = DEFAULT_MAX_BYTES,
     ) -> None:
         self.rabbitmq_url = rabbitmq_url
         self.heartbeat = heartbeat
@@ -43,6 +53,11 @@ class SubmissionPublisher:
         self.report_exchange_name = report_exchange
         self.report_routing_key = report_routing_key
 
+        # schema degli eventi
+        self.rich_events = rich_events
+        self.event_preview_chars = event_preview_chars
+        self.event_max_bytes = event_max_bytes
+
         # risorse AMQP
         self._conn: Optional[AbstractRobustConnection] = None
         self._channel: Optional[AbstractRobustChannel] = None
@@ -123,36 +138,86 @@ class SubmissionPublisher:
         submissionId: str,
         studentId: str,
         deliveredAt: datetime,
-    ) -> dict:
-        return {
-            "assignmentId": assignmentId,
-            "submissionId": submissionId,
-            "studentId": studentId,
-            "deliveredAt": deliveredAt.isoformat(),
-        }
+        *,
+        rich: bool = False,
+        files: Sequence[FileMeta] = (),
+        content: Optional[str] = None,
+        contentTruncated: bool = False,
+        preview_chars: int = DEFAULT_PREVIEW_CHARS,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+    ) -> tuple[int, dict, bytes]:
+        """(versione dello schema, payload, corpo JSON): schema 1, o schema 2 con `rich`."""
+        return EventService.build_submission_event(
+            assignmentId, submissionId, studentId, deliveredAt,
+            rich=rich,
+            files=files,
+            content=content,
+            contentTruncated=contentTruncated,
+            preview_chars=preview_chars,
+            max_bytes=max_bytes,
+        )
+
+    def _build_message(
+        self,
+        eventType: str,
+        assignmentId: str,
+        submissionId: str,
+        studentId: str,
+        deliveredAt: datetime,
+        files: Sequence[FileMeta],
+        content: Optional[str],
+        contentTruncated: bool,
+    ) -> tuple[Message, dict]:
+        version, payload, body = self._build_submission_payload(
+            assignmentId, submissionId, studentId, deliveredAt,
+            rich=self.rich_events,
+            files=files,
+            content=content,
+            contentTruncated=contentTruncated,
+            preview_chars=self.event_preview_chars,
+            max_bytes=self.event_max_bytes,
+        )
+        msg = Message(
+            body=body,
+            content_type="application/json",
+            delivery_mode=DeliveryMode.NOT_PERSISTENT,
+            # contesto di trace W3C negli header AMQP, per i consumer
+            headers=inject_headers({"eventType": eventType, "schemaVersion": version}),
+        )
+        set_attributes(**{
+            "messaging.message.body.size": len(body),
+            "event.schema_version": version,
+            "event.truncated": bool(payload.get("truncated", False)),
+        })
+        return msg, payload
 
     # -------------------------
     # Publish: REVIEW
     # -------------------------
+    @traced(kind=SpanKind.PRODUCER, attributes={"messaging.system": "rabbitmq"})
     async def publish_submission_delivered(
         self,
         assignmentId: str,
         submissionId: str,
         studentId: str,
         deliveredAt: datetime,
+        *,
+        files: Sequence[FileMeta] = (),
+        content: Optional[str] = None,
+        contentTruncated: bool = False,
     ) -> None:
         """Invia il messaggio al dominio REVIEW."""
         await self._ensure_ready()
         assert self._review_exchange is not None
 
-        payload = self._build_submission_payload(assignmentId, submissionId, studentId, deliveredAt)
-        body = json.dumps(payload).encode("utf-8")
-        msg = Message(
-            body=body,
-            content_type="application/json",
-            delivery_mode=DeliveryMode.NOT_PERSISTENT,
-            headers={"eventType": "submission.delivered"},
+        msg, payload = self._build_message(
+            "submission.delivered", assignmentId, submissionId, studentId, deliveredAt, files, content, contentTruncated,
         )
+        set_attributes(**{
+            "messaging.destination.name": self.review_exchange_name,
+            "messaging.rabbitmq.destination.routing_key": self.review_routing_key,
+            "submission.id": submissionId,
+        })
 
         logger.debug(
             "Publishing REVIEW exchange=%s rk=%s payload=%s",
@@ -164,12 +229,17 @@ class SubmissionPublisher:
     # -------------------------
     # Publish: REPORT
     # -------------------------
+    @traced(kind=SpanKind.PRODUCER, attributes={"messaging.system": "rabbitmq"})
     async def publish_submission_report(
         self,
         assignmentId: str,
         submissionId: str,
         studentId: str,
         deliveredAt: datetime,
+        *,
+        files: Sequence[FileMeta] = (),
+        content: Optional[str] = None,
+        contentTruncated: bool = False,
     ) -> None:
         """
         Invia un messaggio anche allo scambio di REPORT,
@@ -178,14 +248,14 @@ class SubmissionPublisher:
         await self._ensure_ready()
         assert self._report_exchange is not None
 
-        payload = self._build_submission_payload(assignmentId, submissionId, studentId, deliveredAt)
-        body = json.dumps(payload).encode("utf-8")
-        msg = Message(
-            body=body,
-            content_type="application/json",
-            delivery_mode=DeliveryMode.NOT_PERSISTENT,
-            headers={"eventType": "submission.reported"},
+        msg, payload = self._build_message(
+            "submission.reported", assignmentId, submissionId, studentId, deliveredAt, files, content, contentTruncated,
         )
+        set_attributes(**{
+            "messaging.destination.name": self.report_exchange_name,
+            "messaging.rabbitmq.destination.routing_key": self.report_routing_key,
+            "submission.id": submissionId,
+        })
 
         logger.debug(
             "Publishing REPORT exchange=%s rk=%s payload=%s",
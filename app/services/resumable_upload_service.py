@@ -0,0 +1,272 @@
+# app/services/resumable_upload_service.py
+from __future__ import annotations
+
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Optional
+from uuid import uuid4
+
+from app.schemas.context import UserContext
+from app.schemas.submission import FileMeta
+from app.schemas.upload import UploadSession, UploadSessionCreate
+from app.database.base import ChunkedBinaryStorage
+from app.database.submission_repo import SubmissionRepo
+from app.database.upload_session_repo import UploadSessionRepo
+from app.services.submission_service import submissionService, _is_student
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SESSION_TTL = timedelta(hours=24)
+COMPLETE_LEASE = timedelta(minutes=10)  # scadenza di una sessione in finalizzazione
+WRITE_BATCH_CHUNKS = 8  # chunk per bulk write (~2MB con chunk GridFS da 255KB)
+
+def create_upload_id() -> str:
+    return f"up-{uuid4().hex}"
+
+def _is_expired(session: UploadSession, now: datetime) -> bool:
+    # Mongo restituisce date naive (UTC)
+    expires = session.expiresAt if session.expiresAt.tzinfo else session.expiresAt.replace(tzinfo=timezone.utc)
+    return expires <= now
+
+class ResumableUploadService:
+    """
+    Upload ripristinabili in stile tus: il client apre una sessione per file,
+    invia i dati con PATCH a offset allineati alla chunk size (anche in
+    parallelo su offset diversi), interroga l'offset ricevuto e infine
+    finalizza la sessione, che diventa un allegato della submission.
+    """
+
+    @staticmethod
+    def received_offset(session: UploadSession) -> int:
+        """Byte ricevuti in modo contiguo dall'inizio del file."""
+        got = set(session.received)
+        n = 0
+        while n in got:
+            n += 1
+        return min(n * session.chunkSize, session.length)
+
+    @staticmethod
+    def is_complete(session: UploadSession) -> bool:
+        return ResumableUploadService.received_offset(session) >= session.length
+
+    @staticmethod
+    async def create_session(
+        submission_id: str,
+        data: UploadSessionCreate,
+        user: UserContext,
+        repo: SubmissionRepo,
+        sessions: UploadSessionRepo,
+        storage: ChunkedBinaryStorage,
+        *,
+        ttl: timedelta = DEFAULT_SESSION_TTL,
+    ) -> Optional[UploadSession]:
+        if not _is_student(user.role):
+            raise PermissionError("Only students can upload files")
+        if data.length < 0:
+            raise ValueError("Upload length must be >= 0")
+
+        submission = await repo.find_one(submission_id)
+        if submission is None:
+            return None
+        if submission.studentId != user.user_id:
+            raise PermissionError("Unauthorized access to this submission")
+
+        now = datetime.now(timezone.utc)
+        session = UploadSession(
+            uploadId=create_upload_id(),
+            submissionId=submission_id,
+            assignmentId=submission.assignmentId,
+            studentId=user.user_id,
+            fileId=storage.new_file_id(),
+            chunkSize=storage.chunk_size,
+            received=[],
+            createdAt=now,
+            expiresAt=now + ttl,
+            **data.model_dump(),
+        )
+        await sessions.create(session)
+        return session
+
+    @staticmethod
+    async def get_session(upload_id: str, user: UserContext, sessions: UploadSessionRepo) -> Optional[UploadSession]:
+        """Sessione del chiamante; le sessioni scadute (in attesa di purge) non esistono più."""
+        session = await sessions.find_one(upload_id)
+        if session is None or _is_expired(session, datetime.now(timezone.utc)):
+            return None
+        if session.studentId != user.user_id:
+            raise PermissionError("Unauthorized access to this upload")
+        return session
+
+    @classmethod
+    async def write(
+        cls,
+        upload_id: str,
+        offset: int,
+        data: AsyncIterator[bytes],
+        user: UserContext,
+        sessions: UploadSessionRepo,
+        storage: ChunkedBinaryStorage,
+        *,
+        ttl: timedelta = DEFAULT_SESSION_TTL,
+    ) -> Optional[UploadSession]:
+        """
+        Scrive i dati a partire da `offset`. I chunk completi vengono resi
+        persistenti a blocchi durante lo stream, quindi se la connessione cade
+        a metà il client riprende dall'ultimo offset registrato.
+        """
+        session = await cls.get_session(upload_id, user, sessions)
+        if session is None:
+            return None
+        if session.status != "open":
+            raise ValueError("Upload is being completed")
+
+        cs = session.chunkSize
+        if offset < 0 or offset % cs != 0 or offset > session.length:
+            raise ValueError(f"Upload-Offset must be a multiple of {cs} within the upload length")
+
+        n = offset // cs
+        end = offset
+        buf = bytearray()
+        pending: list[tuple[int, bytes]] = []
+
+        async def flush() -> None:
+            nonlocal session
+            if not pending:
+                return
+            await storage.write_chunks(session.fileId, pending)
+            updated = await sessions.mark_received(
+                upload_id, [i for i, _ in pending], datetime.now(timezone.utc) + ttl
+            )
+            pending.clear()
+            if updated is None:
+                # finalizzata o eliminata nel frattempo
+                raise ValueError("Upload session is no longer open")
+            session = updated
+
+        try:
+            async for piece in data:
+                end += len(piece)
+                if end > session.length:
+                    raise ValueError("Data exceeds declared upload length")
+                buf += piece
+                while len(buf) >= cs:
+                    pending.append((n, bytes(buf[:cs])))
+                    del buf[:cs]
+                    n += 1
+                    if len(pending) >= WRITE_BATCH_CHUNKS:
+                        await flush()
+        except Exception:
+            # connessione caduta a metà: salva comunque i chunk completi ricevuti
+            await flush()
+            raise
+
+        if buf:
+            # solo l'ultimo chunk del file può essere più corto della chunk size
+            if end != session.length:
+                await flush()
+                raise ValueError(f"Chunks must be multiples of {cs} bytes except the last one")
+            pending.append((n, bytes(buf)))
+        await flush()
+        return session
+
+    @classmethod
+    async def complete(
+        cls,
+        upload_id: str,
+        user: UserContext,
+        repo: SubmissionRepo,
+        sessions: UploadSessionRepo,
+        storage: ChunkedBinaryStorage,
+    ) -> Optional[tuple[UploadSession, FileMeta]]:
+        """Ritorna la sessione chiusa e l'allegato creato; None se la sessione non esiste."""
+        session = await cls.get_session(upload_id, user, sessions)
+        if session is None:
+            return None
+        if not cls.is_complete(session):
+            raise ValueError(
+                f"Upload incomplete: {cls.received_offset(session)}/{session.length} bytes received"
+            )
+        # una sola finalizzazione per sessione: un complete concorrente riceve 409
+        if await sessions.claim(upload_id, datetime.now(timezone.utc) + COMPLETE_LEASE) is None:
+            raise ValueError("Upload is already being completed")
+
+        unlinked = False  # file finalizzato ma non (ancora) collegato alla submission
+        try:
+            # ripetibile: un tentativo precedente può aver già scritto il documento files
+            stored = await storage.finalize_chunks(
+                session.fileId,
+                filename=session.filename,
+                content_type=session.contentType,
+                length=session.length,
+                metadata={
+                    "studentId": session.studentId,
+                    "assignmentId": session.assignmentId,
+                    "submissionId": session.submissionId,
+                },
+            )
+            fm = FileMeta(
+                filename=stored.filename, path=stored.uri, size=stored.size,
+                contentType=stored.content_type, checksum=stored.checksum,
+            )
+            submission = await repo.find_one(session.submissionId)
+            # già collegato da un tentativo fallito dopo add_file
+            if submission is None or all(f.path != fm.path for f in submission.files):
+                unlinked = True
+                await submissionService.add_file(session.submissionId, fm, user, repo)
+                unlinked = False
+            await sessions.delete(upload_id)
+        except BaseException:
+            if unlinked:
+                # file visibile ma non collegato: torna a chunk non finalizzati
+                try:
+                    await storage.unfinalize_chunks(session.fileId)
+                except Exception:
+                    logger.warning("File %s non riportato a chunk", session.fileId, exc_info=True)
+            await sessions.release(upload_id)
+            raise
+        return session, fm
+
+    @staticmethod
+    async def purge_expired(
+        sessions: UploadSessionRepo,
+        storage: ChunkedBinaryStorage,
+        *,
+        now: Optional[datetime] = None,
+    ) -> int:
+        """
+        Elimina le sessioni scadute e i relativi chunk mai finalizzati. Una
+        sessione in finalizzazione scade solo se il complete si è interrotto
+        (vedi COMPLETE_LEASE); i chunk di un file già finalizzato restano.
+        """
+        now = now or datetime.now(timezone.utc)
+        purged = 0
+        for session in await sessions.find_expired(now):
+            try:
+                if await storage.info(session.fileId) is None:
+                    await storage.discard_chunks(session.fileId)
+            except Exception:
+                logger.warning("Pulizia chunk fallita per upload %s", session.uploadId, exc_info=True)
+                continue
+            if await sessions.delete(session.uploadId):
+                purged += 1
+        return purged
+
+    @classmethod
+    async def run_purge_loop(
+        cls,
+        sessions: UploadSessionRepo,
+        storage: ChunkedBinaryStorage,
+        *,
+        interval: float,
+    ) -> None:
+        while True:
+            try:
+                purged = await cls.purge_expired(sessions, storage)
+                if purged:
+                    logger.info("Sessioni di upload scadute eliminate: %s", purged)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Errore nella pulizia delle sessioni di upload")
+            await asyncio.sleep(interval)
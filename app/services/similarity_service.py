@@ -0,0 +1,210 @@
+# app/services/similarity_service.py
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import zlib
+from typing import Optional, Sequence
+
+import numpy as np
+
+from app.core.tracing import traced
+from app.schemas.context import UserContext
+from app.schemas.similarity import Fingerprint, SimilarSubmission
+from app.schemas.submission import FileMeta
+from app.database.base import BinaryStorage
+from app.database.fingerprint_repo import FingerprintRepo
+from app.database.sharding import file_id_from_uri
+from app.database.submission_repo import SubmissionRepo
+from app.services.content_service import ContentService
+from app.services.submission_service import _is_teacher
+
+logger = logging.getLogger(__name__)
+
+NUM_PERM = 128
+BANDS = 32                    # 32 bande x 4 righe: soglia LSH ~ (1/32)^(1/4) = 0.42
+ROWS = NUM_PERM // BANDS
+SHINGLE_WORDS = 5
+HASH_BLOCK = 8192             # shingle per blocco: matrice NUM_PERM x HASH_BLOCK (8MB)
+DEFAULT_MIN_SIMILARITY = 0.5
+DEFAULT_MAX_ATTACHMENT_BYTES = 2 * 1024 * 1024
+
+# estensioni lette come testo (gli altri formati non vengono estratti)
+TEXT_EXTENSIONS = {
+    ".txt", ".md", ".rst", ".tex", ".csv", ".json", ".xml", ".html", ".css", ".sql",
+    ".py", ".java", ".c", ".h", ".cpp", ".hpp", ".cs", ".js", ".ts", ".go", ".rs",
+    ".kt", ".rb", ".php", ".sh", ".ipynb",
+}
+
+_WORD = re.compile(r"\w+")
+_POLY = np.uint64(1099511628211)
+_SHIFT = np.uint64(32)
+_MAX = np.iinfo(np.uint32).max
+
+# permutazioni fisse (seed costante): le firme devono essere confrontabili tra
+# worker, riavvii e versioni. Hash multiply-shift: (a*x + b) >> 32, a dispari.
+_rng = np.random.default_rng(0x5EED)
+_A = _rng.integers(1, 2**63, NUM_PERM, dtype=np.uint64) | np.uint64(1)
+_B = _rng.integers(0, 2**63, NUM_PERM, dtype=np.uint64)
+
+def shingle_hashes(text: str, k: int = SHINGLE_WORDS) -> np.ndarray:
+    """Hash (uint64, senza duplicati) degli shingle di k parole del testo normalizzato."""
+    tokens = _WORD.findall(text.lower())
+    if not tokens:
+        return np.empty(0, dtype=np.uint64)
+    h = np.fromiter((zlib.crc32(t.encode("utf-8")) for t in tokens), dtype=np.uint64, count=len(tokens))
+    k = min(k, len(tokens))
+    n = len(tokens) - k + 1
+    out = np.zeros(n, dtype=np.uint64)
+    for j in range(k):
+        # polinomio modulo 2^64 (overflow voluto)
+        out = out * _POLY + h[j:j + n]
+    return np.unique(out)
+
+def minhash(hashes: np.ndarray) -> np.ndarray:
+    """Firma MinHash (NUM_PERM x uint32), calcolata a blocchi per limitare la memoria."""
+    sig = np.full(NUM_PERM, _MAX, dtype=np.uint32)
+    for start in range(0, len(hashes), HASH_BLOCK):
+        x = hashes[start:start + HASH_BLOCK]
+        values = (_A[:, None] * x[None, :] + _B[:, None]) >> _SHIFT
+        np.minimum(sig, values.min(axis=1).astype(np.uint32), out=sig)
+    return sig
+
+def band_keys(sig: np.ndarray) -> list[str]:
+    """Una chiave per banda: indice della banda + hash delle sue righe."""
+    return [
+        f"{i:02d}{hashlib.blake2b(sig[i * ROWS:(i + 1) * ROWS].tobytes(), digest_size=8).hexdigest()}"
+        for i in range(BANDS)
+    ]
+
+class SimilarityService:
+    """
+    Candidati quasi-duplicati per il controllo antiplagio.
+
+    Alla consegna si calcola la firma MinHash di testo e allegati testuali
+    (hashing vettoriale con NumPy, in un thread: niente CPU sull'event loop)
+    e la si indicizza per bande LSH. La ricerca dei candidati legge solo le
+    firme che condividono almeno una banda, poi stima la similarità dalle firme.
+    """
+
+    @staticmethod
+    def signature(text: str) -> tuple[Optional[np.ndarray], int]:
+        """(firma, numero di shingle); firma None se il testo non ha parole."""
+        hashes = shingle_hashes(text)
+        if len(hashes) == 0:
+            return None, 0
+        return minhash(hashes), len(hashes)
+
+    @staticmethod
+    def similarities(sig: np.ndarray, others: Sequence[bytes]) -> np.ndarray:
+        """Frazione di valori uguali tra `sig` e ogni firma in `others` (stima di Jaccard)."""
+        if not others:
+            return np.empty(0)
+        matrix = np.frombuffer(b"".join(others), dtype=np.uint32).reshape(len(others), NUM_PERM)
+        return (matrix == sig).mean(axis=1)
+
+    @staticmethod
+    async def collect_text(
+        content: str,
+        files: Sequence[FileMeta],
+        storage: Optional[BinaryStorage],
+        *,
+        max_attachment_bytes: int = DEFAULT_MAX_ATTACHMENT_BYTES,
+    ) -> str:
+        parts = [content]
+        for f in files:
+            ext = os.path.splitext(f.filename)[1].lower()
+            file_id = file_id_from_uri(f.path)
+            if storage is None or file_id is None or ext not in TEXT_EXTENSIONS or f.size > max_attachment_bytes:
+                continue
+            try:
+                data = b"".join([c async for c in storage.stream(file_id)])
+            except Exception as e:
+                logger.warning("Allegato %s non letto per la firma: %s", f.path, e)
+                continue
+            parts.append(data.decode("utf-8", errors="ignore"))
+        return "\n".join(parts)
+
+    @staticmethod
+    @traced()
+    async def fingerprint(
+        submission_id: str,
+        assignment_id: str,
+        student_id: Optional[str],
+        content: str,
+        files: Sequence[FileMeta],
+        storage: Optional[BinaryStorage],
+        fingerprints: FingerprintRepo,
+        *,
+        max_attachment_bytes: int = DEFAULT_MAX_ATTACHMENT_BYTES,
+    ) -> Optional[Fingerprint]:
+        """Calcola e salva la firma di una submission (None se non c'è testo)."""
+        text = await SimilarityService.collect_text(content, files, storage, max_attachment_bytes=max_attachment_bytes)
+        sig, shingles = await asyncio.to_thread(SimilarityService.signature, text)
+        if sig is None:
+            return None
+        fp = Fingerprint(
+            submissionId=submission_id,
+            assignmentId=assignment_id,
+            studentId=student_id,
+            signature=sig.tobytes(),
+            bands=band_keys(sig),
+            shingles=shingles,
+        )
+        await fingerprints.save(fp)
+        return fp
+
+    @staticmethod
+    @traced()
+    async def near_duplicates(
+        submission_id: str,
+        user: UserContext,
+        repo: SubmissionRepo,
+        fingerprints: FingerprintRepo,
+        storage: Optional[BinaryStorage] = None,
+        *,
+        min_similarity: float = DEFAULT_MIN_SIMILARITY,
+        limit: int = 20,
+        max_attachment_bytes: int = DEFAULT_MAX_ATTACHMENT_BYTES,
+    ) -> Optional[list[SimilarSubmission]]:
+        """
+        Candidati dello stesso assignment, per similarità decrescente; None se
+        la submission non esiste. Le versioni dello stesso studente e quelle
+        non più ultime degli altri non sono candidati.
+        """
+        if not _is_teacher(user.role):
+            raise PermissionError("Only teachers can check for near-duplicates")
+
+        fp = await fingerprints.find_one(submission_id)
+        if fp is None:
+            # firma mancante (es. submission importate o precedenti): calcolata ora
+            submission = await repo.find_one(submission_id)
+            if submission is None:
+                return None
+            content = await ContentService.resolve(submission, storage, repo)
+            fp = await SimilarityService.fingerprint(
+                submission_id, submission.assignmentId, submission.studentId, content,
+                submission.files, storage, fingerprints, max_attachment_bytes=max_attachment_bytes,
+            )
+            if fp is None:
+                return []
+
+        candidates = await fingerprints.find_candidates(
+            fp.assignmentId, fp.bands, exclude=submission_id, exclude_student=fp.studentId,
+        )
+        sig = np.frombuffer(fp.signature, dtype=np.uint32)
+        scores = SimilarityService.similarities(sig, [c.signature for c in candidates])
+        results = [
+            SimilarSubmission(submissionId=c.submissionId, studentId=c.studentId, similarity=round(float(s), 4))
+            for c, s in zip(candidates, scores)
+            if s >= min_similarity
+        ]
+        if results:
+            # firme di versioni sostituite da una riconsegna (o di submission cancellate)
+            current = {r.submissionId for r in await repo.find_many([r.submissionId for r in results]) if r.latest}
+            results = [r for r in results if r.submissionId in current]
+        results.sort(key=lambda r: (-r.similarity, r.submissionId))
+        return results[:limit]
@@ -1,9 +1,19 @@
 # app/services/submission.py
+import base64
+import json
 from typing import Sequence, Optional
-from app.schemas.submission import SubmissionCreate, Submission, FileMeta
+from app.core.tracing import traced
+from app.schemas.submission import SubmissionCreate, Submission, FileMeta, ContentRef
 from app.schemas.context import UserContext
+from app.schemas.records import SubmissionRecord
+from app.schemas.stats import AssignmentStats
+from app.schemas.search import SearchPage
 from app.database.submission_repo import SubmissionRepo
 from app.database.base import BinaryStorage
+from app.database.sharding import file_id_from_uri
+from app.services.content_service import (
+    ContentService, DEFAULT_INLINE_MAX_BYTES, DEFAULT_PREVIEW_CHARS, DEFAULT_MAX_DELTA_CHAIN,
+)
 
 def _is_teacher(role):
     return role == "teacher" or (isinstance(role, (list, tuple, set)) and "teacher" in role)
@@ -11,13 +21,35 @@ def _is_teacher(role):
 def _is_student(role):
     return role == "student" or (isinstance(role, (list, tuple, set)) and "student" in role)
 
+def _encode_cursor(score: float, submission_id: str) -> str:
+    raw = json.dumps([score, submission_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def _decode_cursor(cursor: str) -> tuple[float, str]:
+    try:
+        score, submission_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return float(score), str(submission_id)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid search cursor") from None
+
+class SubmissionConflict(Exception):
+    """La richiesta non è applicabile allo stato attuale della consegna (HTTP 409)."""
+
+def _checksum_key(key: str) -> str:
+    return key[len("sha256:"):] if key.startswith("sha256:") else key
+
 class submissionService:
     @staticmethod
+    @traced()
     async def create_submission(
         assignment_id: str,
         data: SubmissionCreate,
         user: UserContext,
-        repo: SubmissionRepo
+        repo: SubmissionRepo,
+        storage: BinaryStorage | None = None,
+        *,
+        inline_max_bytes: int = DEFAULT_INLINE_MAX_BYTES,
+        preview_chars: int = DEFAULT_PREVIEW_CHARS,
     ) -> str:
         if not _is_student(user.role):
             raise PermissionError("Only students can create submissions")
@@ -26,41 +58,268 @@ class submissionService:
         already = await repo.find_for_assignment_and_student(assignment_id, user.user_id)
         if already:
             raise PermissionError("You have already submitted for this assignment")
-        else:
-            return await repo.create(data, assignment_id=assignment_id, student_id=user.user_id)
-        
-    
+
+        # testo lungo: compresso nello storage, inline resta solo l'anteprima
+        content_ref: ContentRef | None = None
+        full_text = data.content
+        if storage is not None:
+            data.content, content_ref = await ContentService.offload(
+                data.content,
+                storage,
+                inline_max_bytes=inline_max_bytes,
+                preview_chars=preview_chars,
+                metadata={"assignmentId": assignment_id, "studentId": user.user_id},
+            )
+        try:
+            return await repo.create(
+                data, assignment_id=assignment_id, student_id=user.user_id, content_ref=content_ref,
+                search_text=full_text if content_ref is not None else None,
+            )
+        except Exception:
+            if content_ref is not None:
+                await ContentService.discard(content_ref, storage)
+            raise
+
+    @staticmethod
+    @traced()
+    async def resubmit(
+        assignment_id: str,
+        data: SubmissionCreate,
+        user: UserContext,
+        repo: SubmissionRepo,
+        storage: BinaryStorage | None = None,
+        *,
+        keep_files: Sequence[str] = (),
+        inline_max_bytes: int = DEFAULT_INLINE_MAX_BYTES,
+        preview_chars: int = DEFAULT_PREVIEW_CHARS,
+        max_delta_chain: int = DEFAULT_MAX_DELTA_CHAIN,
+    ) -> tuple[str, Optional[Submission], list[FileMeta]]:
+        """
+        Nuova versione della consegna dello studente (la prima, se non ce n'è
+        ancora una). I file in `keep_files` (per nome o per checksum SHA-256,
+        anche come "sha256:<hex>") passano alla nuova versione senza che il
+        client li ricarichi; il testo lungo diventa un delta rispetto alla
+        versione precedente quando conviene.
+        Ritorna (nuovo ID, versione precedente o None, file tenuti).
+        """
+        if not _is_student(user.role):
+            raise PermissionError("Only students can create submissions")
+        data.studentId = user.user_id
+
+        current = await repo.find_for_assignment_and_student(assignment_id, user.user_id)
+        if not current:
+            new_id = await submissionService.create_submission(
+                assignment_id, data, user, repo, storage,
+                inline_max_bytes=inline_max_bytes, preview_chars=preview_chars,
+            )
+            return new_id, None, []
+        previous = current[0]
+
+        by_name = {f.filename: f for f in previous.files}
+        by_checksum = {f.checksum: f for f in previous.files if f.checksum}
+        kept: list[FileMeta] = []
+        unknown: list[str] = []
+        for key in keep_files:
+            meta = by_name.get(key) or by_checksum.get(_checksum_key(key))
+            if meta is None:
+                unknown.append(key)
+            elif all(meta.path != k.path for k in kept):
+                kept.append(meta)
+        if unknown:
+            raise SubmissionConflict(f"Files not in the previous version: {', '.join(unknown)}")
+
+        content_ref: ContentRef | None = None
+        content_delta = None
+        full_text = data.content
+        if storage is not None:
+            previous_text = await ContentService.resolve(previous, storage, repo)
+            content_delta = await ContentService.delta_against(
+                previous, previous_text, data.content,
+                inline_max_bytes=inline_max_bytes, max_chain=max_delta_chain,
+            )
+            if content_delta is not None:
+                data.content = ContentService.preview(data.content, preview_chars)
+            else:
+                data.content, content_ref = await ContentService.offload(
+                    data.content,
+                    storage,
+                    inline_max_bytes=inline_max_bytes,
+                    preview_chars=preview_chars,
+                    metadata={"assignmentId": assignment_id, "studentId": user.user_id},
+                )
+        new_id = None
+        try:
+            new_id = await repo.create_version(
+                data, previous=previous, files=kept, content_ref=content_ref, content_delta=content_delta,
+                search_text=full_text if content_ref is not None or content_delta is not None else None,
+            )
+        finally:
+            if new_id is None and content_ref is not None:
+                await ContentService.discard(content_ref, storage)
+        if new_id is None:
+            raise SubmissionConflict("The submission has been resubmitted concurrently")
+        return new_id, previous, kept
+
     @staticmethod
+    @traced()
     async def add_file(submission_id: str, file_meta: FileMeta, user: UserContext, repo: SubmissionRepo) -> bool:
         if not _is_student(user.role):
             raise PermissionError("Unauthorized to add files")
         return await repo.add_file(submission_id, file_meta)
 
     @staticmethod
-    async def list_for_assignment(assignment_id: str, user: UserContext, repo: SubmissionRepo) -> Sequence[Submission]:
+    @traced()
+    async def list_for_assignment(
+        assignment_id: str, user: UserContext, repo: SubmissionRepo, *, include_history: bool = False
+    ) -> Sequence[Submission]:
         if _is_teacher(user.role):
-            return await repo.find_for_assignment(assignment_id)
+            return await repo.find_for_assignment(assignment_id, include_history=include_history)
         elif _is_student(user.role):
-            return await repo.find_for_assignment_and_student(assignment_id, user.user_id)
+            return await repo.find_for_assignment_and_student(assignment_id, user.user_id, include_history=include_history)
         else:
             raise PermissionError("Unauthorized access")
 
     @staticmethod
-    async def get_submission(submission_id: str, user: UserContext, repo: SubmissionRepo) -> Optional[Submission]:
-        submission = await repo.find_one(submission_id)
-        if submission is None:
+    @traced()
+    async def list_records_for_assignment(
+        assignment_id: str, user: UserContext, repo: SubmissionRepo, *, include_history: bool = False
+    ) -> Sequence[SubmissionRecord]:
+        """Stesse regole di list_for_assignment, ma ritorna record compatti (percorso veloce)."""
+        if _is_teacher(user.role):
+            return await repo.find_records_for_assignment(assignment_id, include_history=include_history)
+        elif _is_student(user.role):
+            return await repo.find_records_for_assignment_and_student(
+                assignment_id, user.user_id, include_history=include_history
+            )
+        else:
+            raise PermissionError("Unauthorized access")
+
+    @staticmethod
+    def feed_filter_for(user: UserContext) -> Optional[str]:
+        """Filtro studente per il feed live: il docente vede tutto, lo studente solo le proprie."""
+        if _is_teacher(user.role):
             return None
         if _is_student(user.role):
-            if submission.studentId != user.user_id:
-                raise PermissionError("Unauthorized access to this submission")
-            return submission
+            return user.user_id
+        raise PermissionError("Unauthorized access")
+
+    @staticmethod
+    @traced()
+    async def stats_for_assignment(assignment_id: str, user: UserContext, repo: SubmissionRepo) -> AssignmentStats:
+        if not _is_teacher(user.role):
+            raise PermissionError("Only teachers can read assignment statistics")
+        stats = await repo.get_stats(assignment_id)
+        return stats or AssignmentStats(assignmentId=assignment_id)
+
+    @staticmethod
+    @traced()
+    async def search(
+        query: str,
+        user: UserContext,
+        repo: SubmissionRepo,
+        *,
+        assignment_id: Optional[str] = None,
+        cursor: Optional[str] = None,
+        limit: int = 20,
+    ) -> SearchPage:
+        """
+        Ricerca per parole chiave (sintassi $text: "frase esatta", -escluso),
+        ordinata per rilevanza. Il docente cerca ovunque, lo studente solo
+        tra le proprie submission. `cursor` è il nextCursor della pagina precedente.
+        """
+        query = query.strip()
+        if not query:
+            raise ValueError("Search query must not be empty")
+        if limit < 1:
+            raise ValueError("Search limit must be positive")
         if _is_teacher(user.role):
-            return submission
+            student_id = None
+        elif _is_student(user.role):
+            student_id = user.user_id
         else:
             raise PermissionError("Unauthorized access")
+
+        after = _decode_cursor(cursor) if cursor else None
+        # un risultato in più per sapere se esiste la pagina successiva
+        hits = list(await repo.search(
+            query, assignment_id=assignment_id, student_id=student_id, limit=limit + 1, after=after,
+        ))
+        page = SearchPage(items=hits[:limit])
+        if len(hits) > limit:
+            last = page.items[-1]
+            page.nextCursor = _encode_cursor(last.score, last.submission.submissionId)
+        return page
+
+    @staticmethod
+    def _ensure_can_read(submission: Submission | SubmissionRecord, user: UserContext) -> None:
+        if _is_student(user.role):
+            if submission.studentId != user.user_id:
+                raise PermissionError("Unauthorized access to this submission")
+            return
+        if not _is_teacher(user.role):
+            raise PermissionError("Unauthorized access")
+
+    @staticmethod
+    @traced()
+    async def get_submission(
+        submission_id: str,
+        user: UserContext,
+        repo: SubmissionRepo,
+        storage: BinaryStorage | None = None,
+    ) -> Optional[Submission]:
+        """Dettaglio: se c'è lo storage carica anche il testo completo salvato fuori dal documento."""
+        submission = await repo.find_one(submission_id, allow_secondary=True)
+        if submission is None:
+            return None
+        submissionService._ensure_can_read(submission, user)
+        if storage is not None and (submission.contentRef is not None or submission.contentDelta is not None):
+            submission.content = await ContentService.resolve(submission, storage, repo)
+            submission.contentTruncated = False
+        return submission
+
+    @staticmethod
+    @traced()
+    async def get_many(
+        submission_ids: Sequence[str], user: UserContext, repo: SubmissionRepo
+    ) -> tuple[list[SubmissionRecord], list[str], list[str]]:
+        """
+        Lookup in blocco con una sola query: applica a ogni risultato gli stessi
+        controlli di get_submission. Ritorna (trovate, non trovate, vietate)
+        nell'ordine degli ID richiesti, senza duplicati.
+        """
+        if not (_is_teacher(user.role) or _is_student(user.role)):
+            raise PermissionError("Unauthorized access")
+
+        ids = list(dict.fromkeys(submission_ids))
+        by_id = {r.submissionId: r for r in await repo.find_many(ids)}
+
+        items: list[SubmissionRecord] = []
+        not_found: list[str] = []
+        forbidden: list[str] = []
+        for sid in ids:
+            record = by_id.get(sid)
+            if record is None:
+                not_found.append(sid)
+                continue
+            try:
+                submissionService._ensure_can_read(record, user)
+            except PermissionError:
+                forbidden.append(sid)
+                continue
+            items.append(record)
+        return items, not_found, forbidden
         
     @staticmethod
-    async def delete_submission(submission_id: str, user: UserContext, repo: SubmissionRepo, storage: BinaryStorage | None = None) -> bool:
+    @traced()
+    async def delete_submission(
+        submission_id: str,
+        user: UserContext,
+        repo: SubmissionRepo,
+        storage: BinaryStorage | None = None,
+        *,
+        inline_max_bytes: int = DEFAULT_INLINE_MAX_BYTES,
+        preview_chars: int = DEFAULT_PREVIEW_CHARS,
+    ) -> bool:
         if not _is_teacher(user.role):
             raise PermissionError("Only teachers can delete submissions")
 
@@ -69,14 +328,48 @@ class submissionService:
             submission = await repo.find_one(submission_id)
             if submission is None:
                 return False
+
+            # altre versioni: chi usa questa come base del delta riceve il testo
+            # completo, e i file riusati da altre versioni non si cancellano
+            history = await repo.find_for_assignment_and_student(
+                submission.assignmentId, submission.studentId, include_history=True
+            )
+            others = [s for s in history if s.submissionId != submission_id]
+            for other in others:
+                if other.contentDelta is not None and other.contentDelta.base == submission_id:
+                    text = await ContentService.resolve(other, storage, repo)
+                    content, content_ref = await ContentService.offload(
+                        text, storage,
+                        inline_max_bytes=inline_max_bytes,
+                        preview_chars=preview_chars,
+                        metadata={"assignmentId": other.assignmentId, "studentId": other.studentId},
+                    )
+                    await repo.replace_content(
+                        other.submissionId, content, content_ref,
+                        search_text=text if content_ref is not None else None,
+                    )
+            shared = {f.path for other in others for f in other.files}
+
             for f in submission.files:
-                # path atteso: gridfs://<bucket>/<file_id>
-                if f.path.startswith("gridfs://"):
-                    file_id = f.path.rsplit("/", 1)[-1]
+                if f.path in shared:
+                    continue
+                # path atteso: gridfs://<shard>/<oid>; con l'allegato vanno testo e anteprima derivati
+                uris = [f.path]
+                if f.derived is not None:
+                    uris += [u for u in (f.derived.textUri, f.derived.previewUri) if u]
+                for uri in uris:
+                    file_id = file_id_from_uri(uri)
+                    if file_id is None:
+                        continue
                     try:
                         await storage.delete(file_id)
                     except Exception:
                         # non bloccare la cancellazione della submission se un file fallisce
                         pass
+            if submission.contentRef is not None:
+                try:
+                    await ContentService.discard(submission.contentRef, storage)
+                except Exception:
+                    pass
 
         return await repo.delete(submission_id)
\ No newline at end of file
@@ -0,0 +1,85 @@
+# test/benchmark/bench_compression.py
+"""
+Throughput dei download GridFS con e senza compressione del wire protocol.
+
+Carica un file di prova nel bucket `bench_uploads` e lo riscarica con un
+client per ciascun compressore, stampando MB/s. Richiede un MongoDB
+raggiungibile (meglio remoto: in locale la banda non è il collo di bottiglia).
+
+Uso:  PYTHONPATH=. python test/benchmark/bench_compression.py \\
+          --mongo-uri mongodb://host:27017 --db bench [--size-mb 64] [--data text|random]
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from gridfs import AsyncGridFSBucket
+from pymongo import AsyncMongoClient
+
+from app.database.gridfs import GridFSStorage
+
+BUCKET = "bench_uploads"
+
+
+def make_payload(size: int, kind: str) -> bytes:
+    if kind == "random":
+        return os.urandom(size)
+    # testo/codice: il caso tipico degli allegati comprimibili
+    line = b"def handler(request):\n    return {'status': 'ok', 'items': [1, 2, 3]}  # commento\n"
+    return (line * (size // len(line) + 1))[:size]
+
+
+async def _chunks(data: bytes, size: int = 1024 * 1024):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+async def download_mbps(uri: str, db_name: str, file_id: str, size: int, compressors: str, repeat: int) -> float:
+    kwargs = {"compressors": compressors} if compressors else {}
+    client = AsyncMongoClient(uri, **kwargs)
+    try:
+        db = client[db_name]
+        storage = GridFSStorage(bucket=AsyncGridFSBucket(db, bucket_name=BUCKET), bucket_name=BUCKET)
+        best = float("inf")
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            got = 0
+            async for chunk in storage.stream(file_id):
+                got += len(chunk)
+            best = min(best, time.perf_counter() - t0)
+            assert got == size
+        return size / best / 1e6
+    finally:
+        await client.close()
+
+
+async def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--mongo-uri", default="mongodb://localhost:27017")
+    ap.add_argument("--db", default="bench")
+    ap.add_argument("--size-mb", type=int, default=64)
+    ap.add_argument("--data", choices=["text", "random"], default="text")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--compressors", default=",snappy,zstd,zlib", help="lista separata da virgole ('' = nessuna)")
+    args = ap.parse_args()
+
+    size = args.size_mb * 1024 * 1024
+    client = AsyncMongoClient(args.mongo_uri)
+    bucket = AsyncGridFSBucket(client[args.db], bucket_name=BUCKET, chunk_size_bytes=255 * 1024)
+    storage = GridFSStorage(bucket=bucket, bucket_name=BUCKET)
+    stored = await storage.upload(
+        filename="bench.bin", content_type=None, data=_chunks(make_payload(size, args.data))
+    )
+    try:
+        print(f"{'compressor':>10} {'MB/s':>8}")
+        for comp in args.compressors.split(","):
+            mbps = await download_mbps(args.mongo_uri, args.db, stored.file_id, size, comp, args.repeat)
+            print(f"{comp or 'none':>10} {mbps:>8.1f}")
+    finally:
+        await storage.delete(stored.file_id)
+        await client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
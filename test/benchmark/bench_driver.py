@@ -0,0 +1,107 @@
+# test/benchmark/bench_driver.py
+"""
+Latenza per operazione e numero di thread sotto carico: Motor (thread pool
+attorno a PyMongo sincrono) contro l'API async nativa di PyMongo.
+
+Esegue `--concurrency` task che ripetono find_one, update_one e la lettura
+completa di un file GridFS, poi stampa p50/p99 per operazione e il picco di
+thread attivi. Motor non è più una dipendenza: per il confronto installarlo a
+parte (`pip install motor`), altrimenti viene misurato solo PyMongo async.
+
+Uso:  PYTHONPATH=. python test/benchmark/bench_driver.py --mongo-uri mongodb://host:27017 [--concurrency 64]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import threading
+import time
+
+from bson import ObjectId
+
+COLLECTION = "bench_submissions"
+BUCKET = "bench_driver"
+
+
+def _drivers():
+    from gridfs import AsyncGridFSBucket
+    from pymongo import AsyncMongoClient
+    drivers = {"pymongo-async": (AsyncMongoClient, AsyncGridFSBucket)}
+    try:
+        from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorGridFSBucket
+        drivers["motor"] = (AsyncIOMotorClient, AsyncIOMotorGridFSBucket)
+    except ImportError:
+        pass
+    return drivers
+
+
+async def _maybe_await(res):
+    if asyncio.iscoroutine(res) or isinstance(res, asyncio.Future):
+        return await res
+    return res
+
+
+async def run_driver(name, client_cls, bucket_cls, args) -> None:
+    client = client_cls(args.mongo_uri)
+    db = client[args.db]
+    col = db[COLLECTION]
+    bucket = bucket_cls(db, bucket_name=BUCKET)
+
+    await col.delete_many({})
+    await col.insert_many([{"submissionId": f"sm-{i:05d}", "n": 0} for i in range(1000)])
+    await col.create_index("submissionId", unique=True)
+    grid_in = bucket.open_upload_stream("bench.bin")
+    await grid_in.write(os.urandom(args.file_kb * 1024))
+    await grid_in.close()
+    file_id = grid_in._id
+
+    lat: dict[str, list[float]] = {"find_one": [], "update_one": [], "gridfs_read": []}
+    peak_threads = threading.active_count()
+
+    async def worker(w: int) -> None:
+        nonlocal peak_threads
+        for i in range(args.ops):
+            sid = f"sm-{(w * args.ops + i) % 1000:05d}"
+            t0 = time.perf_counter()
+            await col.find_one({"submissionId": sid})
+            t1 = time.perf_counter()
+            await col.update_one({"submissionId": sid}, {"$inc": {"n": 1}})
+            t2 = time.perf_counter()
+            s = await bucket.open_download_stream(ObjectId(file_id))
+            await s.read()
+            await _maybe_await(s.close())
+            t3 = time.perf_counter()
+            lat["find_one"].append(t1 - t0)
+            lat["update_one"].append(t2 - t1)
+            lat["gridfs_read"].append(t3 - t2)
+            peak_threads = max(peak_threads, threading.active_count())
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker(w) for w in range(args.concurrency)))
+    elapsed = time.perf_counter() - t0
+
+    for op, values in lat.items():
+        q = statistics.quantiles(values, n=100)
+        print(f"{name:>14} {op:>12} p50={q[49] * 1e3:7.2f}ms p99={q[98] * 1e3:7.2f}ms")
+    print(f"{name:>14} {'total':>12} {elapsed:.2f}s  peak threads={peak_threads}")
+
+    await bucket.delete(file_id)
+    await col.drop()
+    await _maybe_await(client.close())
+
+
+async def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--mongo-uri", default="mongodb://localhost:27017")
+    ap.add_argument("--db", default="bench")
+    ap.add_argument("--concurrency", type=int, default=64)
+    ap.add_argument("--ops", type=int, default=50)
+    ap.add_argument("--file-kb", type=int, default=512)
+    args = ap.parse_args()
+
+    for name, (client_cls, bucket_cls) in _drivers().items():
+        await run_driver(name, client_cls, bucket_cls, args)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,94 @@
+# test/benchmark/bench_gridfs_upload.py
+"""
+Throughput degli upload GridFS: GridIn (un insert_one per chunk) contro la
+scrittura parallela a batch di GridFSStorage (write_chunks_parallel).
+
+Per ogni configurazione carica `--rounds` volte un file da `--size-mb` MB
+(in pezzi da 1MB, come FileUploadService), stampa i MB/s mediani e verifica
+che il file si rilegga identico con AsyncGridFSBucket standard.
+
+Uso:  PYTHONPATH=. python test/benchmark/bench_gridfs_upload.py --mongo-uri mongodb://host:27017 [--size-mb 500]
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import statistics
+import time
+
+from bson import ObjectId
+
+from app.database.gridfs import GridFSStorage, DEFAULT_CHUNK_SIZE
+
+BUCKET = "bench_upload"
+PIECE = 1024 * 1024
+
+
+async def _pieces(block: bytes, total: int):
+    sent = 0
+    while sent < total:
+        piece = block[: min(PIECE, total - sent)]
+        sent += len(piece)
+        yield piece
+
+
+async def run_config(name: str, storage: GridFSStorage, bucket, block: bytes, args) -> None:
+    total = args.size_mb * 1024 * 1024
+    rates = []
+    for _ in range(args.rounds):
+        t0 = time.perf_counter()
+        stored = await storage.upload(filename="bench.bin", content_type=None, data=_pieces(block, total))
+        elapsed = time.perf_counter() - t0
+        rates.append(total / elapsed / 1e6)
+
+        # leggibile dagli strumenti GridFS standard, byte per byte
+        s = await bucket.open_download_stream(ObjectId(stored.file_id))
+        hasher = hashlib.sha256()
+        while chunk := await s.read(PIECE):
+            hasher.update(chunk)
+        await s.close()
+        assert hasher.hexdigest() == stored.checksum, f"{name}: contenuto diverso"
+        await bucket.delete(ObjectId(stored.file_id))
+
+    print(f"{name:>22} median={statistics.median(rates):8.1f} MB/s  min={min(rates):8.1f}  max={max(rates):8.1f}")
+
+
+async def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--mongo-uri", default="mongodb://localhost:27017")
+    ap.add_argument("--db", default="bench")
+    ap.add_argument("--size-mb", type=int, default=100)
+    ap.add_argument("--rounds", type=int, default=3)
+    ap.add_argument("--batch-chunks", type=int, nargs="+", default=[8, 16])
+    ap.add_argument("--concurrency", type=int, nargs="+", default=[2, 4, 8])
+    args = ap.parse_args()
+
+    from gridfs import AsyncGridFSBucket
+    from pymongo import AsyncMongoClient
+
+    client = AsyncMongoClient(args.mongo_uri)
+    db = client[args.db]
+    bucket = AsyncGridFSBucket(db, bucket_name=BUCKET, chunk_size_bytes=DEFAULT_CHUNK_SIZE)
+    block = os.urandom(PIECE)  # dati incomprimibili: niente vantaggi dalla compressione di rete
+
+    def storage(**kw) -> GridFSStorage:
+        return GridFSStorage(bucket=bucket, bucket_name=BUCKET, db=db, chunk_size=DEFAULT_CHUNK_SIZE, **kw)
+
+    await storage().ensure_indexes()
+    try:
+        await run_config("gridin", storage(), bucket, block, args)
+        for batch in args.batch_chunks:
+            for conc in args.concurrency:
+                await run_config(
+                    f"parallel b={batch} c={conc}",
+                    storage(upload_batch_chunks=batch, upload_concurrency=conc),
+                    bucket, block, args,
+                )
+    finally:
+        await db.drop_collection(f"{BUCKET}.files")
+        await db.drop_collection(f"{BUCKET}.chunks")
+        await client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,86 @@
+# test/benchmark/bench_read_ahead.py
+"""
+Throughput di un singolo download da GridFSStorage.stream al variare del
+read-ahead e della banda del client.
+
+Mongo e client sono simulati: ogni read da `--read-chunk` costa un RTT più
+il tempo di trasferimento a `--db-mbps`, ogni chunk inviato costa
+len/banda del client. Senza read-ahead i due tempi si sommano; con
+read-ahead si sovrappongono e il throughput tende al minimo tra le due bande.
+
+Uso:  PYTHONPATH=. python test/benchmark/bench_read_ahead.py \\
+          [--size-mb 32] [--rtt-ms 2] [--db-mbps 800] [--client-mbps 20,100,400,1000] [--depths 0,1,2,4]
+"""
+import argparse
+import asyncio
+import time
+
+from bson import ObjectId
+
+from app.database.gridfs import GridFSStorage
+from app.database.read_ahead import ReadAheadBudget
+
+MB = 1024 * 1024
+
+
+class FakeGridOut:
+    def __init__(self, size: int, rtt: float, db_bps: float):
+        self.remaining = size
+        self.rtt = rtt
+        self.db_bps = db_bps
+
+    async def read(self, n: int) -> bytes:
+        n = min(n, self.remaining)
+        if n == 0:
+            return b""
+        await asyncio.sleep(self.rtt + n / self.db_bps)
+        self.remaining -= n
+        return bytes(n)
+
+    async def close(self):
+        pass
+
+
+class FakeBucket:
+    def __init__(self, size: int, rtt: float, db_bps: float):
+        self.size, self.rtt, self.db_bps = size, rtt, db_bps
+
+    async def open_download_stream(self, file_id):
+        return FakeGridOut(self.size, self.rtt, self.db_bps)
+
+
+async def download(storage: GridFSStorage, client_bps: float) -> float:
+    start = time.perf_counter()
+    total = 0
+    async for chunk in storage.stream(str(ObjectId())):
+        total += len(chunk)
+        await asyncio.sleep(len(chunk) / client_bps)  # invio al client
+    return total / MB / (time.perf_counter() - start)
+
+
+async def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--size-mb", type=int, default=32)
+    ap.add_argument("--read-chunk", type=int, default=MB)
+    ap.add_argument("--rtt-ms", type=float, default=2.0)
+    ap.add_argument("--db-mbps", type=float, default=800, help="banda Mongo -> app (Mbit/s)")
+    ap.add_argument("--client-mbps", default="20,100,400,1000", help="bande client (Mbit/s)")
+    ap.add_argument("--depths", default="0,1,2,4", help="chunk di read-ahead")
+    args = ap.parse_args()
+
+    bucket = FakeBucket(args.size_mb * MB, args.rtt_ms / 1000, args.db_mbps * 1e6 / 8)
+    depths = [int(d) for d in args.depths.split(",")]
+    print(f"{'client Mbit/s':>14}" + "".join(f"{f'depth={d}':>12}" for d in depths) + "   (MB/s)")
+    for mbps in (float(m) for m in args.client_mbps.split(",")):
+        row = []
+        for depth in depths:
+            storage = GridFSStorage(
+                bucket=bucket, read_bucket=bucket, read_chunk=args.read_chunk,
+                read_ahead_chunks=depth, read_ahead_budget=ReadAheadBudget(64 * MB),
+            )
+            row.append(await download(storage, mbps * 1e6 / 8))
+        print(f"{mbps:>14.0f}" + "".join(f"{v:>12.1f}" for v in row))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
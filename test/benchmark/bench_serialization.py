@@ -0,0 +1,91 @@
+# test/benchmark/bench_serialization.py
+"""
+Costo CPU per documento della lista submission: percorso Pydantic
+(_from_doc + validazione/serializzazione del response_model) contro il
+percorso veloce (SubmissionRecord + orjson).
+
+Uso:  PYTHONPATH=. python test/benchmark/bench_serialization.py [--docs 500] [--files 0,5,20]
+"""
+import argparse
+import json
+import time
+from datetime import datetime, timedelta
+
+from pydantic import TypeAdapter
+
+from app.schemas.submission import Submission, FileMeta
+from app.schemas.records import SubmissionRecord, encode_records
+
+LIST_ADAPTER = TypeAdapter(list[Submission])
+
+
+def make_docs(n: int, files: int) -> list[dict]:
+    base = datetime(2025, 1, 1, 12, 0, 0)
+    return [
+        {
+            "_id": i,
+            "submissionId": f"sm-{i:05d}",
+            "createdAt": base + timedelta(milliseconds=i),
+            "assignmentId": "A1",
+            "studentId": f"s{i}",
+            "content": "Lorem ipsum dolor sit amet " * 8,
+            "files": [
+                {"filename": f"file-{j}.pdf", "path": f"gridfs://uploads/{i:012d}{j:012d}", "size": 1024 * j}
+                for j in range(files)
+            ],
+        }
+        for i in range(n)
+    ]
+
+
+def from_doc(d: dict) -> Submission:
+    # stessa logica di MongosubmissionRepository._from_doc
+    return Submission(
+        submissionId=d["submissionId"],
+        createdAt=d["createdAt"],
+        assignmentId=d["assignmentId"],
+        studentId=d.get("studentId"),
+        content=d.get("content", ""),
+        files=[FileMeta(**f) for f in d.get("files", [])],
+    )
+
+
+def pydantic_path(docs: list[dict]) -> bytes:
+    # 1) _from_doc  2) validazione response_model  3) serializzazione + json.dumps
+    items = [from_doc(d) for d in docs]
+    validated = LIST_ADAPTER.validate_python([i.model_dump() for i in items])
+    content = LIST_ADAPTER.dump_python(validated, mode="json")
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def fast_path(docs: list[dict]) -> bytes:
+    return encode_records([SubmissionRecord.from_doc(d) for d in docs])
+
+
+def per_doc_us(fn, docs: list[dict], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(docs)
+        best = min(best, time.perf_counter() - t0)
+    return best / len(docs) * 1e6
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--docs", type=int, default=500)
+    ap.add_argument("--files", default="0,5,20,50")
+    ap.add_argument("--repeat", type=int, default=20)
+    args = ap.parse_args()
+
+    print(f"{'files/doc':>9} {'pydantic us/doc':>16} {'fast us/doc':>12} {'speedup':>8}")
+    for files in (int(x) for x in args.files.split(",")):
+        docs = make_docs(args.docs, files)
+        assert json.loads(pydantic_path(docs)) == json.loads(fast_path(docs))
+        slow = per_doc_us(pydantic_path, docs, args.repeat)
+        fast = per_doc_us(fast_path, docs, args.repeat)
+        print(f"{files:>9} {slow:>16.2f} {fast:>12.2f} {slow / fast:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+#!/bin/sh
+# test/benchmark/run_benchmarks.sh
+#
+# Baseline dei micro-benchmark e controllo delle regressioni.
+#
+#   test/benchmark/run_benchmarks.sh save            # salva una nuova baseline
+#   test/benchmark/run_benchmarks.sh check [soglia]  # confronta con l'ultima baseline
+#
+# Il controllo fallisce se la mediana di un benchmark peggiora oltre la
+# soglia (default 15%). Le baseline stanno in test/benchmark/baselines/,
+# una cartella per macchina (interprete, CPU): vanno salvate sulla stessa
+# macchina/agente che esegue il controllo.
+set -eu
+
+cd "$(dirname "$0")/../.."
+STORAGE="file://test/benchmark/baselines"
+MODE="${1:-check}"
+THRESHOLD="${2:-15%}"
+
+case "$MODE" in
+  save)
+    PYTHONPATH=. python -m pytest test/benchmark -q \
+      --benchmark-only --benchmark-storage="$STORAGE" --benchmark-autosave
+    ;;
+  check)
+    PYTHONPATH=. python -m pytest test/benchmark -q \
+      --benchmark-only --benchmark-storage="$STORAGE" \
+      --benchmark-compare --benchmark-compare-fail="median:${THRESHOLD}" \
+      --benchmark-columns=min,median,iqr,rounds
+    ;;
+  *)
+    echo "uso: $0 save|check [soglia, es. 15%]" >&2
+    exit 2
+    ;;
+esac
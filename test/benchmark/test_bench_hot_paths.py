@@ -0,0 +1,157 @@
+# test/benchmark/test_bench_hot_paths.py
+import io
+from datetime import datetime, timedelta, timezone
+
+import jwt
+import pytest
+from bson import ObjectId
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+from fastapi.security import HTTPAuthorizationCredentials
+from starlette.requests import Request
+
+from app.database.gridfs import GridFSStorage
+from app.database.mongo_submissions import MongosubmissionRepository
+from app.services.auth_service import AuthService
+from app.services.file_upload_service import FileUploadService
+from app.services.publisher_service import SubmissionPublisher
+
+MB = 1024 * 1024
+
+
+# ------------------------------- Fakes ----------------------------------------
+class FakeCollection:
+    def with_options(self, **kwargs):
+        return self
+
+class FakeDb:
+    def __getitem__(self, name):
+        return FakeCollection()
+
+class FakeGridIn:
+    """Scarta i dati: si misura solo il lavoro di GridFSStorage.upload (hash + conteggio)."""
+
+    def __init__(self):
+        self._id = ObjectId()
+
+    async def write(self, chunk):
+        pass
+
+    async def close(self):
+        pass
+
+class FakeBucket:
+    def open_upload_stream(self, filename, metadata=None):
+        return FakeGridIn()
+
+class FakeUploadFile:
+    def __init__(self, data: bytes):
+        self.filename = "report.pdf"
+        self.content_type = "application/pdf"
+        self._buf = io.BytesIO(data)
+
+    async def read(self, size: int = -1) -> bytes:
+        return self._buf.read(size)
+
+
+def _doc(files: int) -> dict:
+    return {
+        "_id": ObjectId(),
+        "submissionId": "sm-00042",
+        "createdAt": datetime(2025, 1, 1, 12, 0, tzinfo=timezone.utc),
+        "assignmentId": "A1",
+        "studentId": "s1",
+        "content": "Lorem ipsum dolor sit amet " * 8,
+        "files": [
+            {"filename": f"file-{j}.pdf", "path": f"gridfs://uploads/{ObjectId()}", "size": 1024 * j}
+            for j in range(files)
+        ],
+    }
+
+
+# ------------------------------ Repository ------------------------------------
+@pytest.mark.benchmark(group="repo._from_doc")
+@pytest.mark.parametrize("files", [0, 1, 10, 50])
+def test_from_doc(benchmark, files):
+    repo = MongosubmissionRepository(FakeDb())
+    doc = _doc(files)
+    result = benchmark(repo._from_doc, doc)
+    assert len(result.files) == files
+
+
+# ------------------------------- Publisher ------------------------------------
+@pytest.mark.benchmark(group="publisher.payload")
+def test_build_payload_and_encode(benchmark):
+    delivered = datetime(2025, 1, 1, 12, 0, tzinfo=timezone.utc)
+
+    def build():
+        return SubmissionPublisher._build_submission_payload("A1", "sm-00042", "s1", delivered)[2]
+
+    assert b'"submissionId": "sm-00042"' in benchmark(build)
+
+
+# -------------------------------- Storage -------------------------------------
+@pytest.mark.benchmark(group="gridfs.upload")
+@pytest.mark.parametrize("size_mb", [1, 16])
+def test_gridfs_upload_hashing(benchmark, run_sync, size_mb):
+    storage = GridFSStorage(bucket=FakeBucket())
+    data = b"x" * (size_mb * MB)
+
+    async def chunks():
+        for i in range(0, len(data), MB):
+            yield data[i:i + MB]
+
+    def upload():
+        return run_sync(storage.upload(filename="f.bin", content_type=None, data=chunks()))
+
+    stored = benchmark(upload)
+    assert stored.size == len(data)
+    benchmark.extra_info["MB"] = size_mb
+
+
+# --------------------------------- Upload -------------------------------------
+@pytest.mark.benchmark(group="upload._iter_file")
+@pytest.mark.parametrize("chunk_kb", [64, 256, 1024, 4096])
+def test_iter_file(benchmark, run_sync, chunk_kb):
+    data = b"x" * (16 * MB)
+
+    async def consume():
+        n = 0
+        async for chunk in FileUploadService._iter_file(FakeUploadFile(data), chunk_kb * 1024):
+            n += len(chunk)
+        return n
+
+    assert benchmark(lambda: run_sync(consume())) == len(data)
+
+
+# ---------------------------------- Auth --------------------------------------
+def _keypair(algorithm: str):
+    if algorithm == "RS256":
+        private = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    else:
+        private = ec.generate_private_key(ec.SECP256R1())
+    public = private.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+    ).decode()
+    return private, public
+
+@pytest.mark.benchmark(group="auth.get_current_user")
+@pytest.mark.parametrize("algorithm", ["RS256", "ES256"])
+def test_get_current_user(benchmark, run_sync, monkeypatch, algorithm):
+    private, public = _keypair(algorithm)
+    monkeypatch.setattr(AuthService, "JWT_ALGORITHM", algorithm)
+    monkeypatch.setattr(AuthService, "PUBLIC_KEY", public)
+    token = jwt.encode(
+        {"sub": "s1", "role": "student", "exp": datetime.now(timezone.utc) + timedelta(hours=1)},
+        private,
+        algorithm=algorithm,
+    )
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+    def call():
+        # richiesta nuova a ogni giro: niente utente già decodificato nello scope
+        request = Request({"type": "http", "headers": [(b"authorization", f"Bearer {token}".encode())]})
+        return run_sync(AuthService.get_current_user(request, credentials))
+
+    user = benchmark(call)
+    assert user.user_id == "s1"
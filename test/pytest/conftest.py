@@ -0,0 +1,15 @@
+# tests/unit/conftest.py
+import os
+
+import pytest
+
+# variabili obbligatorie dei Settings: valori fittizi per i moduli che leggono `settings` all'import
+SETTINGS_ENV = (
+    "ENV", "JWT_ALGORITHM", "JWT_PUBLIC_KEY", "MONGO_URI", "MONGO_DB_NAME",
+    "RABBITMQ_USERNAME", "RABBITMQ_PASSWORD", "RABBITMQ_URL",
+)
+
+@pytest.fixture
+def settings_env(monkeypatch):
+    for key in SETTINGS_ENV:
+        monkeypatch.setenv(key, os.environ.get(key, "x"))
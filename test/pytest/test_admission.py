@@ -0,0 +1,83 @@
+# tests/unit/test_admission.py
+import asyncio
+import pytest
+
+from app.core.admission import AdmissionController, AdmissionRejected, UPLOAD, DOWNLOAD
+
+
+def _controller(**overrides):
+    base = dict(
+        max_uploads=2, max_downloads=1, max_upload_bytes=100, max_uploads_per_user=1,
+        max_queue=2, queue_timeout=0.2, retry_after=7, read_pressure=0,
+    )
+    base.update(overrides)
+    return AdmissionController(**base)
+
+
+# --------------------------------- Tests --------------------------------------
+@pytest.mark.asyncio
+async def test_queue_full_rejects_with_retry_after():
+    ctl = _controller(max_queue=0)
+    async with ctl.admit(DOWNLOAD):
+        with pytest.raises(AdmissionRejected) as exc:
+            async with ctl.admit(DOWNLOAD):
+                pass
+    assert exc.value.retry_after == 7
+    assert ctl.snapshot()["downloads"] == 0
+
+@pytest.mark.asyncio
+async def test_waiter_admitted_on_release_and_timeout():
+    ctl = _controller()
+    order = []
+
+    async def download(tag, hold):
+        async with ctl.admit(DOWNLOAD):
+            order.append(tag)
+            await asyncio.sleep(hold)
+
+    await asyncio.gather(download("a", 0.05), download("b", 0))
+    assert order == ["a", "b"]
+
+    async with ctl.admit(DOWNLOAD):
+        with pytest.raises(AdmissionRejected):
+            async with ctl.admit(DOWNLOAD):
+                pass
+    assert ctl.snapshot() == {"uploads": 0, "downloads": 0, "uploadBytes": 0, "reads": 0, "queued": 0}
+
+@pytest.mark.asyncio
+async def test_per_user_limit_does_not_block_other_users():
+    ctl = _controller(max_uploads=3)
+    async with ctl.admit(UPLOAD, user_id="u1", nbytes=10):
+        waiting = asyncio.create_task(_hold(ctl, "u1"))
+        await asyncio.sleep(0)
+        # u1 è al suo limite ed è in coda, ma u2 entra subito
+        async with ctl.admit(UPLOAD, user_id="u2", nbytes=10):
+            assert ctl.uploads == 2
+        assert not waiting.done()
+    await waiting
+    assert ctl.uploads == 0
+
+async def _hold(ctl, user_id):
+    async with ctl.admit(UPLOAD, user_id=user_id, nbytes=10):
+        await asyncio.sleep(0)
+
+@pytest.mark.asyncio
+async def test_upload_byte_budget():
+    ctl = _controller(max_uploads_per_user=5)
+    async with ctl.admit(UPLOAD, user_id="u1", nbytes=80):
+        with pytest.raises(AdmissionRejected):
+            async with ctl.admit(UPLOAD, user_id="u2", nbytes=30):
+                pass
+    # da solo un upload più grande del budget passa comunque
+    async with ctl.admit(UPLOAD, user_id="u1", nbytes=500):
+        assert ctl.upload_bytes == 500
+
+@pytest.mark.asyncio
+async def test_reads_have_priority_over_uploads():
+    ctl = _controller(read_pressure=1)
+    async with ctl.track_read():
+        task = asyncio.create_task(_hold(ctl, "u1"))
+        await asyncio.sleep(0.01)
+        assert ctl.uploads == 0 and ctl.snapshot()["queued"] == 1
+    await task
+    assert ctl.snapshot()["queued"] == 0
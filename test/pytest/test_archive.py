@@ -0,0 +1,92 @@
+# tests/unit/test_archive.py
+from datetime import datetime, timezone
+import pytest
+
+from app.database.archive_storage import ArchiveStorage
+from app.database.base import BinaryStorage
+from app.schemas.file import StoredFile, FileInfo
+from app.services.archive_service import ArchiveService
+
+
+# ------------------------------ Fake storage ----------------------------------
+class FakeStorage(BinaryStorage):
+    def __init__(self, bucket):
+        self.bucket = bucket
+        self.files: dict[str, bytes] = {}
+
+    async def upload(self, *, filename, content_type, data, metadata=None):
+        file_id = f"{len(self.files) + 1:024x}"
+        self.files[file_id] = b"".join([c async for c in data])
+        return StoredFile(file_id=file_id, filename=filename, size=len(self.files[file_id]),
+                          content_type=content_type, uri=f"gridfs://{self.bucket}/{file_id}")
+
+    async def stream(self, file_id):
+        if file_id not in self.files:
+            raise FileNotFoundError(file_id)
+        yield self.files[file_id]
+
+    async def info(self, file_id):
+        return FileInfo(file_id=file_id, size=len(self.files[file_id])) if file_id in self.files else None
+
+    async def delete(self, file_id):
+        return self.files.pop(file_id, None) is not None
+
+
+async def _read(storage, file_id):
+    return b"".join([c async for c in storage.stream(file_id)])
+
+NOW = datetime(2025, 7, 1, tzinfo=timezone.utc)
+
+
+# --------------------------------- Tests --------------------------------------
+@pytest.mark.asyncio
+async def test_archive_storage_reads_archived_ids_and_stale_links():
+    hot, cold = FakeStorage("uploads"), FakeStorage("archive")
+    storage = ArchiveStorage(hot, cold)
+    hot.files["a" * 24] = b"hot"
+    cold.files["b" * 24] = b"cold"
+
+    assert await _read(storage, "a" * 24) == b"hot"
+    # id d'archivio: direttamente dal bucket freddo
+    assert await _read(storage, "archive." + "b" * 24) == b"cold"
+    # link salvato prima dell'archiviazione (id caldo, stesso oid)
+    assert await _read(storage, "b" * 24) == b"cold"
+    assert (await storage.info("b" * 24)).file_id == "b" * 24
+    with pytest.raises(FileNotFoundError):
+        await _read(storage, "c" * 24)
+    assert await storage.info("c" * 24) is None
+
+    stored = await storage.upload(filename="new", content_type=None, data=_gen(b"n"))
+    assert stored.uri.startswith("gridfs://uploads/")
+    assert await storage.delete("archive." + "b" * 24) and not cold.files
+
+async def _gen(data):
+    yield data
+
+def test_stub_keeps_api_fields_and_restore_keeps_later_files():
+    doc = {
+        "_id": "oid1", "submissionId": "sm-00001", "assignmentId": "A1", "studentId": "s1",
+        "createdAt": NOW, "content": "x" * 2000, "internal": True,
+        "files": [{"filename": "r.pdf", "path": "gridfs://b1/" + "1" * 24, "size": 10,
+                   "derived": {"status": "ready", "textUri": None, "previewUri": "gridfs://b1/" + "3" * 24}}],
+    }
+    moved = {"gridfs://b1/" + "1" * 24: "gridfs://archive/" + "1" * 24,
+             "gridfs://b1/" + "3" * 24: "gridfs://archive/" + "3" * 24}
+    ref = {"uri": "gridfs://archive/" + "2" * 24, "size": 2000, "encoding": "zlib"}
+
+    stub = ArchiveService.make_stub(doc, moved=moved, bundle_uri="gridfs://archive/" + "9" * 24,
+                                    archived_at=NOW, content="x" * 500, content_ref=ref)
+    assert stub["files"][0]["path"] == "gridfs://archive/" + "1" * 24
+    assert stub["files"][0]["derived"]["previewUri"] == "gridfs://archive/" + "3" * 24
+    assert stub["content"] == "x" * 500 and stub["contentRef"] == ref
+    assert "internal" not in stub and stub["archived"]["at"] == NOW
+    assert ArchiveService.cold_blob_uris(stub) == [
+        "gridfs://archive/" + "1" * 24, "gridfs://archive/" + "3" * 24, ref["uri"],
+    ]
+
+    # file aggiunto allo stub dopo l'archiviazione: non si perde col restore
+    late = {"filename": "late.txt", "path": "gridfs://uploads/" + "3" * 24, "size": 1}
+    stub["files"].append(late)
+    restored = ArchiveService.restored_doc(doc, stub)
+    assert restored["content"] == doc["content"] and restored["internal"] is True
+    assert restored["files"] == doc["files"] + [late]
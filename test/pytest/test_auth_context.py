@@ -0,0 +1,39 @@
+# tests/unit/test_auth_context.py
+import pytest
+
+from app.core.auth_context import AuthContextMiddleware, authenticate, cached_user, scope_user_id
+from app.schemas.context import UserContext
+
+
+class CountingDecoder:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, token):
+        self.calls += 1
+        if token == "bad":
+            raise ValueError("Invalid token")
+        return UserContext(user_id=token, role="student")
+
+
+@pytest.mark.asyncio
+async def test_token_decoded_once_per_request():
+    decode = CountingDecoder()
+    mw = AuthContextMiddleware(None, decode=decode)
+
+    async def inner(scope, receive, send):
+        inner.seen = (scope_user_id(scope), scope_user_id(scope), authenticate(scope, decode))
+    mw.app = inner
+
+    await mw({"type": "http", "headers": [(b"authorization", b"Bearer s1")]}, None, None)
+    assert inner.seen[0] == inner.seen[1] == "s1" and inner.seen[2].user_id == "s1"
+    assert decode.calls == 1
+
+    scope = {"type": "http", "headers": [(b"authorization", b"Bearer bad")]}
+    await mw(scope, None, None)
+    decoded, user, error = cached_user(scope)
+    assert decoded and user is None and isinstance(error, ValueError)
+    assert inner.seen[0] is None and decode.calls == 2
+
+    await mw({"type": "http", "headers": []}, None, None)
+    assert inner.seen[0] is None and decode.calls == 2
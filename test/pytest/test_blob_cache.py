@@ -0,0 +1,113 @@
+# tests/unit/test_blob_cache.py
+import asyncio
+import pytest
+
+from app.database.base import BinaryStorage
+from app.database.blob_cache import CachingStorage
+from app.schemas.file import FileInfo
+
+
+# ------------------------------ Fake storage ----------------------------------
+class CountingStorage(BinaryStorage):
+    def __init__(self, files):
+        self.files = files
+        self.streams = 0
+        self.infos = 0
+
+    async def upload(self, *, filename, content_type, data, metadata=None):
+        raise NotImplementedError
+
+    async def stream(self, file_id):
+        self.streams += 1
+        await asyncio.sleep(0.01)
+        data = self.files[file_id]
+        for i in range(0, len(data), 4):
+            yield data[i:i + 4]
+
+    async def info(self, file_id):
+        self.infos += 1
+        data = self.files.get(file_id)
+        return FileInfo(file_id=file_id, size=len(data)) if data is not None else None
+
+    async def delete(self, file_id):
+        return self.files.pop(file_id, None) is not None
+
+
+async def _read(storage, file_id):
+    return b"".join([c async for c in storage.stream(file_id)])
+
+
+# --------------------------------- Tests --------------------------------------
+@pytest.mark.asyncio
+async def test_concurrent_first_reads_coalesce_and_repeats_skip_storage():
+    inner = CountingStorage({"a": b"x" * 30})
+    cache = CachingStorage(inner, max_bytes=100, max_object_bytes=50, read_chunk=8)
+
+    results = await asyncio.gather(*(_read(cache, "a") for _ in range(10)))
+    assert all(r == b"x" * 30 for r in results)
+    assert inner.streams == 1
+
+    # download ripetuto (info + stream): nessuna lettura dallo storage
+    before = inner.infos
+    assert (await cache.info("a")).size == 30
+    assert await _read(cache, "a") == b"x" * 30
+    assert (inner.streams, inner.infos) == (1, before)
+    assert cache.stats()["hits"] == 1
+
+@pytest.mark.asyncio
+async def test_byte_bounded_lru_large_files_bypass_and_delete():
+    inner = CountingStorage({"a": b"a" * 40, "b": b"b" * 40, "c": b"c" * 40, "big": b"g" * 80})
+    cache = CachingStorage(inner, max_bytes=100, max_object_bytes=50)
+
+    await _read(cache, "a")
+    await _read(cache, "b")
+    await _read(cache, "a")          # "a" diventa il più recente
+    await _read(cache, "c")          # 120 > 100: esce "b"
+    assert cache.size == 80 and inner.streams == 3
+    await _read(cache, "a")
+    assert inner.streams == 3
+    await _read(cache, "b")
+    assert inner.streams == 4
+
+    await _read(cache, "big")
+    await _read(cache, "big")
+    assert inner.streams == 6 and cache.size <= 100
+
+    assert await cache.delete("a")
+    assert await cache.info("a") is None
+
+@pytest.mark.asyncio
+async def test_entries_expire_after_ttl():
+    now = [0.0]
+    inner = CountingStorage({"a": b"abc"})
+    cache = CachingStorage(inner, max_bytes=100, max_object_bytes=50, ttl_seconds=60, clock=lambda: now[0])
+
+    await _read(cache, "a")
+    now[0] = 59
+    await _read(cache, "a")
+    assert inner.streams == 1
+    now[0] = 61
+    await _read(cache, "a")
+    assert inner.streams == 2
+
+@pytest.mark.asyncio
+async def test_read_in_flight_during_delete_does_not_repopulate_cache():
+    class SlowStorage(CountingStorage):
+        async def stream(self, file_id):
+            data = self.files[file_id]   # letto prima della delete
+            started.set()
+            await release.wait()
+            yield data
+
+    started, release = asyncio.Event(), asyncio.Event()
+    inner = SlowStorage({"a": b"x" * 30})
+    cache = CachingStorage(inner, max_bytes=100, max_object_bytes=50)
+
+    reading = asyncio.ensure_future(_read(cache, "a"))
+    await started.wait()
+    assert await cache.delete("a")
+    release.set()
+    assert await reading == b"x" * 30
+
+    assert cache.stats()["entries"] == 0 and cache.size == 0
+    assert await cache.info("a") is None
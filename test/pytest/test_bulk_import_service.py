@@ -0,0 +1,155 @@
+# tests/unit/test_bulk_import_service.py
+import asyncio
+import io
+import json
+import zipfile
+import pytest
+from starlette.datastructures import UploadFile
+
+from app.schemas.context import UserContext
+from app.schemas.file import StoredFile
+from app.services.bulk_import_service import BulkImportService, UploadedFilesSource, ZipSource
+
+
+# -------------------------- Fake storage + repo --------------------------------
+class FakeStorage:
+    def __init__(self, fail_on=()):
+        self.files: dict[str, bytes] = {}
+        self.fail_on = set(fail_on)
+        self.active = 0
+        self.max_active = 0
+        self._n = 0
+
+    async def upload(self, *, filename, content_type, data, metadata=None):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            payload = b"".join([c async for c in data])
+            await asyncio.sleep(0.01)
+            if filename in self.fail_on:
+                raise IOError("disk full")
+            self._n += 1
+            file_id = f"{self._n:024x}"
+            self.files[file_id] = payload
+            return StoredFile(file_id=file_id, filename=filename, size=len(payload),
+                              content_type=content_type, uri=f"gridfs://uploads/{file_id}")
+        finally:
+            self.active -= 1
+
+    async def delete(self, file_id):
+        return self.files.pop(file_id, None) is not None
+
+
+class FakeSubmissionRepo:
+    def __init__(self, existing=(), reject=()):
+        self.existing = set(existing)
+        self.reject = set(reject)
+        self.inserted = []
+
+    async def find_submitted_pairs(self, pairs):
+        return set(pairs) & self.existing
+
+    async def create_many(self, items):
+        out = []
+        for it in items:
+            if it.studentId in self.reject:
+                out.append((None, "write error"))
+            else:
+                self.inserted.append(it)
+                out.append((f"sm-{len(self.inserted):05d}", None))
+        return out
+
+
+class FakePublisher:
+    def __init__(self):
+        self.events = []
+
+    async def publish_submission_delivered(self, **kw):
+        self.events.append(("delivered", kw["submissionId"]))
+
+    async def publish_submission_report(self, **kw):
+        self.events.append(("report", kw["submissionId"]))
+
+
+def _manifest(*records) -> bytes:
+    return "\n".join(r if isinstance(r, str) else json.dumps(r) for r in records).encode()
+
+def _upload(name, payload=b"x"):
+    return UploadFile(filename=name, file=io.BytesIO(payload))
+
+teacher = UserContext(user_id="t1", role="teacher")
+
+
+# --------------------------------- Tests --------------------------------------
+@pytest.mark.asyncio
+async def test_import_reports_each_line_and_cleans_up_failures():
+    storage = FakeStorage(fail_on={"bad.pdf"})
+    repo = FakeSubmissionRepo(existing={("A1", "old")}, reject={"s5"})
+    manifest = _manifest(
+        {"assignmentId": "A1", "studentId": "s1", "content": "ciao", "createdAt": "2024-05-01T10:00:00Z",
+         "files": [{"name": "s1/report.pdf"}]},
+        "{not json",
+        {"assignmentId": "A1", "studentId": "s1"},                              # duplicato nel manifest
+        {"assignmentId": "A1", "studentId": "old"},                             # già consegnato
+        {"assignmentId": "A1", "studentId": "s3", "files": [{"name": "missing.pdf"}]},
+        "",
+        {"assignmentId": "A1", "studentId": "s4", "files": [{"name": "ok.txt"}, {"name": "bad.pdf"}]},
+        {"assignmentId": "A1", "studentId": "s5", "files": [{"name": "s5.txt"}]},  # insert rifiutato
+        {"studentId": "s6"},
+    )
+    source = UploadedFilesSource([
+        _upload("s1/report.pdf", b"pdf"), _upload("ok.txt"), _upload("bad.pdf"), _upload("s5.txt"),
+    ])
+
+    report = await BulkImportService.import_manifest(manifest, source, teacher, repo, storage)
+
+    by_line = {r.line: r for r in report.results}
+    assert (report.imported, report.failed) == (1, 7)
+    assert by_line[1].status == "imported" and by_line[1].submissionId == "sm-00001"
+    assert by_line[2].error.startswith("invalid JSON")
+    assert by_line[3].error == "duplicate record in manifest"
+    assert by_line[4].error == "already submitted for this assignment"
+    assert by_line[5].error == "missing file: missing.pdf"
+    assert 6 not in by_line
+    assert by_line[7].error.startswith("file upload failed")
+    assert by_line[8].error == "write error"
+    assert by_line[9].error.startswith("assignmentId")
+
+    sub = repo.inserted[0]
+    assert sub.createdAt.year == 2024 and sub.files[0].filename == "report.pdf"
+    # restano solo i blob della submission importata
+    assert list(storage.files.values()) == [b"pdf"]
+
+@pytest.mark.asyncio
+async def test_zip_import_bounds_concurrency_and_publishes_on_request():
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        lines = []
+        for i in range(20):
+            zf.writestr(f"files/{i}.txt", f"file {i}")
+            lines.append({"assignmentId": "A1", "studentId": f"s{i}", "files": [{"name": f"files/{i}.txt"}]})
+        zf.writestr("manifest.ndjson", _manifest(*lines))
+    buf.seek(0)
+
+    storage, repo, publisher = FakeStorage(), FakeSubmissionRepo(), FakePublisher()
+    with zipfile.ZipFile(buf) as zf:
+        source = ZipSource(zf)
+        report = await BulkImportService.import_manifest(
+            source.manifest(), source, teacher, repo, storage, publisher, concurrency=4,
+        )
+
+    assert report.imported == 20 and report.failed == 0
+    assert 1 < storage.max_active <= 4
+    assert sorted(storage.files.values()) == sorted(f"file {i}".encode() for i in range(20))
+    assert len(publisher.events) == 40
+
+@pytest.mark.asyncio
+async def test_import_is_teacher_only_and_bounded():
+    repo, storage = FakeSubmissionRepo(), FakeStorage()
+    with pytest.raises(PermissionError):
+        await BulkImportService.import_manifest(b"", UploadedFilesSource([]),
+                                                UserContext(user_id="s1", role="student"), repo, storage)
+    manifest = _manifest(*({"assignmentId": "A1", "studentId": f"s{i}"} for i in range(3)))
+    with pytest.raises(ValueError):
+        await BulkImportService.import_manifest(manifest, UploadedFilesSource([]), teacher, repo, storage,
+                                                max_records=2)
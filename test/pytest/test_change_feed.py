@@ -0,0 +1,217 @@
+# tests/unit/test_change_feed.py
+import asyncio
+import pytest
+from datetime import datetime, timezone
+
+from app.services.change_feed import (
+    SubmissionChangeFeed, decode_change,
+    EVENT_CREATED, EVENT_FILE_ADDED, EVENT_DELETED, EVENT_REPLACED, EVENT_SUPERSEDED, EVENT_RESET,
+)
+
+
+# ------------------------- Fake collection + change stream --------------------
+class FakeStream:
+    def __init__(self, changes: asyncio.Queue):
+        self.changes = changes
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.changes.get()
+
+
+class HistoryLost(Exception):
+    code = 286
+
+
+class FakeCollection:
+    """
+    `changes` alimenta il cursore condiviso; `history` simula l'oplog per i
+    cursori aperti con start_after (che ricevono anche i cambi successivi).
+    """
+    def __init__(self):
+        self.changes: asyncio.Queue = asyncio.Queue()
+        self.history: list[dict] = []
+        self.private: list[asyncio.Queue] = []
+        self.watch_calls = 0
+        self.resume_tokens = []
+        self.start_after = []
+
+    async def watch(self, pipeline, **kwargs):
+        self.watch_calls += 1
+        if kwargs.get("start_after") is not None:
+            token = kwargs["start_after"]["_data"]
+            self.start_after.append(token)
+            ids = [c["_id"]["_data"] for c in self.history]
+            if token not in ids:
+                raise HistoryLost("resume point no longer in oplog")
+            q: asyncio.Queue = asyncio.Queue()
+            for c in self.history[ids.index(token) + 1:]:
+                q.put_nowait(c)
+            self.private.append(q)
+            return FakeStream(q)
+        self.resume_tokens.append(kwargs.get("resume_after"))
+        return FakeStream(self.changes)
+
+    async def emit(self, change, *, shared: bool = True):
+        # il cursore condiviso, aperto prima, vede il cambio per primo
+        self.history.append(change)
+        if shared:
+            await self.changes.put(change)
+        for q in self.private:
+            q.put_nowait(change)
+
+
+def _insert(token, assignment_id="A1", student_id="s1", sid="sm-1"):
+    return {
+        "_id": {"_data": token},
+        "operationType": "insert",
+        "fullDocument": {
+            "submissionId": sid, "assignmentId": assignment_id, "studentId": student_id,
+            "content": "hi", "createdAt": datetime(2025, 1, 1, tzinfo=timezone.utc), "files": [],
+        },
+    }
+
+
+async def _next(sub):
+    async for ev in sub.events(keepalive=1):
+        return ev
+
+
+# --------------------------------- Tests --------------------------------------
+def test_decode_insert_update_delete():
+    ev = decode_change(_insert("t1"))
+    assert ev.type == EVENT_CREATED and ev.id == "t1" and ev.assignmentId == "A1"
+    assert b'"submissionId":"sm-1"' in ev.to_sse()
+
+    upd = {
+        "_id": {"_data": "t2"},
+        "operationType": "update",
+        "updateDescription": {"updatedFields": {"files.0": {"filename": "a.pdf", "path": "gridfs://uploads/x", "size": 3}}},
+        "fullDocument": {"submissionId": "sm-1", "assignmentId": "A1", "studentId": "s1"},
+    }
+    ev = decode_change(upd)
+    assert ev.type == EVENT_FILE_ADDED and ev.data["files"][0].filename == "a.pdf"
+
+    dele = {
+        "_id": {"_data": "t3"},
+        "operationType": "delete",
+        "fullDocumentBeforeChange": {"submissionId": "sm-1", "assignmentId": "A1", "studentId": "s1"},
+    }
+    assert decode_change(dele).type == EVENT_DELETED
+
+    # stub d'archivio (replace_one): il client riceve il record aggiornato
+    stub = _insert("t5")
+    stub["operationType"] = "replace"
+    stub["fullDocument"]["archived"] = {"bundle": "gridfs://archive/x"}
+    ev = decode_change(stub)
+    assert ev.type == EVENT_REPLACED and ev.data.submissionId == "sm-1"
+    # senza pre-image non si sa a quale assignment apparteneva
+    assert decode_change({"_id": {"_data": "t4"}, "operationType": "delete"}) is None
+
+
+@pytest.mark.asyncio
+async def test_shared_cursor_filters_by_assignment_and_student():
+    col = FakeCollection()
+    feed = SubmissionChangeFeed(col)
+    async with feed.subscribe("A1") as teacher_sub, feed.subscribe("A1", student_id="s2") as student_sub:
+        await col.emit(_insert("t1", student_id="s1"))
+        await col.emit(_insert("t2", assignment_id="A2"))
+        await col.emit(_insert("t3", student_id="s2", sid="sm-2"))
+
+        assert (await _next(teacher_sub)).id == "t1"
+        assert (await _next(teacher_sub)).id == "t3"
+        assert (await _next(student_sub)).id == "t3"
+        assert col.watch_calls == 1
+    await feed.close()
+
+
+@pytest.mark.asyncio
+async def test_resume_with_last_event_id():
+    col = FakeCollection()
+    feed = SubmissionChangeFeed(col)
+    async with feed.subscribe("A1") as sub:
+        for t in ("t1", "t2", "t3"):
+            await col.emit(_insert(t))
+        for _ in range(3):
+            await _next(sub)
+
+    # riconnessione: arrivano solo gli eventi successivi al Last-Event-ID
+    async with feed.subscribe("A1", last_event_id="t1") as sub:
+        assert [(await _next(sub)).id for _ in range(2)] == ["t2", "t3"]
+
+    # token sconosciuto -> reset, il client deve ricaricare la lista
+    async with feed.subscribe("A1", last_event_id="old") as sub:
+        assert (await _next(sub)).type == EVENT_RESET
+    await feed.close()
+
+
+@pytest.mark.asyncio
+async def test_stopped_cursor_forgets_resume_token():
+    col = FakeCollection()
+    feed = SubmissionChangeFeed(col, linger=0)
+    async with feed.subscribe("A1") as sub:
+        await col.emit(_insert("t1"))
+        await _next(sub)
+    await asyncio.sleep(0.01)  # nessun subscriber: il cursore si ferma
+
+    # il nuovo cursore condiviso parte da adesso; il Last-Event-ID di prima
+    # si riprende con un cursore proprio
+    async with feed.subscribe("A1", last_event_id="t1") as sub:
+        await asyncio.sleep(0)
+        await col.emit(_insert("t2"), shared=False)
+        assert (await _next(sub)).id == "t2"
+        assert col.resume_tokens == [None, None] and col.start_after == ["t1"]
+    await feed.close()
+
+
+@pytest.mark.asyncio
+async def test_resume_from_another_worker_hands_over_to_the_shared_cursor():
+    col = FakeCollection()
+    feed = SubmissionChangeFeed(col)
+    # t1, t2 sono stati serviti da un altro worker: qui il buffer non li ha
+    await col.emit(_insert("t1"), shared=False)
+    await col.emit(_insert("t2"), shared=False)
+    async with feed.subscribe("A1", last_event_id="t1") as sub:
+        await asyncio.sleep(0)
+        assert (await _next(sub)).id == "t2"
+        # da t3 il cursore condiviso lo vede: niente doppioni, si prosegue dal buffer
+        await col.emit(_insert("t3"))
+        await col.emit(_insert("t4"))
+        assert [(await _next(sub)).id for _ in range(2)] == ["t3", "t4"]
+        await asyncio.sleep(0.01)
+        assert sub.queue.empty() and not sub.catching_up
+    assert col.start_after == ["t1"]
+
+    # token non più nell'oplog -> reset
+    async with feed.subscribe("A1", last_event_id="gone") as sub:
+        assert (await _next(sub)).type == EVENT_RESET
+    await feed.close()
+
+
+def test_superseded_version_is_hidden_and_restored():
+    doc = {"submissionId": "sm-1", "assignmentId": "A1", "studentId": "s1", "content": "hi",
+           "createdAt": datetime(2025, 1, 1, tzinfo=timezone.utc), "files": []}
+    ev = decode_change({
+        "_id": {"_data": "t1"},
+        "operationType": "update",
+        "updateDescription": {"updatedFields": {"latest": False}},
+        "fullDocument": {**doc, "latest": False},
+    })
+    assert ev.type == EVENT_SUPERSEDED and ev.data == {"submissionId": "sm-1"} and ev.assignmentId == "A1"
+
+    # cancellata la nuova versione, la precedente torna l'ultima: record completo
+    ev = decode_change({
+        "_id": {"_data": "t2"},
+        "operationType": "update",
+        "updateDescription": {"updatedFields": {"latest": True}},
+        "fullDocument": {**doc, "latest": True},
+    })
+    assert ev.type == EVENT_REPLACED and ev.data.submissionId == "sm-1"
@@ -0,0 +1,103 @@
+# tests/unit/test_command_log.py
+import logging
+import pytest
+
+from app.core.command_log import CommandLog, command_shape, plan_summary
+
+ADDR = ("mongo-1", 27017)
+
+
+# ------------------------------- Fake client ----------------------------------
+class FakeDatabase:
+    def __init__(self, calls):
+        self.calls = calls
+
+    async def command(self, cmd):
+        self.calls.append(cmd)
+        return {"queryPlanner": {"winningPlan": {
+            "stage": "LIMIT",
+            "inputStage": {"stage": "FETCH", "inputStage": {"stage": "IXSCAN", "indexName": "assignmentId_1_createdAt_-1"}},
+        }}}
+
+
+class FakeClient:
+    def __init__(self, nodes):
+        self.nodes = frozenset(nodes)
+        self.calls = []
+
+    def __getitem__(self, name):
+        return FakeDatabase(self.calls)
+
+
+def _run(log, request_id, name, command, ms, *, address=ADDR, failed=False):
+    log.started(request_id, address, name, "peer", command)
+    log.finished(request_id, address, name, int(ms * 1000), failed=failed)
+
+
+def _find(student):
+    return {
+        "find": "submissions", "filter": {"assignmentId": "A1", "studentId": student, "latest": {"$ne": False}},
+        "sort": {"createdAt": -1}, "limit": 20, "lsid": {"id": "x"}, "$db": "peer",
+    }
+
+
+# --------------------------------- Tests --------------------------------------
+def test_slow_commands_are_logged_without_values(caplog):
+    log = CommandLog(slow_ms=50)
+    with caplog.at_level(logging.WARNING, logger="app.core.command_log"):
+        _run(log, 1, "find", _find("mario.rossi"), 10)
+        _run(log, 2, "find", _find("mario.rossi"), 120)
+        _run(log, 3, "insert", {"insert": "submissions", "documents": [{"content": "tema segreto"}]}, 80, failed=True)
+        _run(log, 4, "hello", {"hello": 1}, 500)
+
+    text = caplog.text
+    assert "mario.rossi" not in text and "tema segreto" not in text and "A1" not in text
+    assert '"filter":{"assignmentId":"?","studentId":"?","latest":{"$ne":"?"}}' in text
+    assert '"sort":{"createdAt":-1}' in text and "(failed)" in text
+    assert "hello" not in text
+
+    stats = log.stats()["commands"]
+    assert stats["find"]["count"] == 2 and stats["find"]["slow"] == 1 and stats["find"]["maxMs"] == 120
+    assert stats["insert"] == {"count": 1, "failed": 1, "slow": 1, "totalMs": 80.0, "maxMs": 80.0}
+    assert stats["hello"]["slow"] == 0
+    assert log.stats()["inflight"] == 0
+
+def test_aggregate_shape_keeps_stage_structure():
+    shape = command_shape("aggregate", "peer", {
+        "aggregate": "submissions",
+        "pipeline": [{"$match": {"assignmentId": "A1"}}, {"$sort": {"createdAt": 1}}, {"$limit": 5}],
+    })
+    assert shape == {
+        "op": "aggregate", "ns": "peer.submissions",
+        "pipeline": [{"$match": {"assignmentId": "?"}}, {"$sort": {"createdAt": 1}}, {"$limit": "?"}],
+    }
+
+@pytest.mark.asyncio
+async def test_explain_top_shapes_once_per_interval():
+    now = [0.0]
+    log = CommandLog(slow_ms=50, explain_top=1, clock=lambda: now[0])
+    client = FakeClient([ADDR])
+
+    _run(log, 1, "find", _find("a"), 90)
+    _run(log, 2, "find", _find("b"), 300)   # stessa forma: resta la più lenta
+    _run(log, 3, "count", {"count": "submissions", "query": {"assignmentId": "A1"}}, 200)
+    _run(log, 4, "find", _find("c"), 400, address=("storage-1", 27017))
+
+    # solo la forma più lenta, e solo se viene da un nodo di questo client
+    assert await log.explain_slowest(client, min_interval=60) == 0
+    _run(log, 5, "find", _find("b"), 300)
+    assert await log.explain_slowest(client, min_interval=60) == 1
+    explained = client.calls[0]
+    assert explained["verbosity"] == "queryPlanner"
+    assert "lsid" not in explained["explain"] and "$db" not in explained["explain"]
+
+    _run(log, 6, "find", _find("d"), 300)
+    assert await log.explain_slowest(client, min_interval=60) == 0
+    now[0] = 61
+    _run(log, 7, "find", _find("d"), 300)
+    assert await log.explain_slowest(client, min_interval=60) == 1
+
+def test_plan_summary():
+    assert plan_summary({"queryPlanner": {"winningPlan": {"queryPlan": {
+        "stage": "SORT", "inputStage": {"stage": "COLLSCAN"}}}}}) == "SORT > COLLSCAN"
+    assert plan_summary({}) == "n/a"
@@ -0,0 +1,52 @@
+# tests/unit/test_event_service.py
+import json
+import pytest
+from datetime import datetime, timezone
+
+from app.schemas.submission import FileMeta
+from app.services.event_service import EventService, SCHEMA_VERSION_BASIC, SCHEMA_VERSION_RICH
+
+NOW = datetime(2025, 6, 1, 12, 0, tzinfo=timezone.utc)
+FILES = [
+    FileMeta(filename="tema.pdf", path="gridfs://uploads/" + "a" * 24, size=1200,
+             contentType="application/pdf", checksum="ab" * 32),
+    FileMeta(filename="dati.csv", path="gridfs://blobs1/" + "b" * 24, size=30),
+]
+
+
+def test_basic_event_is_unchanged():
+    version, payload, body = EventService.build_submission_event("A1", "S1", "s1", NOW, files=FILES, content="x")
+    assert version == SCHEMA_VERSION_BASIC
+    assert json.loads(body) == payload == {
+        "assignmentId": "A1", "submissionId": "S1", "studentId": "s1", "deliveredAt": NOW.isoformat(),
+    }
+
+def test_rich_event_carries_manifest_and_preview():
+    version, payload, body = EventService.build_submission_event(
+        "A1", "S1", "s1", NOW, rich=True, files=FILES, content="è" * 600, preview_chars=100,
+    )
+    assert version == SCHEMA_VERSION_RICH and json.loads(body) == payload
+    assert [f["fileId"] for f in payload["files"]] == ["a" * 24, "blobs1." + "b" * 24]
+    assert payload["files"][0]["contentType"] == "application/pdf" and payload["files"][1]["checksum"] is None
+    assert payload["fileCount"] == 2 and payload["totalSize"] == 1230
+    assert payload["contentPreview"] == "è" * 100 and payload["contentTruncated"] is True
+    assert payload["truncated"] is False and payload["href"] == "/api/v1/submissions/S1"
+
+def test_oversized_rich_event_sends_only_reference():
+    many = FILES * 50
+    version, payload, body = EventService.build_submission_event(
+        "A1", "S1", "s1", NOW, rich=True, files=many, content="testo", max_bytes=2048,
+    )
+    assert version == SCHEMA_VERSION_RICH and len(body) <= 2048
+    assert payload["truncated"] is True and "files" not in payload and "contentPreview" not in payload
+    assert payload["fileCount"] == 100 and payload["href"] == "/api/v1/submissions/S1"
+
+def test_href_is_the_detail_route(settings_env):
+    pytest.importorskip("fastapi")
+    pytest.importorskip("pymongo")
+    from fastapi import FastAPI
+    from app.routers.v1 import submission
+
+    app = FastAPI()
+    app.include_router(submission.router, prefix="/api/v1")
+    assert EventService.submission_href("S1") == app.url_path_for("get_submission_endpoint", submission_id="S1")
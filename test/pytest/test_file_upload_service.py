@@ -131,6 +131,7 @@ async def test_upload_pdf_content_type(storage, repo, student: UserContext):
     assert m.filename == "report.pdf"
     assert m.size == len(pdf_bytes)
     assert m.path.startswith("gridfs://uploads/")
+    assert m.contentType == "application/pdf" and m.checksum == "sha256:deadbeef"
 
     # Verifica che lo storage abbia ricevuto il content_type giusto
     up = storage.uploaded[0]
@@ -138,3 +139,39 @@ async def test_upload_pdf_content_type(storage, repo, student: UserContext):
     assert up["metadata"]["assignmentId"] == "A1"
     assert up["metadata"]["submissionId"] == "S1"
     assert up["metadata"]["studentId"] == student.user_id
+
+@pytest.mark.asyncio
+async def test_identical_upload_reuses_previous_version_blob(storage, repo, student):
+    import hashlib
+    same, changed = b"stesso contenuto", b"nuovo contenuto"
+    previous = [FileMeta(filename="dati.csv", path="gridfs://uploads/OLD", size=len(same),
+                         contentType="text/csv", checksum=hashlib.sha256(same).hexdigest())]
+    files = [
+        UploadFile(filename="dati_v2.csv", file=io.BytesIO(same), size=len(same)),
+        UploadFile(filename="tema.txt", file=io.BytesIO(changed), size=len(changed)),
+    ]
+    metas = await FileUploadService.upload_files(
+        assignment_id="A1", submission_id="S2", files=files, user=student, repo=repo, storage=storage, reuse=previous,
+    )
+    # il CSV identico non viene salvato di nuovo: stesso blob, nome nuovo
+    assert [m.path for m in metas] == ["gridfs://uploads/OLD", "gridfs://uploads/FAKEID"]
+    assert metas[0].filename == "dati_v2.csv" and metas[0].contentType == "text/csv"
+    assert [u["filename"] for u in storage.uploaded] == ["tema.txt"]
+    assert [m.filename for m in repo.files["S2"]] == ["dati_v2.csv", "tema.txt"]
+
+@pytest.mark.asyncio
+async def test_identical_uploads_reuse_a_previous_blob_only_once(storage, repo, student):
+    import hashlib
+    same = b"stesso contenuto"
+    previous = [FileMeta(filename="dati.csv", path="gridfs://uploads/OLD", size=len(same),
+                         contentType="text/csv", checksum=hashlib.sha256(same).hexdigest())]
+    files = [
+        UploadFile(filename="dati.csv", file=io.BytesIO(same), size=len(same)),
+        UploadFile(filename="copia.csv", file=io.BytesIO(same), size=len(same)),
+    ]
+    metas = await FileUploadService.upload_files(
+        assignment_id="A1", submission_id="S2", files=files, user=student, repo=repo, storage=storage, reuse=previous,
+    )
+    # il secondo upload identico non ripete lo stesso path nella versione
+    assert [m.path for m in metas] == ["gridfs://uploads/OLD", "gridfs://uploads/FAKEID"]
+    assert [u["filename"] for u in storage.uploaded] == ["copia.csv"]
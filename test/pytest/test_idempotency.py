@@ -0,0 +1,168 @@
+# tests/unit/test_idempotency.py
+import asyncio
+import json
+import pytest
+from datetime import datetime, timezone
+
+from app.core.auth_context import bearer_token
+from app.core.idempotency import IdempotencyMiddleware
+from app.database.idempotency_repo import IdempotencyStore
+from app.schemas.idempotency import IdempotencyRecord
+
+
+# ------------------------------ Fake store ------------------------------------
+class FakeIdempotencyStore(IdempotencyStore):
+    def __init__(self):
+        self.records: dict[str, IdempotencyRecord] = {}
+
+    async def claim(self, key, *, fingerprint, expires_at):
+        existing = self.records.get(key)
+        if existing is not None and not (existing.status == "pending" and existing.expiresAt < datetime.now(timezone.utc)):
+            return existing
+        self.records[key] = IdempotencyRecord(key=key, fingerprint=fingerprint, status="pending", expiresAt=expires_at)
+        return None
+
+    async def find(self, key):
+        return self.records.get(key)
+
+    async def complete(self, key, *, status, headers, body, expires_at):
+        self.records[key] = self.records[key].model_copy(update={
+            "status": "completed", "responseStatus": status,
+            "responseHeaders": headers, "responseBody": body, "expiresAt": expires_at,
+        })
+
+    async def release(self, key):
+        rec = self.records.get(key)
+        if rec is not None and rec.status == "pending":
+            del self.records[key]
+
+
+# ------------------------------ Fake app --------------------------------------
+class FakeApp:
+    """Crea una submission per ogni chiamata; può fallire o bloccarsi su un evento."""
+
+    def __init__(self, status=201, gate=None, headers=()):
+        self.calls = 0
+        self.status = status
+        self.gate = gate
+        self.headers = list(headers)
+
+    async def __call__(self, scope, receive, send):
+        self.calls += 1
+        await receive()
+        if self.gate is not None:
+            await self.gate.wait()
+        body = json.dumps({"submissionId": f"sm-{self.calls}"}).encode()
+        await send({"type": "http.response.start", "status": self.status,
+                    "headers": [(b"content-type", b"application/json"), *self.headers]})
+        await send({"type": "http.response.body", "body": body})
+
+
+def _middleware(app, store, **overrides):
+    base = dict(
+        identify=bearer_token,
+        ttl_seconds=60, pending_ttl_seconds=60, wait_seconds=1.0,
+        max_body_bytes=1024, poll_interval=0.01, store=store,
+    )
+    base.update(overrides)
+    return IdempotencyMiddleware(app, **base)
+
+
+async def _post(mw, key="k1", user="u1", path="/api/v1/submissions"):
+    headers = [(b"authorization", f"Bearer {user}".encode())]
+    if key:
+        headers.append((b"idempotency-key", key.encode()))
+    scope = {"type": "http", "method": "POST", "path": path, "headers": headers}
+    body_reads = 0
+
+    async def receive():
+        nonlocal body_reads
+        body_reads += 1
+        return {"type": "http.request", "body": b"payload", "more_body": False}
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    await mw(scope, receive, send)
+    headers = dict(sent[0].get("headers", []))
+    return sent[0]["status"], headers, sent[1]["body"], body_reads
+
+
+# --------------------------------- Tests --------------------------------------
+@pytest.mark.asyncio
+async def test_retry_replays_without_reading_body():
+    app, store = FakeApp(), FakeIdempotencyStore()
+    mw = _middleware(app, store)
+
+    status, headers, body, reads = await _post(mw)
+    assert status == 201 and reads == 1 and b"idempotent-replayed" not in headers
+
+    status, headers, replayed, reads = await _post(mw)
+    assert status == 201 and replayed == body
+    assert reads == 0 and headers[b"idempotent-replayed"] == b"true"
+    assert app.calls == 1
+
+    # stessa chiave, altro utente: richiesta indipendente
+    await _post(mw, user="u2")
+    assert app.calls == 2
+
+@pytest.mark.asyncio
+async def test_concurrent_duplicate_waits_for_original():
+    gate = asyncio.Event()
+    app, store = FakeApp(gate=gate), FakeIdempotencyStore()
+    mw = _middleware(app, store)
+
+    first = asyncio.create_task(_post(mw))
+    await asyncio.sleep(0.01)
+    second = asyncio.create_task(_post(mw))
+    await asyncio.sleep(0.01)
+    assert not second.done()
+
+    gate.set()
+    r1, r2 = await asyncio.gather(first, second)
+    assert app.calls == 1
+    assert r1[2] == r2[2] and r2[3] == 0
+
+@pytest.mark.asyncio
+async def test_server_error_releases_key():
+    app, store = FakeApp(status=503), FakeIdempotencyStore()
+    mw = _middleware(app, store)
+
+    assert (await _post(mw))[0] == 503
+    assert store.records == {}
+    app.status = 201
+    assert (await _post(mw))[0] == 201
+    assert app.calls == 2
+
+@pytest.mark.asyncio
+async def test_retry_after_response_is_not_stored():
+    # 429 dell'ammissione (coda piena): il retry deve arrivare all'app, non ricevere di nuovo 429
+    app, store = FakeApp(status=429, headers=[(b"retry-after", b"5")]), FakeIdempotencyStore()
+    mw = _middleware(app, store)
+
+    status, headers, _, _ = await _post(mw)
+    assert status == 429 and store.records == {}
+    app.status, app.headers = 201, []
+    status, headers, _, _ = await _post(mw)
+    assert status == 201 and b"idempotent-replayed" not in headers
+    assert app.calls == 2
+    assert (await _post(mw))[1][b"idempotent-replayed"] == b"true"
+
+@pytest.mark.asyncio
+async def test_wait_timeout_and_passthrough():
+    gate = asyncio.Event()
+    app, store = FakeApp(gate=gate), FakeIdempotencyStore()
+    mw = _middleware(app, store, wait_seconds=0.05)
+
+    first = asyncio.create_task(_post(mw))
+    await asyncio.sleep(0.01)
+    status, headers, _, _ = await _post(mw)
+    assert status == 409 and headers[b"retry-after"] == b"1"
+    gate.set()
+    await first
+
+    # senza header la richiesta passa senza toccare lo store
+    await _post(mw, key=None)
+    assert app.calls == 2 and len(store.records) == 1
@@ -0,0 +1,48 @@
+# tests/unit/test_loop_monitor.py
+import asyncio
+import logging
+import time
+import pytest
+
+from app.core.loop_monitor import LoopMonitor, percentile
+
+
+def _blocking_step(seconds):
+    time.sleep(seconds)
+
+
+# --------------------------------- Tests --------------------------------------
+def test_percentile():
+    values = sorted(float(i) for i in range(1, 101))
+    assert percentile(values, 0.5) == 51 and percentile(values, 0.99) == 99 and percentile([], 0.9) == 0.0
+
+@pytest.mark.asyncio
+async def test_lag_sampler_reports_percentiles():
+    monitor = LoopMonitor(interval=0.01)
+    monitor.start()
+    await asyncio.sleep(0.1)
+    _blocking_step(0.15)
+    await asyncio.sleep(0.05)
+    await monitor.stop()
+
+    stats = monitor.stats()
+    assert stats["lag"]["samples"] >= 3
+    assert stats["lag"]["maxMs"] >= 100
+    assert stats["lag"]["p50Ms"] < 100
+    assert "hotspots" not in stats  # watchdog spento
+
+@pytest.mark.asyncio
+async def test_watchdog_captures_blocking_stack_once(caplog):
+    monitor = LoopMonitor(interval=0.01, watchdog_ms=50)
+    with caplog.at_level(logging.WARNING, logger="app.core.loop_monitor"):
+        monitor.start()
+        await asyncio.sleep(0.05)
+        _blocking_step(0.3)
+        await asyncio.sleep(0.05)
+        await monitor.stop()
+
+    stats = monitor.stats()
+    assert stats["blocked"] == 1
+    [(spot, count)] = stats["hotspots"].items()
+    assert spot.endswith("_blocking_step") and count == 1
+    assert "time.sleep(seconds)" in caplog.text
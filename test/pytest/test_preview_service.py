@@ -0,0 +1,145 @@
+# tests/unit/test_preview_service.py
+import base64
+import io
+import json
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import pytest
+
+from app.database.base import BinaryStorage
+from app.schemas.context import UserContext
+from app.schemas.file import StoredFile, FileInfo
+from app.schemas.submission import Submission, FileMeta
+from app.services.preview_service import PreviewService, PreviewWorkers, extract_derived
+
+PNG = b"\x89PNG\r\n\x1a\nfake"
+
+
+# --------------------------- Fake storage + repository ---------------------------
+class FakeStorage(BinaryStorage):
+    def __init__(self):
+        self.files: dict[str, bytes] = {}
+        self.meta: dict[str, dict] = {}
+
+    async def upload(self, *, filename, content_type, data, metadata=None):
+        file_id = f"{len(self.files) + 1:024x}"
+        self.files[file_id] = b"".join([c async for c in data])
+        self.meta[file_id] = metadata or {}
+        return StoredFile(file_id=file_id, filename=filename, size=len(self.files[file_id]),
+                          content_type=content_type, uri=f"gridfs://uploads/{file_id}")
+
+    async def stream(self, file_id):
+        yield self.files[file_id]
+
+    async def info(self, file_id):
+        return FileInfo(file_id=file_id, size=len(self.files[file_id])) if file_id in self.files else None
+
+    async def delete(self, file_id):
+        return self.files.pop(file_id, None) is not None
+
+
+class FakeSubmissionRepo:
+    def __init__(self, submission):
+        self.items = {submission.submissionId: submission}
+
+    async def find_one(self, submission_id, *, allow_secondary=False):
+        return self.items.get(submission_id)
+
+    async def set_file_derived(self, submission_id, path, derived):
+        s = self.items.get(submission_id)
+        meta = next((f for f in s.files if f.path == path), None) if s else None
+        if meta is None:
+            return False
+        meta.derived = derived
+        return True
+
+
+def _notebook():
+    return json.dumps({"cells": [
+        {"cell_type": "markdown", "source": ["# Esercizio 1\n", "Media mobile"]},
+        {"cell_type": "code", "source": "plot(x)", "outputs": [
+            {"data": {"text/plain": "<Figure>", "image/png": base64.b64encode(PNG).decode()}},
+        ]},
+    ]}).encode()
+
+def _docx(text):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as z:
+        z.writestr("word/document.xml", f"<w:document><w:body><w:p><w:r><w:t>{text}</w:t></w:r></w:p>"
+                                        "<w:p><w:r><w:t>Fine &amp; saluti</w:t></w:r></w:p></w:body></w:document>")
+        z.writestr("docProps/thumbnail.jpeg", b"jpeg")
+    return buf.getvalue()
+
+async def _seed(storage, files):
+    metas = []
+    for name, ctype, data in files:
+        stored = await storage.upload(filename=name, content_type=ctype, data=_once(data))
+        metas.append(FileMeta(filename=name, path=stored.uri, size=len(data), contentType=ctype))
+    return metas
+
+async def _once(data):
+    yield data
+
+
+# --------------------------------- Tests --------------------------------------
+def test_extract_formats():
+    nb = extract_derived("analisi.ipynb", "application/x-ipynb+json", _notebook())
+    assert nb["status"] == "ready" and "Media mobile" in nb["text"] and "plot(x)" in nb["text"]
+    assert nb["preview"] == PNG and nb["previewContentType"] == "image/png"
+
+    doc = extract_derived("tema.docx", None, _docx("Introduzione"))
+    assert doc["text"].split() == ["Introduzione", "Fine", "&", "saluti"]
+    assert doc["preview"] == b"jpeg" and doc["previewContentType"] == "image/jpeg"
+
+    txt = extract_derived("main.py", "text/x-python", b"print('ciao')\n" * 100, max_text_chars=20)
+    assert txt["text"] == "print('ciao')\nprint(" and txt["textTruncated"] and txt["preview"] is None
+
+    assert extract_derived("dati.bin", "application/octet-stream", b"\x00")["status"] == "unsupported"
+
+@pytest.mark.asyncio
+async def test_derive_runs_in_process_pool_and_links_blobs():
+    storage = FakeStorage()
+    metas = await _seed(storage, [
+        ("analisi.ipynb", None, _notebook()),
+        ("dati.bin", None, b"\x00" * 10),
+        ("enorme.txt", "text/plain", b"x" * 2000),
+    ])
+    submission = Submission(submissionId="S1", assignmentId="A1", studentId="s1", content="c",
+                            createdAt=datetime.now(timezone.utc), files=metas)
+    repo = FakeSubmissionRepo(submission)
+    workers = PreviewWorkers.process_pool(1, max_pending=2)
+    try:
+        task = PreviewService.schedule(workers, "S1", metas, storage, repo, max_source_bytes=1000)
+        assert workers.pending == 1
+        assert await task == 2
+    finally:
+        await workers.shutdown()
+
+    nb, binary, big = submission.files
+    assert nb.derived.status == "ready" and nb.derived.textSize > 0 and not nb.derived.textTruncated
+    assert storage.meta[nb.derived.previewUri.rsplit("/", 1)[1]]["source"] == nb.path
+    assert binary.derived.status == "unsupported" and binary.derived.textUri is None
+    assert big.derived is None  # oltre max_source_bytes: nessuna estrazione
+
+    teacher = UserContext(user_id="t1", role="teacher")
+    file_id, ctype = await PreviewService.get_derived("S1", "analisi.ipynb", "preview", teacher, repo)
+    assert storage.files[file_id] == PNG and ctype == "image/png"
+    file_id, ctype = await PreviewService.get_derived("S1", "analisi.ipynb", "text", teacher, repo)
+    assert b"Esercizio 1" in storage.files[file_id] and ctype.startswith("text/plain")
+    assert await PreviewService.get_derived("S1", "dati.bin", "preview", teacher, repo) is None
+    with pytest.raises(PermissionError):
+        await PreviewService.get_derived("S1", "analisi.ipynb", "text", UserContext(user_id="s2", role="student"), repo)
+
+@pytest.mark.asyncio
+async def test_derived_blobs_dropped_when_submission_is_gone():
+    storage = FakeStorage()
+    [meta] = await _seed(storage, [("tema.docx", None, _docx("Testo"))])
+    repo = FakeSubmissionRepo(Submission(submissionId="other", assignmentId="A1", studentId="s1", content="c",
+                                         createdAt=datetime.now(timezone.utc)))
+    workers = PreviewWorkers(ThreadPoolExecutor(1), max_pending=1)
+    try:
+        assert await PreviewService.derive_file("S1", meta, storage, repo, workers) is None
+    finally:
+        await workers.shutdown()
+    assert list(storage.files) == [meta.path.rsplit("/", 1)[1]]
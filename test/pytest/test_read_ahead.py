@@ -0,0 +1,96 @@
+# tests/unit/test_read_ahead.py
+import asyncio
+import pytest
+
+from app.database.read_ahead import ReadAheadBudget, read_ahead
+
+
+class FakeStream:
+    """Stream a chunk con una latenza di lettura; registra quante read sono partite."""
+
+    def __init__(self, chunks: int, size: int = 4, delay: float = 0.0, fail_at: int | None = None):
+        self.remaining = chunks
+        self.size = size
+        self.delay = delay
+        self.fail_at = fail_at
+        self.reads = 0
+
+    async def read(self, n: int) -> bytes:
+        self.reads += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.fail_at is not None and self.reads == self.fail_at:
+            raise OSError("connection reset")
+        if self.remaining == 0:
+            return b""
+        self.remaining -= 1
+        return b"x" * self.size
+
+
+# --------------------------------- Tests --------------------------------------
+@pytest.mark.asyncio
+async def test_prefetches_while_client_is_slow():
+    s = FakeStream(chunks=10)
+    chunks = read_ahead(s.read, 4, depth=3)
+    first = await chunks.__anext__()
+    assert first == b"xxxx"
+    # client lento: nel frattempo il producer legge fino a depth chunk in
+    # memoria, contando quello che il client sta ancora ricevendo
+    await asyncio.sleep(0.01)
+    assert s.reads == 3
+    rest = [c async for c in chunks]
+    assert len(rest) == 9 and s.reads == 11  # + la read finale vuota
+
+@pytest.mark.asyncio
+async def test_global_budget_limits_prefetch_and_is_released():
+    budget = ReadAheadBudget(max_bytes=4)
+    a, b = FakeStream(chunks=10), FakeStream(chunks=10)
+    ga = read_ahead(a.read, 4, depth=4, budget=budget)
+    gb = read_ahead(b.read, 4, depth=4, budget=budget)
+    await ga.__anext__()
+    await gb.__anext__()
+    await asyncio.sleep(0.01)
+    # oltre ai chunk "gratuiti" in invio, un solo chunk in anticipo in tutto il worker
+    assert budget.used == 4
+    assert (a.reads - 1) + (b.reads - 1) == 1
+
+    # disconnessione a metà: il budget torna libero
+    await ga.aclose()
+    await gb.aclose()
+    assert budget.used == 0
+
+@pytest.mark.asyncio
+async def test_chunks_in_memory_never_exceed_depth():
+    s = FakeStream(chunks=20, delay=0.001)
+    depth, in_memory, peak = 3, 0, 0
+    real_read = s.read
+
+    async def counting_read(n):
+        nonlocal in_memory, peak
+        in_memory += 1  # buffer allocato dalla read in corso
+        peak = max(peak, in_memory)
+        return await real_read(n)
+
+    async for _ in read_ahead(counting_read, 4, depth=depth):
+        await asyncio.sleep(0.005)  # invio lento al client
+        in_memory -= 1
+    assert peak <= depth
+
+@pytest.mark.asyncio
+async def test_read_error_is_raised_to_consumer():
+    budget = ReadAheadBudget(max_bytes=100)
+    s = FakeStream(chunks=10, fail_at=3)
+    got = []
+    with pytest.raises(OSError):
+        async for c in read_ahead(s.read, 4, depth=2, budget=budget):
+            got.append(c)
+    assert len(got) == 2 and budget.used == 0
+
+@pytest.mark.asyncio
+async def test_depth_zero_reads_sequentially():
+    s = FakeStream(chunks=3)
+    chunks = read_ahead(s.read, 4, depth=0)
+    await chunks.__anext__()
+    await asyncio.sleep(0.01)
+    assert s.reads == 1
+    assert len([c async for c in chunks]) == 2
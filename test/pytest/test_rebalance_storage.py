@@ -0,0 +1,71 @@
+# tests/unit/test_rebalance_storage.py
+from types import SimpleNamespace
+
+import pytest
+
+
+# ------------------------- Fake collection (minimale) -------------------------
+class FakeSubmissions:
+    """update_many per i soli pattern usati dal job: "a.b" e "files.$[f].<campo>" con array_filters."""
+
+    def __init__(self, docs):
+        self.docs = docs
+
+    @staticmethod
+    def _get(doc, path):
+        for part in path.split("."):
+            if not isinstance(doc, dict):
+                return None
+            doc = doc.get(part)
+        return doc
+
+    @staticmethod
+    def _set(doc, path, value):
+        *parents, last = path.split(".")
+        for part in parents:
+            doc = doc.setdefault(part, {})
+        doc[last] = value
+
+    async def update_many(self, query, update, *, array_filters=None):
+        (field, expected), = query.items()
+        (target, value), = update["$set"].items()
+        modified = 0
+        for doc in self.docs:
+            if field.startswith("files."):
+                inner = field[len("files."):]
+                matched = [f for f in doc.get("files", []) if self._get(f, inner) == expected]
+                if not matched:
+                    continue
+                (flt, wanted), = array_filters[0].items()
+                for f in doc["files"]:
+                    if self._get(f, flt[len("f."):]) == wanted:
+                        self._set(f, target[len("files.$[f]."):], value)
+                modified += 1
+            elif self._get(doc, field) == expected:
+                self._set(doc, target, value)
+                modified += 1
+        return SimpleNamespace(modified_count=modified)
+
+
+# --------------------------------- Tests --------------------------------------
+@pytest.mark.asyncio
+async def test_update_references_rewrites_files_derived_and_content(settings_env):
+    pytest.importorskip("pymongo")
+    from app.jobs.rebalance_storage import _update_references
+
+    old, new = "gridfs://uploads/abc", "gridfs://b1/abc"
+    docs = [
+        {"files": [
+            {"path": old, "derived": {"textUri": "gridfs://uploads/t1"}},
+            {"path": "gridfs://uploads/x", "derived": {"textUri": old, "previewUri": old}},
+        ]},
+        {"files": [], "contentRef": {"uri": old}},
+        {"files": [{"path": "gridfs://uploads/y", "derived": None}]},
+    ]
+    submissions = FakeSubmissions(docs)
+
+    assert await _update_references(submissions, old, new) == 4
+    assert docs[0]["files"][0] == {"path": new, "derived": {"textUri": "gridfs://uploads/t1"}}
+    assert docs[0]["files"][1]["derived"] == {"textUri": new, "previewUri": new}
+    assert docs[1]["contentRef"]["uri"] == new
+    assert docs[2]["files"][0] == {"path": "gridfs://uploads/y", "derived": None}
@@ -0,0 +1,276 @@
+# tests/unit/test_resumable_upload_service.py
+import asyncio
+import pytest
+from datetime import datetime, timedelta, timezone
+
+from app.services.resumable_upload_service import ResumableUploadService
+from app.schemas.submission import Submission, FileMeta
+from app.schemas.upload import UploadSessionCreate
+from app.schemas.context import UserContext
+
+
+# ------------------------- Fake repository + storage --------------------------
+class FakeSubmissionRepo:
+    def __init__(self):
+        self.items: dict[str, Submission] = {}
+        self.files: dict[str, list[FileMeta]] = {}
+        self.fail_add = False
+
+    async def find_one(self, submission_id: str):
+        return self.items.get(submission_id)
+
+    async def add_file(self, submission_id: str, file_meta: FileMeta) -> bool:
+        if self.fail_add:
+            raise ConnectionError("mongo down")
+        self.files.setdefault(submission_id, []).append(file_meta)
+        self.items[submission_id].files.append(file_meta)
+        return True
+
+
+class FakeUploadSessionRepo:
+    def __init__(self):
+        self.items = {}
+        self.fail_delete = False
+
+    async def create(self, session):
+        self.items[session.uploadId] = session
+
+    async def find_one(self, upload_id):
+        s = self.items.get(upload_id)
+        return s.model_copy(deep=True) if s else None
+
+    async def mark_received(self, upload_id, indices, expires_at):
+        s = self.items.get(upload_id)
+        if s is None or s.status != "open":
+            return None
+        s.received = sorted(set(s.received) | set(indices))
+        s.expiresAt = expires_at
+        return s.model_copy(deep=True)
+
+    async def claim(self, upload_id, expires_at):
+        s = self.items.get(upload_id)
+        if s is None or s.status != "open":
+            return None
+        s.status, s.expiresAt = "completing", expires_at
+        return s.model_copy(deep=True)
+
+    async def release(self, upload_id):
+        s = self.items.get(upload_id)
+        if s is not None and s.status == "completing":
+            s.status = "open"
+
+    async def find_expired(self, now, limit=100):
+        return [s for s in self.items.values() if s.expiresAt < now][:limit]
+
+    async def delete(self, upload_id):
+        if self.fail_delete:
+            self.fail_delete = False
+            raise ConnectionError("mongo down")
+        return self.items.pop(upload_id, None) is not None
+
+
+class FakeChunkedStorage:
+    chunk_size = 4
+
+    def __init__(self):
+        self.chunks: dict[str, dict[int, bytes]] = {}
+        self.files: dict[str, int] = {}   # documenti files: id -> lunghezza
+        self.finalized: list[str] = []
+
+    def new_file_id(self):
+        return f"F{len(self.chunks) + 1}"
+
+    async def write_chunks(self, file_id, chunks):
+        self.chunks.setdefault(file_id, {}).update(dict(chunks))
+
+    async def finalize_chunks(self, file_id, *, filename, content_type, length, metadata=None):
+        await asyncio.sleep(0)
+        parts = self.chunks.get(file_id, {})
+        data = b"".join(parts[n] for n in sorted(parts))
+        assert len(data) == length
+        assert self.files.setdefault(file_id, length) == length
+        self.finalized.append(file_id)
+
+        class _Stored:
+            pass
+        st = _Stored()
+        st.file_id, st.filename, st.size = file_id, filename, len(data)
+        st.uri = f"gridfs://uploads/{file_id}"
+        st.content_type, st.checksum = content_type, None
+        return st
+
+    async def discard_chunks(self, file_id):
+        self.chunks.pop(file_id, None)
+
+    async def unfinalize_chunks(self, file_id):
+        self.files.pop(file_id, None)
+
+    async def info(self, file_id):
+        return object() if file_id in self.files else None
+
+
+async def _stream(*parts: bytes):
+    for p in parts:
+        yield p
+
+
+# -------------------------------- Fixtures -------------------------------------
+@pytest.fixture
+def repo():
+    r = FakeSubmissionRepo()
+    r.items["S1"] = Submission(
+        submissionId="S1", assignmentId="A1", studentId="s1",
+        content="", files=[], createdAt=datetime.now(timezone.utc),
+    )
+    return r
+
+@pytest.fixture
+def sessions():
+    return FakeUploadSessionRepo()
+
+@pytest.fixture
+def storage():
+    return FakeChunkedStorage()
+
+@pytest.fixture
+def student():
+    return UserContext(user_id="s1", role="student")
+
+@pytest.fixture
+def student2():
+    return UserContext(user_id="s2", role="student")
+
+async def _open(repo, sessions, storage, user, length=10):
+    return await ResumableUploadService.create_session(
+        "S1", UploadSessionCreate(filename="video.mp4", length=length), user, repo, sessions, storage
+    )
+
+
+# --------------------------------- Tests --------------------------------------
+@pytest.mark.asyncio
+async def test_create_session_requires_owner(repo, sessions, storage, student2):
+    with pytest.raises(PermissionError):
+        await _open(repo, sessions, storage, student2)
+
+@pytest.mark.asyncio
+async def test_create_session_missing_submission(repo, sessions, storage, student):
+    res = await ResumableUploadService.create_session(
+        "nope", UploadSessionCreate(filename="a", length=1), student, repo, sessions, storage
+    )
+    assert res is None
+
+@pytest.mark.asyncio
+async def test_write_resume_and_complete(repo, sessions, storage, student):
+    s = await _open(repo, sessions, storage, student)
+    assert ResumableUploadService.received_offset(s) == 0
+
+    # primo invio interrotto dopo 6 byte: l'ultimo pezzo non è a fine file
+    # quindi viene rifiutato, ma il chunk completo resta persistito
+    with pytest.raises(ValueError):
+        await ResumableUploadService.write(s.uploadId, 0, _stream(b"abc", b"def"), student, sessions, storage)
+    s = await ResumableUploadService.get_session(s.uploadId, student, sessions)
+    assert ResumableUploadService.received_offset(s) == 4
+
+    s = await ResumableUploadService.write(s.uploadId, 4, _stream(b"efghij"), student, sessions, storage)
+    assert ResumableUploadService.received_offset(s) == 10
+
+    closed, fm = await ResumableUploadService.complete(s.uploadId, student, repo, sessions, storage)
+    assert closed.submissionId == "S1" and fm.filename == "video.mp4" and fm.size == 10
+    assert repo.files["S1"][0].path == f"gridfs://uploads/{s.fileId}"
+    assert await sessions.find_one(s.uploadId) is None
+
+@pytest.mark.asyncio
+async def test_parallel_out_of_order_chunks(repo, sessions, storage, student):
+    s = await _open(repo, sessions, storage, student)
+    s = await ResumableUploadService.write(s.uploadId, 8, _stream(b"ij"), student, sessions, storage)
+    # offset contiguo ancora fermo a 0 finché manca il chunk iniziale
+    assert ResumableUploadService.received_offset(s) == 0
+    s = await ResumableUploadService.write(s.uploadId, 0, _stream(b"abcdefgh"), student, sessions, storage)
+    assert ResumableUploadService.is_complete(s)
+
+@pytest.mark.asyncio
+async def test_write_rejects_misaligned_or_overflow(repo, sessions, storage, student):
+    s = await _open(repo, sessions, storage, student)
+    with pytest.raises(ValueError):
+        await ResumableUploadService.write(s.uploadId, 3, _stream(b"x"), student, sessions, storage)
+    with pytest.raises(ValueError):
+        await ResumableUploadService.write(s.uploadId, 8, _stream(b"xyz"), student, sessions, storage)
+
+@pytest.mark.asyncio
+async def test_complete_incomplete_upload(repo, sessions, storage, student):
+    s = await _open(repo, sessions, storage, student)
+    await ResumableUploadService.write(s.uploadId, 0, _stream(b"abcd"), student, sessions, storage)
+    with pytest.raises(ValueError):
+        await ResumableUploadService.complete(s.uploadId, student, repo, sessions, storage)
+
+@pytest.mark.asyncio
+async def test_purge_expired_discards_chunks(repo, sessions, storage, student):
+    s = await _open(repo, sessions, storage, student)
+    await ResumableUploadService.write(s.uploadId, 0, _stream(b"abcd"), student, sessions, storage)
+    purged = await ResumableUploadService.purge_expired(
+        sessions, storage, now=datetime.now(timezone.utc) + timedelta(days=2)
+    )
+    assert purged == 1
+    assert s.fileId not in storage.chunks
+    assert await sessions.find_one(s.uploadId) is None
+
+@pytest.mark.asyncio
+async def test_concurrent_complete_finalizes_once(repo, sessions, storage, student):
+    s = await _open(repo, sessions, storage, student)
+    await ResumableUploadService.write(s.uploadId, 0, _stream(b"abcdefghij"), student, sessions, storage)
+
+    results = await asyncio.gather(
+        *(ResumableUploadService.complete(s.uploadId, student, repo, sessions, storage) for _ in range(2)),
+        return_exceptions=True,
+    )
+    assert sum(isinstance(r, ValueError) for r in results) == 1
+    assert storage.finalized == [s.fileId] and len(repo.files["S1"]) == 1
+
+@pytest.mark.asyncio
+async def test_expired_session_rejects_writes(repo, sessions, storage, student):
+    s = await _open(repo, sessions, storage, student)
+    # come letta da Mongo: data naive in UTC
+    sessions.items[s.uploadId].expiresAt = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(seconds=1)
+    assert await ResumableUploadService.write(s.uploadId, 0, _stream(b"abcd"), student, sessions, storage) is None
+    assert await ResumableUploadService.complete(s.uploadId, student, repo, sessions, storage) is None
+    assert s.fileId not in storage.chunks
+
+@pytest.mark.asyncio
+async def test_complete_can_be_retried_after_a_failure(repo, sessions, storage, student):
+    s = await _open(repo, sessions, storage, student)
+    await ResumableUploadService.write(s.uploadId, 0, _stream(b"abcdefghij"), student, sessions, storage)
+
+    # collegamento alla submission fallito: il file torna a chunk non finalizzati
+    repo.fail_add = True
+    with pytest.raises(ConnectionError):
+        await ResumableUploadService.complete(s.uploadId, student, repo, sessions, storage)
+    assert storage.files == {} and s.fileId in storage.chunks
+    assert (await sessions.find_one(s.uploadId)).status == "open"
+
+    # collegato, ma la sessione non si chiude: il retry non ricollega né rifinalizza da zero
+    repo.fail_add, sessions.fail_delete = False, True
+    with pytest.raises(ConnectionError):
+        await ResumableUploadService.complete(s.uploadId, student, repo, sessions, storage)
+    assert storage.files == {s.fileId: 10}
+
+    _, fm = await ResumableUploadService.complete(s.uploadId, student, repo, sessions, storage)
+    assert [f.path for f in repo.files["S1"]] == [fm.path]
+    assert storage.files == {s.fileId: 10} and await sessions.find_one(s.uploadId) is None
+
+@pytest.mark.asyncio
+async def test_purge_skips_completing_sessions_and_finalized_files(repo, sessions, storage, student):
+    s = await _open(repo, sessions, storage, student)
+    await ResumableUploadService.write(s.uploadId, 0, _stream(b"abcdefghij"), student, sessions, storage)
+    now = datetime.now(timezone.utc)
+
+    # finalizzazione in corso: la scadenza è spostata in avanti, la purge non la tocca
+    sessions.items[s.uploadId].expiresAt = now - timedelta(seconds=1)
+    await sessions.claim(s.uploadId, now + timedelta(minutes=10))
+    assert await ResumableUploadService.purge_expired(sessions, storage, now=now) == 0
+
+    # complete interrotto dopo la finalizzazione: la sessione va, i chunk del file restano
+    await storage.finalize_chunks(s.fileId, filename="video.mp4", content_type=None, length=10)
+    later = now + timedelta(hours=1)
+    assert await ResumableUploadService.purge_expired(sessions, storage, now=later) == 1
+    assert await sessions.find_one(s.uploadId) is None
+    assert len(storage.chunks[s.fileId]) == 3
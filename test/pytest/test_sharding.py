@@ -0,0 +1,114 @@
+# tests/unit/test_sharding.py
+import itertools
+import pytest
+
+from app.database.base import ChunkedBinaryStorage
+from app.database.routing_storage import RoutingStorage
+from app.database.sharding import HashRing, file_id_from_uri, split_file_id, join_file_id
+from app.schemas.file import StoredFile, FileInfo
+
+
+# ------------------------------ Fake shard ------------------------------------
+_ids = itertools.count(1)
+
+class FakeShard(ChunkedBinaryStorage):
+    def __init__(self, bucket):
+        self.bucket = bucket
+        self.chunk_size = 4
+        self.files: dict[str, bytes] = {}
+
+    def new_file_id(self):
+        return f"{next(_ids):024x}"
+
+    async def upload(self, *, filename, content_type, data, metadata=None, file_id=None):
+        file_id = file_id or self.new_file_id()
+        self.files[file_id] = b"".join([c async for c in data])
+        return StoredFile(file_id=file_id, filename=filename, size=len(self.files[file_id]),
+                          content_type=content_type, uri=f"gridfs://{self.bucket}/{file_id}")
+
+    async def stream(self, file_id):
+        yield self.files[file_id]
+
+    async def info(self, file_id):
+        return FileInfo(file_id=file_id, size=len(self.files[file_id])) if file_id in self.files else None
+
+    async def delete(self, file_id):
+        return self.files.pop(file_id, None) is not None
+
+    async def write_chunks(self, file_id, chunks):
+        pass
+
+    async def finalize_chunks(self, file_id, *, filename, content_type, length, metadata=None):
+        raise NotImplementedError
+
+    async def discard_chunks(self, file_id):
+        pass
+
+    async def unfinalize_chunks(self, file_id):
+        pass
+
+
+async def _data(payload=b"data"):
+    yield payload
+
+
+# --------------------------------- Tests --------------------------------------
+def test_file_ids_and_legacy_uris():
+    assert split_file_id("abc") == ("uploads", "abc")
+    assert split_file_id("blobs1.abc") == ("blobs1", "abc")
+    assert join_file_id("uploads", "abc") == "abc"
+    # i path già salvati restano validi
+    assert file_id_from_uri("gridfs://uploads/abc") == "abc"
+    assert file_id_from_uri("gridfs://blobs1/abc") == "blobs1.abc"
+    assert file_id_from_uri("s3://bucket/abc") is None
+
+def test_adding_a_shard_moves_only_its_share():
+    keys = [f"{i:024x}" for i in range(5000)]
+    before = HashRing({"uploads": 1, "b1": 1})
+    after = HashRing({"uploads": 1, "b1": 1, "b2": 1})
+
+    moved = [k for k in keys if before.node_for(k) != after.node_for(k)]
+    # solo verso il nuovo shard, circa un terzo delle chiavi
+    assert all(after.node_for(k) == "b2" for k in moved)
+    assert 0.25 < len(moved) / len(keys) < 0.42
+    assert min(after.distribution(keys).values()) > 1200
+
+@pytest.mark.asyncio
+async def test_routing_storage_places_reads_and_deletes_by_shard():
+    shards = {name: FakeShard(name) for name in ("uploads", "b1", "b2")}
+    storage = RoutingStorage(shards, HashRing({"uploads": 0, "b1": 1, "b2": 1}))
+
+    stored = [await storage.upload(filename="f", content_type=None, data=_data()) for _ in range(20)]
+    assert not shards["uploads"].files  # peso 0: solo lettura
+    for s in stored:
+        shard, oid = split_file_id(s.file_id)
+        assert s.uri == f"gridfs://{shard}/{oid}" and oid in shards[shard].files
+        assert file_id_from_uri(s.uri) == s.file_id
+        assert b"".join([c async for c in storage.stream(s.file_id)]) == b"data"
+
+    # file storico: id senza shard -> bucket "uploads"
+    legacy = await shards["uploads"].upload(filename="old", content_type=None, data=_data(b"old"))
+    assert (await storage.info(legacy.file_id)).size == 3
+    assert await storage.delete(legacy.file_id)
+    assert await storage.info("unknown.abc") is None
+
+@pytest.mark.asyncio
+async def test_route_by_assignment_colocates_files():
+    shards = {name: FakeShard(name) for name in ("uploads", "b1", "b2")}
+    storage = RoutingStorage(shards, HashRing({"uploads": 1, "b1": 1, "b2": 1}), route_by="assignment")
+
+    stored = [
+        await storage.upload(filename="f", content_type=None, data=_data(), metadata={"assignmentId": "A1"})
+        for _ in range(10)
+    ]
+    assert len({split_file_id(s.file_id)[0] for s in stored}) == 1
+
+@pytest.mark.asyncio
+async def test_upload_keeps_preassigned_file_id():
+    shards = {name: FakeShard(name) for name in ("uploads", "b1", "b2")}
+    storage = RoutingStorage(shards, HashRing({"uploads": 1, "b1": 1, "b2": 1}))
+
+    file_id = storage.new_file_id()
+    stored = await storage.upload(filename="f", content_type=None, data=_data(b"abc"), file_id=file_id)
+    assert stored.file_id == file_id
+    assert b"".join([c async for c in storage.stream(file_id)]) == b"abc"
@@ -0,0 +1,133 @@
+# tests/unit/test_similarity_service.py
+import random
+from datetime import datetime, timezone
+import numpy as np
+import pytest
+
+from app.schemas.context import UserContext
+from app.schemas.records import SubmissionRecord
+from app.schemas.submission import Submission, FileMeta
+from app.services.similarity_service import SimilarityService, band_keys
+
+
+# -------------------------- Fake repository + storage --------------------------
+class FakeFingerprints:
+    def __init__(self):
+        self.items = {}
+        self.candidate_calls = []
+
+    async def save(self, fp):
+        self.items[fp.submissionId] = fp
+
+    async def find_one(self, submission_id):
+        return self.items.get(submission_id)
+
+    async def find_candidates(self, assignment_id, bands, *, exclude, exclude_student=None):
+        wanted = set(bands)
+        found = [
+            fp for fp in self.items.values()
+            if fp.assignmentId == assignment_id and fp.submissionId != exclude and wanted & set(fp.bands)
+            and (exclude_student is None or fp.studentId != exclude_student)
+        ]
+        self.candidate_calls.append(len(found))
+        return found
+
+    async def delete(self, submission_id):
+        return self.items.pop(submission_id, None) is not None
+
+
+class FakeSubmissionRepo:
+    def __init__(self, items):
+        self.items = {s.submissionId: s for s in items}
+
+    async def find_one(self, submission_id, *, allow_secondary=False):
+        return self.items.get(submission_id)
+
+    async def find_many(self, submission_ids):
+        return [SubmissionRecord.from_doc(self.items[i].model_dump()) for i in submission_ids if i in self.items]
+
+
+class FakeStorage:
+    def __init__(self, blobs):
+        self.blobs = blobs
+
+    async def stream(self, file_id):
+        yield self.blobs[file_id]
+
+
+def _submission(submission_id, student_id, content="", *, latest=True, files=()):
+    return Submission(
+        submissionId=submission_id, assignmentId="A1", studentId=student_id, content=content,
+        createdAt=datetime.now(timezone.utc), files=list(files), latest=latest,
+    )
+
+def _essay(rng, words, n=400):
+    return " ".join(rng.choice(words) for _ in range(n))
+
+teacher = UserContext(user_id="t1", role="teacher")
+
+
+# --------------------------------- Tests --------------------------------------
+def test_signature_estimates_jaccard():
+    rng = random.Random(7)
+    words = [f"parola{i}" for i in range(3000)]
+    a = _essay(rng, words, 2000)
+    b = a + " " + _essay(rng, words, 200)
+    sig_a, n_a = SimilarityService.signature(a)
+    sig_b, _ = SimilarityService.signature(b)
+    sig_c, _ = SimilarityService.signature(_essay(rng, words, 2000))
+
+    assert sig_a.dtype == np.uint32 and n_a > 1900
+    sims = SimilarityService.similarities(sig_a, [sig_b.tobytes(), sig_c.tobytes()])
+    assert sims[0] > 0.8 and sims[1] < 0.1
+    assert set(band_keys(sig_a)) & set(band_keys(sig_b))
+    # stesso testo, stessa firma (anche in un altro processo: seed fisso)
+    assert (SimilarityService.signature(a.upper())[0] == sig_a).all()
+    assert SimilarityService.signature("  ... ")[0] is None
+
+@pytest.mark.asyncio
+async def test_near_duplicates_uses_lsh_candidates_and_attachments():
+    rng = random.Random(3)
+    words = [f"w{i}" for i in range(5000)]
+    source = _essay(rng, words)
+    fingerprints = FakeFingerprints()
+    storage = FakeStorage({"aa": source.encode()})
+
+    # s1 ha copiato il testo di s0 in un allegato; gli altri sono indipendenti
+    await SimilarityService.fingerprint("S0", "A1", "s0", source, [], None, fingerprints)
+    for i in range(2, 30):
+        await SimilarityService.fingerprint(f"S{i}", "A1", f"s{i}", _essay(rng, words), [], None, fingerprints)
+    await SimilarityService.fingerprint("X", "A2", "s0", source, [], None, fingerprints)
+
+    copied = _submission("S1", "s1", "vedi allegato", files=[
+        FileMeta(filename="tema.txt", path="gridfs://uploads/aa", size=len(source)),
+        FileMeta(filename="foto.png", path="gridfs://uploads/bb", size=10),
+    ])
+    repo = FakeSubmissionRepo([copied, _submission("S0", "s0", source)])
+
+    # firma mancante: calcolata al volo, allegato testuale incluso
+    result = await SimilarityService.near_duplicates("S1", teacher, repo, fingerprints, storage, min_similarity=0.5)
+    assert [r.submissionId for r in result] == ["S0"] and result[0].similarity > 0.9
+    assert fingerprints.candidate_calls == [1]  # solo chi condivide una banda, altro assignment escluso
+    assert "S1" in fingerprints.items
+
+    assert await SimilarityService.near_duplicates("nope", teacher, repo, fingerprints) is None
+    with pytest.raises(PermissionError):
+        await SimilarityService.near_duplicates("S1", UserContext(user_id="s1", role="student"), repo, fingerprints)
+
+@pytest.mark.asyncio
+async def test_near_duplicates_skip_own_versions_and_superseded_ones():
+    rng = random.Random(5)
+    words = [f"w{i}" for i in range(5000)]
+    text = _essay(rng, words)
+    fingerprints = FakeFingerprints()
+    repo = FakeSubmissionRepo([
+        _submission("V1", "s1", text, latest=False), _submission("V2", "s1", text),
+        _submission("C1", "s2", text, latest=False), _submission("C2", "s2", text + " fine"),
+    ])
+    for sub in repo.items.values():
+        await SimilarityService.fingerprint(sub.submissionId, "A1", sub.studentId, sub.content, [], None, fingerprints)
+
+    # la versione precedente dello stesso studente non è una copia; dell'altro conta solo l'ultima
+    result = await SimilarityService.near_duplicates("V2", teacher, repo, fingerprints)
+    assert [r.submissionId for r in result] == ["C2"]
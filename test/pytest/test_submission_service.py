@@ -3,18 +3,26 @@ import pytest
 from datetime import datetime, timezone
 from uuid import uuid4
 
-from app.services.submission_service import submissionService
+from app.services.submission_service import submissionService, SubmissionConflict
 from app.schemas.submission import SubmissionCreate, Submission, FileMeta
 from app.schemas.context import UserContext
+from app.schemas.records import SubmissionRecord, encode_records
+from app.schemas.stats import AssignmentStats
+from app.schemas.search import SearchHit
+from pydantic import TypeAdapter
 
 
 # ------------------------- Fake repository (minimale) -------------------------
 class FakeSubmissionRepo:
     def __init__(self):
         self.items: dict[str, Submission] = {}
+        self.search_texts: dict[str, str] = {}
 
-    async def create(self, data: SubmissionCreate, *, assignment_id: str, student_id: str) -> str:
+    async def create(self, data: SubmissionCreate, *, assignment_id: str, student_id: str, content_ref=None,
+                     search_text=None) -> str:
         new_id = str(uuid4())
+        if search_text is not None:
+            self.search_texts[new_id] = search_text
         sub = Submission(
             submissionId=new_id,
             assignmentId=assignment_id,
@@ -22,10 +30,43 @@ class FakeSubmissionRepo:
             content=data.content,
             files=[],
             createdAt=datetime.now(timezone.utc),
+            contentTruncated=content_ref is not None,
+            contentRef=content_ref,
         )
         self.items[new_id] = sub
         return new_id
 
+    async def create_version(self, data, *, previous, files=(), content_ref=None, content_delta=None, search_text=None):
+        if not self.items[previous.submissionId].latest:
+            return None
+        self.items[previous.submissionId].latest = False
+        new_id = str(uuid4())
+        if search_text is not None:
+            self.search_texts[new_id] = search_text
+        self.items[new_id] = Submission(
+            submissionId=new_id,
+            assignmentId=previous.assignmentId,
+            studentId=previous.studentId,
+            content=data.content,
+            files=list(files),
+            createdAt=datetime.now(timezone.utc),
+            contentTruncated=content_ref is not None or content_delta is not None,
+            version=previous.version + 1,
+            previousId=previous.submissionId,
+            contentRef=content_ref,
+            contentDelta=content_delta,
+        )
+        return new_id
+
+    async def replace_content(self, submission_id, content, content_ref, *, search_text=None):
+        if search_text is not None:
+            self.search_texts[submission_id] = search_text
+        else:
+            self.search_texts.pop(submission_id, None)
+        sub = self.items[submission_id]
+        sub.content, sub.contentRef, sub.contentDelta = content, content_ref, None
+        return True
+
     async def add_file(self, submission_id: str, file_meta: FileMeta) -> bool:
         sub = self.items.get(submission_id)
         if not sub:
@@ -33,26 +74,89 @@ class FakeSubmissionRepo:
         sub.files.append(file_meta)
         return True
 
-    async def find_for_assignment(self, assignment_id: str):
-        return [s for s in self.items.values() if s.assignmentId == assignment_id]
+    async def find_for_assignment(self, assignment_id: str, *, include_history=False):
+        return [s for s in self.items.values() if s.assignmentId == assignment_id and (include_history or s.latest)]
+
+    async def find_for_assignment_and_student(self, assignment_id: str, student_id: str, *, include_history=False):
+        return [s for s in await self.find_for_assignment(assignment_id, include_history=include_history)
+                if s.studentId == student_id]
 
-    async def find_for_assignment_and_student(self, assignment_id: str, student_id: str):
-        return [s for s in self.items.values() if s.assignmentId == assignment_id and s.studentId == student_id]
+    async def find_records_for_assignment(self, assignment_id: str, *, include_history=False):
+        items = await self.find_for_assignment(assignment_id, include_history=include_history)
+        return [SubmissionRecord.from_doc(s.model_dump()) for s in items]
 
-    async def find_one(self, submission_id: str):
+    async def find_records_for_assignment_and_student(self, assignment_id: str, student_id: str, *, include_history=False):
+        items = await self.find_for_assignment_and_student(assignment_id, student_id, include_history=include_history)
+        return [SubmissionRecord.from_doc(s.model_dump()) for s in items]
+
+    async def find_one(self, submission_id: str, *, allow_secondary: bool = False):
         return self.items.get(submission_id)
 
+    async def find_many(self, submission_ids):
+        self.find_many_calls = getattr(self, "find_many_calls", 0) + 1
+        return [SubmissionRecord.from_doc(self.items[i].model_dump()) for i in submission_ids if i in self.items]
+
     async def delete(self, submission_id: str):
-        return self.items.pop(submission_id, None) is not None
+        sub = self.items.pop(submission_id, None)
+        if sub is None:
+            return False
+        for other in self.items.values():
+            if other.previousId == submission_id:
+                other.previousId = sub.previousId
+        if sub.latest and sub.previousId in self.items:
+            self.items[sub.previousId].latest = True
+        return True
+
+    async def get_stats(self, assignment_id: str):
+        subs = await self.find_for_assignment(assignment_id)
+        if not subs:
+            return None
+        return AssignmentStats(
+            assignmentId=assignment_id,
+            submissionCount=len(subs),
+            fileCount=sum(len(s.files) for s in subs),
+            totalBytes=sum(f.size for s in subs for f in s.files),
+            firstSubmissionAt=min(s.createdAt for s in subs),
+            lastSubmissionAt=max(s.createdAt for s in subs),
+        )
+
+    async def search(self, query, *, assignment_id=None, student_id=None, limit=20, after=None):
+        # punteggio = parole della query presenti nel testo
+        words = query.lower().split()
+        hits = []
+        for s in self.items.values():
+            if (assignment_id and s.assignmentId != assignment_id) or (student_id and s.studentId != student_id):
+                continue
+            text = self.search_texts.get(s.submissionId, s.content)
+            score = float(sum(w in text.lower().split() for w in words))
+            if score:
+                hits.append(SearchHit(score=score, submission=SubmissionRecord.from_doc(s.model_dump())))
+        hits.sort(key=lambda h: (-h.score, h.submission.submissionId))
+        if after is not None:
+            hits = [h for h in hits if (-h.score, h.submission.submissionId) > (-after[0], after[1])]
+        return hits[:limit]
 
 
 # ------------------------------- Fake storage ---------------------------------
 class FakeStorage:
     def __init__(self):
         self.deleted: list[str] = []
+        self.blobs: dict[str, bytes] = {}
+
+    async def upload(self, *, filename, content_type, data, metadata=None):
+        file_id = f"BLOB{len(self.blobs) + 1}"
+        self.blobs[file_id] = b"".join([c async for c in data])
+
+        class _Stored:
+            uri = f"gridfs://uploads/{file_id}"
+        return _Stored()
+
+    async def stream(self, file_id: str):
+        yield self.blobs[file_id]
 
     async def delete(self, file_id: str) -> bool:
         self.deleted.append(file_id)
+        self.blobs.pop(file_id, None)
         return True
 
 
@@ -170,3 +274,193 @@ async def test_delete_ok_and_calls_storage(repo, teacher, student):
     # seconda delete -> False
     ok2 = await submissionService.delete_submission(sid, teacher, repo, storage=storage)
     assert ok2 is False
+
+@pytest.mark.asyncio
+async def test_list_records_same_json_as_response_model(repo, teacher, student, student2):
+    sid1 = await submissionService.create_submission("A1", _make_create(content="è ok"), student, repo)
+    await submissionService.create_submission("A1", _make_create(), student2, repo)
+    await submissionService.add_file(
+        sid1, FileMeta(filename="x.txt", path="gridfs://uploads/abc", size=3), student, repo
+    )
+
+    models = await submissionService.list_for_assignment("A1", teacher, repo)
+    records = await submissionService.list_records_for_assignment("A1", teacher, repo)
+    assert encode_records(records) == TypeAdapter(list[Submission]).dump_json(models)
+
+    # lo studente vede solo la propria anche sul percorso veloce
+    mine = await submissionService.list_records_for_assignment("A1", student, repo)
+    assert [r.submissionId for r in mine] == [sid1]
+
+@pytest.mark.asyncio
+async def test_stats_teacher_only_and_empty_default(repo, teacher, student):
+    with pytest.raises(PermissionError):
+        await submissionService.stats_for_assignment("A1", student, repo)
+
+    empty = await submissionService.stats_for_assignment("A1", teacher, repo)
+    assert empty.submissionCount == 0 and empty.firstSubmissionAt is None
+
+    sid = await submissionService.create_submission("A1", _make_create(), student, repo)
+    await submissionService.add_file(
+        sid, FileMeta(filename="x.txt", path="gridfs://uploads/abc", size=7), student, repo
+    )
+    stats = await submissionService.stats_for_assignment("A1", teacher, repo)
+    assert (stats.submissionCount, stats.fileCount, stats.totalBytes) == (1, 1, 7)
+
+@pytest.mark.asyncio
+async def test_get_many_applies_per_user_checks(repo, teacher, student, student2):
+    sid1 = await submissionService.create_submission("A1", _make_create(), student, repo)
+    sid2 = await submissionService.create_submission("A1", _make_create(), student2, repo)
+
+    items, not_found, forbidden = await submissionService.get_many([sid2, "nope", sid1, sid1], teacher, repo)
+    assert [r.submissionId for r in items] == [sid2, sid1]
+    assert not_found == ["nope"] and forbidden == []
+    assert repo.find_many_calls == 1
+
+    items, not_found, forbidden = await submissionService.get_many([sid1, sid2], student, repo)
+    assert [r.submissionId for r in items] == [sid1]
+    assert forbidden == [sid2]
+
+    with pytest.raises(PermissionError):
+        await submissionService.get_many([sid1], UserContext(user_id="x", role="guest"), repo)
+
+@pytest.mark.asyncio
+async def test_long_content_offloaded_and_loaded_on_detail(repo, teacher, student):
+    storage = FakeStorage()
+    long_text = "parola " * 5000
+    sid = await submissionService.create_submission(
+        "A1", _make_create(content=long_text), student, repo, storage,
+        inline_max_bytes=1024, preview_chars=20,
+    )
+    # inline solo l'anteprima, il testo completo è compresso nello storage
+    saved = await repo.find_one(sid)
+    assert saved.content == long_text[:20] and saved.contentTruncated
+    assert len(storage.blobs["BLOB1"]) < len(long_text)
+    listed = await submissionService.list_records_for_assignment("A1", teacher, repo)
+    assert listed[0].content == long_text[:20] and listed[0].contentTruncated
+
+    detail = await submissionService.get_submission(sid, student, repo, storage)
+    assert detail.content == long_text and not detail.contentTruncated
+
+    await submissionService.delete_submission(sid, teacher, repo, storage=storage)
+    assert storage.deleted == ["BLOB1"]
+
+@pytest.mark.asyncio
+async def test_short_content_stays_inline(repo, student):
+    storage = FakeStorage()
+    sid = await submissionService.create_submission("A1", _make_create(), student, repo, storage)
+    saved = await repo.find_one(sid)
+    assert saved.content == "Hello world" and saved.contentRef is None
+    assert storage.blobs == {}
+
+@pytest.mark.asyncio
+async def test_search_ranks_paginates_and_scopes_students(repo, teacher, student, student2):
+    texts = ["alfa beta", "alfa", "beta gamma", "alfa beta gamma", "delta"]
+    for i, text in enumerate(texts):
+        await submissionService.create_submission(f"A{i}", _make_create(content=text), student, repo)
+    await submissionService.create_submission("A0", _make_create(content="alfa beta gamma"), student2, repo)
+
+    seen, cursor = [], None
+    while True:
+        page = await submissionService.search("alfa beta gamma", teacher, repo, cursor=cursor, limit=2)
+        seen += [(h.score, h.submission.content) for h in page.items]
+        if page.nextCursor is None:
+            break
+        cursor = page.nextCursor
+    assert [score for score, _ in seen] == [3.0, 3.0, 2.0, 2.0, 1.0]
+    assert len(seen) == 5
+
+    page = await submissionService.search("gamma", student2, repo)
+    assert [h.submission.studentId for h in page.items] == ["s2"]
+    page = await submissionService.search("alfa", teacher, repo, assignment_id="A1")
+    assert [h.submission.content for h in page.items] == ["alfa"]
+
+    with pytest.raises(ValueError):
+        await submissionService.search("  ", teacher, repo)
+    with pytest.raises(ValueError):
+        await submissionService.search("alfa", teacher, repo, cursor="not-a-cursor")
+
+@pytest.mark.asyncio
+async def test_search_covers_text_beyond_the_inline_preview(repo, teacher, student):
+    storage = FakeStorage()
+    text = "introduzione " * 200 + "conclusione"
+    sid = await submissionService.create_submission(
+        "A1", _make_create(content=text), student, repo, storage, inline_max_bytes=1024, preview_chars=20,
+    )
+    assert "conclusione" not in (await repo.find_one(sid)).content
+
+    page = await submissionService.search("conclusione", teacher, repo)
+    assert [h.submission.submissionId for h in page.items] == [sid]
+
+    # anche le nuove versioni restano cercabili per intero
+    v2, _, _ = await submissionService.resubmit(
+        "A1", _make_create(content=text + " bibliografia"), student, repo, storage,
+        inline_max_bytes=1024, preview_chars=20,
+    )
+    assert (await repo.find_one(v2)).contentTruncated
+    page = await submissionService.search("bibliografia", teacher, repo)
+    assert [h.submission.submissionId for h in page.items] == [v2]
+
+@pytest.mark.asyncio
+async def test_resubmission_keeps_history_reuses_files_and_stores_delta(repo, teacher, student):
+    storage = FakeStorage()
+    lines = [f"riga {i} del tema\n" for i in range(2000)]
+    v1_text = "".join(lines)
+    v1 = await submissionService.create_submission(
+        "A1", _make_create(content=v1_text), student, repo, storage, inline_max_bytes=1024, preview_chars=20,
+    )
+    shared = FileMeta(filename="dati.csv", path="gridfs://uploads/SHARED", size=3, checksum="c1")
+    await submissionService.add_file(v1, shared, student, repo)
+    await submissionService.add_file(v1, FileMeta(filename="old.txt", path="gridfs://uploads/OLD", size=1), student, repo)
+
+    with pytest.raises(SubmissionConflict):
+        await submissionService.resubmit("A1", _make_create(content="x"), student, repo, storage, keep_files=["nope"])
+
+    # una riga corretta: il testo nuovo è un delta, il CSV passa alla nuova versione
+    lines[10] = "riga 10 corretta\n"
+    v2_text = "".join(lines)
+    v2, previous, kept = await submissionService.resubmit(
+        "A1", _make_create(content=v2_text), student, repo, storage,
+        keep_files=["dati.csv"], inline_max_bytes=1024, preview_chars=20,
+    )
+    assert previous.submissionId == v1 and kept == [shared]
+    saved = await repo.find_one(v2)
+    assert saved.version == 2 and saved.previousId == v1 and saved.contentDelta.base == v1
+    assert saved.contentRef is None and len(storage.blobs) == 1  # nessun nuovo blob per il testo
+    assert [f.path for f in saved.files] == [shared.path]
+
+    # la lista mostra solo l'ultima versione, salvo history
+    listed = await submissionService.list_records_for_assignment("A1", teacher, repo)
+    assert [(r.submissionId, r.version, r.latest) for r in listed] == [(v2, 2, True)]
+    full = await submissionService.list_records_for_assignment("A1", student, repo, include_history=True)
+    assert {r.submissionId for r in full} == {v1, v2}
+
+    detail = await submissionService.get_submission(v2, student, repo, storage)
+    assert detail.content == v2_text and not detail.contentTruncated
+
+    # cancellando la base: la v2 riceve il testo completo, il file condiviso resta
+    await submissionService.delete_submission(v1, teacher, repo, storage=storage, inline_max_bytes=1024)
+    assert "OLD" in storage.deleted and "SHARED" not in storage.deleted
+    saved = await repo.find_one(v2)
+    assert saved.contentDelta is None and saved.previousId is None
+    assert (await submissionService.get_submission(v2, student, repo, storage)).content == v2_text
+
+@pytest.mark.asyncio
+async def test_resubmission_keeps_files_by_checksum_and_reports_conflicts(repo, student):
+    v1 = await submissionService.create_submission("A1", _make_create(), student, repo)
+    csv = FileMeta(filename="dati.csv", path="gridfs://uploads/CSV", size=3, checksum="ab" * 32)
+    await submissionService.add_file(v1, csv, student, repo)
+
+    # il client conosce l'hash del file: non serve ricaricarne i byte
+    v2, _, kept = await submissionService.resubmit(
+        "A1", _make_create(content="v2"), student, repo, keep_files=["sha256:" + "ab" * 32, "dati.csv"],
+    )
+    assert kept == [csv] and [f.path for f in (await repo.find_one(v2)).files] == [csv.path]
+
+    # la v1 non è più l'ultima: riconsegnare partendo da lei è un conflitto
+    stale = await repo.find_one(v1)
+    repo.find_for_assignment_and_student = lambda *a, **k: _async([stale])
+    with pytest.raises(SubmissionConflict):
+        await submissionService.resubmit("A1", _make_create(content="v3"), student, repo)
+
+async def _async(value):
+    return value
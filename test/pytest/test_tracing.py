@@ -0,0 +1,111 @@
+# tests/unit/test_tracing.py
+import json
+import pytest
+
+from opentelemetry import trace
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from opentelemetry.sdk.trace.sampling import TraceIdRatioBased
+
+from app.core.tracing import traced, inject_headers, extract_context, FileSpanExporter
+
+EXPORTER = InMemorySpanExporter()
+
+
+@pytest.fixture(autouse=True)
+def spans():
+    # il provider globale si può installare una sola volta per processo
+    if not isinstance(trace.get_tracer_provider(), TracerProvider):
+        provider = TracerProvider()
+        provider.add_span_processor(SimpleSpanProcessor(EXPORTER))
+        trace.set_tracer_provider(provider)
+    EXPORTER.clear()
+    yield EXPORTER
+
+
+class FakeRepo:
+    @traced()
+    async def create(self):
+        return inject_headers({"eventType": "submission.delivered"})
+
+    @traced()
+    async def stream(self):
+        for chunk in (b"a", b"b"):
+            yield chunk
+
+
+class FakeService:
+    @staticmethod
+    @traced()
+    async def create_submission(repo):
+        headers = await repo.create()
+        data = b"".join([c async for c in repo.stream()])
+        return headers, data
+
+
+# --------------------------------- Tests --------------------------------------
+@pytest.mark.asyncio
+async def test_nested_spans_and_amqp_propagation(spans):
+    headers, data = await FakeService.create_submission(FakeRepo())
+    assert data == b"ab"
+
+    finished = {s.name: s for s in spans.get_finished_spans()}
+    root = finished["FakeService.create_submission"]
+    for child in ("FakeRepo.create", "FakeRepo.stream"):
+        assert finished[child].parent.span_id == root.context.span_id
+
+    # il consumer ricostruisce il contesto dagli header del messaggio
+    assert headers["eventType"] == "submission.delivered"
+    ctx = trace.get_current_span(extract_context(headers)).get_span_context()
+    assert ctx.trace_id == root.context.trace_id
+    assert ctx.span_id == finished["FakeRepo.create"].context.span_id
+
+@pytest.mark.asyncio
+async def test_async_generator_span_is_not_current_between_chunks(spans):
+    repo = FakeRepo()
+    with trace.get_tracer("test").start_as_current_span("consumer") as consumer:
+        async for _ in repo.stream():
+            # dopo lo yield il consumer è di nuovo nel proprio span
+            assert trace.get_current_span() is consumer
+            with trace.get_tracer("test").start_as_current_span("handle-chunk"):
+                pass
+        stream = repo.stream()
+        await stream.__anext__()
+        await stream.aclose()
+
+    finished = spans.get_finished_spans()
+    consumer_id = consumer.get_span_context().span_id
+    assert all(s.parent.span_id == consumer_id for s in finished if s.name == "handle-chunk")
+    assert [s.name for s in finished].count("FakeRepo.stream") == 2
+
+def test_sync_errors_are_recorded(spans):
+    @traced("AuthService.decode_token")
+    def decode():
+        raise ValueError("bad token")
+
+    with pytest.raises(ValueError):
+        decode()
+    (span,) = spans.get_finished_spans()
+    assert span.name == "AuthService.decode_token"
+    assert not span.status.is_ok
+
+def test_file_exporter_and_sampling(tmp_path):
+    path = tmp_path / "traces" / "spans.jsonl"
+    provider = TracerProvider(sampler=TraceIdRatioBased(1.0))
+    provider.add_span_processor(SimpleSpanProcessor(FileSpanExporter(str(path))))
+    tracer = provider.get_tracer("test")
+    with tracer.start_as_current_span("outer"):
+        with tracer.start_as_current_span("inner"):
+            pass
+
+    lines = path.read_text().splitlines()
+    assert [json.loads(line)["name"] for line in lines] == ["inner", "outer"]
+
+    # sample rate 0: nessuno span esportato
+    path.unlink()
+    provider = TracerProvider(sampler=TraceIdRatioBased(0.0))
+    provider.add_span_processor(SimpleSpanProcessor(FileSpanExporter(str(path))))
+    with provider.get_tracer("test").start_as_current_span("dropped"):
+        pass
+    assert not path.exists()